@@ -0,0 +1,441 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import sys
+import time
+import shlex
+import shutil
+import logging
+import cPickle
+import threading
+import traceback
+
+from component import Component
+from futures import FutureList
+from pool import get_pool
+from runners import register_cf_runner, run_par_task, run_par_task_in_process
+from libhpc.wrapper.process import launch
+from libhpc.wrapper.toolchain import register_tool, get_tool_path
+import tracing
+
+LOG = logging.getLogger(__name__)
+
+# Running the component tasks of a PAR as an array job on a cluster's 
+# batch scheduler, SLURM or PBS, rather than on the local machine. The 
+# 'batch' PAR runner writes each task, a component.Component, its 
+# parameters and context, to a parameter file in a job directory on a 
+# shared filesystem and submits a single array job, with one array task
+# per PAR task, that runs libhpc.tools.cf_batch_task. Each array task 
+# writes its result to a file in the job directory. The runner polls the
+# directory for results, checking the scheduler only occasionally to 
+# detect array tasks that ended without writing a result, and returns 
+# the results in the order of the PAR's tasks.
+#
+# PARs with more tasks than max_array_size (the scheduler's limit on the
+# size of an array) are submitted as several array jobs. The scheduler,
+# job directory and any extra submission arguments, e.g. the partition
+# and time limit, are set with set_batch_config() or the 
+# LIBHPC_CF_BATCH_SCHEDULER, LIBHPC_CF_BATCH_DIR and LIBHPC_CF_BATCH_ARGS
+# environment variables. The array tasks run with the environment of the
+# submitting process, which must include the location of the libraries
+# providing the components' functions.
+
+SCHEDULER_ENV_VAR = 'LIBHPC_CF_BATCH_SCHEDULER'
+DIRECTORY_ENV_VAR = 'LIBHPC_CF_BATCH_DIR'
+ARGS_ENV_VAR = 'LIBHPC_CF_BATCH_ARGS'
+
+# The environment variables providing the index of an array task
+ARRAY_INDEX_ENV_VARS = ['SLURM_ARRAY_TASK_ID', 'PBS_ARRAY_INDEX', 'PBS_ARRAYID']
+
+DEFAULT_MAX_ARRAY_SIZE = 1000
+# The interval between checks of the job directory for results grows 
+# from MIN_POLL_INTERVAL to poll_interval while no results arrive.
+MIN_POLL_INTERVAL = 0.5
+DEFAULT_POLL_INTERVAL = 10.0
+DEFAULT_STATUS_INTERVAL = 60.0
+RESULT_GRACE_PERIOD = 30.0
+
+register_tool('sbatch', 'sbatch', version_args=['--version'])
+register_tool('squeue', 'squeue', version_args=['--version'])
+register_tool('scancel', 'scancel', version_args=['--version'])
+register_tool('qsub', 'qsub', version_args=['--version'])
+register_tool('qstat', 'qstat', version_args=['--version'])
+register_tool('qdel', 'qdel', version_args=['--version'])
+
+_batch_config = None
+_batch_lock = threading.Lock()
+_job_counter = [0]
+
+# Run a scheduler command, returning its exit status, stdout and stderr
+def run_command(argv):
+    handle = launch(argv, capture_output=True, supervise=False)
+    (stdout, stderr) = handle.get_output()
+    return (handle.wait(), stdout, stderr)
+
+class BatchScheduler():
+    '''
+    The commands used to submit, check and cancel array jobs on a batch
+    scheduler.
+    '''
+    
+    name = None
+    
+    # Submit an array job running script with array indexes 0 to size-1 
+    # and return the job identifier.
+    def submit(self, script, job_name, size, log_file, max_running=None, submit_args=None):
+        argv = self.get_submit_command(script, job_name, size, log_file, max_running, submit_args)
+        (status, stdout, stderr) = run_command(argv)
+        if status != 0:
+            raise ValueError('Unable to submit the array job <' + job_name + '> to ' + self.name + \
+                ', exit status ' + str(status) + ': ' + stderr.strip())
+        return self.parse_job_id(stdout)
+    
+    # Return False once the scheduler no longer has the job queued or 
+    # running. Errors querying the scheduler are assumed to be temporary.
+    def is_active(self, job_id):
+        (status, stdout, stderr) = run_command(self.get_status_command(job_id))
+        return self.parse_status(status, stdout, stderr)
+    
+    def cancel(self, job_id):
+        run_command(self.get_cancel_command(job_id))
+
+class SlurmScheduler(BatchScheduler):
+    
+    name = 'slurm'
+    
+    def get_submit_command(self, script, job_name, size, log_file, max_running=None, submit_args=None):
+        array = '0-' + str(size - 1)
+        if max_running != None:
+            array = array + '%' + str(max_running)
+        return [get_tool_path('sbatch'), '--parsable', '--job-name', job_name, '--array', array, 
+                '--output', log_file] + list(submit_args or []) + [script]
+    
+    # sbatch --parsable writes the job id, followed by ;cluster on a
+    # multi-cluster system
+    def parse_job_id(self, stdout):
+        return stdout.strip().split(';')[0]
+    
+    def get_status_command(self, job_id):
+        return [get_tool_path('squeue'), '-h', '-j', job_id, '-o', '%i']
+    
+    def parse_status(self, status, stdout, stderr):
+        if status == 0:
+            return stdout.strip() != ''
+        return 'Invalid job id' not in stderr
+    
+    def get_cancel_command(self, job_id):
+        return [get_tool_path('scancel'), job_id]
+    
+    def get_log_file(self, job_dir, first):
+        return os.path.join(job_dir, 'array_' + str(first) + '_%a.log')
+
+class PbsScheduler(BatchScheduler):
+    
+    name = 'pbs'
+    
+    # PBS Professional does not accept an array of a single task so the 
+    # range always includes at least two indexes. The array task for an 
+    # index with no parameter file exits without doing anything.
+    def get_submit_command(self, script, job_name, size, log_file, max_running=None, submit_args=None):
+        array = '0-' + str(max(size, 2) - 1)
+        if max_running != None:
+            array = array + '%' + str(max_running)
+        return [get_tool_path('qsub'), '-V', '-N', job_name, '-J', array, '-j', 'oe', 
+                '-o', log_file] + list(submit_args or []) + [script]
+    
+    def parse_job_id(self, stdout):
+        return stdout.strip()
+    
+    def get_status_command(self, job_id):
+        return [get_tool_path('qstat'), job_id]
+    
+    def parse_status(self, status, stdout, stderr):
+        if status == 0:
+            return True
+        return 'Unknown Job Id' not in stderr
+    
+    def get_cancel_command(self, job_id):
+        return [get_tool_path('qdel'), job_id]
+    
+    # PBS writes the logs of array tasks to a directory
+    def get_log_file(self, job_dir, first):
+        return job_dir
+
+BATCH_SCHEDULERS = {'slurm': SlurmScheduler, 'pbs': PbsScheduler}
+
+class BatchConfig():
+    '''
+    The settings used by the batch PAR runner. scheduler is the name of a
+    scheduler in BATCH_SCHEDULERS, directory the shared directory in which
+    job directories are created, submit_args a list of extra arguments 
+    for the submission command and max_running, if set, limits the 
+    number of array tasks the scheduler runs at once. Job directories are
+    removed after a successful run unless keep_files is True. 
+    result_grace_period is the time allowed for results written on other
+    nodes to appear in the job directory once the jobs have finished.
+    '''
+    
+    def __init__(self, scheduler=None, directory=None, submit_args=None, max_running=None, 
+                 max_array_size=DEFAULT_MAX_ARRAY_SIZE, poll_interval=DEFAULT_POLL_INTERVAL, 
+                 status_interval=DEFAULT_STATUS_INTERVAL, keep_files=False, 
+                 result_grace_period=RESULT_GRACE_PERIOD):
+        '''
+        Constructor
+        '''
+        if scheduler == None:
+            scheduler = os.environ.get(SCHEDULER_ENV_VAR, 'slurm')
+        if scheduler not in BATCH_SCHEDULERS:
+            raise ValueError('Unknown batch scheduler <' + str(scheduler) + '>, expected one of ' + \
+                str(sorted(BATCH_SCHEDULERS.keys())))
+        self.scheduler = BATCH_SCHEDULERS[scheduler]()
+        if directory == None:
+            directory = os.environ.get(DIRECTORY_ENV_VAR, os.path.join(os.getcwd(), 'libhpc-batch'))
+        self.directory = os.path.abspath(directory)
+        if submit_args == None:
+            submit_args = shlex.split(os.environ.get(ARGS_ENV_VAR, ''))
+        self.submit_args = submit_args
+        for name, value in [('max_running', max_running), ('max_array_size', max_array_size)]:
+            if (value != None) and ((type(value) != type(0)) or (value < 1)):
+                raise ValueError(name + ' must be a positive integer, got <' + str(value) + '>')
+        self.max_running = max_running
+        self.max_array_size = max_array_size
+        self.poll_interval = poll_interval
+        self.status_interval = status_interval
+        self.keep_files = keep_files
+        self.result_grace_period = result_grace_period
+
+def set_batch_config(config):
+    global _batch_config
+    with _batch_lock:
+        _batch_config = config
+
+# Get the process' batch settings, by default taken from the environment
+def get_batch_config():
+    global _batch_config
+    with _batch_lock:
+        if _batch_config == None:
+            _batch_config = BatchConfig()
+        return _batch_config
+
+def get_task_file(job_dir, index):
+    return os.path.join(job_dir, 'task_' + str(index) + '.pkl')
+
+def get_result_file(job_dir, index):
+    return os.path.join(job_dir, 'result_' + str(index) + '.pkl')
+
+class BatchRun():
+    '''
+    A single run of the batch PAR runner: the job directory, the array 
+    jobs submitted and the results collected so far.
+    '''
+    
+    def __init__(self, task_list, config):
+        '''
+        Constructor
+        '''
+        self.task_list = task_list
+        self.config = config
+        self.scheduler = config.scheduler
+        with _batch_lock:
+            _job_counter[0] = _job_counter[0] + 1
+            job_name = 'libhpc-' + str(os.getpid()) + '-' + str(_job_counter[0])
+        self.job_name = job_name
+        self.job_dir = os.path.join(config.directory, job_name + '-' + str(int(time.time())))
+        self.job_ids = []
+        self.results = {}
+    
+    def write_tasks(self):
+        os.makedirs(self.job_dir)
+        for index, task in enumerate(self.task_list):
+            with open(get_task_file(self.job_dir, index), 'wb') as task_file:
+                cPickle.dump(task, task_file, cPickle.HIGHEST_PROTOCOL)
+    
+    # Write the script run by each array task of the array job starting
+    # at task index first
+    def write_script(self, first):
+        script = os.path.join(self.job_dir, 'run_' + str(first) + '.sh')
+        with open(script, 'w') as script_file:
+            script_file.write('#!/bin/sh\n')
+            script_file.write('cd ' + shell_quote(os.getcwd()) + '\n')
+            script_file.write('exec ' + ' '.join([shell_quote(arg) for arg in 
+                [sys.executable, '-m', 'libhpc.tools.cf_batch_task', self.job_dir, str(first)]]) + '\n')
+        os.chmod(script, 0755)
+        return script
+    
+    def submit(self):
+        self.write_tasks()
+        for first in range(0, len(self.task_list), self.config.max_array_size):
+            size = min(self.config.max_array_size, len(self.task_list) - first)
+            job_id = self.scheduler.submit(self.write_script(first), self.job_name, size, 
+                                           self.scheduler.get_log_file(self.job_dir, first), 
+                                           self.config.max_running, self.config.submit_args)
+            LOG.info('Submitted array job %s of %s tasks to %s.', job_id, size, self.scheduler.name)
+            self.job_ids.append(job_id)
+    
+    # Read the results that have appeared in the job directory, listing 
+    # the directory once rather than checking for each result file. 
+    # Returns the number of new results.
+    def collect(self):
+        new_results = 0
+        for filename in os.listdir(self.job_dir):
+            if not (filename.startswith('result_') and filename.endswith('.pkl')):
+                continue
+            index = int(filename[len('result_'):-len('.pkl')])
+            if index in self.results:
+                continue
+            with open(os.path.join(self.job_dir, filename), 'rb') as result_file:
+                result = cPickle.load(result_file)
+            if result[0] == 'error':
+                LOG.error('Batch task %s failed:\n%s', index, result[2])
+                self.cancel()
+                raise result[1]
+            value, task_trace = result[1]
+            active_tracer = tracing.tracer
+            if (task_trace != None) and (active_tracer != None):
+                active_tracer.add_events(task_trace[0], task_trace[1])
+            self.results[index] = value
+            new_results = new_results + 1
+        return new_results
+    
+    def is_complete(self):
+        return len(self.results) == len(self.task_list)
+    
+    def is_active(self):
+        for job_id in self.job_ids:
+            if self.scheduler.is_active(job_id):
+                return True
+        return False
+    
+    def cancel(self):
+        for job_id in self.job_ids:
+            self.scheduler.cancel(job_id)
+    
+    # Wait for the results of all tasks, returning them in task order
+    def wait(self):
+        interval = MIN_POLL_INTERVAL
+        last_status_check = time.time()
+        finished_time = None
+        while True:
+            if self.collect() > 0:
+                interval = MIN_POLL_INTERVAL
+            if self.is_complete():
+                break
+            now = time.time()
+            if finished_time != None:
+                if now - finished_time > self.config.result_grace_period:
+                    missing = [index for index in range(len(self.task_list)) if index not in self.results]
+                    raise RuntimeError('The array jobs ' + str(self.job_ids) + ' finished without results ' \
+                        'for ' + str(len(missing)) + ' tasks, e.g. task ' + str(missing[0]) + \
+                        ', see the logs in ' + self.job_dir)
+            elif now - last_status_check >= self.config.status_interval:
+                last_status_check = now
+                if not self.is_active():
+                    finished_time = now
+                    interval = MIN_POLL_INTERVAL
+                    continue
+            time.sleep(interval)
+            interval = min(interval * 2, self.config.poll_interval)
+        if not self.config.keep_files:
+            shutil.rmtree(self.job_dir, True)
+        return [self.results[index] for index in range(len(self.task_list))]
+
+def shell_quote(value):
+    return "'" + str(value).replace("'", "'\\''") + "'"
+
+# Run the array task with index array_index of the array job starting at
+# task index first, writing its result to the job directory. The result
+# file is written under a temporary name and renamed so that a partly
+# written result is never read.
+def run_array_task(job_dir, first, array_index):
+    index = first + array_index
+    task_file = get_task_file(job_dir, index)
+    if not os.path.exists(task_file):
+        return
+    with open(task_file, 'rb') as task_input:
+        task = cPickle.load(task_input)
+    try:
+        result = ('result', run_par_task_in_process(task))
+    except Exception, e:
+        result = ('error', e, traceback.format_exc())
+    try:
+        data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+    except (cPickle.PicklingError, TypeError), e:
+        data = cPickle.dumps(('error', RuntimeError(repr(e)), traceback.format_exc()), cPickle.HIGHEST_PROTOCOL)
+    result_file = get_result_file(job_dir, index)
+    with open(result_file + '.tmp', 'wb') as result_output:
+        result_output.write(data)
+    os.rename(result_file + '.tmp', result_file)
+
+def get_array_index():
+    for env_var in ARRAY_INDEX_ENV_VARS:
+        if os.environ.get(env_var):
+            return int(os.environ[env_var])
+    raise ValueError('No array task index was found in the environment, expected one of ' + \
+        str(ARRAY_INDEX_ENV_VARS))
+
+# Run the component tasks of a PAR as array jobs. Nested coordination 
+# forms can't be written to parameter files so they are run on the local
+# thread pool, while the array jobs run.
+def run_par_batch(task_list, pool_size=None):
+    output = [None] * len(task_list)
+    component_indexes = []
+    local_indexes = []
+    for index in range(len(task_list)):
+        if isinstance(task_list[index][0], Component):
+            component_indexes.append(index)
+        else:
+            local_indexes.append(index)
+    
+    local_results = None
+    if len(local_indexes) > 0:
+        local_results = FutureList(get_pool(pool_size).submit(run_par_task, 
+                                        [task_list[index] for index in local_indexes]))
+    if len(component_indexes) > 0:
+        batch_run = BatchRun([task_list[index] for index in component_indexes], get_batch_config())
+        batch_run.submit()
+        for index, result in zip(component_indexes, batch_run.wait()):
+            output[index] = result
+    if local_results != None:
+        for index, result in zip(local_indexes, local_results.result()):
+            output[index] = result
+    return output
+
+register_cf_runner('PAR', 'batch', run_par_batch)
@@ -0,0 +1,343 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import cPickle as pickle
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from files import find_files, file_digest, parse_size
+
+LOG = logging.getLogger(__name__)
+
+# An opt-in, content-addressed cache of component results. When a result
+# cache is enabled, each component run is keyed on the component id and
+# function, the parameter values and the content of any input files. If 
+# an entry exists for the key, the component's output files are restored
+# from the cache and the cached result is returned without running the
+# component. Otherwise the component is run and its result and output 
+# files are added to the cache.
+#
+# The cache is held in a directory that may be shared between processes.
+# Entries are written to a temporary directory and moved into place with
+# an atomic rename so concurrent writers, e.g. PAR branches running the
+# same component, cannot corrupt an entry. If a maximum size is set, the
+# least recently used entries are evicted when it is exceeded. The total
+# size of the entries is kept in a size file, updated as entries are 
+# added, so that the cache is only walked to find the entries to evict 
+# once the total exceeds the maximum.
+#
+# A cache is enabled for the process with set_result_cache() or by 
+# setting the LIBHPC_CF_CACHE_DIR (and, optionally, 
+# LIBHPC_CF_CACHE_MAX_SIZE) environment variables.
+
+CACHE_DIR_ENV_VAR = 'LIBHPC_CF_CACHE_DIR'
+CACHE_MAX_SIZE_ENV_VAR = 'LIBHPC_CF_CACHE_MAX_SIZE'
+
+# Included in every key so that entries written by an incompatible 
+# version of the cache are not used. Entries written by version 1 could
+# hold copies of input files.
+CACHE_FORMAT_VERSION = 2
+
+# Eviction removes entries until the cache is no larger than this 
+# fraction of its maximum size, so that a full cache is not walked again
+# on every store.
+EVICT_TARGET_RATIO = 0.9
+
+_result_cache = None
+_env_caches = {}
+_cache_lock = threading.Lock()
+
+def set_result_cache(cache):
+    global _result_cache
+    _result_cache = cache
+
+# Get the result cache for the process. A cache set with set_result_cache()
+# takes precedence over one configured through the environment. Returns
+# None if no cache is enabled.
+def get_result_cache():
+    if _result_cache != None:
+        return _result_cache
+    directory = os.environ.get(CACHE_DIR_ENV_VAR)
+    if not directory:
+        return None
+    max_size = os.environ.get(CACHE_MAX_SIZE_ENV_VAR)
+    with _cache_lock:
+        if (directory, max_size) not in _env_caches:
+            _env_caches[(directory, max_size)] = ResultCache(directory, max_size)
+        return _env_caches[(directory, max_size)]
+
+# Components wrapping command line tools return the tool's exit status
+# as their first, ignored, return value. Results with a non-zero status
+# are not cached.
+def result_succeeded(component, result):
+    return_data = component.get_return_data()
+    if (len(return_data) == 0) or (return_data[0].get_type() != 'int') or (not return_data[0].ignore()):
+        return True
+    status = result
+    if isinstance(result, (tuple, list)):
+        if len(result) == 0:
+            return True
+        status = result[0]
+    return (status == 0) or (status == None)
+
+def _get_dir_size(directory):
+    size = 0
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            size = size + os.path.getsize(os.path.join(root, name))
+    return size
+
+def _make_dirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+class ResultCache():
+    '''
+    A content-addressed store of component results and output files held
+    in a directory on disk.
+    '''
+    
+    def __init__(self, directory, max_size=None):
+        '''
+        Constructor
+        '''
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = parse_size(max_size)
+        self.entries_dir = os.path.join(self.directory, 'entries')
+        self.tmp_dir = os.path.join(self.directory, 'tmp')
+        self.size_file = os.path.join(self.directory, 'size')
+        _make_dirs(self.entries_dir)
+        _make_dirs(self.tmp_dir)
+    
+    # Compute the key for running component with parameter_list. The key
+    # covers the content, rather than the names, of input files but only 
+    # the names of output files.
+    def get_key(self, component, parameter_list):
+        input_values, output_values = component.split_parameter_values(parameter_list)
+        input_files = [(path, file_digest(path)) for path in find_files(input_values)]
+        key_data = (CACHE_FORMAT_VERSION, component.get_id(), component.get_code(),
+                    list(parameter_list), input_files)
+        return hashlib.sha1(repr(key_data)).hexdigest()
+    
+    def get_entry_dir(self, key):
+        return os.path.join(self.entries_dir, key[:2], key)
+    
+    # Look up an entry, restoring its output files if it is found. Returns
+    # a tuple of a boolean stating whether the entry was found and the 
+    # cached result. Entries that cannot be read, e.g. because they have
+    # been evicted by another process, are treated as missing.
+    def lookup(self, key):
+        entry_dir = self.get_entry_dir(key)
+        entry_file = os.path.join(entry_dir, 'entry.pickle')
+        try:
+            with open(entry_file, 'rb') as f:
+                entry = pickle.load(f)
+            for original_path, stored_name, digest in entry['files']:
+                self.restore_file(os.path.join(entry_dir, 'files', stored_name), original_path, digest)
+            # The entry file's modification time records when the entry
+            # was last used, for least recently used eviction.
+            os.utime(entry_file, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError) as e:
+            if os.path.exists(entry_file):
+                LOG.warning('Unable to use result cache entry <%s>: %s', key, e)
+            return (False, None)
+        return (True, entry['result'])
+    
+    def restore_file(self, source, target, digest):
+        if os.path.isfile(target) and (file_digest(target) == digest):
+            return
+        target_dir = os.path.dirname(os.path.abspath(target))
+        _make_dirs(target_dir)
+        temp_file = tempfile.NamedTemporaryFile(dir=target_dir, prefix='.libhpc-cache-', delete=False)
+        temp_file.close()
+        try:
+            shutil.copyfile(source, temp_file.name)
+            os.rename(temp_file.name, target)
+        finally:
+            if os.path.exists(temp_file.name):
+                os.remove(temp_file.name)
+        LOG.debug('Restored <%s> from the result cache', target)
+    
+    # Add an entry with the given result and output files. If another
+    # writer has already added an entry for the key, it is kept.
+    def store(self, key, output_files, result):
+        temp_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        try:
+            os.mkdir(os.path.join(temp_dir, 'files'))
+            file_records = []
+            for path in output_files:
+                if not os.path.isfile(path):
+                    continue
+                stored_name = str(len(file_records)) + '_' + os.path.basename(path)
+                shutil.copyfile(path, os.path.join(temp_dir, 'files', stored_name))
+                file_records.append((path, stored_name, file_digest(path)))
+            with open(os.path.join(temp_dir, 'entry.pickle'), 'wb') as f:
+                pickle.dump({'result': result, 'files': file_records}, f, pickle.HIGHEST_PROTOCOL)
+            entry_size = _get_dir_size(temp_dir)
+            entry_dir = self.get_entry_dir(key)
+            _make_dirs(os.path.dirname(entry_dir))
+            try:
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                if not os.path.exists(entry_dir):
+                    raise
+                LOG.debug('Result cache entry <%s> was added by another writer', key)
+                entry_size = 0
+        finally:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        total_size = self.add_size(entry_size)
+        if (self.max_size != None) and (total_size > self.max_size):
+            self.evict(int(self.max_size * EVICT_TARGET_RATIO))
+    
+    # Open the size file, which holds the total size of the entries, and 
+    # lock it against other processes sharing the cache. The lock is 
+    # released when the file is closed.
+    def open_size_file(self):
+        size_file = open(self.size_file, 'a+')
+        if fcntl != None:
+            fcntl.flock(size_file.fileno(), fcntl.LOCK_EX)
+        return size_file
+    
+    # Get the total size held in size_file, or None if it is not set
+    def read_size(self, size_file):
+        size_file.seek(0)
+        try:
+            return int(size_file.read())
+        except ValueError:
+            return None
+    
+    def write_size(self, size_file, total_size):
+        size_file.seek(0)
+        size_file.truncate()
+        size_file.write(str(total_size))
+        size_file.flush()
+    
+    # Add size bytes to the total size of the entries and return the new
+    # total. If the total is not known, e.g. for a cache written before 
+    # the size file was kept, it is found by walking the entries.
+    def add_size(self, size):
+        with self.open_size_file() as size_file:
+            total_size = self.read_size(size_file)
+            if total_size == None:
+                total_size = sum([entry[1] for entry in self.list_entries()])
+            else:
+                total_size = total_size + size
+            self.write_size(size_file, total_size)
+        return total_size
+    
+    # List the entries as tuples of the time they were last used, their 
+    # size and their directory
+    def list_entries(self):
+        entries = []
+        for prefix in os.listdir(self.entries_dir):
+            prefix_dir = os.path.join(self.entries_dir, prefix)
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, 'entry.pickle'))
+                    size = _get_dir_size(entry_dir)
+                except OSError:
+                    continue
+                entries.append((last_used, size, entry_dir))
+        return entries
+    
+    # Remove the least recently used entries until the total size of the
+    # cache is no more than max_size bytes. The total is recounted from 
+    # the entries, correcting any drift in the size file.
+    def evict(self, max_size):
+        with self.open_size_file() as size_file:
+            entries = self.list_entries()
+            total_size = sum([entry[1] for entry in entries])
+            entries.sort()
+            while (total_size > max_size) and (len(entries) > 0):
+                total_size = self.remove_entry(entries.pop(0), total_size)
+            self.write_size(size_file, total_size)
+    
+    # Remove an entry, given as listed by list_entries, from a cache of 
+    # total_size bytes and return the new total size
+    def remove_entry(self, entry, total_size):
+        last_used, size, entry_dir = entry
+        # Move the entry out of the entries directory before deleting it 
+        # so that it is never seen partially deleted.
+        trash_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        try:
+            os.rename(entry_dir, os.path.join(trash_dir, 'entry'))
+            total_size = total_size - size
+            LOG.debug('Evicted result cache entry <%s>', entry_dir)
+        except OSError:
+            pass
+        shutil.rmtree(trash_dir, ignore_errors=True)
+        return total_size
+    
+    # Run func, the function implementing component, with parameter_list
+    # using the cached result if one is available.
+    def run(self, component, func, parameter_list):
+        try:
+            key = self.get_key(component, parameter_list)
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to compute a result cache key for <%s>, running without the cache: %s', 
+                        component.get_id(), e)
+            return func(*parameter_list)
+        
+        found, result = self.lookup(key)
+        if found:
+            LOG.info('Using cached result for component <%s>', component.get_id())
+            return result
+        
+        result = func(*parameter_list)
+        if result_succeeded(component, result):
+            try:
+                self.store(key, component.get_output_files(parameter_list, result), result)
+            except (IOError, OSError) as e:
+                LOG.warning('Unable to add the result of <%s> to the result cache: %s', component.get_id(), e)
+        return result
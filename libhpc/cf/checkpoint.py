@@ -0,0 +1,204 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import errno
+import hashlib
+import logging
+import tempfile
+import threading
+import cPickle as pickle
+
+from component import Component
+from files import find_files
+
+LOG = logging.getLogger(__name__)
+
+# Checkpointing of PIPE expressions. When a PIPE is given a checkpoint 
+# file, the output of each stage is recorded in the file as the stage
+# completes. If the expression is run again, e.g. after a failure, stages
+# that completed in a previous run are not re-run and their recorded 
+# output is used, so the expression resumes after the last completed 
+# stage.
+#
+# Each recorded output is stored with a fingerprint of the stage and its 
+# input - the stage's function and static parameters, the input value and 
+# the size and modification time of any input files - and the size and
+# modification time of any files in the output. A recorded output is only
+# used if the fingerprint matches and the output files are unchanged, so 
+# changes to a pipeline's parameters or input files are detected and the
+# affected stages re-run.
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+# Describe an element of a coordination forms expression for use in a
+# fingerprint. Nested forms are described by their form, elements and 
+# parameters.
+def describe_element(element):
+    if type(element) == type(tuple()):
+        return ('static', describe_element(element[0]), list(element[1:]))
+    if isinstance(element, Component):
+        return ('component', element.get_id(), element.get_code())
+    if hasattr(element, 'cf_form'):
+        return ('form', element.cf_form, [describe_element(e) for e in element.cf_elements], 
+                getattr(element, 'cf_params', None))
+    return ('function', getattr(element, '__module__', None), getattr(element, '__name__', repr(element)))
+
+def get_file_state(path):
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime)
+
+def get_fingerprint(description, input_value):
+    file_states = [get_file_state(path) for path in find_files(input_value)]
+    return hashlib.sha1(repr((CHECKPOINT_FORMAT_VERSION, description, input_value, file_states))).hexdigest()
+
+class Checkpoint():
+    '''
+    A journal of the outputs of the completed stages of a PIPE expression,
+    held in a file.
+    '''
+    
+    def __init__(self, filename):
+        '''
+        Constructor
+        '''
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.stages = self.load()
+    
+    # Load the journal. A missing, unreadable or incompatible checkpoint
+    # file is treated as an empty journal.
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                journal = pickle.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                LOG.warning('Unable to read checkpoint file <%s>, running all stages: %s', self.filename, e)
+            return {}
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            LOG.warning('Checkpoint file <%s> is invalid, running all stages: %s', self.filename, e)
+            return {}
+        if (type(journal) != type(dict())) or (journal.get('version') != CHECKPOINT_FORMAT_VERSION):
+            LOG.warning('Checkpoint file <%s> has an unsupported format, running all stages.', self.filename)
+            return {}
+        return journal['stages']
+    
+    # Write the journal to a temporary file that is synced to disk and then
+    # renamed over the checkpoint file, so that the checkpoint file is 
+    # always complete even if the process is killed while it is written.
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        temp_file = tempfile.NamedTemporaryFile(dir=directory, prefix='.' + os.path.basename(self.filename) + '-', 
+                                                delete=False)
+        try:
+            with temp_file:
+                pickle.dump({'version': CHECKPOINT_FORMAT_VERSION, 'stages': self.stages}, temp_file, 
+                            pickle.HIGHEST_PROTOCOL)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.rename(temp_file.name, self.filename)
+        finally:
+            if os.path.exists(temp_file.name):
+                os.remove(temp_file.name)
+        # Sync the directory so that the rename is durable
+        try:
+            directory_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+        except OSError:
+            pass
+    
+    # Get the recorded output of the stage at position. Returns a tuple of
+    # a boolean stating whether a valid output was found and the output.
+    def get_output(self, position, fingerprint):
+        with self.lock:
+            entry = self.stages.get(position)
+        if (entry == None) or (entry['fingerprint'] != fingerprint):
+            return (False, None)
+        for file_state in entry['files']:
+            try:
+                if get_file_state(file_state[0]) != file_state:
+                    LOG.info('Output file <%s> of checkpointed PIPE stage %s has changed.', file_state[0], position)
+                    return (False, None)
+            except OSError:
+                LOG.info('Output file <%s> of checkpointed PIPE stage %s no longer exists.', file_state[0], position)
+                return (False, None)
+        return (True, entry['output'])
+    
+    # Record the output of the stage at position. Entries for later stages
+    # are discarded since they were based on a previous output.
+    def record(self, position, fingerprint, output):
+        file_states = [get_file_state(path) for path in find_files(output)]
+        with self.lock:
+            for recorded_position in self.stages.keys():
+                if recorded_position > position:
+                    del self.stages[recorded_position]
+            self.stages[position] = {'fingerprint': fingerprint, 'output': output, 'files': file_states}
+            self.save()
+
+class CheckpointedStage():
+    '''
+    Wraps a forms.PipeStage so that its output is taken from the checkpoint
+    if it has already been recorded and is otherwise recorded once the 
+    stage has run.
+    '''
+    
+    def __init__(self, stage, checkpoint):
+        '''
+        Constructor
+        '''
+        self.stage = stage
+        self.checkpoint = checkpoint
+        self.description = ('stage', stage.position, describe_element(stage.func), stage.new_params)
+    
+    def __call__(self, output):
+        position = self.stage.position
+        fingerprint = get_fingerprint(self.description, output)
+        found, recorded_output = self.checkpoint.get_output(position, fingerprint)
+        if found:
+            LOG.info('PIPE: Stage %s completed in a previous run, using output from checkpoint <%s>.', 
+                     position, self.checkpoint.filename)
+            return recorded_output
+        output = self.stage(output)
+        self.checkpoint.record(position, fingerprint, output)
+        return output
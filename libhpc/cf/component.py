@@ -43,12 +43,28 @@ File created on Aug 7, 2012
 
 @author: jhc02
 '''
-import sys
+import os
 import importlib
+import logging
 import threading
+import functools
 
 import params
+import tracing
 from collections import Iterable
+from log import TRACE
+from cache import get_result_cache
+from files import derive_filename, find_files
+from uptodate import get_skip_up_to_date, outputs_up_to_date
+from resources import ResourceRequest
+from context import get_context_value, ALLOCATED_THREADS_KEY
+
+LOG = logging.getLogger(__name__)
+
+# Functions resolved from component code strings, keyed by the fully 
+# qualified function name, and the lock used when resolving them
+_resolved_functions = {}
+_resolve_lock = threading.Lock()
 
 class Component():
     '''
@@ -70,20 +86,64 @@ class Component():
     # Additional parameters - whether these should be added to the parameter list before or
     # after existing params. In some case this matters.
     additional_params = 'pre'
+    # Files written by the function that are not passed as parameters, e.g.
+    # index files. A list of (parameter index, filename template) tuples,
+    # see files.derive_filename for the template format.
+    side_outputs = []
+    # Whether results of this component may be stored in the result cache
+    cacheable = True
+    # The fully qualified name of a function taking the component's 
+    # parameters and the read_stdin and write_stdout keyword arguments 
+    # that returns a stream.StreamCommand for the tool the component runs. 
+    # Components providing this can be connected by pipes in a streaming 
+    # PIPE, see runners.run_pipe_streaming.
+    stream_code = None
+    # The fully qualified name of a function taking the component's 
+    # parameters that returns a stream.StreamCommand for the tool the 
+    # component runs, without starting it. The command's result for the
+    # tool's exit status must be the value the component's function 
+    # returns. The tools of components providing this, or stream_code, can
+    # be launched directly by the launch PAR runner, see 
+    # runners.run_par_launch.
+    command_code = None
+    # The CPUs, memory and scratch space needed to run the component, an 
+    # instance of resources.ResourceRequest, or None if not declared
+    resources = None
+    # The name of the keyword argument through which the component's 
+    # function takes the number of threads to use, if it has one. When
+    # the component is run by a resource-aware scheduler, the number of
+    # CPUs allocated to it is passed through this argument.
+    threads_arg = None
 
-    def __init__(self, id, name, function_entry_point, input_params, return_params, static_pos = 'post'):
+    def __init__(self, id, name, function_entry_point, input_params, return_params, static_pos = 'post',
+                 side_outputs = None, cacheable = True, stream_code = None, resources = None, threads_arg = None,
+                 command_code = None):
         '''
         Constructor
         '''
-        print 'Creating a new coordination forms component...'
         self.component_id = id
         self.component_name = name
         self.component_code = function_entry_point
         self.parameters = input_params
         self.return_data = return_params
         self.static_params_pos = static_pos
+        if side_outputs != None:
+            self.side_outputs = side_outputs
+        self.cacheable = cacheable
+        self.stream_code = stream_code
+        self.command_code = command_code
+        # Resources may be given as a dictionary of the arguments to
+        # ResourceRequest, e.g. {'cpus': (1, 8), 'memory': '8G'}
+        if isinstance(resources, dict):
+            resources = ResourceRequest(**resources)
+        self.resources = resources
+        self.threads_arg = threads_arg
+        # The number of input parameters the component expects and the 
+        # number of values it returns, counted once from the metadata
+        self.input_count = len([p for p in self.parameters if p.get_dir() == 'input'])
+        self.output_count = self.count_output_values()
         #self.dependencies = dependencies
-        print 'Creating a new coordination forms component...\n\tID: '  + self.component_id + '\tType: ' + self.component_name + '\n'
+        LOG.debug('Creating a new coordination forms component...\n\tID: %s\tType: %s', self.component_id, self.component_name)
         
     def get_id(self):
         return self.component_id
@@ -100,119 +160,338 @@ class Component():
     def get_code(self):
         return self.component_code
     
+    def get_stream_code(self):
+        return self.stream_code
+    
+    def get_command_code(self):
+        return self.command_code
+    
+    def get_resources(self):
+        return self.resources
+    
+    def get_threads_arg(self):
+        return self.threads_arg
+    
     def get_dependencies(self):
         return self.dependencies
     
+    def get_input_count(self):
+        return self.input_count
+    
+    # The number of values returned by run(). If this is 1, the single 
+    # value is returned, otherwise a tuple of this length is returned.
+    def get_output_count(self):
+        return self.output_count
+    
+    def count_output_values(self):
+        count = 0
+        if len(self.return_data) == 1:
+            if not self.return_data[0].ignore():
+                count = 1
+        elif len(self.return_data) > 1:
+            # Multiple return values are returned together as a list
+            count = 1
+        for value in self.parameters:
+            if ((value.get_dir() == 'output') or (value.get_dir() == 'inout')) and not value.ignore():
+                count = count + 1
+        return count
+    
+    # Resolve the fully qualified function name in component_code to the
+    # function that implements this component. Resolution is done once per
+    # process for each function name and the result cached.
+    def get_function(self):
+        return self.get_resolved_function(self.component_code)
+    
+    def get_resolved_function(self, component_code):
+        try:
+            return _resolved_functions[component_code]
+        except KeyError:
+            pass
+        with _resolve_lock:
+            if component_code not in _resolved_functions:
+                _resolved_functions[component_code] = self.resolve_function(component_code)
+            return _resolved_functions[component_code]
+    
+    # Handle lookup of function code that we're going to run.
+    # Lookup uses the string providing the package and name of the function 
+    def resolve_function(self, component_code):
+        function_parts = component_code.rsplit('.',1)
+        func = None
+        if len(function_parts) == 2:
+            #mod = __import__(function_parts[0])
+            mod = importlib.import_module(function_parts[0])
+            LOG.debug('Got module %s', mod)
+        else:
+            LOG.error('The provided component_name <%s> is invalid, a fully qualified name must be specified.', function_parts)
+            raise ValueError('The provided component_name <' + str(function_parts) + '> is invalid, a fully qualified name must be specified.')
+        func = getattr(mod, function_parts[1], None)
+        LOG.debug('Checking if function %s is callable...function parts: %s', func, function_parts)
+        # Raising here, rather than returning, means that an invalid entry
+        # point is not cached and is reported by resolve_expression.
+        if func == None:
+            LOG.error('The module <%s> has no function <%s>.', function_parts[0], function_parts[1])
+            raise ValueError('The provided component_name <' + component_code + '> is invalid, the module <' + \
+                function_parts[0] + '> has no function <' + function_parts[1] + '>.')
+        if not callable(func):
+            LOG.error('The provided component_name <%s> does not name a callable function.', component_code)
+            raise ValueError('The provided component_name <' + component_code + '> is invalid, <' + \
+                function_parts[1] + '> is not callable.')
+        LOG.debug('Function is callable')
+        return func
+    
+    # Get the command that runs the component's tool with parameter_list,
+    # reading its input from stdin and/or writing its output to stdout.
+    def get_stream_command(self, parameter_list, read_stdin=False, write_stdout=False):
+        if self.stream_code == None:
+            raise ValueError('Component <' + str(self.component_id) + '> does not support streaming.')
+        if not hasattr(parameter_list, '__iter__'):
+            parameter_list = [parameter_list]
+        command_func = self.get_resolved_function(self.stream_code)
+        if not callable(command_func):
+            raise ValueError('Stream command <' + str(self.stream_code) + '> for component <' + 
+                             str(self.component_id) + '> is not callable.')
+        return command_func(*parameter_list, read_stdin=read_stdin, write_stdout=write_stdout)
+    
+    # Whether the component's tool can be started through get_command
+    def can_launch(self):
+        return (self.command_code != None) or (self.stream_code != None)
+    
+    # Get the command that runs the component's tool with parameter_list,
+    # without starting it. A component that only provides a stream command
+    # gets it with stdin and stdout not connected to other tools.
+    def get_command(self, parameter_list):
+        if self.command_code == None:
+            if self.stream_code == None:
+                raise ValueError('Component <' + str(self.component_id) + '> does not provide a command.')
+            return self.get_stream_command(parameter_list)
+        if not hasattr(parameter_list, '__iter__'):
+            parameter_list = [parameter_list]
+        command_func = self.get_resolved_function(self.command_code)
+        if not callable(command_func):
+            raise ValueError('Command <' + str(self.command_code) + '> for component <' + 
+                             str(self.component_id) + '> is not callable.')
+        return command_func(*parameter_list)
+    
     def static_params_pre(self):
         if self.static_params_pos == 'pre':
             return True
         else:
             return False
+    
+    # Split the values in a parameter list into the values of input 
+    # parameters and the values of output and inout parameters, based on the
+    # parameter metadata. Values beyond the declared parameters are inputs.
+    def split_parameter_values(self, parameter_list):
+        input_values = []
+        output_values = []
+        for index, value in enumerate(parameter_list):
+            if (index < len(self.parameters)) and (self.parameters[index].get_dir() != 'input'):
+                output_values.append(value)
+            else:
+                input_values.append(value)
+        return (input_values, output_values)
+    
+    # Get the names of the files written by the component when run with 
+    # parameter_list: the values of output and inout parameters, the side
+    # outputs and, if the result is provided, any files it refers to. 
+    # Files that are inputs of the run are left out, e.g. a reference 
+    # genome that a component returns unchanged, or passes as the value 
+    # of an inout parameter, was not written by it.
+    def get_output_files(self, parameter_list, result=None):
+        input_values, output_values = self.split_parameter_values(parameter_list)
+        output_files = find_files(output_values)
+        for index, template in self.side_outputs:
+            if (index < len(parameter_list)) and isinstance(parameter_list[index], basestring):
+                output_files.append(derive_filename(template, parameter_list[index]))
+        if result != None:
+            output_files.extend(find_files(result))
+        input_files = [os.path.realpath(path) for path in find_files(input_values)]
+        unique_files = []
+        for path in output_files:
+            if (path not in unique_files) and (os.path.realpath(path) not in input_files):
+                unique_files.append(path)
+        return unique_files
+    
+    # Get the value of the output parameter param from parameter_list, 
+    # deriving it from the value of another parameter if no value is 
+    # provided. index is the position of the parameter in parameter_list,
+    # or None for a return value. Returns None if there is no value.
+    def get_output_value(self, param, index, parameter_list):
+        value = None
+        if (index != None) and (index < len(parameter_list)):
+            value = parameter_list[index]
+        if (value == None) and (param.get_derive() != None):
+            source_index, template = param.get_derive()
+            if (source_index < len(parameter_list)) and isinstance(parameter_list[source_index], basestring):
+                value = derive_filename(template, parameter_list[source_index])
+        return value
+    
+    # If the files written by running the component with parameter_list
+    # all exist and are newer than its input files, build the result that
+    # the component's function would return. Returns a tuple of a boolean
+    # stating whether the outputs are up to date and the result. 
+    def get_up_to_date_result(self, parameter_list):
+        result = []
+        output_files = []
+        for param in self.return_data:
+            if param.get_derive() != None:
+                result.append(self.get_output_value(param, None, parameter_list))
+                output_files.append(result[-1])
+            elif param.ignore():
+                # Ignored return values are generally a command's exit status
+                if param.get_type() == 'int':
+                    result.append(0)
+                else:
+                    result.append(None)
+            else:
+                return (False, None)
+        for index, param in enumerate(self.parameters):
+            if (param.get_dir() == 'output') or (param.get_dir() == 'inout'):
+                result.append(self.get_output_value(param, index, parameter_list))
+                output_files.append(result[-1])
+        for index, template in self.side_outputs:
+            if (index >= len(parameter_list)) or not isinstance(parameter_list[index], basestring):
+                return (False, None)
+            output_files.append(derive_filename(template, parameter_list[index]))
+        
+        for path in output_files:
+            if not isinstance(path, basestring):
+                return (False, None)
+        input_values, output_values = self.split_parameter_values(parameter_list)
+        if not outputs_up_to_date(find_files(input_values), output_files):
+            return (False, None)
+        # The function returns its return value unwrapped when it is the
+        # only value, output parameter values are always returned in a 
+        # tuple, as process_result expects
+        if (len(result) == 1) and (len(self.return_data) == 1):
+            return (True, result[0])
+        return (True, tuple(result))
 
+    # Run the component with the provided parameters. If a result store
+    # is provided, the result is also stored to it. When tracing is enabled
+    # the run is recorded as a trace event.
     def run(self, parameter_list, result_store=None):
-        print 'Parameter list provided: <' + str(parameter_list) + '>\n\n'
+        if tracing.tracer != None:
+            with tracing.span(self.component_id, 'component', 
+                              args={'component_id': self.component_id, 'name': self.component_name}):
+                return self.execute(parameter_list, result_store)
+        return self.execute(parameter_list, result_store)
+    
+    def execute(self, parameter_list, result_store=None):
+        LOG.debug('Parameter list provided: <%s>', parameter_list)
         if not hasattr(parameter_list, '__iter__'):
                 parameter_list = [parameter_list]
                 
-        print 'Component to run: ' + self.component_name + ' - ' + str(len(parameter_list)) + ' parameters.\n'
+        LOG.debug('Component to run: %s - %s parameters.', self.component_name, len(parameter_list))
         
-        # Handle lookup of function code that we're going to run.
-        # Lookup uses the string providing the package and name of the function 
-        function_parts = self.component_code.rsplit('.',1)
-        func = None
-        if len(function_parts) == 2:
-            #mod = __import__(function_parts[0])
-            mod = importlib.import_module(function_parts[0])
-            sys.stdout.write('Got module ' + str(mod) + '\n')
-        else:
-            sys.stdout.write('ValueError: The provided component_name <' + str(function_parts) + '> is invalid, a fully qualified name must be specified.\n')
-            raise ValueError('The provided component_name <' + str(function_parts) + '> is invalid, a fully qualified name must be specified.')
-        func = getattr(mod, function_parts[1], None)
-        sys.stdout.write('Checking if function ' + str(func) + ' is callable...function parts: ' + str(function_parts) + '\n')
+        # Look up the function code that we're going to run. The function
+        # is resolved the first time the component is run and then cached.
+        func = self.get_function()
         if callable(func):
-            sys.stdout.write('Function is callable\n\n')
+            # Pass on the number of threads allocated to this run, if any
+            if self.threads_arg != None:
+                threads = get_context_value(ALLOCATED_THREADS_KEY)
+                if threads != None:
+                    func = functools.partial(func, **{self.threads_arg: threads})
             # Do any pre/post processing of function data here.
-            sys.stdout.write(threading.current_thread().getName() + ': About to run function...\n\n')
+            LOG.debug('%s: About to run function...', self.component_name)
             # TODO: Handle None inputs to parameter list? Received an earlier error about marshalling
             # values to unicode and thought this was because I was passing a None as a parameter. Check this.
             # Problem occurred when calling fastqplitter with None as a parameter. 
-            result = func(*parameter_list)
-            
-            # Turn off returning result as a tuple for now.
-            #if type(result) != type(tuple()):
-            #    result = (result,)
-            
-            result_length = 1
-            if hasattr(result,'__iter__'):
-                result_length = len(result)
-            print 'Function <' + self.get_name() + '> has completed and returned <' + str(result_length) + '> values.\n'
+            up_to_date = False
+            if get_skip_up_to_date():
+                up_to_date, result = self.get_up_to_date_result(parameter_list)
+                if up_to_date:
+                    LOG.info('Skipping component <%s>, its outputs are up to date.', self.component_id)
+            if not up_to_date:
+                result_cache = get_result_cache()
+                if (result_cache != None) and self.cacheable:
+                    result = result_cache.run(self, func, parameter_list)
+                else:
+                    result = func(*parameter_list)
             
-            # We now prepare a tuple to return. This contains all the parameters
-            # That are marked as outputs and not marked as being ignored.
-            # A list will be built and converted to a tuple
-            return_list = []
-            
-            # First check the function return value. This may be a single value or
-            # an iterable list. If its length is 1 we assume its just a single return value.
-            # If its greater than 1 we assume its wrapped in a list or tuple. We build a corresponding
-            # list that will end up as the first element of return_list
-            count = 0
-            if len(self.return_data) == 0:
-                # No value is returned so ignore return value
-                pass
-            elif len(self.return_data) == 1: 
-                if not self.return_data[0].ignore():
-                    # We're returning a single value, it may be wrapped in
-                    # a tuple or list or may be an unwrapped value
-                    if hasattr(result,'__iter__'):
-                        #return_list.append(result[0])
-                        return_list.append(result)
-                    else:
-                        return_list.append(result)
+            return self.process_result(result, result_store)
+    
+    # Build the value returned by run() from the result returned by the
+    # component's function, keeping the return values and output 
+    # parameters that are not ignored. If a result store is provided, the 
+    # value is also stored to it.
+    def process_result(self, result, result_store=None):
+        # Turn off returning result as a tuple for now.
+        #if type(result) != type(tuple()):
+        #    result = (result,)
+        
+        result_length = 1
+        if hasattr(result,'__iter__'):
+            result_length = len(result)
+        LOG.debug('Function <%s> has completed and returned <%s> values.', self.get_name(), result_length)
+        
+        # We now prepare a tuple to return. This contains all the parameters
+        # That are marked as outputs and not marked as being ignored.
+        # A list will be built and converted to a tuple
+        return_list = []
+        
+        # First check the function return value. This may be a single value or
+        # an iterable list. If its length is 1 we assume its just a single return value.
+        # If its greater than 1 we assume its wrapped in a list or tuple. We build a corresponding
+        # list that will end up as the first element of return_list
+        count = 0
+        if len(self.return_data) == 0:
+            # No value is returned so ignore return value
+            pass
+        elif len(self.return_data) == 1: 
+            if not self.return_data[0].ignore():
+                # We're returning a single value, it may be wrapped in
+                # a tuple or list or may be an unwrapped value
+                if hasattr(result,'__iter__'):
+                    #return_list.append(result[0])
+                    return_list.append(result)
+                else:
+                    return_list.append(result)
+            count = count + 1
+        else:
+            return_result_list = []
+            for value in self.return_data:
+                if not value.ignore():
+                    # TODO: Do we want to package up the main return value as a list
+                    # leading to the following line appending result[0][count]?
+                    return_result_list.append(result[count])
+                count = count + 1
+            return_list.append(return_result_list)
+        
+        # Now we go through the other parameters in turn, adding them to the 
+        # return list if they're marked as output and not marked to be ignored.
+        LOG.debug("Count is: %s, we're expecting the remaining return values in the result tuple.", count)
+        for value in self.parameters:
+            if (value.get_dir() == 'output') or (value.get_dir() == 'inout'):
+                if not value.ignore():
+                    return_list.append(result[count])
                 count = count + 1
-            else:
-                return_result_list = []
-                for value in self.return_data:
-                    if not value.ignore():
-                        # TODO: Do we want to package up the main return value as a list
-                        # leading to the following line appending result[0][count]?
-                        return_result_list.append(result[count])
-                    count = count + 1
-                return_list.append(return_result_list)
-            
-            # Now we go through the other parameters in turn, adding them to the 
-            # return list if they're marked as output and not marked to be ignored.
-            print 'Count is: ' + str(count) + ', we\'re expecting the remaining return values in the result tuple.'
-            for value in self.parameters:
-                if (value.get_dir() == 'output') or (value.get_dir() == 'inout'):
-                    if not value.ignore():
-                        return_list.append(result[count])
-                    count = count + 1
-            
-            # If we've been provided with a result store and an
-            # associated index, we store the result here, otherwise
-            # we return the result. result_store[0] is the list for results to
-            # be stored to, result_store[1] is the index at which to store the result  
-            if result_store != None:
-                print 'Storing result <' + str(return_list) + '> to result store index ' + str(result_store[1])
-                print 'Result array: ' + str(result_store[0])
-                if len(return_list) == 1:
-                    print 'Storing single value to result store for function <' + self.get_name() + '>.'
-                    result_store[0][result_store[1]] = return_list[0]
-                elif len(return_list) > 1:
-                    print 'Storing <' + str(len(return_list)) + '> values from function <' + self.get_name() + '> to result store.'
-                    result_store[0][result_store[1]] = tuple(return_list)
-                #else:
-                #   result_store[0][result_store[1]] = result
         
+        # If we've been provided with a result store and an
+        # associated index, we store the result here, otherwise
+        # we return the result. result_store[0] is the list for results to
+        # be stored to, result_store[1] is the index at which to store the result  
+        if result_store != None:
+            LOG.debug('Storing result <%s> to result store index %s', return_list, result_store[1])
+            LOG.log(TRACE, 'Result array: %s', result_store[0])
             if len(return_list) == 1:
-                print 'Returning a single value from function <' + self.get_name() + '>.'
-                return return_list[0]
+                LOG.debug('Storing single value to result store for function <%s>.', self.get_name())
+                result_store[0][result_store[1]] = return_list[0]
             elif len(return_list) > 1:
-                print 'Returning <' + str(len(return_list)) + '> values from function <' + self.get_name() + '>.'
-                return tuple(return_list)
-            else:
-                print 'Nothing to return from function <' + self.get_name() + '>.'
+                LOG.debug('Storing <%s> values from function <%s> to result store.', len(return_list), self.get_name())
+                result_store[0][result_store[1]] = tuple(return_list)
+            #else:
+            #   result_store[0][result_store[1]] = result
+    
+        if len(return_list) == 1:
+            LOG.debug('Returning a single value from function <%s>.', self.get_name())
+            return return_list[0]
+        elif len(return_list) > 1:
+            LOG.debug('Returning <%s> values from function <%s>.', len(return_list), self.get_name())
+            return tuple(return_list)
+        else:
+            LOG.debug('Nothing to return from function <%s>.', self.get_name())
         
 class ComponentList():
     '''
@@ -226,7 +505,7 @@ class ComponentList():
         '''
         Constructor
         '''
-        print 'Creating a new coordination forms component list with ' + len(component_list) + ' components...'
+        LOG.debug('Creating a new coordination forms component list with %s components...', len(component_list))
         
         for comp in component_list:
             self.component_list.append(comp)
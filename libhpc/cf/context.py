@@ -0,0 +1,98 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import threading
+
+# Execution context for coordination forms. The context is a dictionary of
+# values, such as the nesting path used for tracing, that is associated
+# with the running thread. Coordination forms capture the context when they
+# create tasks and bind it in the thread or process that runs the task so
+# that values set around an expression apply to all of its tasks.
+#
+# A context dictionary must not be modified once it has been bound, new
+# values are added by binding a modified copy.
+
+# The context key holding the identifier of the PAR task being run
+PAR_TASK_ID_KEY = 'par_task_id'
+# The context key holding the number of CPUs allocated to the task being
+# run by a resource-aware scheduler, see libhpc.cf.resources
+ALLOCATED_THREADS_KEY = 'allocated_threads'
+
+_local = threading.local()
+_empty_context = {}
+
+def get_context():
+    return getattr(_local, 'context', _empty_context)
+
+def get_context_value(key, default=None):
+    return get_context().get(key, default)
+
+class ContextBinding():
+    '''
+    Binds a context to the current thread for the duration of a with 
+    block, restoring the previous context on exit.
+    '''
+    
+    def __init__(self, context):
+        '''
+        Constructor
+        '''
+        self.context = context
+        self.previous = None
+    
+    def __enter__(self):
+        self.previous = get_context()
+        _local.context = self.context
+        return self.context
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.context = self.previous
+        return False
+
+# Bind the given context dictionary, e.g. one captured by get_context()
+# in another thread.
+def bind_context(context):
+    return ContextBinding(context)
+
+# Bind a copy of the current context with the given values added.
+def bind_values(**values):
+    context = dict(get_context())
+    context.update(values)
+    return ContextBinding(context)
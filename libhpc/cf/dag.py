@@ -0,0 +1,493 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import sys
+import time
+import heapq
+import logging
+import threading
+
+from component import Component
+from context import bind_context, get_context, PAR_TASK_ID_KEY, ALLOCATED_THREADS_KEY
+from resources import get_resource_request
+from pool import get_pool, get_default_pool_size, check_pool_size
+import forms
+from libhpc.wrapper.toolchain import get_tools_context
+
+LOG = logging.getLogger(__name__)
+
+# Compilation of coordination forms expressions into task graphs. When an
+# expression is run by calling it, each form runs its elements through 
+# recursive calls: a PIPE runs its stages strictly in turn and a PAR waits
+# for all of its tasks to complete before returning. Independent work in
+# different parts of an expression therefore cannot overlap.
+#
+# compile_expression() lowers an expression built from PIPE, PAR, BYPASS,
+# APPEND, SPLIT and FILTER into a graph of nodes, each of which runs a 
+# component or applies the parameter handling ("glue") of a form to the
+# values of the nodes it depends on. Each node is run as soon as the 
+# nodes it depends on have completed. Where a form selects elements of a
+# PAR's output, e.g. a FILTER or a PAR task taking the corresponding 
+# element of its input, the node depends only on the selected task rather
+# than the whole PAR. Ready nodes are run in order of their upward rank, 
+# the estimated time of the longest path from the node to the end of the
+# graph, so that work on the critical path is started first. Component
+# run times are estimated from previous runs in the process.
+#
+# Forms created with an explicit runner or a checkpoint file and any 
+# other callables are run as single nodes using their own implementation.
+
+# Placeholder input for an expression that is called without parameters
+# and so uses the parameters bound to it.
+_BOUND_PARAMS = object()
+
+# Estimated run time, in seconds, for components that have not yet been
+# run in this process, relative to glue nodes which are estimated as free.
+DEFAULT_COMPONENT_COST = 1.0
+
+# Mean run time of each component, keyed by component id
+_component_times = {}
+_component_times_lock = threading.Lock()
+
+def estimate_component_cost(component):
+    with _component_times_lock:
+        if component.get_id() in _component_times:
+            return _component_times[component.get_id()][0]
+    return DEFAULT_COMPONENT_COST
+
+def record_component_time(component, duration):
+    with _component_times_lock:
+        mean, count = _component_times.get(component.get_id(), (0.0, 0))
+        _component_times[component.get_id()] = ((mean * count + duration) / (count + 1), count + 1)
+
+class TaskNode():
+    '''
+    A node of a task graph. The value of the node is the result of 
+    calling its function with the values of the nodes it depends on. For
+    a component node, the function returns the component's parameters.
+    '''
+    
+    def __init__(self, index, kind, name, func, dependencies, context=None, component=None):
+        '''
+        Constructor
+        '''
+        self.index = index
+        # One of 'input', 'glue', 'select', 'gather', 'component' or 'form'
+        self.kind = kind
+        self.name = name
+        self.func = func
+        self.dependencies = dependencies
+        self.context = context
+        self.component = component
+        self.successors = []
+        self.cost = 0.0
+        if component != None:
+            self.cost = estimate_component_cost(component)
+        elif kind == 'form':
+            self.cost = DEFAULT_COMPONENT_COST
+        self.rank = self.cost
+        self.value = None
+    
+    # Evaluate the node. If the node was allocated CPUs by a resource pool,
+    # allocated_threads is the number allocated. Components are run with 
+    # executor, a function taking the component and its parameters, if one
+    # is provided.
+    def evaluate(self, allocated_threads=None, executor=None):
+        values = [dependency.value for dependency in self.dependencies]
+        if self.context == None:
+            return self.func(*values)
+        context = self.context
+        if allocated_threads != None:
+            context = dict(context)
+            context[ALLOCATED_THREADS_KEY] = allocated_threads
+        with bind_context(context):
+            if self.component == None:
+                return self.func(*values)
+            start_time = time.time()
+            if executor != None:
+                value = executor(self.component, self.func(*values))
+            else:
+                value = self.component.run(self.func(*values))
+            record_component_time(self.component, time.time() - start_time)
+            return value
+    
+    def __repr__(self):
+        return '<TaskNode ' + str(self.index) + ' ' + self.kind + ' ' + str(self.name) + '>'
+
+class TaskGraph():
+    '''
+    A graph of tasks compiled from a coordination forms expression.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.nodes = []
+        self.output = None
+    
+    def add_node(self, kind, name, func, dependencies=None, context=None, component=None):
+        if dependencies == None:
+            dependencies = []
+        node = TaskNode(len(self.nodes), kind, name, func, dependencies, context, component)
+        for dependency in dependencies:
+            dependency.successors.append(node)
+        self.nodes.append(node)
+        return node
+    
+    # Compute the upward rank of each node. Nodes are always added after
+    # the nodes they depend on so the node list is in topological order.
+    def compute_ranks(self):
+        for node in reversed(self.nodes):
+            successor_rank = 0.0
+            for successor in node.successors:
+                successor_rank = max(successor_rank, successor.rank)
+            node.rank = node.cost + successor_rank
+    
+    # Return the list of nodes on the critical path of the graph, the path
+    # with the highest estimated run time.
+    def get_critical_path(self):
+        self.compute_ranks()
+        path = []
+        candidates = [node for node in self.nodes if len(node.dependencies) == 0]
+        while len(candidates) > 0:
+            node = max(candidates, key=lambda candidate: (candidate.rank, -candidate.index))
+            path.append(node)
+            candidates = node.successors
+        return path
+    
+    # Run the graph using pool_size threads and return the value of its
+    # output node. If a node raises an exception, no further nodes are
+    # started and the exception is re-raised once running nodes finish.
+    # If a resources.ResourcePool is provided, component nodes are only
+    # started once the resources they need are free in the pool. If an
+    # executor is provided, e.g. distributed.Coordinator.run_component, 
+    # it is called with each component and its parameters to run it.
+    def run(self, pool_size=None, resource_pool=None, executor=None):
+        if pool_size == None:
+            pool_size = get_default_pool_size()
+        check_pool_size(pool_size)
+        self.compute_ranks()
+        LOG.debug('Running task graph of %s nodes with %s threads.', len(self.nodes), pool_size)
+        
+        state = _GraphRun(self, resource_pool, executor)
+        get_pool(pool_size).map(state.work, range(pool_size))
+        if state.exc_info != None:
+            raise state.exc_info[0], state.exc_info[1], state.exc_info[2]
+        return self.output.value
+
+class _GraphRun():
+    '''
+    The state of a single run of a task graph, shared by the threads 
+    running its nodes.
+    '''
+    
+    def __init__(self, graph, resource_pool=None, executor=None):
+        self.resource_pool = resource_pool
+        self.executor = executor
+        # With a resource pool, the pool's condition is used so that 
+        # workers waiting for resources are woken when they are released
+        if resource_pool != None:
+            self.condition = resource_pool.condition
+        else:
+            self.condition = threading.Condition()
+        self.ready = []
+        self.pending = {}
+        self.remaining = len(graph.nodes)
+        self.exc_info = None
+        for node in graph.nodes:
+            self.pending[node.index] = len(node.dependencies)
+            if len(node.dependencies) == 0:
+                self.push(node)
+    
+    def push(self, node):
+        heapq.heappush(self.ready, (-node.rank, node.index, node))
+    
+    # Take the ready node with the highest rank, or with a resource pool
+    # the highest ranked node whose resources are free. Returns a tuple of
+    # the node and its allocation, or None if no node can be started.
+    def claim(self):
+        if len(self.ready) == 0:
+            return None
+        if self.resource_pool == None:
+            return (heapq.heappop(self.ready)[2], None)
+        for entry in sorted(self.ready):
+            node = entry[2]
+            allocation = None
+            if node.component != None:
+                allocation = self.resource_pool.try_acquire(get_resource_request(node.component), len(self.ready))
+                if allocation == None:
+                    continue
+            self.ready.remove(entry)
+            heapq.heapify(self.ready)
+            return (node, allocation)
+        return None
+    
+    # Run ready nodes until the graph completes or a node fails
+    def work(self, worker_index):
+        while True:
+            with self.condition:
+                claimed = None
+                while (self.remaining > 0) and (self.exc_info == None):
+                    claimed = self.claim()
+                    if claimed != None:
+                        break
+                    self.condition.wait()
+                if (self.remaining == 0) or (self.exc_info != None):
+                    return
+                node, allocation = claimed
+            try:
+                if allocation != None:
+                    node.value = node.evaluate(allocation.cpus, self.executor)
+                else:
+                    node.value = node.evaluate(executor=self.executor)
+            except:
+                with self.condition:
+                    if self.exc_info == None:
+                        self.exc_info = sys.exc_info()
+                    self.condition.notify_all()
+                return
+            finally:
+                if allocation != None:
+                    self.resource_pool.release(allocation)
+            with self.condition:
+                self.remaining = self.remaining - 1
+                for successor in node.successors:
+                    self.pending[successor.index] = self.pending[successor.index] - 1
+                    if self.pending[successor.index] == 0:
+                        self.push(successor)
+                self.condition.notify_all()
+
+def _call_form(expression, value):
+    if value is _BOUND_PARAMS:
+        return expression()
+    return expression(value)
+
+# Run the component of a BYPASS or APPEND, checking its input as the
+# form does
+def _check_input(component, input):
+    forms.check_input_count(component, len(input))
+    return input
+
+# The conversion applied by a PIPE to the input of a nested form
+def _pipe_form_input(value):
+    if (type(value) != type(list())) and (value != None):
+        if type(value) == type(""):
+            return [value]
+        return list(value)
+    return value
+
+class ExpressionCompiler():
+    '''
+    Lowers a coordination forms expression into a TaskGraph.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.graph = TaskGraph()
+    
+    def compile(self, expression, input=_BOUND_PARAMS):
+        input_node = self.graph.add_node('input', 'input', lambda: input)
+        self.graph.output = self.lower(expression, input_node, get_context())
+        return self.graph
+    
+    def is_bound(self, node):
+        return (node.kind == 'input') and (node.func() is _BOUND_PARAMS)
+    
+    def glue(self, name, func, dependencies, context):
+        return self.graph.add_node('glue', name, func, dependencies, context)
+    
+    # Get a node whose value is a tuple stating whether element index of 
+    # the value of node is available and the element. Elements of the
+    # output of a PAR are taken directly from the PAR's task.
+    def select(self, node, index, context):
+        if (node.kind == 'gather') and (index < len(node.dependencies)):
+            return self.graph.add_node('select', 'select[' + str(index) + ']', 
+                                       lambda value: (True, value), [node.dependencies[index]], context)
+        def select_element(value):
+            if value == None:
+                return (False, None)
+            return (True, value[index])
+        return self.graph.add_node('select', 'select[' + str(index) + ']', select_element, [node], context)
+    
+    def gather(self, nodes, context):
+        return self.graph.add_node('gather', 'gather', lambda *values: list(values), nodes, context)
+    
+    # Lower an expression that is run with the value of input_node and
+    # return the node giving its output.
+    def lower(self, expression, input_node, context):
+        form = getattr(expression, 'cf_form', None)
+        options = getattr(expression, 'cf_options', {})
+        if (form == 'PIPE') and (options.get('runner') == None) and (options.get('checkpoint') == None):
+            return self.lower_pipe(expression, input_node, context)
+        if (form == 'PAR') and (options.get('runner') == None) and not options.get('stream'):
+            return self.lower_par(expression, input_node, context)
+        if form in ['BYPASS', 'APPEND']:
+            return self.lower_bypass_append(expression, form, input_node, context)
+        if form == 'TOOLS':
+            return self.lower_tools(expression, input_node, context)
+        if (form == 'FILTER') and not self.is_bound(input_node):
+            selection_indices = expression.cf_params[0]
+            if (input_node.kind == 'gather') and (type(selection_indices) == type([])) and \
+                    (len(selection_indices) > 0) and (max(selection_indices) < len(input_node.dependencies)):
+                LOG.debug('Selecting elements %s of PAR output directly.', selection_indices)
+                return self.gather([input_node.dependencies[index] for index in selection_indices], context)
+        if form in ['SPLIT', 'FILTER']:
+            return self.glue(form, lambda value: _call_form(expression, value), [input_node], context)
+        if not callable(expression):
+            raise ValueError('Unable to compile an element of type <' + str(type(expression)) + \
+                '>, expected a coordination form or a component.')
+        name = form
+        if name == None:
+            name = getattr(expression, '__name__', repr(expression))
+        return self.graph.add_node('form', name, lambda value: _call_form(expression, value), 
+                                   [input_node], context)
+    
+    def lower_pipe(self, expression, input_node, context):
+        function_list = expression.cf_elements
+        node = input_node
+        if self.is_bound(input_node):
+            initial_param_list = expression.cf_params
+            node = self.graph.add_node('input', 'PIPE input', lambda: initial_param_list)
+        position = 0
+        for func_element in reversed(function_list):
+            stage = forms.PipeStage(func_element, position, len(function_list))
+            # The output of a PAR is passed unchanged to a following nested
+            # form without static parameters, so the nested form can select
+            # from the PAR's tasks directly.
+            pass_through = (node.kind == 'gather') and (position > 0) and (stage.new_params == None)
+            if not pass_through:
+                node = self.glue('PIPE[' + str(position) + ']', stage.prepare, [node], context)
+            if isinstance(stage.func, Component):
+                node = self.graph.add_node('component', stage.func.get_id(), stage.get_component_input, 
+                                           [node], context, stage.func)
+            else:
+                if not pass_through:
+                    node = self.glue('PIPE[' + str(position) + '] input', _pipe_form_input, [node], context)
+                node = self.lower(stage.func, node, context)
+            position = position + 1
+        return node
+    
+    def lower_par(self, expression, input_node, context):
+        function_list = expression.cf_elements
+        param_list = expression.cf_params
+        bound = self.is_bound(input_node) or ((input_node.kind == 'input') and (input_node.func() == None))
+        task_nodes = []
+        for count in range(len(function_list)):
+            func_element = function_list[count]
+            func, static_params = forms.get_element_function(func_element, 'PAR')
+            task_context = dict(context)
+            task_context[PAR_TASK_ID_KEY] = count
+            
+            if bound:
+                prepare = self.glue('PAR[' + str(count) + ']', 
+                    lambda func_element=func_element, count=count: forms.prepare_par_task(func_element, count, param_list), 
+                    [], task_context)
+            else:
+                base_param = self.select(input_node, count, task_context)
+                prepare = self.glue('PAR[' + str(count) + ']', 
+                    lambda selected, func_element=func_element, count=count: 
+                        forms.prepare_par_task(func_element, count, param_list, selected[1], selected[0]),
+                    [base_param], task_context)
+            
+            if isinstance(func, Component):
+                task_nodes.append(self.graph.add_node('component', func.get_id(), 
+                    lambda task: task[1], [prepare], task_context, func))
+            else:
+                params = self.glue('PAR[' + str(count) + '] input', lambda task: task[1], [prepare], task_context)
+                task_nodes.append(self.lower(func, params, task_context))
+        return self.gather(task_nodes, context)
+    
+    def lower_bypass_append(self, expression, form, input_node, context):
+        func, new_params = forms.get_element_function(expression.cf_elements[0], form)
+        if (new_params != None) and (form == 'BYPASS'):
+            new_params = forms.process_param_tags(new_params, 0)
+        
+        if self.is_bound(input_node):
+            params = expression.cf_params
+            input_node = self.graph.add_node('input', form + ' input', lambda: params)
+        prepare = self.glue(form, lambda param_list: forms.add_static_params(func, param_list, new_params), 
+                            [input_node], context)
+        if isinstance(func, Component):
+            output = self.graph.add_node('component', func.get_id(), 
+                lambda input: _check_input(func, input), [prepare], context, func)
+        else:
+            output = self.lower(func, prepare, context)
+        
+        # The output of a BYPASS is its input, once its function has run
+        if form == 'BYPASS':
+            return self.glue(form + ' output', lambda param_list, result: param_list, [input_node, output], context)
+        return self.glue(form + ' output', forms.append_output, [prepare, output], context)
+
+    # The nodes of the expression run by a TOOLS are run with its tool 
+    # locations added to their context.
+    def lower_tools(self, expression, input_node, context):
+        func = expression.cf_elements[0]
+        tools_context = get_tools_context(context, expression.cf_options['tools'])
+        if self.is_bound(input_node) and (expression.cf_params != None):
+            params = expression.cf_params
+            input_node = self.graph.add_node('input', 'TOOLS input', lambda: params)
+        if isinstance(func, Component):
+            return self.graph.add_node('component', func.get_id(), lambda input: input, 
+                                       [input_node], tools_context, func)
+        return self.lower(func, input_node, tools_context)
+
+# Compile a coordination forms expression into a TaskGraph. If input is
+# provided, the graph runs the expression with this input, otherwise it
+# runs the expression with the parameters bound to it, as when calling
+# the expression without parameters.
+def compile_expression(expression, input=_BOUND_PARAMS):
+    return ExpressionCompiler().compile(expression, input)
+
+# Return a function that runs a coordination forms expression by 
+# compiling it into a task graph and running the graph with pool_size
+# threads. The function is called in the same way as the expression.
+# If a resource pool is provided, e.g. resources.get_resource_pool(), 
+# components are packed onto the pool's resources, see TaskGraph.run.
+# Components are run with executor if one is provided, e.g. to run them
+# on the workers of a distributed.Coordinator.
+def schedule(expression, pool_size=None, resource_pool=None, executor=None):
+    if pool_size != None:
+        check_pool_size(pool_size)
+    def scheduled_implementation(input=_BOUND_PARAMS):
+        return compile_expression(expression, input).run(pool_size, resource_pool, executor)
+    return scheduled_implementation
@@ -0,0 +1,574 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import sys
+import time
+import socket
+import logging
+import cPickle
+import threading
+import traceback
+import subprocess
+import collections
+from multiprocessing.connection import Listener, Client
+
+from component import Component
+from context import get_context
+from futures import Future, FutureList
+from pool import get_pool
+from runners import register_cf_runner, register_cf_submitter, run_par_task, run_par_task_in_process
+import tracing
+
+LOG = logging.getLogger(__name__)
+
+# Running the component tasks of coordination forms on several machines.
+# A Coordinator, run by the process evaluating an expression, listens for
+# TCP connections from worker daemons (see libhpc.tools.cf_worker) on 
+# each node. Each worker registers the number of tasks it can run at once
+# (its slots) and the coordinator sends it tasks, a component.Component, 
+# its parameters and context, as slots become free. The 'distributed' PAR
+# runner sends the component tasks of a PAR to the coordinator, and a 
+# task graph can send its component nodes using Coordinator.run_component 
+# (see dag.schedule).
+#
+# Workers send a heartbeat every HEARTBEAT_INTERVAL seconds. A worker 
+# that is not heard from within the coordinator's heartbeat timeout, or 
+# whose connection is lost, is removed and the tasks it was running are 
+# sent to other workers, up to max_attempts times in total for a task.
+# If no workers are connected for no_worker_timeout seconds while tasks 
+# are waiting, the waiting tasks fail. Tasks that have not completed when
+# the coordinator is closed also fail.
+#
+# Connections are authenticated with a shared key, from the 
+# LIBHPC_CF_AUTHKEY environment variable or generated by the coordinator.
+# Tasks and results are sent as pickles so the key should only be shared
+# with trusted workers. Workers must be able to import the functions of
+# the components they run.
+#
+# Messages are tuples. A worker sends ('register', name, slots) when it
+# connects, then ('heartbeat',), ('result', task_id, result) and 
+# ('error', task_id, exception, traceback_text). The coordinator sends 
+# ('run', task_id, pickled_task) and ('shutdown',).
+
+COORDINATOR_ENV_VAR = 'LIBHPC_CF_COORDINATOR'
+AUTHKEY_ENV_VAR = 'LIBHPC_CF_AUTHKEY'
+
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_TIMEOUT = 10.0
+MAX_ATTEMPTS = 3
+NO_WORKER_TIMEOUT = 300.0
+# The time a worker keeps trying to connect to a coordinator that is not
+# yet listening
+CONNECT_TIMEOUT = 30.0
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+# Parse an address of the form host:port
+def parse_address(address):
+    if isinstance(address, tuple):
+        return address
+    host, separator, port = address.rpartition(':')
+    if (separator == '') or (not port.isdigit()):
+        raise ValueError('Expected an address of the form host:port, got <' + str(address) + '>')
+    return (host, int(port))
+
+def format_address(address):
+    return address[0] + ':' + str(address[1])
+
+def get_authkey(authkey=None):
+    if authkey == None:
+        authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    return authkey
+
+class _RemoteTask():
+    '''
+    A task sent, or waiting to be sent, to a worker.
+    '''
+    
+    def __init__(self, task_id, payload):
+        '''
+        Constructor
+        '''
+        self.task_id = task_id
+        self.payload = payload
+        self.attempts = 0
+        self.future = Future()
+        # When the task was last queued to be sent to a worker
+        self.queued_time = time.time()
+
+class _RemoteWorker():
+    '''
+    The coordinator's connection to a registered worker.
+    '''
+    
+    def __init__(self, name, slots, connection):
+        '''
+        Constructor
+        '''
+        self.name = name
+        self.slots = slots
+        self.connection = connection
+        self.running = {}
+        self.send_lock = threading.Lock()
+    
+    def get_free_slots(self):
+        return self.slots - len(self.running)
+    
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+    
+    def close(self):
+        try:
+            self.connection.close()
+        except (IOError, OSError):
+            pass
+
+class Coordinator():
+    '''
+    Accepts connections from worker daemons and runs tasks on them. 
+    address is the (host, port) to listen on, port 0 selects a free port;
+    the address in use is available as the address attribute. Tasks fail
+    if no workers are connected for no_worker_timeout seconds while they
+    wait, or never if it is None.
+    '''
+    
+    def __init__(self, address=('localhost', 0), authkey=None, heartbeat_timeout=HEARTBEAT_TIMEOUT, 
+                 max_attempts=MAX_ATTEMPTS, no_worker_timeout=NO_WORKER_TIMEOUT):
+        '''
+        Constructor
+        '''
+        authkey = get_authkey(authkey)
+        if authkey == None:
+            authkey = os.urandom(16).encode('hex')
+        self.authkey = authkey
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.no_worker_timeout = no_worker_timeout
+        self.listener = Listener(parse_address(address), authkey=authkey)
+        self.address = self.listener.address
+        self.condition = threading.Condition()
+        self.workers = {}
+        self.pending = collections.deque()
+        self.next_task_id = 0
+        self.closed = False
+        # When the last worker was lost, or the coordinator started
+        self.no_workers_time = time.time()
+        self.threads = [threading.Thread(target=self.accept_workers, name='libhpc-coordinator')]
+        if no_worker_timeout != None:
+            self.threads.append(threading.Thread(target=self.monitor_workers, name='libhpc-coordinator-monitor'))
+        for coordinator_thread in self.threads:
+            coordinator_thread.daemon = True
+            coordinator_thread.start()
+        LOG.info('Coordinator listening on %s', format_address(self.address))
+    
+    def accept_workers(self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception, e:
+                if self.closed:
+                    return
+                LOG.warning('Rejected a worker connection: %s', e)
+                continue
+            worker_thread = threading.Thread(target=self.serve_worker, args=(connection,), 
+                                             name='libhpc-coordinator-worker')
+            worker_thread.daemon = True
+            worker_thread.start()
+    
+    # Register a worker and handle its messages until it is lost
+    def serve_worker(self, connection):
+        try:
+            if not connection.poll(self.heartbeat_timeout):
+                raise EOFError('no registration received')
+            message = connection.recv()
+            if (type(message) != type(tuple())) or (len(message) != 3) or (message[0] != 'register'):
+                raise EOFError('unexpected registration message <' + repr(message)[:80] + '>')
+        except (EOFError, IOError), e:
+            LOG.warning('Worker failed to register: %s', e)
+            connection.close()
+            return
+        
+        with self.condition:
+            name = str(message[1])
+            while name in self.workers:
+                name = name + "'"
+            worker = _RemoteWorker(name, max(1, int(message[2])), connection)
+            self.workers[name] = worker
+            self.no_workers_time = None
+            self.condition.notify_all()
+        LOG.info('Worker <%s> registered with %s slots.', worker.name, worker.slots)
+        self.dispatch()
+        
+        try:
+            # Any message from the worker shows that it is still alive
+            while connection.poll(self.heartbeat_timeout):
+                message = connection.recv()
+                if message[0] == 'result':
+                    self.complete(worker, message[1], message[2])
+                elif message[0] == 'error':
+                    LOG.error('Task %s failed on worker <%s>:\n%s', message[1], worker.name, message[3])
+                    self.complete(worker, message[1], None, (type(message[2]), message[2], None))
+            LOG.warning('Worker <%s> missed its heartbeat.', worker.name)
+        except (EOFError, IOError), e:
+            if not self.closed:
+                LOG.warning('Lost the connection to worker <%s>: %s', worker.name, e)
+        self.remove_worker(worker)
+    
+    # Remove a lost worker, sending the tasks it was running to other 
+    # workers unless they have been tried max_attempts times.
+    def remove_worker(self, worker):
+        failed = []
+        with self.condition:
+            if self.workers.get(worker.name) is worker:
+                del self.workers[worker.name]
+                if len(self.workers) == 0:
+                    self.no_workers_time = time.time()
+            lost_tasks = sorted(worker.running.values(), key=lambda task: task.task_id, reverse=True)
+            worker.running = {}
+            for task in lost_tasks:
+                if (task.attempts >= self.max_attempts) or self.closed:
+                    failed.append(task)
+                else:
+                    task.queued_time = time.time()
+                    self.pending.appendleft(task)
+            self.condition.notify_all()
+        worker.close()
+        for task in failed:
+            fail_task(task, 'Task ' + str(task.task_id) + ' was lost by ' + str(task.attempts) + \
+                ' workers, the last was <' + worker.name + '>.')
+        if len(lost_tasks) > len(failed):
+            LOG.warning('Re-dispatching %s tasks from worker <%s>.', len(lost_tasks) - len(failed), worker.name)
+        self.dispatch()
+    
+    # Send pending tasks to the workers with free slots
+    def dispatch(self):
+        sends = []
+        with self.condition:
+            while len(self.pending) > 0:
+                workers = [worker for worker in self.workers.values() if worker.get_free_slots() > 0]
+                if len(workers) == 0:
+                    break
+                worker = max(workers, key=lambda worker: worker.get_free_slots())
+                task = self.pending.popleft()
+                task.attempts = task.attempts + 1
+                worker.running[task.task_id] = task
+                sends.append((worker, task))
+        for worker, task in sends:
+            try:
+                worker.send(('run', task.task_id, task.payload))
+            except (IOError, OSError, ValueError), e:
+                # The worker's connection is closed so that its tasks are
+                # re-dispatched once serve_worker notices
+                LOG.warning('Unable to send task %s to worker <%s>: %s', task.task_id, worker.name, e)
+                worker.close()
+    
+    def complete(self, worker, task_id, value, exc_info=None):
+        with self.condition:
+            task = worker.running.pop(task_id, None)
+        if task != None:
+            if exc_info != None:
+                task.future.set_exc_info(exc_info)
+            else:
+                result, task_trace = value
+                active_tracer = tracing.tracer
+                if (task_trace != None) and (active_tracer != None):
+                    active_tracer.add_events(task_trace[0], task_trace[1])
+                task.future.set_result(result)
+        self.dispatch()
+    
+    # Fail the waiting tasks once no workers have been connected for 
+    # no_worker_timeout seconds since the later of the last worker being 
+    # lost and the task being queued.
+    def monitor_workers(self):
+        while True:
+            failed = []
+            with self.condition:
+                if self.closed:
+                    return
+                if (len(self.workers) == 0) and (len(self.pending) > 0):
+                    now = time.time()
+                    for task in list(self.pending):
+                        if now - max(task.queued_time, self.no_workers_time) >= self.no_worker_timeout:
+                            self.pending.remove(task)
+                            failed.append(task)
+                self.condition.wait(min(1.0, self.no_worker_timeout / 4.0))
+            for task in failed:
+                fail_task(task, 'Task ' + str(task.task_id) + ' failed, no workers were connected for ' + \
+                    str(self.no_worker_timeout) + ' seconds.')
+    
+    # Send a PAR task, a tuple of a component.Component, its parameters 
+    # and context, to be run by a worker, returning a futures.Future for 
+    # its result. The task is pickled when it is submitted so that 
+    # parameters that can't be sent are reported here.
+    def submit(self, task):
+        payload = cPickle.dumps(task, cPickle.HIGHEST_PROTOCOL)
+        with self.condition:
+            if self.closed:
+                raise ValueError('The coordinator at ' + format_address(self.address) + ' has been closed.')
+            remote_task = _RemoteTask(self.next_task_id, payload)
+            self.next_task_id = self.next_task_id + 1
+            self.pending.append(remote_task)
+        self.dispatch()
+        return remote_task.future
+    
+    # Run a component on a worker with the current context and return its
+    # result
+    def run_component(self, component, parameter_list):
+        return self.submit((component, parameter_list, get_context())).result()
+    
+    def get_worker_names(self):
+        with self.condition:
+            return sorted(self.workers.keys())
+    
+    def get_slots(self):
+        with self.condition:
+            return sum([worker.slots for worker in self.workers.values()])
+    
+    # Wait until at least count workers have registered, returning False 
+    # if the timeout expires first.
+    def wait_for_workers(self, count, timeout=None):
+        deadline = None
+        if timeout != None:
+            deadline = time.time() + timeout
+        with self.condition:
+            while len(self.workers) < count:
+                if deadline == None:
+                    self.condition.wait(1.0)
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+    
+    # Stop accepting workers, ask the registered workers to exit and fail
+    # the tasks that have not completed
+    def close(self):
+        with self.condition:
+            self.closed = True
+            workers = self.workers.values()
+            unfinished = list(self.pending)
+            self.pending.clear()
+            for worker in workers:
+                unfinished.extend(worker.running.values())
+                worker.running = {}
+            self.condition.notify_all()
+        for task in unfinished:
+            fail_task(task, 'The coordinator at ' + format_address(self.address) + \
+                ' was closed before task ' + str(task.task_id) + ' completed.')
+        for worker in workers:
+            try:
+                worker.send(('shutdown',))
+            except (IOError, OSError, ValueError):
+                pass
+            worker.close()
+        self.listener.close()
+        # Wake the accepting thread
+        try:
+            socket.create_connection(self.address, 1.0).close()
+        except socket.error:
+            pass
+        for coordinator_thread in self.threads:
+            coordinator_thread.join(1.0)
+
+def fail_task(task, message):
+    try:
+        raise RuntimeError(message)
+    except RuntimeError:
+        task.future.set_exc_info(sys.exc_info())
+
+# Start the process' coordinator listening on address, host:port or a 
+# (host, port) tuple.
+def start_coordinator(address=('localhost', 0), authkey=None, heartbeat_timeout=HEARTBEAT_TIMEOUT, 
+                      max_attempts=MAX_ATTEMPTS, no_worker_timeout=NO_WORKER_TIMEOUT):
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator != None:
+            raise ValueError('A coordinator is already listening on ' + format_address(_coordinator.address))
+        _coordinator = Coordinator(address, authkey, heartbeat_timeout, max_attempts, no_worker_timeout)
+        return _coordinator
+
+def stop_coordinator():
+    global _coordinator
+    with _coordinator_lock:
+        coordinator = _coordinator
+        _coordinator = None
+    if coordinator != None:
+        coordinator.close()
+
+# Get the process' coordinator. If none has been started, one is started
+# on the address in the LIBHPC_CF_COORDINATOR environment variable.
+def get_coordinator():
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator == None:
+            if not os.environ.get(COORDINATOR_ENV_VAR):
+                raise ValueError('No coordinator has been started, use start_coordinator() or set the ' + \
+                    COORDINATOR_ENV_VAR + ' environment variable to the host:port to listen on.')
+            _coordinator = Coordinator(os.environ[COORDINATOR_ENV_VAR])
+        return _coordinator
+
+class Worker():
+    '''
+    A worker daemon that connects to the coordinator at address and runs 
+    up to slots tasks at once until the coordinator shuts it down or the 
+    connection is lost.
+    '''
+    
+    def __init__(self, address, authkey=None, slots=1, name=None, heartbeat_interval=HEARTBEAT_INTERVAL):
+        '''
+        Constructor
+        '''
+        self.address = parse_address(address)
+        self.authkey = get_authkey(authkey)
+        if self.authkey == None:
+            raise ValueError('The key shared with the coordinator must be provided, e.g. through the ' + \
+                AUTHKEY_ENV_VAR + ' environment variable.')
+        self.slots = slots
+        if name == None:
+            name = socket.gethostname() + ':' + str(os.getpid())
+        self.name = name
+        self.heartbeat_interval = heartbeat_interval
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.stopped = threading.Event()
+    
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except socket.error:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(0.5)
+    
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+    
+    def run(self):
+        self.connection = self.connect()
+        self.send(('register', self.name, self.slots))
+        LOG.info('Worker <%s> connected to %s', self.name, format_address(self.address))
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats, name='libhpc-worker-heartbeat')
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == 'shutdown':
+                    break
+                if message[0] == 'run':
+                    task_thread = threading.Thread(target=self.run_task, args=(message[1], message[2]), 
+                                                   name='libhpc-worker-task-' + str(message[1]))
+                    task_thread.daemon = True
+                    task_thread.start()
+        except (EOFError, IOError):
+            LOG.warning('Worker <%s> lost the connection to the coordinator.', self.name)
+        finally:
+            # Let the heartbeat thread finish before the connection is 
+            # closed and the interpreter exits
+            self.stopped.set()
+            heartbeat_thread.join(self.heartbeat_interval)
+            self.connection.close()
+    
+    def send_heartbeats(self):
+        while not self.stopped.wait(self.heartbeat_interval):
+            try:
+                self.send(('heartbeat',))
+            except (IOError, OSError, ValueError):
+                return
+    
+    def run_task(self, task_id, payload):
+        try:
+            message = ('result', task_id, run_par_task_in_process(cPickle.loads(payload)))
+        except Exception, e:
+            message = ('error', task_id, e, traceback.format_exc())
+        try:
+            try:
+                self.send(message)
+            except (cPickle.PicklingError, TypeError), e:
+                # The result or exception can't be sent back
+                self.send(('error', task_id, RuntimeError(repr(e)), traceback.format_exc()))
+        except (IOError, OSError, ValueError):
+            LOG.warning('Worker <%s> was unable to return the result of task %s.', self.name, task_id)
+
+# Start count worker daemons on the local machine for the coordinator, 
+# e.g. for testing, returning their subprocess.Popen objects. The workers
+# exit when the coordinator is closed.
+def start_local_workers(count, slots=1, coordinator=None, heartbeat_interval=HEARTBEAT_INTERVAL):
+    if coordinator == None:
+        coordinator = get_coordinator()
+    env = dict(os.environ)
+    env[AUTHKEY_ENV_VAR] = coordinator.authkey
+    processes = []
+    for index in range(count):
+        command = [sys.executable, '-m', 'libhpc.tools.cf_worker', '--address', format_address(coordinator.address), 
+                   '--slots', str(slots), '--name', 'local-' + str(index), '--heartbeat', str(heartbeat_interval)]
+        processes.append(subprocess.Popen(command, env=env))
+    return processes
+
+# Run the component tasks of a PAR on the coordinator's workers. Nested 
+# coordination forms are run on the local thread pool and can themselves
+# use the distributed runner.
+def submit_par_distributed(task_list, pool_size=None):
+    coordinator = get_coordinator()
+    futures = [None] * len(task_list)
+    local_indexes = []
+    for index in range(len(task_list)):
+        if isinstance(task_list[index][0], Component):
+            futures[index] = coordinator.submit(task_list[index])
+        else:
+            local_indexes.append(index)
+    if len(local_indexes) > 0:
+        local_futures = get_pool(pool_size).submit(run_par_task, [task_list[index] for index in local_indexes])
+        for index, future in zip(local_indexes, local_futures):
+            futures[index] = future
+    return futures
+
+def run_par_distributed(task_list, pool_size=None):
+    return FutureList(submit_par_distributed(task_list, pool_size)).result()
+
+register_cf_runner('PAR', 'distributed', run_par_distributed)
+register_cf_submitter('PAR', 'distributed', submit_par_distributed)
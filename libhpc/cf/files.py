@@ -0,0 +1,112 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import hashlib
+import threading
+
+# Helper functions for handling the files named by component parameters.
+
+# Derive a filename from a template and the value of another parameter.
+# The template may use {path} - the full source path, {stem} - the path 
+# without its final extension and {ext} - the final extension, e.g.
+# derive_filename('{stem}.bai', 'sample.bam') returns 'sample.bai'
+def derive_filename(template, path):
+    parts = path.rsplit('.', 1)
+    ext = ''
+    if len(parts) == 2:
+        ext = parts[1]
+    return template.format(path=path, stem=parts[0], ext=ext)
+
+# Return the list of values in a parameter value that name existing 
+# files. Lists and tuples of values are searched recursively.
+def find_files(value):
+    files = []
+    if isinstance(value, basestring):
+        if (len(value) > 0) and os.path.isfile(value):
+            files.append(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            files.extend(find_files(item))
+    return files
+
+# Content digests of files, keyed by the file's path, device, inode, size
+# and modification time so that an unmodified file is only hashed once.
+_digests = {}
+_digests_lock = threading.Lock()
+
+def _file_identity(path):
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+
+# Return the SHA-1 hex digest of the content of a file.
+def file_digest(path, block_size=1024*1024):
+    identity = _file_identity(path)
+    with _digests_lock:
+        if identity in _digests:
+            return _digests[identity]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        block = input_file.read(block_size)
+        while block:
+            digest.update(block)
+            block = input_file.read(block_size)
+    digest = digest.hexdigest()
+    with _digests_lock:
+        _digests[identity] = digest
+    return digest
+
+# Parse a size given as a number of bytes or a string with an optional
+# K, M, G or T suffix, e.g. '500M' or '20G'. None is returned unchanged.
+def parse_size(size):
+    if (size == None) or isinstance(size, (int, long)):
+        return size
+    multipliers = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    value = str(size).strip().upper()
+    if value.endswith('B'):
+        value = value[:-1]
+    multiplier = 1
+    if (len(value) > 0) and (value[-1] in multipliers):
+        multiplier = multipliers[value[-1]]
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise ValueError('Invalid size <' + str(size) + '>, expected a number of bytes with an optional K, M, G or T suffix')
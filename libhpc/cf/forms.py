@@ -43,12 +43,22 @@ File created on Aug 7, 2012
 
 @author: jhc02
 '''
-import threading
-
 import types
+import logging
 from collections import Iterable
 from component import Component
-import Queue
+from pool import check_pool_size, get_default_pool_size, get_pool
+from runners import get_cf_runner, set_cf_runner, check_cf_runner, submit_cf_tasks, stream_cf_tasks
+from futures import FutureList, chain_future
+from context import get_context, get_context_value, bind_context, PAR_TASK_ID_KEY
+from checkpoint import Checkpoint, CheckpointedStage
+# Register the 'distributed' and 'batch' PAR runners
+import distributed
+import batch
+import tracing
+from libhpc.wrapper.toolchain import use_tools
+
+LOG = logging.getLogger(__name__)
 
 PAR_TASK_IDENTIFIER_INT = '<<PAR_TASK_ID, int>>'
 PAR_TASK_IDENTIFIER_STRING = '<<PAR_TASK_ID, string>>'
@@ -68,150 +78,324 @@ PAR_TASK_IDENTIFIER_STRING = '<<PAR_TASK_ID, string>>'
 # PIPE is passed a list of functions and the initial parameter list.
 # If the initial parameter list is empty, it is expected to be passed in
 # to the partially prepared PIPE function that is returned.
-def PIPE(function_list, initial_param_list = None):
-    print "PIPE cf called...preparing PIPE function...\n"
-    print 'Received a list of ' + str(len(function_list)) + ' functions\n'
+# runner optionally names the PIPE implementation to use for this
+# expression (see libhpc.cf.runners), otherwise the runner selected for
+# the process is used.
+# If checkpoint is provided, it is the name of a file in which the output
+# of each stage is recorded as it completes. A re-run of the expression 
+# resumes after the last stage recorded in the file whose function,
+# input and input files are unchanged (see libhpc.cf.checkpoint). The name
+# may include a PAR_TASK_ID tag where the PIPE is run as part of a PAR.
+def PIPE(function_list, initial_param_list = None, runner = None, checkpoint = None):
+    LOG.debug('PIPE cf called...preparing PIPE function...')
+    LOG.debug('Received a list of %s functions', len(function_list))
     
     if initial_param_list == None:
-        print "No initial param list provided, the generated function will expect this as its first parameter...\n"
+        LOG.debug('No initial param list provided, the generated function will expect this as its first parameter...')
     
+    if runner != None:
+        check_cf_runner('PIPE', runner)
+    
+    # The stages are prepared, and the expression checked, once when the
+    # PIPE is created so that errors are reported before anything is run.
+    pipe_stages = get_pipe_stages(function_list)
+    check_pipe_stages(pipe_stages, initial_param_list)
     
     def PIPE_implementation(initial_param_list = initial_param_list, par_task_id = None):
-        # Work through the function list in reverse
-        # Elements may be instances of component.Component or may be
-        # functions resulting from the pre-evaluation of nested
-        # coordination forms.
-        count = 0
-        output = None
+        stage_list = pipe_stages
+        if par_task_id != None:
+            stage_list = get_pipe_stages(function_list, par_task_id)
         
-        for func_element in reversed(function_list):
-            # An element of the PIPE may be an instance of component.Component
-            # or a tuple containing an instance of component.Component as the
-            # first element followed by parameters as the subsequent elements.
-            
-            func = None
-            new_params = None
-            
-            # If we have a tuple, extract the function and the other params
-            if type(func_element) == type(tuple()):
-                func = func_element[0]
-                new_params = func_element[1:]
-                
-                # At this point, we run through the new params
-                # and look to see if any of them contain the PAR_TASK_ID
-                # tag. If so, we replace this tag with the PAR task id number.
-                # We set par task id to -1 if one is not specified and this
-                # PIPE is therefore not running as part of a PAR task
-                if par_task_id == None:
-                    print 'PIPE: No parallel task identifier provided, assume we\'re not running in a PAR and setting task_id to 0.'
-                    par_task_id = 0
-                else:
-                    print 'PIPE: We\'re running in a PAR environment. Checking additional inputs for task id replacement...'
-                new_params = process_param_tags(new_params, par_task_id)
-            else:
-                func = func_element
-            
-            # Prepare parameters - if we're at element 0 then read input from initial_param_list
-            # If for some reason there are params provided in new_params then we prepend the
-            # initial_param_list to these params.
-            print 'PIPE: Initial output value for function ' + str(count) + ' before adding new_params: <' + str(output) + '>\n'
-            print 'PIPE: New params for function ' + str(count) + ' <' + str(new_params) + '>'
-            
-            # If we're on the first iteration, add the initial params to new_params
-            if count == 0:
-                if initial_param_list == None:
-                    print 'initial_param_list is empty, assume first element of PIPE' \
-                        ' is another cf that will produce initial parameter list.\n'
-                elif new_params != None:
-                    # Need to check whether 'new_params' (those added into pipe in tuple with function name)
-                    # are placed before or after the output params from the previous function
-                    # Get metadata from function to determine whether to add additional
-                    # params before or after existing params
-                    if func.static_params_pre():
-                        output = list(new_params) + list(initial_param_list) 
-                    else:
-                        output = list(initial_param_list) + list(new_params)
-                else:
-                    output = list(initial_param_list)
+        if checkpoint != None:
+            # Where the PIPE is run as a PAR task, the task identifier is 
+            # taken from the context if it is not provided
+            task_id = par_task_id
+            if task_id == None:
+                task_id = get_context_value(PAR_TASK_ID_KEY, 0)
+            checkpoint_file = process_param_tags([checkpoint], task_id)[0]
+            journal = Checkpoint(checkpoint_file)
+            stage_list = [CheckpointedStage(stage, journal) for stage in stage_list]
+        
+        return GET_CF_RUNNER('PIPE', runner)(stage_list, initial_param_list)
+    
+    # Return the PIPE implementation function
+    return set_form_metadata(PIPE_implementation, 'PIPE', function_list, initial_param_list, 
+                             {'runner': runner, 'checkpoint': checkpoint})
+
+# Prepare the stages of a PIPE. The function list is worked through in
+# reverse. Elements may be instances of component.Component or may be
+# functions resulting from the pre-evaluation of nested coordination forms.
+def get_pipe_stages(function_list, par_task_id = None):
+    stage_list = []
+    for func_element in reversed(function_list):
+        stage_list.append(PipeStage(func_element, len(stage_list), len(function_list), par_task_id))
+    return stage_list
+
+# Check that each component in a PIPE will receive enough input values,
+# where the number of values can be determined before the PIPE is run: 
+# from the initial parameters for the first stage and, for later stages, 
+# from the metadata of a component returning a tuple of values.
+def check_pipe_stages(stage_list, initial_param_list = None):
+    input_count = None
+    if hasattr(initial_param_list, '__len__'):
+        input_count = len(initial_param_list)
+    for stage in stage_list:
+        # Values from a previous stage are passed as a single value when
+        # static parameters are added to them, unless they're in a list.
+        if (stage.position > 0) and (stage.new_params != None) and (input_count != None):
+            input_count = 1
+        if (stage.new_params != None) and (input_count != None):
+            input_count = input_count + len(stage.new_params)
+        if isinstance(stage.func, Component):
+            if input_count != None:
+                check_input_count(stage.func, input_count)
+            input_count = None
+            if stage.func.get_output_count() > 1:
+                input_count = stage.func.get_output_count()
+        else:
+            input_count = None
+
+# Check that a component will receive at least as many values as it has 
+# input parameters.
+def check_input_count(func, input_count):
+    if input_count < func.get_input_count():
+        raise ValueError('Function ' + func.get_code() + ' has ' + str(len(func.parameters)) + \
+            ' parameters and expects ' + str(func.get_input_count()) + ' input parameters but only ' \
+            + str(input_count) + ' are available.')
+
+# Split an element of the function list of a coordination form, named by 
+# cf_string, into its function and any static parameters provided with it 
+# in a tuple, checking that the function is a component.Component or a 
+# nested coordination form. Static parameters can only be provided with a
+# component since they are placed according to its metadata.
+def get_element_function(func_element, cf_string):
+    func = func_element
+    static_params = None
+    if type(func_element) == type(tuple()):
+        if len(func_element) == 0:
+            raise ValueError(cf_string + ': An empty tuple was provided in place of a function.')
+        func = func_element[0]
+        static_params = func_element[1:]
+    if isinstance(func, Component):
+        return (func, static_params)
+    if isinstance(func, types.FunctionType):
+        if static_params != None:
+            raise ValueError(cf_string + ': Static parameters can only be provided with a component,' \
+                ' not with a nested coordination form <' + func.__name__ + '>.')
+        return (func, static_params)
+    LOG.error('%s: One of the functions in the function_list is of an unknown type.', cf_string)
+    raise ValueError(cf_string + ': One of the functions in the function_list is of an unknown type <' \
+        + str(type(func)) + '>. Unable to evaluate this ' + cf_string + ' expression...')
+
+class PipeStage():
+    '''
+    A single element of a PIPE expression. Calling the stage with the
+    output of the previous stage (or the initial parameter list for the
+    first stage) prepares the input for the stage's function, runs it
+    and returns its output.
+    '''
+    
+    def __init__(self, func_element, position, pipe_length, par_task_id = None):
+        '''
+        Constructor
+        '''
+        # An element of the PIPE may be an instance of component.Component
+        # or a tuple containing an instance of component.Component as the
+        # first element followed by parameters as the subsequent elements.
+        self.position = position
+        self.pipe_length = pipe_length
+        self.new_params = None
+        
+        # If we have a tuple, extract the function and the other params
+        self.func, new_params = get_element_function(func_element, 'PIPE')
+        
+        # The placement of static parameters and the number of input
+        # parameters expected by a component are taken from its metadata
+        self.static_params_pre = False
+        self.expected_input_count = 0
+        # A streaming PAR takes its inputs from the previous stage without
+        # them being gathered into a list
+        self.streams_input = getattr(self.func, 'cf_options', {}).get('stream', False)
+        if isinstance(self.func, Component):
+            self.static_params_pre = self.func.static_params_pre()
+            self.expected_input_count = self.func.get_input_count()
+        
+        if new_params != None:
+            # At this point, we run through the new params
+            # and look to see if any of them contain the PAR_TASK_ID
+            # tag. If so, we replace this tag with the PAR task id number.
+            # We set par task id to -1 if one is not specified and this
+            # PIPE is therefore not running as part of a PAR task
+            if par_task_id == None:
+                LOG.debug("PIPE: No parallel task identifier provided, assume we're not running" \
+                    " in a PAR and setting task_id to 0.")
+                par_task_id = 0
             else:
+                LOG.debug("PIPE: We're running in a PAR environment. Checking additional inputs" \
+                    " for task id replacement...")
+            self.new_params = process_param_tags(new_params, par_task_id)
+    
+    def __call__(self, output):
+        return self.execute(self.prepare(output))
+    
+    # Prepare parameters - if we're at element 0 then output is the 
+    # initial_param_list. If for some reason there are params provided in 
+    # new_params then we prepend the initial_param_list to these params.
+    def prepare(self, output):
+        new_params = self.new_params
+        LOG.debug('PIPE: Initial output value for function %s before adding new_params: <%s>', self.position, output)
+        LOG.debug('PIPE: New params for function %s <%s>', self.position, new_params)
+        
+        # If we're on the first iteration, add the initial params to new_params
+        if self.position == 0:
+            initial_param_list = output
+            if initial_param_list == None:
+                LOG.debug('initial_param_list is empty, assume first element of PIPE is another' \
+                    ' cf that will produce initial parameter list.')
+            elif new_params != None:
                 # Need to check whether 'new_params' (those added into pipe in tuple with function name)
                 # are placed before or after the output params from the previous function
                 # Get metadata from function to determine whether to add additional
                 # params before or after existing params
-                if new_params != None:
-                    # If previous output value was not wrapped in list, wrap it now
-                    if type(list()) != type(output):
+                if self.static_params_pre:
+                    output = new_params + list(initial_param_list) 
+                else:
+                    output = list(initial_param_list) + new_params
+            elif not self.streams_input:
+                output = list(initial_param_list)
+        else:
+            # Need to check whether 'new_params' (those added into pipe in tuple with function name)
+            # are placed before or after the output params from the previous function
+            # Get metadata from function to determine whether to add additional
+            # params before or after existing params
+            if new_params != None:
+                # If previous output value was not wrapped in list, wrap it now
+                if type(list()) != type(output):
+                    output = [output]
+                if self.static_params_pre:
+                    output = new_params + output
+                else:
+                    output = output + new_params
+        
+        LOG.debug('PIPE: Complete input to function %s <%s>', self.position, output)
+        return output
+    
+    # Whether the stage runs a component whose tool can be connected to
+    # the tools of adjacent stages through pipes, see 
+    # runners.run_pipe_streaming.
+    def can_stream(self):
+        return isinstance(self.func, Component) and (self.func.get_stream_code() != None)
+    
+    # Get the command that runs this stage with the output of the previous
+    # stage, reading its input from stdin and/or writing to stdout.
+    def get_stream_command(self, output, read_stdin=False, write_stdout=False):
+        params = self.prepare(output)
+        check_input_count(self.func, len(params))
+        return self.func.get_stream_command(params, read_stdin, write_stdout)
+    
+    # Whether the stage runs a form that can start its tasks without 
+    # waiting for them, see runners.run_pipe_sequential. Static parameters
+    # can't be added to the individual futures of a submitted stage.
+    def can_submit(self):
+        return hasattr(self.func, 'cf_submit') and (self.new_params == None)
+    
+    # Start the stage's tasks with the output of the previous stage, which 
+    # may be a futures.FutureList, returning a FutureList of their results.
+    def submit(self, output):
+        if not isinstance(output, FutureList):
+            output = self.prepare(output)
+            if (output != None) and (type(output) != type(list())):
+                if type(output) == type(""):
+                    output = [output]
+                else:
+                    output = list(output)
+        return self.func.cf_submit(output)
+    
+    def execute(self, output):
+        if tracing.tracer != None:
+            with tracing.span('PIPE stage ' + str(self.position), 'stage', '[' + str(self.position) + ']'):
+                return self.execute_stage(output)
+        return self.execute_stage(output)
+    
+    # Check the input to the stage's component
+    def get_component_input(self, output):
+        if isinstance(output, types.GeneratorType):
+            output = list(output)
+        check_input_count(self.func, len(output))
+        return output
+    
+    def execute_stage(self, output):
+        func = self.func
+        # Check if func is an instance of component.Component or a function
+        # resulting from the pre-evaluation of another coordination forms expression
+        if isinstance(func, Component):
+            # if we reach this code, the current element of the PIPE is a
+            # standard function that will be called via its metadata object.
+            # If we're at element 0, the input may be coming from some
+            # other coordination form that has not yet been evaluated.
+            LOG.debug('Function %s requires %s params.', func.get_code(), len(func.parameters))
+            LOG.debug('Function input contains: %s params', len(output))
+            LOG.debug('Expecting at least <%s> input params for function <%s> which takes' \
+                ' total of %s params', self.expected_input_count, func.get_name(), len(func.parameters))
+            output = self.get_component_input(output)
+            
+            LOG.debug('About to run function <%s>...', func.get_code())
+            output = func.run(output)
+        elif isinstance(func, types.FunctionType):
+            # If we reach this code, we assume that this element of the
+            # PIPE is a pre-evaluated, nested, coordination forms expression
+            # If we're at element 0, the input may be coming from some
+            # other coordination form that has not yet been evaluated.
+            LOG.debug('About to run pre-evaluated function <%s>...', func.__name__)
+            if (type(output) != type(list())) and not self.streams_input:
+                # Need to check why output must be wrapped as list
+                # This causes an issue for nested split elements
+                # Replacing wrapping of tuple with list with conversion to a list
+                if output != None:
+                    #output = [output]
+                    if type(output) == type(""):
                         output = [output]
-                    if func.static_params_pre():
-                        output = list(new_params) + output
                     else:
-                        output = output + list(new_params)
-            
-            print 'PIPE: Complete input to function ' + str(count) + ' <' + str(output) + '>\n'
-            
-            # Check if func is an instance of component.Component or a function
-            # resulting from the pre-evaluation of another coordination forms expression
-            if isinstance(func, Component):
-                # if we reach this code, the current element of the PIPE is a
-                # standard function that will be called via its metadata object.
-                # If we're at element 0, the input may be coming from some
-                # other coordination form that has not yet been evaluated.
-                print 'Function ' + func.get_code() + ' requires ' + str(len(func.parameters)) + ' params. '
-                print 'Function input contains: ' + str(len(output)) + ' params\n'
-                
-                # Count up the expected number of input parameters
-                expected_input_count = 0
-                for p in func.parameters:
-                    if p.get_dir() == 'input':
-                        expected_input_count = expected_input_count + 1
-                print 'Expecting at least <' + str(expected_input_count) + '> input params for function <' \
-                    + func.get_name() + '> which takes total of ' + str(len(func.parameters)) + ' params\n'
-                if len(output) < expected_input_count:
-                    raise ValueError('Function ' + func.get_code + ' has ' + str(len(func.parameters)) + \
-                        ' parameters and expects ' + str(expected_input_count) + ' input parameters but only ' \
-                        + str(len(output)) + ' are available.')
-                
-                print 'About to run function <' + func.get_code() + '>...\n'
-                output = func.run(output)
-            elif isinstance(func, types.FunctionType):
-                # If we reach this code, we assume that this element of the
-                # PIPE is a pre-evaluated, nested, coordination forms expression
-                # If we're at element 0, the input may be coming from some
-                # other coordination form that has not yet been evaluated.
-                print 'About to run pre-evaluated function <' + func.__name__ + '>...\n'
-                if type(output) != type(list()):
-                    # Need to check why output must be wrapped as list
-                    # This causes an issue for nested split elements
-                    # Replacing wrapping of tuple with list with conversion to a list
-                    if output != None:
-                        #output = [output]
-                        if type(output) == type(""):
-                            output = [output]
-                        else:
-                            output = list(output)
-                output = func(output)
-            else:
-                print('One of the functions in the function_list is of an unknown type. Unable to evaluate this PIPE expression...')
-                raise ValueError('One of the functions in the function_list is of an unknown type. Unable to evaluate this PIPE expression...')
-
-            print 'Processing function ' + str((count+1)) + ' of ' + str(len(function_list)) + '\n'
-            count += 1
-            
+                        output = list(output)
+            output = func(output)
+        else:
+            LOG.error('One of the functions in the function_list is of an unknown type.' \
+                ' Unable to evaluate this PIPE expression...')
+            raise ValueError('One of the functions in the function_list is of an unknown type. Unable to evaluate this PIPE expression...')
+        
+        LOG.debug('Processing function %s of %s', self.position + 1, self.pipe_length)
         return output
     
-    # Return the PIPE implementation function
-    return PIPE_implementation
-    
 # The PAR form takes a list of functions that can be run in parallel.
 # It identifies the most suitable way to run these functions.
 # This may be sequentially, as multiple concurrent threads or on 
 # separate machines.
 # PAR returns a new function that will carry out this computation when 
 # its run method is called.
-# Ultimately there will be multiple implementations of this PAR function
-# but for now, there will be a single, hard-coded multi-threaded implementation
-def PAR(function_list, param_list=None):
-    print "PAR cf called...preparing parameters\n"
+# There are multiple implementations of this PAR function, registered
+# in libhpc.cf.runners: 'threads' (the default) runs the tasks on a 
+# bounded pool of worker threads, 'processes' runs components in a pool
+# of worker processes so that pure-Python components are not serialised
+# by the interpreter lock and 'sequential' runs the tasks one after 
+# another in the calling thread. runner optionally names the 
+# implementation to use for this expression, otherwise the runner
+# selected for the process is used. pool_size sets the number of workers
+# used by this expression, if it is not provided the process-wide 
+# default from libhpc.cf.pool is used.
+# If stream is True, function_list is a single component (or tuple) or
+# nested form that is run once for each element of an iterable of inputs,
+# see get_par_stream.
+def PAR(function_list, param_list=None, pool_size=None, runner=None, stream=False, max_pending=None):
+    LOG.debug('PAR cf called...preparing parameters')
+    
+    if pool_size != None:
+        check_pool_size(pool_size)
+    if runner != None:
+        check_cf_runner('PAR', runner)
+    if stream:
+        return get_par_stream(function_list, param_list, pool_size, runner, max_pending)
+    if max_pending != None:
+        raise ValueError('PAR: max_pending can only be provided for a streaming PAR.')
 
     # If param_list is none, we expect to find the parameters
     # in a tuple with the function name. If its not None,
@@ -224,9 +408,9 @@ def PAR(function_list, param_list=None):
     # TODO: Is this correct? Don't we need to check if each element of function_list
     # is the length of the corresponding element of param_list?
     if param_list == None:
-        print 'We have missing parameters, these will be passed with function call\n'
+        LOG.debug('We have missing parameters, these will be passed with function call')
     else:
-        print 'Parameter list provided, checking the correct number of params have been provided\n'
+        LOG.debug('Parameter list provided, checking the correct number of params have been provided')
         if not len(function_list) == len(param_list):
             raise ValueError('A parameter list has been provided. ' \
                     'This must be the same length as the function list <' \
@@ -240,11 +424,31 @@ def PAR(function_list, param_list=None):
 #                param_list[element_count] = tuple([element])
 #            element_count = element_count + 1
     
-    print "PAR cf...generating PAR implementation\n"
+    # Check the function list when the PAR is created. Where the parameters
+    # of every task are provided in param_list, the tasks are prepared once
+    # and reused each time the PAR is run without additional parameters.
+    has_static_params = False
+    for func_element in function_list:
+        func, static_params = get_element_function(func_element, 'PAR')
+        if static_params != None:
+            has_static_params = True
+    bound_tasks = None
+    if (param_list != None) and not has_static_params:
+        bound_tasks = [prepare_par_task(function_list[count], count, param_list) 
+                       for count in range(len(function_list))]
+    par_function_list = function_list
+    
+    LOG.debug('PAR cf...generating PAR implementation')
     def PAR_implementation(base_params=None, function_list = function_list):
     
-        output = [None] * len(function_list)
-        thread_list = []
+        task_list = []
+        # Each task is run with the context of the thread calling PAR with 
+        # the task's identifier added. When tracing, the context also 
+        # identifies the task in the nesting path.
+        parent_context = get_context()
+        trace_path = None
+        if tracing.tracer != None:
+            trace_path = tracing.get_path()
         
 #        if base_params != None:
 #            # We need to ensure that all elements of the base_params list are
@@ -255,118 +459,232 @@ def PAR(function_list, param_list=None):
 #                    base_params[element_count] = tuple([element])
 #                element_count = element_count + 1
     
-        # For each function in the function list prepare a new thread
-        # that will run the function. Results will be assigned in the order
+        # For each function in the function list prepare a task that
+        # will run the function. Results will be assigned in the order
         # of function_list to the output array.
         count = 0
         for func_element in function_list:
-            print 'Handling func_element ' + str(count) + ': ' + str(func_element) 
-            # If we have a tuple, extract the function and the other params
-            func = None
-            params = []
-            
-            
-            # TODO: If we have missing parameters, check that the right number are provided.
-            
-            # parameters = []
-            # See if we've been given a tuple containing a function and params,
-            # or whether we've just been given the function
-            if type(func_element) == type(tuple()):
-                func = func_element[0]
-                static_params = list(func_element[1:])
-                # If we've got base params to which the static params are added, 
-                # make sure the static params are placed correctly before or after
-                # base params depending on the function metadata
-                if static_params != None:
-                    if func.static_params_pre():
-                        print 'Place static params <' + str(static_params) + '> for partial func_list BEFORE existing params <' + str(base_params[count]) + '>\n'
-                        params = static_params + [base_params[count]]
-                    else:
-                        print 'Place static params <' + str(static_params) + '> for partial func_list AFTER existing params <' + str(base_params[count]) + '>\n'
-                        params = [base_params[count]] + static_params
+            if base_params != None:
+                task = get_task(count, func_element, function_list, parent_context, trace_path, base_params[count], True)
             else:
-                func = func_element
-                if (param_list == None) and (base_params == None):
-                    raise ValueError('Function was called without parameters, expecting to find parameters in param_list but this is also empty.')
-                if param_list != None:
-                    if hasattr(param_list[count], '__iter__'):
-                        params = list(param_list[count])
-                    else:
-                        params = list([param_list[count]])
-                if base_params != None:
-                    if hasattr(base_params[count], '__iter__'):
-                        params = params + list(base_params[count])
-                    else:
-                        params = params + list([base_params[count]])
-            
-            # At this point we've processed the parameters and combined any
-            # params provided in the original parameter list with any additional
-            # parameters added through a function tuple. We can now pre-process any
-            # task identifier tags.
-            params = process_param_tags(params, count)
-            
-            # We've now split the function and parameters into separate groups            
-            print 'Parameters for passing to thread: ' + str(params)
-            print 'Tuple of params to call thread function with: ' + str(tuple(params))
-            
-            
-            # func may be an instance of the Component class or another (nested)
-            # co-ordination form.
-            if isinstance(func, Component):
-                print 'About to run function <' + func.get_code() + '>, additional params provided <' + str(params) + '>...\n'
-                # Create a thread for this function
-                thread_list.append(threading.Thread(target=func.run, args=[tuple(params), (output, count)]))
-            elif isinstance(func, types.FunctionType):
-                print 'About to run nested non-function object <' + str(func) + '>, additional params provided <' + str(params) + '>...\n'
-                #thread_list.append(threading.Thread(target=func, args=[tuple(params), (output, count)]))
-                # Based on the info here: http://stackoverflow.com/questions/6893968/how-to-get-the-return-value-from-a-thread-in-python
-                # we're using a wrapper function to get the result from the nested function object
-                # that is called by the thread
-                def func_wrapper(parameter_list, result_store=None, func=func):
-                    return_value = func(parameter_list)
-                    if result_store != None:
-                        print 'PAR_NESTED_FORM: Storing result <' + str(return_value) + '> to result store index ' + str(result_store[1])
-                        print 'PAR_NESTED_FORM: Result array: ' + str(result_store[0])
-                        print 'PAR_NESTED_FORM: Storing return value to result store for function <' + str(func) + '>.'
-                        result_store[0][result_store[1]] = return_value
-                
-                #result_queue = Queue.Queue()
-                
-                # Create a thread for this function
-                new_thread = threading.Thread(target=func_wrapper, args=[tuple(params), (output, count)])
-                #new_thread.result_queue = result_queue
-                thread_list.append(new_thread)
-                
-            else:
-                print('PAR: One of the functions in the function_list is of an unknown type. Unable to evaluate this PAR expression...')
-                raise ValueError('PAR: One of the functions in the function_list is of an unknown type. Unable to evaluate this PAR expression...')
-            
+                task = get_task(count, func_element, function_list, parent_context, trace_path)
+            task_list.append(task)
             count = count+1
             
-        # Run the threads
-        print 'We now have a list of <' + str(len(thread_list)) + '> functions to run in parallel...'
-        for thread_to_run in thread_list:
-            thread_to_run.start()
-    
-        # Set a join to wait until all jobs are completed
-        print 'Waiting for all parallel jobs to complete...'
-        for thread_to_run in thread_list:
-            thread_to_run.join()
-        print 'All parallel jobs have completed...'
-        
-        print 'Final output: ' + str(output)
+        # Run the tasks using the selected runner, results are returned
+        # in the order of function_list.
+        LOG.debug('We now have a list of <%s> functions to run in parallel...', len(task_list))
+        output = GET_CF_RUNNER('PAR', runner)(task_list, pool_size)
+        LOG.debug('All parallel jobs have completed...')
+        
+        LOG.debug('Final output: %s', output)
+        return output
+    
+    def get_task(count, func_element, function_list, parent_context, trace_path, base_param=None, has_base_param=False):
+        LOG.debug('Handling func_element %s: %s', count, func_element)
+        if has_base_param:
+            func, params = prepare_par_task(func_element, count, param_list, base_param, True)
+        elif (bound_tasks != None) and (function_list is par_function_list):
+            func, params = bound_tasks[count]
+        else:
+            func, params = prepare_par_task(func_element, count, param_list)
+        
+        # func may be an instance of the Component class or another (nested)
+        # co-ordination form.
+        if isinstance(func, Component):
+            LOG.debug('About to run function <%s>, additional params provided <%s>...', func.get_code(), params)
+        else:
+            LOG.debug('About to run nested non-function object <%s>, additional params' \
+                ' provided <%s>...', func, params)
+        return (func, params, get_task_context(parent_context, trace_path, count))
+    
+    # Start the tasks without waiting for them and return a FutureList of
+    # their results, in the order of function_list. base_params may itself
+    # be a FutureList, e.g. the output of a PAR submitted by the previous
+    # stage of a PIPE, in which case each task is started as soon as the
+    # future for its element of base_params completes.
+    def PAR_submit(base_params=None):
+        parent_context = get_context()
+        trace_path = None
+        if tracing.tracer != None:
+            trace_path = tracing.get_path()
+        
+        if not isinstance(base_params, FutureList):
+            task_list = []
+            for count in range(len(par_function_list)):
+                if base_params != None:
+                    task_list.append(get_task(count, par_function_list[count], par_function_list, 
+                                              parent_context, trace_path, base_params[count], True))
+                else:
+                    task_list.append(get_task(count, par_function_list[count], par_function_list, 
+                                              parent_context, trace_path))
+            return FutureList(submit_cf_tasks('PAR', task_list, pool_size, runner))
+        
+        if len(base_params) < len(par_function_list):
+            raise ValueError('PAR: ' + str(len(par_function_list)) + ' tasks were submitted but only ' + \
+                str(len(base_params)) + ' input values will be available.')
+        output = FutureList()
+        for count in range(len(par_function_list)):
+            def submit_task(base_param, count=count):
+                task = get_task(count, par_function_list[count], par_function_list, 
+                                parent_context, trace_path, base_param, True)
+                return submit_cf_tasks('PAR', [task], pool_size, runner)[0]
+            output.append(chain_future(base_params[count], submit_task))
         return output
 
-    return PAR_implementation
+    par_expression = set_form_metadata(PAR_implementation, 'PAR', function_list, param_list, 
+                                       {'pool_size': pool_size, 'runner': runner})
+    par_expression.cf_submit = PAR_submit
+    return par_expression
+
+# Prepare a streaming PAR, which runs func_element, a component, a tuple
+# of a component and static parameters or a nested form, with each input
+# taken from an iterable such as a generator or a file. Inputs are taken
+# as tasks are started and the result of each task is yielded, in the 
+# order of the inputs, by the generator the PAR returns, so memory use is
+# bounded by max_pending, the number of tasks that are started but whose
+# results have not been yielded (by default twice the pool size), rather 
+# than by the number of tasks. The inputs are provided in param_list or
+# when the PAR is called; an iterator in param_list is consumed by the
+# first run.
+def get_par_stream(func_element, param_list=None, pool_size=None, runner=None, max_pending=None):
+    if type(func_element) == type([]):
+        if len(func_element) != 1:
+            raise ValueError('PAR: A streaming PAR takes a single function to run with each input,' \
+                ' got a function list of length <' + str(len(func_element)) + '>')
+        func_element = func_element[0]
+    get_element_function(func_element, 'PAR')
+    if (max_pending != None) and ((type(max_pending) != type(0)) or (max_pending < 1)):
+        raise ValueError('PAR: max_pending must be a positive integer, got <' + str(max_pending) + '>')
+    
+    def PAR_stream_implementation(base_params=None):
+        inputs = base_params
+        if inputs == None:
+            inputs = param_list
+        if inputs == None:
+            raise ValueError('PAR: A streaming PAR was called without inputs and no param_list was provided.')
+        parent_context = get_context()
+        trace_path = None
+        if tracing.tracer != None:
+            trace_path = tracing.get_path()
+        
+        def get_tasks():
+            for count, base_param in enumerate(inputs):
+                func, params = prepare_par_task(func_element, count, None, base_param, True)
+                yield (func, params, get_task_context(parent_context, trace_path, count))
+        return stream_cf_tasks('PAR', get_tasks(), pool_size, runner, max_pending)
+    
+    return set_form_metadata(PAR_stream_implementation, 'PAR', [func_element], param_list, 
+        {'pool_size': pool_size, 'runner': runner, 'stream': True, 'max_pending': max_pending})
+
+# Get the context for the PAR task at position count. The task's 
+# identifier is available to nested forms through the context and, when
+# tracing, the context also identifies the task in the nesting path.
+def get_task_context(parent_context, trace_path, count):
+    task_context = dict(parent_context)
+    task_context[PAR_TASK_ID_KEY] = count
+    if trace_path != None:
+        task_context[tracing.TRACE_PATH_KEY] = trace_path + ('[' + str(count) + ']',)
+    return task_context
+
+# Prepare the function and parameters of the PAR task at position count 
+# of a PAR expression. func_element is the element of the PAR function
+# list, param_list the parameter list bound to the expression and, if 
+# has_base_param is True, base_param is the task's element of the 
+# parameters the PAR implementation was called with.
+def prepare_par_task(func_element, count, param_list=None, base_param=None, has_base_param=False):
+    # If we have a tuple, extract the function and the other params
+    func = None
+    params = []
+    
+    # TODO: If we have missing parameters, check that the right number are provided.
+    
+    # parameters = []
+    # See if we've been given a tuple containing a function and params,
+    # or whether we've just been given the function
+    if type(func_element) == type(tuple()):
+        func = func_element[0]
+        static_params = list(func_element[1:])
+        if not has_base_param:
+            raise ValueError('PAR: Static parameters were provided for task ' + str(count) + \
+                ' but PAR was called without parameters to add them to.')
+        # If we've got base params to which the static params are added, 
+        # make sure the static params are placed correctly before or after
+        # base params depending on the function metadata
+        if static_params != None:
+            if func.static_params_pre():
+                LOG.debug('Place static params <%s> for partial func_list BEFORE existing params' \
+                    ' <%s>', static_params, base_param)
+                params = static_params + [base_param]
+            else:
+                LOG.debug('Place static params <%s> for partial func_list AFTER existing params' \
+                    ' <%s>', static_params, base_param)
+                params = [base_param] + static_params
+    else:
+        func = func_element
+        if (param_list == None) and (not has_base_param):
+            raise ValueError('Function was called without parameters, expecting to find parameters in param_list but this is also empty.')
+        if param_list != None:
+            if hasattr(param_list[count], '__iter__'):
+                params = list(param_list[count])
+            else:
+                params = list([param_list[count]])
+        if has_base_param:
+            if hasattr(base_param, '__iter__'):
+                params = params + list(base_param)
+            else:
+                params = params + list([base_param])
+
+    # At this point we've processed the parameters and combined any
+    # params provided in the original parameter list with any additional
+    # parameters added through a function tuple. We can now pre-process any
+    # task identifier tags.
+    params = process_param_tags(params, count)
+    
+    # We've now split the function and parameters into separate groups            
+    LOG.debug('Parameters for passing to task: %s', params)
+    return (func, tuple(params))
     
-def GET_CF_RUNNER(cf_string):
-    pass
+# Get the implementation (runner) of the coordination form named by
+# cf_string, e.g. 'PAR'. If name is not provided, the runner selected
+# for the process, through SET_CF_RUNNER or the LIBHPC_CF_RUNNER_<FORM>
+# environment variable, or the form's default runner is returned.
+def GET_CF_RUNNER(cf_string, name=None):
+    return get_cf_runner(cf_string, name)
+
+# Select the runner used for the coordination form named by cf_string
+# by all expressions that do not specify their own runner.
+def SET_CF_RUNNER(cf_string, name):
+    set_cf_runner(cf_string, name)
+
+# Start running a coordination forms expression, or a component, without
+# waiting for it to finish. A PAR returns a futures.FutureList with a 
+# future for the result of each of its tasks, in order, so that each 
+# result can be used as soon as it is ready, e.g. by iterating over 
+# FutureList.completed(). params may be a FutureList from an earlier 
+# SUBMIT, each task then starts once its own input is ready. Other 
+# expressions return a single futures.Future for their output, run on the
+# worker pool of size pool_size.
+def SUBMIT(expression, params=None, pool_size=None):
+    if hasattr(expression, 'cf_submit'):
+        return expression.cf_submit(params)
+    if isinstance(expression, Component):
+        run_expression = lambda: expression.run(params)
+    elif params == None:
+        run_expression = expression
+    else:
+        run_expression = lambda: expression(params)
+    task_context = get_context()
+    def run_task(ignored):
+        with bind_context(task_context):
+            return run_expression()
+    return get_pool(pool_size).submit(run_task, [None])[0]
 
 # The BYPASS form is applied to a function that is to be run
 # but have its output bypassed. The provided function is run with
 # the specified input and the input is then directed to the output.
 def BYPASS(func, params=None, par_task_id = None):
-    print "BYPASS cf called...preparing parameters\n"
+    LOG.debug('BYPASS cf called...preparing parameters')
 
     # If param_list is none, we expect to find the parameters
     # in a tuple with the function name. If its not None,
@@ -377,61 +695,41 @@ def BYPASS(func, params=None, par_task_id = None):
     # or a tuple of multiple parameters
     
     if params == None:
-        print 'BYPASS: Parameters not provided, we expect to receive these with function call\n'
+        LOG.debug('BYPASS: Parameters not provided, we expect to receive these with function call')
     else:
-        print 'BYPASS: Parameter list provided\n'
+        LOG.debug('BYPASS: Parameter list provided')
         
     
-    print "BYPASS cf...generating BYPASS implementation\n"
-    def BYPASS_implementation(param_list = params, func = func, par_task_id = None):
+    # The function and its static parameters are checked once when the
+    # BYPASS is created. At this point, we run through the new params
+    # and look to see if any of them contain the PAR_TASK_ID tag. If so,
+    # we replace this tag with the PAR task id number. The task id is 0 
+    # unless a PAR task id is provided when the BYPASS is run.
+    bypass_func, static_params = get_element_function(func, 'BYPASS')
+    bypass_params = None
+    if static_params != None:
+        bypass_params = process_param_tags(static_params, 0)
+    check_static_input(bypass_func, params, bypass_params)
     
-        print 'Handling function ' + str(func)
-       
-        # The function passed to BYPASS may be an instance of component.Component
-        # or a tuple containing an instance of component.Component as the
-        # first element followed by parameters as the subsequent elements.
+    LOG.debug('BYPASS cf...generating BYPASS implementation')
+    def BYPASS_implementation(param_list = params, func = bypass_func, par_task_id = None):
+    
+        LOG.debug('Handling function %s', func)
         
-        new_params = None
+        new_params = bypass_params
         output = None
-        
-        # If we have a tuple, extract the function and the other params
-        # Otherwise, func is already the function so leave it as is
-        if type(func) == type(tuple()):
-            new_params = func[1:]
-            func = func[0]
-            
-            # At this point, we run through the new params
-            # and look to see if any of them contain the PAR_TASK_ID
-            # tag. If so, we replace this tag with the PAR task id number.
-            # We set par task id to -1 if one is not specified and this
-            # PIPE is therefore not running as part of a PAR task
-            if par_task_id == None:
-                print 'BYPASS: No parallel task identifier provided, assume we\'re not running in a PAR and setting task ID to 0.'
-                par_task_id = 0
-            else:
-                print 'BYPASS: We\'re running in a PAR environment. Pre-processing parameters for tags.'
-            new_params = process_param_tags(new_params, par_task_id)
+        if (static_params != None) and (par_task_id != None):
+            LOG.debug("BYPASS: We're running in a PAR environment. Pre-processing parameters for tags.")
+            new_params = process_param_tags(static_params, par_task_id)
                     
         # If for some reason there are params provided in new_params then we prepend the
         # initial_param_list to these params.
-        print 'BYPASS: Initial params for function <' + str(params) + '>'
-        print 'BYPASS: New params for function <' + str(new_params) + '>'
+        LOG.debug('BYPASS: Initial params for function <%s>', params)
+        LOG.debug('BYPASS: New params for function <%s>', new_params)
         
-        if param_list == None:
-            print 'param_list is empty so assuming we\'ll receive params on function call'
-        elif new_params != None:
-            # Need to check whether 'new_params' (those added into pipe in tuple with function name)
-            # are placed before or after the output params from the previous function
-            # Get metadata from function to determine whether to add additional
-            # params before or after existing params
-            if func.static_params_pre():
-                output = list(new_params) + list(param_list) 
-            else:
-                output = list(param_list) + list(new_params)
-        else:
-            output = list(param_list)
+        output = add_static_params(func, param_list, new_params)
         
-        print 'BYPASS: Complete input to function <' + str(output) + '>\n'
+        LOG.debug('BYPASS: Complete input to function <%s>', output)
         
         # Check if func is an instance of component.Component or a function
         # resulting from the pre-evaluation of another coordination forms expression
@@ -440,62 +738,50 @@ def BYPASS(func, params=None, par_task_id = None):
             # standard function that will be called via its metadata object.
             # The input may be coming from some
             # other coordination form that has not yet been evaluated.
-            print 'Function ' + func.get_code() + ' requires ' + str(len(func.parameters)) + ' params. '
-            print 'Function input contains: ' + str(len(output)) + ' params\n'
+            LOG.debug('Function %s requires %s params.', func.get_code(), len(func.parameters))
+            LOG.debug('Function input contains: %s params', len(output))
+            LOG.debug('Expecting at least <%s> input params for function <%s> which takes' \
+                ' total of %s params', func.get_input_count(), func.get_name(), len(func.parameters))
+            check_input_count(func, len(output))
             
-            # Count up the expected number of input parameters
-            expected_input_count = 0
-            for p in func.parameters:
-                if p.get_dir() == 'input':
-                    expected_input_count = expected_input_count + 1
-            print 'Expecting at least <' + str(expected_input_count) + '> input params for function <' \
-                + func.get_name() + '> which takes total of ' + str(len(func.parameters)) + ' params\n'
-            if len(output) < expected_input_count:
-                raise ValueError('Function ' + func.get_code + ' has ' + str(len(func.parameters)) + \
-                    ' parameters and expects ' + str(expected_input_count) + ' input parameters but only ' \
-                    + str(len(output)) + ' are available.')
-            
-            print 'About to run function <' + func.get_code() + '>...\n'
+            LOG.debug('About to run function <%s>...', func.get_code())
             output = func.run(output)
         elif isinstance(func, types.FunctionType):
             # If we reach this code, we assume that this BYPASS contains
             # a pre-evaluated, nested, coordination forms expression
             # The input may be coming from some
             # other coordination form that has not yet been evaluated.
-            print 'About to run pre-evaluated function <' + func.__name__ + '>...\n'
+            LOG.debug('About to run pre-evaluated function <%s>...', func.__name__)
             if type(output) != type(list()):
                 if output != None:
                     output = [output]
             output = func(output)
-        else:
-            print('BYPASS: The function provided is of an unknown type. Unable to evaluate this BYPASS expression...')
-            raise ValueError('BYPASS: The function provided is of an unknown type. Unable to evaluate this BYPASS expression...')
 
-        print 'BYPASS: Handled function ' + str(func.get_code()) + '\n'
+        LOG.debug('BYPASS: Handled function %s', func)
             
         return param_list
 
-    return BYPASS_implementation
+    return set_form_metadata(BYPASS_implementation, 'BYPASS', [func], params)
 
 # The SPLIT form takes a single list of inputs and splits this list into
 # two equal parts.
 def SPLIT(param=None):
-    print "SPLIT cf called...preparing parameters\n"
+    LOG.debug('SPLIT cf called...preparing parameters')
 
     # If param is none, we expect the input parameter to be
     # passed in when the implementation is called.
     if param == None:
-        print 'SPLIT: No input provided, this will be passed with the function call...\n'
+        LOG.debug('SPLIT: No input provided, this will be passed with the function call...')
     else:
-        print 'SPLIT: Input parameter provided, checking that this is a list or tuple\n'
+        LOG.debug('SPLIT: Input parameter provided, checking that this is a list or tuple')
         if not (type(param) == type([])) or (type(param) == type(tuple())):
             raise ValueError('SPLIT: The parameter provided is not a list or a tuple: ' \
                     + str(param))
         
-    print "SPLIT cf...generating SPLIT implementation\n"
+    LOG.debug('SPLIT cf...generating SPLIT implementation')
     def SPLIT_implementation(new_param = None, base_params=param):
 
-        print "Running SPLIT implementation with base_params: " + str(base_params) + " and new parameters: " + str(new_param)
+        LOG.debug('Running SPLIT implementation with base_params: %s and new parameters: %s', base_params, new_param)
         # Prepare a two item list to contain the split input params    
         output = [None] * 2
         if base_params == None:
@@ -513,16 +799,149 @@ def SPLIT(param=None):
             # Concatenate parameters
             base_params += new_param
         
-        if(len(base_params) % 2 == 0):
-            output[0] = base_params[:len(base_params)/2]
-            output[1] = base_params[len(base_params)/2:]
-        else:
-            output[0] = base_params[:len(base_params)/2+1]
-            output[1] = base_params[len(base_params)/2+1:]
+        # If the list has an odd number of elements, the first part holds
+        # the extra element
+        output[0], output[1] = chunk_list(base_params, 2)
         
         return output
 
-    return SPLIT_implementation
+    return set_form_metadata(SPLIT_implementation, 'SPLIT', params=param)
+
+# Split a list or tuple into count contiguous parts whose lengths differ 
+# by at most one, the first parts holding any extra elements. Each part
+# is a slice of items so elements are copied once, into their part.
+def chunk_list(items, count):
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for index in range(count):
+        end = start + size
+        if index < extra:
+            end = end + 1
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+# Get the number of shards a SCATTER splits an input of length elements
+# into: the requested number of shards, the number of chunks of 
+# chunk_size elements or, if neither is given, the default PAR pool 
+# size, i.e. the number of cores. There are never more shards than
+# elements.
+def get_shard_count(length, shards=None, chunk_size=None):
+    if chunk_size != None:
+        count = (length + chunk_size - 1) // chunk_size
+    elif shards != None:
+        count = shards
+    else:
+        count = get_default_pool_size()
+    return max(min(count, length), 0)
+
+# The SCATTER form splits its input list into shards and applies func,
+# a component or coordination form, to each shard in parallel, as a 
+# PAR with one task for each shard. The output is the list of the 
+# results for each shard, in the order of the shards, which can be 
+# recombined with GATHER, e.g. PIPE([GATHER(), SCATTER(func)]).
+#
+# The input is split into shards equal parts, or into parts of 
+# chunk_size elements. If neither is given the number of shards is the
+# default PAR pool size. chunker, if provided, is a function taking the 
+# input and the number of shards and returning the list of shards, 
+# used in place of chunk_list(), e.g. to keep related elements in the
+# same shard. As with PAR, each shard is the parameter list for func, or
+# if func is given in a tuple with static parameters, a single parameter 
+# added to them, and pool_size and runner select how the shards are run.
+# Shards are passed to their tasks without further copying.
+def SCATTER(func, shards=None, chunk_size=None, chunker=None, params=None, pool_size=None, runner=None):
+    LOG.debug('SCATTER cf called...preparing parameters')
+    
+    if (shards != None) and (chunk_size != None):
+        raise ValueError('SCATTER: Only one of shards and chunk_size can be specified.')
+    for name, value in [('shards', shards), ('chunk_size', chunk_size)]:
+        if (value != None) and ((type(value) != type(0)) or (value < 1)):
+            raise ValueError('SCATTER: ' + name + ' must be a positive integer, got <' + str(value) + '>')
+    if (chunker != None) and not callable(chunker):
+        raise ValueError('SCATTER: The chunker provided is not callable: ' + str(chunker))
+    if pool_size != None:
+        check_pool_size(pool_size)
+    if runner != None:
+        check_cf_runner('PAR', runner)
+    scatter_func, static_params = get_element_function(func, 'SCATTER')
+    
+    LOG.debug('SCATTER cf...generating SCATTER implementation')
+    def SCATTER_implementation(param_list = params):
+        if param_list == None:
+            param_list = []
+        if (type(param_list) != type([])) and (type(param_list) != type(tuple())):
+            raise ValueError('SCATTER: The input provided is not a list or a tuple: ' + str(param_list))
+        
+        count = get_shard_count(len(param_list), shards, chunk_size)
+        if count == 0:
+            LOG.debug('SCATTER: Input is empty, there are no shards to run')
+            return []
+        if chunker != None:
+            shard_list = chunker(param_list, count)
+        else:
+            shard_list = chunk_list(param_list, count)
+        LOG.debug('SCATTER: Split input of %s elements into %s shards', len(param_list), len(shard_list))
+        
+        # The shards are run as PAR tasks so that each has its own task
+        # identifier and is run by the selected PAR runner
+        parent_context = get_context()
+        trace_path = None
+        if tracing.tracer != None:
+            trace_path = tracing.get_path()
+        task_list = []
+        for count, shard in enumerate(shard_list):
+            shard_params = shard
+            if static_params != None:
+                shard_params = add_static_params(scatter_func, [shard], process_param_tags(static_params, count))
+            task_list.append((scatter_func, shard_params, get_task_context(parent_context, trace_path, count)))
+        return GET_CF_RUNNER('PAR', runner)(task_list, pool_size)
+
+    return set_form_metadata(SCATTER_implementation, 'SCATTER', [func], params, 
+                             {'shards': shards, 'chunk_size': chunk_size, 'chunker': chunker, 
+                              'pool_size': pool_size, 'runner': runner})
+
+# Concatenate the results of the shards of a SCATTER. Results that are
+# lists or tuples are joined, any other result is added as one element.
+def concatenate_shards(shard_results):
+    output = []
+    for result in shard_results:
+        if (type(result) == type([])) or (type(result) == type(tuple())):
+            output.extend(result)
+        else:
+            output.append(result)
+    return output
+
+# The GATHER form recombines the list of shard results produced by a 
+# SCATTER. By default the results are concatenated in order, see 
+# concatenate_shards(). func may be a function that takes the list of
+# shard results and returns the combined output, or a component, e.g. 
+# one merging BAM files, that is run with the list of shard results as 
+# its only parameter.
+def GATHER(func=None, params=None):
+    LOG.debug('GATHER cf called...preparing parameters')
+    
+    if func == None:
+        func = concatenate_shards
+    elif not (isinstance(func, Component) or callable(func)):
+        raise ValueError('GATHER: The gather function provided is not a component or callable: ' + str(func))
+    if isinstance(func, Component):
+        check_input_count(func, 1)
+    
+    LOG.debug('GATHER cf...generating GATHER implementation')
+    def GATHER_implementation(shard_results = params):
+        if shard_results == None:
+            shard_results = []
+        LOG.debug('GATHER: Combining the results of %s shards', len(shard_results))
+        if isinstance(func, Component):
+            return func.run([shard_results])
+        return func(shard_results)
+
+    elements = []
+    if isinstance(func, Component):
+        elements = [func]
+    return set_form_metadata(GATHER_implementation, 'GATHER', elements, params, {'func': func})
 
 # The FILTER form takes a list of integers and a list or tuple  
 # of function output data is its input. The integer list defines the indices
@@ -530,7 +949,7 @@ def SPLIT(param=None):
 # A new list or tuple is generated (dependent on the input type) and this
 # contains only the specified indices from the input data.
 def FILTER(selection_indices, params=None):
-    print "FILTER cf called...preparing parameters\n"
+    LOG.debug('FILTER cf called...preparing parameters')
 
     # If param_list is none, we expect to find the parameters
     # in a tuple with the function name or provided at a later time
@@ -542,26 +961,26 @@ def FILTER(selection_indices, params=None):
     # or a tuple of multiple parameters
     
     if params == None:
-        print 'FILTER: Parameters not provided, we expect to receive these with function call\n'
+        LOG.debug('FILTER: Parameters not provided, we expect to receive these with function call')
     else:
-        print 'FILTER: Parameter list provided\n'
+        LOG.debug('FILTER: Parameter list provided')
         
     
-    print "FILTER cf...generating FILTER implementation\n"
+    LOG.debug('FILTER cf...generating FILTER implementation')
     def FILTER_implementation(param_list = params, selection_indices = selection_indices):
 
-        print 'FILTER: Input data to filter: ' + str(param_list)
+        LOG.debug('FILTER: Input data to filter: %s', param_list)
             
         # Check that a list of integers was provided for the selection indices
         if type(selection_indices) != type([]):
-            print "FILTER: No selection indices specified, returning empty list"
+            LOG.debug('FILTER: No selection indices specified, returning empty list')
             return []
         
         # Check that enough parameters are available to satisfy all indices in the list
         if max(selection_indices) > len(param_list)-1:
-            print "FILTER: A selection index of " + str(max(selection_indices)) + \
-                " (zero indexed) was specified but only " + str(len(param_list)) + \
-                " input parameters have been provided. Returning empty list."
+            LOG.debug('FILTER: A selection index of %s (zero indexed) was specified but only' \
+                ' %s input parameters have been provided. Returning empty list.',
+                max(selection_indices), len(param_list))
             return []
            
         # Otherwise we now know that we can satisfy the requirements of the input
@@ -578,16 +997,16 @@ def FILTER(selection_indices, params=None):
             # Convert output to tuple so its in the same format as original input
             output_list = tuple(output_list)
         
-        print "FILTER: Return data from filter: " + str(output_list)
+        LOG.debug('FILTER: Return data from filter: %s', output_list)
         
         return output_list
 
-    return FILTER_implementation
+    return set_form_metadata(FILTER_implementation, 'FILTER', params=(selection_indices, params))
 
 # The APPEND form takes a component or co-ordination form description
 # and runs this entity, appending its output to the original input data  
 def APPEND(func, params=None):
-    print "APPEND cf called...preparing parameters\n"
+    LOG.debug('APPEND cf called...preparing parameters')
 
     # If param_list is none, we expect to find the parameters
     # in a tuple with the function name. If its not None,
@@ -598,52 +1017,37 @@ def APPEND(func, params=None):
     # or a tuple of multiple parameters
     
     if params == None:
-        print 'APPEND: Parameters not provided, we expect to receive these with function call\n'
+        LOG.debug('APPEND: Parameters not provided, we expect to receive these with function call')
     else:
-        print 'APPEND: Parameter list provided\n'
+        LOG.debug('APPEND: Parameter list provided')
         
     
-    print "APPEND cf...generating APPEND implementation\n"
-    def APPEND_implementation(param_list = params, func = func):
+    # The function and its static parameters are checked once when the
+    # APPEND is created
+    append_func, append_params = get_element_function(func, 'APPEND')
+    check_static_input(append_func, params, append_params)
+    
+    LOG.debug('APPEND cf...generating APPEND implementation')
+    def APPEND_implementation(param_list = params, func = append_func):
     
-        print 'Handling function ' + str(func)
+        LOG.debug('Handling function %s', func)
        
-        # The function passed to BYPASS may be an instance of component.Component
-        # or a tuple containing an instance of component.Component as the
-        # first element followed by parameters as the subsequent elements.
-        # Alternatively it may a nested coordination form - an instance of 
-        # types.FunctionType
+        # The function passed to APPEND may be an instance of component.Component,
+        # provided with static parameters in a tuple, or a nested coordination 
+        # form - an instance of types.FunctionType
         
-        new_params = None
+        new_params = append_params
         input = None
         output = None
-        
-        # If we have a tuple, extract the function and the other params
-        # Otherwise, func is already the function so leave it as is
-        if type(func) == type(tuple()):
-            new_params = func[1:]
-            func = func[0]
                                 
         # If for some reason there are params provided in new_params then we prepend the
         # initial_param_list to these params.
-        print 'APPEND: Initial params for function <' + str(params) + '>'
-        print 'APPEND: New params for function <' + str(new_params) + '>'
+        LOG.debug('APPEND: Initial params for function <%s>', params)
+        LOG.debug('APPEND: New params for function <%s>', new_params)
         
-        if param_list == None:
-            print 'param_list is empty so assuming we\'ll receive params on function call'
-        elif new_params != None:
-            # Need to check whether 'new_params' (those added into pipe in tuple with function name)
-            # are placed before or after the output params from the previous function
-            # Get metadata from function to determine whether to add additional
-            # params before or after existing params
-            if func.static_params_pre():
-                input = list(new_params) + list(param_list) 
-            else:
-                input = list(param_list) + list(new_params)
-        else:
-            input = list(param_list)
+        input = add_static_params(func, param_list, new_params)
         
-        print 'APPEND: Complete input to function <' + str(input) + '>\n'
+        LOG.debug('APPEND: Complete input to function <%s>', input)
         
         # Check if func is an instance of component.Component or a function
         # resulting from the pre-evaluation of another coordination forms expression
@@ -652,69 +1056,200 @@ def APPEND(func, params=None):
             # standard function that will be called via its metadata object.
             # The input may be coming from some
             # other coordination form that has not yet been evaluated.
-            print 'APPEND: Function ' + func.get_code() + ' requires ' + str(len(func.parameters)) + ' params. '
-            print 'APPEND: Function input contains: ' + str(len(input)) + ' params\n'
-            
-            # Count up the expected number of input parameters
-            expected_input_count = 0
-            for p in func.parameters:
-                if p.get_dir() == 'input':
-                    expected_input_count = expected_input_count + 1
-            print 'Expecting at least <' + str(expected_input_count) + '> input params for function <' \
-                + func.get_name() + '> which takes total of ' + str(len(func.parameters)) + ' params\n'
-            if len(input) < expected_input_count:
-                raise ValueError('Function ' + func.get_code + ' has ' + str(len(func.parameters)) + \
-                    ' parameters and expects ' + str(expected_input_count) + ' input parameters but only ' \
-                    + str(len(input)) + ' are available.')
+            LOG.debug('APPEND: Function %s requires %s params.', func.get_code(), len(func.parameters))
+            LOG.debug('APPEND: Function input contains: %s params', len(input))
+            LOG.debug('Expecting at least <%s> input params for function <%s> which takes' \
+                ' total of %s params', func.get_input_count(), func.get_name(), len(func.parameters))
+            check_input_count(func, len(input))
             
-            print 'About to run function <' + func.get_code() + '>...\n'
+            LOG.debug('About to run function <%s>...', func.get_code())
             output = func.run(input)
         elif isinstance(func, types.FunctionType):
             # If we reach this code, we assume that this APPEND contains
             # a pre-evaluated, nested, coordination forms expression
             # The input may be coming from some
             # other coordination form that has not yet been evaluated.
-            print 'APPEND: About to run pre-evaluated function <' + func.__name__ + '>...\n'
+            LOG.debug('APPEND: About to run pre-evaluated function <%s>...', func.__name__)
             if type(output) != type(list()):
                 if output != None:
                     output = [output]
             output = func(input)
-        else:
-            print('APPEND: The function provided is of an unknown type. Unable to evaluate this APPEND expression...')
-            raise ValueError('APPEND: The function provided is of an unknown type. Unable to evaluate this APPEND expression...')
-
         
         if isinstance(func, Component):
-            print 'APPEND: Handled function <' + str(func.get_code()) + '>. Combining input/output list.\n'
+            LOG.debug('APPEND: Handled function <%s>. Combining input/output list.', func.get_code())
         elif isinstance(func, types.FunctionType):
-            print 'APPEND: Handled function <' + func.__name__ + '>. Combining input/output list.\n'
+            LOG.debug('APPEND: Handled function <%s>. Combining input/output list.', func.__name__)
         
-        return_data = []
-        
-        if type(input) == type(output):
-            if (type(input) == type([])) or (type(input) == type(tuple())):
-                return_data = input + output
-            else:
-                return_data = [input] + [output]
-        elif type(input) == type([]):
-            if type(output) == type(tuple()):
-                return_data = input + list(output)
-            else:
-                return_data = input + [output]
-        elif type(input) == type(tuple()):
-            if type(output) == type([]):
-                return_data = input + tuple(output)
-            else:
-                return_data = input + (output, )
-        else:
-            return_data = [input] + [output]
+        return_data = append_output(input, output)
         
-        print 'Return data from APPEND: ' + str(return_data)
+        LOG.debug('Return data from APPEND: %s', return_data)
         
         return return_data
 
-    return APPEND_implementation
+    return set_form_metadata(APPEND_implementation, 'APPEND', [func], params)
+
+# The TOOLS form runs a component or coordination forms expression with 
+# the tool locations in tools, a dictionary of tool names and locations,
+# in place of those set in the toolchain used by the wrappers, see
+# libhpc.wrapper.toolchain. The locations apply only to the tasks of this
+# expression, so, for example, the tasks of a PAR can use different 
+# versions of a tool.
+def TOOLS(func, tools, params=None):
+    LOG.debug('TOOLS cf called...preparing parameters')
+    
+    if not (isinstance(func, Component) or callable(func)):
+        raise ValueError('TOOLS: The function provided is not a component or a coordination forms' \
+                         ' expression: ' + str(func))
+    if type(tools) != type({}):
+        raise ValueError('TOOLS: The tools must be provided as a dictionary of tool names and locations.')
+    tools = dict(tools)
+    
+    LOG.debug('TOOLS cf...generating TOOLS implementation')
+    def TOOLS_implementation(param_list = params):
+        LOG.debug('TOOLS: Running with tool locations %s', tools)
+        with use_tools(**tools):
+            if isinstance(func, Component):
+                return func.run(param_list)
+            if param_list == None:
+                return func()
+            return func(param_list)
+
+    return set_form_metadata(TOOLS_implementation, 'TOOLS', [func], params, {'tools': tools})
+
+# The GUARD form runs a component or coordination forms expression 
+# between two components that hold a resource for it, acquire and 
+# release, e.g. bwa.shm_acquire and bwa.shm_release. Each is given as a
+# component or a tuple of a component and its static parameters and is
+# run with the input of the form, as the function of a BYPASS is, its 
+# output being discarded. As in a try/finally block, release is run once
+# the expression has finished whether or not it succeeded, unless 
+# acquire failed. The output of the form is that of the expression.
+def GUARD(func, acquire, release, params=None):
+    LOG.debug('GUARD cf called...preparing parameters')
+    
+    if not (isinstance(func, Component) or callable(func)):
+        raise ValueError('GUARD: The function provided is not a component or a coordination forms' \
+                         ' expression: ' + str(func))
+    acquire_func, acquire_params = get_element_function(acquire, 'GUARD')
+    release_func, release_params = get_element_function(release, 'GUARD')
+    if not (isinstance(acquire_func, Component) and isinstance(release_func, Component)):
+        raise ValueError('GUARD: The acquire and release functions must be components.')
+    
+    def run_guard_component(component, static_params, param_list):
+        input = add_static_params(component, param_list, static_params)
+        if input == None:
+            input = list(static_params or [])
+        component.run(input)
+    
+    LOG.debug('GUARD cf...generating GUARD implementation')
+    def GUARD_implementation(param_list = params):
+        run_guard_component(acquire_func, acquire_params, param_list)
+        try:
+            if isinstance(func, Component):
+                return func.run(param_list)
+            if param_list == None:
+                return func()
+            return func(param_list)
+        finally:
+            run_guard_component(release_func, release_params, param_list)
+
+    return set_form_metadata(GUARD_implementation, 'GUARD', [func, acquire, release], params)
+
+# Check, when a BYPASS or APPEND expression is created with parameters,
+# that its function will receive enough input values.
+def check_static_input(func, params, static_params):
+    if isinstance(func, Component) and hasattr(params, '__len__'):
+        input_count = len(params)
+        if static_params != None:
+            input_count = input_count + len(static_params)
+        check_input_count(func, input_count)
+
+# Build the input to the function of a BYPASS or APPEND expression from
+# the parameters it was called with and the static parameters provided 
+# in a tuple with the function. Returns None if no parameters were 
+# provided.
+def add_static_params(func, param_list, new_params):
+    if param_list == None:
+        LOG.debug("param_list is empty so assuming we'll receive params on function call")
+        return None
+    if new_params != None:
+        # Need to check whether 'new_params' (those added into pipe in tuple with function name)
+        # are placed before or after the output params from the previous function
+        # Get metadata from function to determine whether to add additional
+        # params before or after existing params
+        if func.static_params_pre():
+            return list(new_params) + list(param_list) 
+        return list(param_list) + list(new_params)
+    return list(param_list)
+
+# Combine the input and output of the function of an APPEND expression.
+def append_output(input, output):
+    if type(input) == type(output):
+        if (type(input) == type([])) or (type(input) == type(tuple())):
+            return input + output
+        return [input] + [output]
+    elif type(input) == type([]):
+        if type(output) == type(tuple()):
+            return input + list(output)
+        return input + [output]
+    elif type(input) == type(tuple()):
+        if type(output) == type([]):
+            return input + tuple(output)
+        return input + (output, )
+    return [input] + [output]
+
+
+# Record the name of the coordination form and the elements (components,
+# component tuples or nested forms) that it was applied to, any 
+# parameters bound to the expression and the options, such as the runner,
+# it was created with on the function implementing an expression so that
+# the expression can be inspected.
+# The returned function records each invocation of the form as a trace 
+# event when tracing is enabled.
+def set_form_metadata(implementation, cf_string, elements=None, params=None, options=None):
+    def traced_implementation(*args, **kwargs):
+        if tracing.tracer == None:
+            return implementation(*args, **kwargs)
+        with tracing.span(cf_string, 'form'):
+            return implementation(*args, **kwargs)
+    traced_implementation.__name__ = implementation.__name__
+    traced_implementation.cf_form = cf_string
+    if elements == None:
+        elements = []
+    traced_implementation.cf_elements = list(elements)
+    traced_implementation.cf_params = params
+    if options == None:
+        options = {}
+    traced_implementation.cf_options = options
+    return traced_implementation
+
+# Return the list of component.Component instances used in a coordination
+# forms expression, in the order they appear, including those in nested
+# forms. Each component appears once.
+def get_components(expression):
+    components = []
+    seen = set()
+    pending = [expression]
+    while len(pending) > 0:
+        element = pending.pop(0)
+        if type(element) == type(tuple()):
+            element = element[0]
+        if isinstance(element, Component):
+            if id(element) not in seen:
+                seen.add(id(element))
+                components.append(element)
+        elif hasattr(element, 'cf_elements'):
+            pending = list(element.cf_elements) + pending
+    return components
 
+# Resolve the function of every component in a coordination forms
+# expression before it is run so that invalid entry points are reported
+# before any component is run. Returns the list of components.
+def resolve_expression(expression):
+    components = get_components(expression)
+    for component in components:
+        component.get_function()
+    return components
 
 # Process the provided list of parameters for replacement of tags.
 def process_param_tags(param_list, task_id=-1):
@@ -722,16 +1257,16 @@ def process_param_tags(param_list, task_id=-1):
     new_param_list = []
     for param in param_list:
         if type(param) == type(""):
-            print 'PRE_PROCESS_PARAM_TAGS: Checking string param for task ID replacement.'
+            LOG.debug('PRE_PROCESS_PARAM_TAGS: Checking string param for task ID replacement.')
             if PAR_TASK_IDENTIFIER_STRING in param:
-                print 'PRE_PROCESS_PARAM_TAGS: String PAR_ID replacement for: ' + str(param)
+                LOG.debug('PRE_PROCESS_PARAM_TAGS: String PAR_ID replacement for: %s', param)
                 param = param.replace(PAR_TASK_IDENTIFIER_STRING, str(task_id))
-                print 'PRE_PROCESS_PARAM_TAGS: Param after replacement: ' + str(param)
+                LOG.debug('PRE_PROCESS_PARAM_TAGS: Param after replacement: %s', param)
             elif PAR_TASK_IDENTIFIER_INT in param:
-                print 'PRE_PROCESS_PARAM_TAGS: Integer PAR_ID replacement for: ' + str(param)
+                LOG.debug('PRE_PROCESS_PARAM_TAGS: Integer PAR_ID replacement for: %s', param)
                 param = param.replace(PAR_TASK_IDENTIFIER_INT, str(task_id))
                 param = int(param)
-                print 'PRE_PROCESS_PARAM_TAGS: Param after replacement: ' + str(param)
+                LOG.debug('PRE_PROCESS_PARAM_TAGS: Param after replacement: %s', param)
         
         new_param_list.append(param)
     
@@ -0,0 +1,253 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import sys
+import time
+import Queue
+import threading
+
+# Futures for the results of coordination forms tasks that have been 
+# started but may not have finished, see forms.SUBMIT. A PAR can return
+# a FutureList, a future for each of its tasks, so that later stages can
+# start on each result as soon as it is ready rather than waiting for the
+# slowest task. A PAR given a FutureList as its input starts each task 
+# once the future for its input completes, see chain_future.
+#
+# A thread waiting for a future helps to run the pending tasks the future
+# depends on, as the thread calling WorkerPool.map does, so that waiting 
+# from within a pool thread, or with a pool of size 1, always makes 
+# progress.
+
+# The interval at which a waiting thread checks for new tasks it can help
+# with, where no task it depends on could be run when it started waiting.
+HELP_POLL_INTERVAL = 0.01
+
+class Future():
+    '''
+    The result of a task that may not have completed yet. helper is an
+    optional function that runs a pending task the future depends on, 
+    returning True if it ran a task.
+    '''
+    
+    def __init__(self, helper=None):
+        '''
+        Constructor
+        '''
+        self.condition = threading.Condition()
+        self.completed = False
+        self.value = None
+        self.exc_info = None
+        self.callbacks = []
+        self.helper = helper
+        # The future this future's completion depends on, which waiting
+        # threads help to complete
+        self.upstream = None
+    
+    def done(self):
+        return self.completed
+    
+    def set_result(self, value):
+        self.complete(value, None)
+    
+    # Complete the future with the exception from sys.exc_info()
+    def set_exc_info(self, exc_info):
+        self.complete(None, exc_info)
+    
+    def complete(self, value, exc_info):
+        with self.condition:
+            if self.completed:
+                raise ValueError('The future has already completed.')
+            self.value = value
+            self.exc_info = exc_info
+            self.completed = True
+            self.helper = None
+            self.upstream = None
+            self.condition.notify_all()
+            callbacks = self.callbacks
+            self.callbacks = []
+        # Callbacks are run without holding the lock so that they can use
+        # the future, e.g. to chain further tasks.
+        for callback in callbacks:
+            callback(self)
+    
+    # Call callback with the future once it has completed, immediately if 
+    # it already has.
+    def add_done_callback(self, callback):
+        with self.condition:
+            if not self.completed:
+                self.callbacks.append(callback)
+                return
+        callback(self)
+    
+    # Run a pending task this future depends on, returning True if one 
+    # was run.
+    def help(self):
+        helper = self.helper
+        if (helper != None) and helper():
+            return True
+        upstream = self.upstream
+        return (upstream != None) and upstream.help()
+    
+    # Wait for the future to complete, returning True if it has, or False 
+    # if the timeout expired first.
+    def wait(self, timeout=None):
+        deadline = None
+        if timeout != None:
+            deadline = time.time() + timeout
+        while not self.completed:
+            if self.help():
+                continue
+            interval = HELP_POLL_INTERVAL
+            if deadline != None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                interval = min(interval, remaining)
+            with self.condition:
+                if not self.completed:
+                    self.condition.wait(interval)
+        return True
+    
+    # Get the result, waiting for it if necessary. If the task raised an
+    # exception, it is raised here.
+    def result(self):
+        self.wait()
+        if self.exc_info != None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+    
+    def __repr__(self):
+        if not self.completed:
+            return 'Future(pending)'
+        if self.exc_info != None:
+            return 'Future(exception=' + repr(self.exc_info[1]) + ')'
+        return 'Future(' + repr(self.value) + ')'
+
+class FutureList(list):
+    '''
+    A list of futures for the results of the tasks of a form, in the 
+    order of the tasks.
+    '''
+    
+    # Get the list of results in task order, waiting for all of them
+    def result(self):
+        return [future.result() for future in self]
+    
+    # Iterate over (index, result) pairs in the order the tasks complete
+    def completed(self):
+        indexes = dict((id(future), index) for index, future in enumerate(self))
+        for future in as_completed(self):
+            yield (indexes[id(future)], future.result())
+
+# Get a future that has already completed with value
+def completed_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+# Run func with the value, or set the exception, from sys.exc_info(), of 
+# running it, on future.
+def run_into_future(future, func, *args):
+    try:
+        value = func(*args)
+    except:
+        future.set_exc_info(sys.exc_info())
+        return
+    future.set_result(value)
+
+# Get a future for the result of the future returned by submit(value) once
+# input_future completes with value. An exception from input_future, or 
+# from submit, completes the returned future.
+def chain_future(input_future, submit):
+    output = Future()
+    output.upstream = input_future
+    def copy_result(task_future):
+        if task_future.exc_info != None:
+            output.set_exc_info(task_future.exc_info)
+        else:
+            output.set_result(task_future.value)
+    def start_task(completed_input):
+        if completed_input.exc_info != None:
+            output.set_exc_info(completed_input.exc_info)
+            return
+        try:
+            task_future = submit(completed_input.value)
+        except:
+            output.set_exc_info(sys.exc_info())
+            return
+        output.upstream = task_future
+        task_future.add_done_callback(copy_result)
+    input_future.add_done_callback(start_task)
+    return output
+
+# Iterate over futures in the order in which they complete, helping to 
+# run the pending tasks they depend on while waiting.
+def as_completed(futures):
+    futures = list(futures)
+    completed = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(completed.put)
+    pending = set(id(future) for future in futures)
+    for _ in range(len(futures)):
+        while True:
+            try:
+                future = completed.get_nowait()
+                break
+            except Queue.Empty:
+                pass
+            helped = False
+            for waiting in futures:
+                if (id(waiting) in pending) and waiting.help():
+                    helped = True
+                    break
+            if not helped:
+                try:
+                    future = completed.get(True, HELP_POLL_INTERVAL)
+                    break
+                except Queue.Empty:
+                    pass
+        pending.discard(id(future))
+        yield future
+
+# Get the value of output, waiting for the results of a FutureList
+def resolve(output):
+    if isinstance(output, FutureList):
+        return output.result()
+    return output
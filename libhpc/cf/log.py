@@ -0,0 +1,85 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import sys
+import logging
+
+# Logging support for the coordination forms library. Modules log to
+# loggers named after the module (e.g. libhpc.cf.forms) under the 'libhpc'
+# logger. By default nothing is output and, since messages are only
+# formatted when their level is enabled, logging in the execution path
+# costs little more than a level check. Call set_verbosity() or configure
+# the 'libhpc' logger with the standard logging module to see messages.
+
+# An additional level, below DEBUG, for very verbose output such as the
+# contents of PAR result lists.
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+LOGGER_NAME = 'libhpc'
+
+_root_logger = logging.getLogger(LOGGER_NAME)
+_root_logger.addHandler(logging.NullHandler())
+_handler = None
+
+VERBOSITY_LEVELS = {'trace': TRACE, 'debug': logging.DEBUG, 'info': logging.INFO, 
+                    'warning': logging.WARNING, 'error': logging.ERROR}
+
+# Set the level of messages output by the library, either as one of the
+# names in VERBOSITY_LEVELS or a logging level number. Messages are written
+# to stream (default: stderr). Passing None stops the library's output.
+def set_verbosity(level, stream=None):
+    global _handler
+    if _handler != None:
+        _root_logger.removeHandler(_handler)
+        _handler = None
+    if level == None:
+        _root_logger.setLevel(logging.NOTSET)
+        return
+    if type(level) == type(''):
+        if level.lower() not in VERBOSITY_LEVELS:
+            raise ValueError('Unknown verbosity level <' + level + '>, expected one of ' + str(sorted(VERBOSITY_LEVELS.keys())))
+        level = VERBOSITY_LEVELS[level.lower()]
+    if stream == None:
+        stream = sys.stderr
+    _handler = logging.StreamHandler(stream)
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(threadName)-12s %(name)-18s %(levelname)-7s %(message)s'))
+    _root_logger.addHandler(_handler)
+    _root_logger.setLevel(level)
@@ -43,6 +43,9 @@ File created on Aug 7, 2012
 
 @author: jhc02
 '''
+import logging
+
+LOG = logging.getLogger(__name__)
 
 class Parameter():
     '''
@@ -61,16 +64,19 @@ class Parameter():
     dir = 'input'
     ignore_param = False
     index = None
+    # For output parameters, how to derive the parameter's value when none
+    # is provided: a tuple of the index of the parameter the value is 
+    # derived from and a filename template, see files.derive_filename
+    derive = None
     
     # The value of this parameter
     # value
     
 
-    def __init__(self, id, type, dir='input', ignore=None, index=None, value=None):
+    def __init__(self, id, type, dir='input', ignore=None, index=None, value=None, derive=None):
         '''
         Constructor
         '''
-        print 'Creating a new coordination forms parameter...'
         self.param_id = id
         if type not in self.param_types:
             raise ValueError(type + ' is not an accepted parameter data type value')
@@ -83,9 +89,15 @@ class Parameter():
         if (index != None) and (index >= 0):
             self.index = index
         self.value = value
-        print 'Creating a new coordination forms parameter...\n\tID: ' + self.param_id + '\tType: ' \
-            + self.type + '\tValue: ' + str(self.value) + '\n\tDirection: ' + self.dir + '\tIgnore: ' \
-            + str(self.ignore_param) + '\tIndex: ' + str(self.index) + '\n'
+        if derive != None:
+            if self.dir == 'input':
+                raise ValueError('Parameter <' + str(id) + '>: derive can only be specified for output and inout parameters')
+            if (not isinstance(derive, tuple)) or (len(derive) != 2):
+                raise ValueError('Parameter <' + str(id) + '>: derive must be a tuple of a parameter index and a filename template')
+            self.derive = derive
+        LOG.debug('Creating a new coordination forms parameter...\n\tID: %s\tType: %s\tValue: %s' \
+            '\n\tDirection: %s\tIgnore: %s\tIndex: %s', self.param_id, self.type, self.value, 
+            self.dir, self.ignore_param, self.index)
         
     def get_id(self):
         return self.param_id
@@ -101,6 +113,9 @@ class Parameter():
     
     def ignore(self):
         return self.ignore_param
+    
+    def get_derive(self):
+        return self.derive
 
 class ParameterList():
     '''
@@ -114,7 +129,7 @@ class ParameterList():
         '''
         Constructor
         '''
-        print 'Creating a new coordination forms parameter list with ' + len(param_list) + ' arguments...'
+        LOG.debug('Creating a new coordination forms parameter list with %s arguments...', len(param_list))
         
         for param in param_list:
             self.parameter_list.append(param)
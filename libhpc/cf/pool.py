@@ -0,0 +1,339 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import sys
+import time
+import atexit
+import threading
+import multiprocessing
+import Queue
+
+from futures import Future
+
+# Reusable, bounded pools of worker threads and worker processes used to
+# run the tasks of coordination forms such as PAR. Pools are shared per
+# size so that repeated evaluation of an expression does not create new
+# threads or processes.
+#
+# The process-wide default pool size can be set with set_default_pool_size()
+# or the LIBHPC_PAR_POOL_SIZE environment variable. If neither is provided,
+# the number of cores on the local machine is used.
+
+POOL_SIZE_ENV_VAR = 'LIBHPC_PAR_POOL_SIZE'
+
+# The longest time, in seconds, for which exit waits for idle worker 
+# threads to stop
+EXIT_JOIN_TIMEOUT = 0.5
+
+_default_pool_size = None
+_pools = {}
+_process_pools = {}
+_pools_lock = threading.Lock()
+
+def check_pool_size(size):
+    if (type(size) != type(0)) or (size < 1):
+        raise ValueError('The pool size must be a positive integer, got <' + str(size) + '>')
+    return size
+
+def set_default_pool_size(size):
+    global _default_pool_size
+    if size != None:
+        size = check_pool_size(size)
+    _default_pool_size = size
+
+def get_default_pool_size():
+    if _default_pool_size != None:
+        return _default_pool_size
+    if os.environ.get(POOL_SIZE_ENV_VAR):
+        try:
+            return check_pool_size(int(os.environ[POOL_SIZE_ENV_VAR]))
+        except ValueError:
+            raise ValueError('The ' + POOL_SIZE_ENV_VAR + ' environment variable must be set ' \
+                'to a positive integer, got <' + os.environ[POOL_SIZE_ENV_VAR] + '>')
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+# Get the shared pool of the requested size, creating it if necessary.
+# If no size is given, the process-wide default is used.
+def get_pool(size=None):
+    if size == None:
+        size = get_default_pool_size()
+    size = check_pool_size(size)
+    with _pools_lock:
+        if size not in _pools:
+            _pools[size] = WorkerPool(size)
+        return _pools[size]
+
+class _Batch():
+    '''
+    A set of tasks submitted to the pool by a single call to map or 
+    submit. Tasks are claimed one at a time by the pool's worker threads 
+    and by the thread that submitted the batch or, for submit, threads
+    waiting for the batch's futures.
+    '''
+
+    def __init__(self, func, items):
+        self.func = func
+        self.items = items
+        self.results = [None] * len(items)
+        self.exc_info = None
+        self.next_index = 0
+        self.remaining = len(items)
+        self.condition = threading.Condition()
+        # For submit, a futures.Future for the result of each task
+        self.futures = None
+
+    def claim(self):
+        with self.condition:
+            if self.next_index >= len(self.items):
+                return None
+            index = self.next_index
+            self.next_index = self.next_index + 1
+            return index
+
+    def run(self, index):
+        try:
+            self.results[index] = self.func(self.items[index])
+        except:
+            exc_info = sys.exc_info()
+            with self.condition:
+                if self.exc_info == None:
+                    self.exc_info = exc_info
+            if self.futures != None:
+                self.futures[index].set_exc_info(exc_info)
+        else:
+            if self.futures != None:
+                self.futures[index].set_result(self.results[index])
+        with self.condition:
+            self.remaining = self.remaining - 1
+            if self.remaining == 0:
+                self.condition.notify_all()
+
+    # Run the next unclaimed task, returning False if there are none
+    def run_next(self):
+        index = self.claim()
+        if index == None:
+            return False
+        self.run(index)
+        return True
+
+    def run_pending(self):
+        while self.run_next():
+            pass
+
+    def wait(self):
+        with self.condition:
+            while self.remaining > 0:
+                self.condition.wait()
+        if self.exc_info != None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.results
+
+class WorkerPool():
+    '''
+    A fixed-size pool of daemon worker threads. Worker threads are started
+    lazily the first time the pool is used and are reused for every
+    subsequent call.
+    '''
+
+    def __init__(self, size):
+        '''
+        Constructor
+        '''
+        self.size = check_pool_size(size)
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            # The thread calling map also runs tasks, so size-1 workers
+            # give a total concurrency of size.
+            while len(self._threads) < self.size - 1:
+                worker = threading.Thread(target=self._worker,
+                    name='libhpc-pool-' + str(self.size) + '-' + str(len(self._threads)))
+                worker.daemon = True
+                worker.start()
+                self._threads.append(worker)
+
+    def _worker(self):
+        while True:
+            batch = self._queue.get()
+            if batch == None:
+                return
+            batch.run_pending()
+
+    # Apply func to each element of items using the pool's threads and
+    # return the list of results in the order of items. The calling thread
+    # takes part in running the tasks so that a map issued from within a
+    # pool thread (e.g. a nested PAR) always makes progress. If any task
+    # raises an exception, the first exception is re-raised here once all
+    # tasks have finished.
+    def map(self, func, items):
+        items = list(items)
+        if len(items) == 0:
+            return []
+        batch = _Batch(func, items)
+        if len(items) > 1 and self.size > 1:
+            self._start()
+            for _ in range(min(self.size, len(items)) - 1):
+                self._queue.put(batch)
+        batch.run_pending()
+        return batch.wait()
+
+    # Start applying func to each element of items using the pool's threads
+    # and return a list of futures.Future for the results, in the order of
+    # items, without waiting for them. A thread waiting for one of the
+    # futures runs the batch's unclaimed tasks so that, as for map, waiting 
+    # from within a pool thread, or on a pool of size 1 that has no worker
+    # threads, makes progress.
+    def submit(self, func, items):
+        items = list(items)
+        batch = _Batch(func, items)
+        batch.futures = [Future(batch.run_next) for _ in items]
+        if len(items) > 0 and self.size > 1:
+            self._start()
+            for _ in range(min(self.size - 1, len(items))):
+                self._queue.put(batch)
+        return batch.futures
+
+    # Stop the worker threads once any queued work has been taken. The
+    # pool can still be used afterwards, new threads are started on demand.
+    # Returns the stopped threads.
+    def shutdown(self, wait=True):
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+            for _ in threads:
+                self._queue.put(None)
+        if wait:
+            for worker in threads:
+                worker.join()
+        return threads
+
+# Get the shared pool of worker processes of the requested size, creating
+# it if necessary. If no size is given, the process-wide default is used.
+def get_process_pool(size=None):
+    if size == None:
+        size = get_default_pool_size()
+    size = check_pool_size(size)
+    with _pools_lock:
+        if size not in _process_pools:
+            _process_pools[size] = ProcessWorkerPool(size)
+        return _process_pools[size]
+
+class ProcessWorkerPool():
+    '''
+    A fixed-size pool of worker processes for tasks that are limited by the
+    global interpreter lock. Worker processes are started lazily and reused
+    for every subsequent call. Functions and task arguments passed to the
+    pool must be picklable.
+    '''
+
+    def __init__(self, size):
+        '''
+        Constructor
+        '''
+        self.size = check_pool_size(size)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool == None:
+                self._pool = multiprocessing.Pool(self.size)
+            return self._pool
+
+    # Start applying func to each element of items in the worker processes.
+    # Tasks are sent to the workers in chunks to reduce the number of
+    # messages that need to be pickled. Returns a handle whose get()
+    # method returns the results in the order of items.
+    def map_async(self, func, items):
+        items = list(items)
+        chunksize, extra = divmod(len(items), self.size * 4)
+        if extra or chunksize == 0:
+            chunksize = chunksize + 1
+        return self._get_pool().map_async(func, items, chunksize)
+
+    def map(self, func, items):
+        return self.map_async(func, items).get()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            process_pool = self._pool
+            self._pool = None
+        if process_pool != None:
+            process_pool.close()
+            if wait:
+                process_pool.join()
+
+    # Stop the worker processes straight away, abandoning any tasks they
+    # are running or have queued.
+    def terminate(self):
+        with self._lock:
+            process_pool = self._pool
+            self._pool = None
+        if process_pool != None:
+            process_pool.terminate()
+            process_pool.join()
+
+# Stop the workers before the interpreter is torn down. Exit does not 
+# wait for work still running in the pools: the thread pools' daemon 
+# threads are told to stop without waiting for them and the worker 
+# processes are terminated. Idle threads are given EXIT_JOIN_TIMEOUT 
+# seconds to take the stop request so that they are not woken while the
+# interpreter is being torn down.
+def _shutdown_pools():
+    with _pools_lock:
+        thread_pools = _pools.values()
+        process_pools = _process_pools.values()
+    threads = []
+    for worker_pool in thread_pools:
+        threads.extend(worker_pool.shutdown(wait=False))
+    for worker_pool in process_pools:
+        worker_pool.terminate()
+    deadline = time.time() + EXIT_JOIN_TIMEOUT
+    for worker in threads:
+        worker.join(max(0, deadline - time.time()))
+
+atexit.register(_shutdown_pools)
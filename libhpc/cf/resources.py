@@ -0,0 +1,271 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+from files import parse_size
+
+LOG = logging.getLogger(__name__)
+
+# Resource-aware scheduling. A component can declare the CPUs, memory 
+# and scratch disk space that a run of it needs (see 
+# component.Component), e.g. a GATK tool needing an 8GB heap. The 
+# 'resources' PAR runner and task graphs run with a resource pool only
+# start a task when the node has the resources it needs free, packing 
+# tasks onto the node's actual resources rather than running a fixed 
+# number of tasks at once. Tasks are considered largest first so that 
+# small tasks fill the space left around the large ones.
+#
+# A component's CPU requirement may be a range, a tuple of the minimum 
+# and maximum number of CPUs it can use. Such a task is allocated a 
+# share of the free CPUs within its range and, if the component declares 
+# the keyword argument its wrapper takes a thread count through, the 
+# allocated count is passed to the wrapper.
+#
+# The node's resources are detected when the pool is created. They can 
+# be overridden with the LIBHPC_CF_CPUS, LIBHPC_CF_MEMORY and 
+# LIBHPC_CF_SCRATCH environment variables. Scratch space is measured in 
+# the directory named by LIBHPC_CF_SCRATCH_DIR, or the temporary 
+# directory if it is not set.
+
+CPUS_ENV_VAR = 'LIBHPC_CF_CPUS'
+MEMORY_ENV_VAR = 'LIBHPC_CF_MEMORY'
+SCRATCH_ENV_VAR = 'LIBHPC_CF_SCRATCH'
+SCRATCH_DIR_ENV_VAR = 'LIBHPC_CF_SCRATCH_DIR'
+
+_resource_pool = None
+_resource_pool_lock = threading.Lock()
+
+class ResourceRequest():
+    '''
+    The resources needed by a single run of a component.
+    '''
+    
+    def __init__(self, cpus=1, memory=0, scratch=0):
+        '''
+        Constructor
+        '''
+        if isinstance(cpus, tuple):
+            if len(cpus) != 2:
+                raise ValueError('A CPU range must be a tuple of the minimum and maximum number of CPUs, got <' + 
+                                 str(cpus) + '>')
+            self.min_cpus, self.max_cpus = cpus
+        else:
+            self.min_cpus = cpus
+            self.max_cpus = cpus
+        if (type(self.min_cpus) != type(0)) or (type(self.max_cpus) != type(0)) or \
+                (self.min_cpus < 1) or (self.max_cpus < self.min_cpus):
+            raise ValueError('Invalid CPU requirement <' + str(cpus) + '>, expected a positive integer or a ' \
+                             'tuple of a minimum and maximum')
+        # Memory and scratch space in bytes, sizes such as '8G' are accepted
+        self.memory = parse_size(memory)
+        self.scratch = parse_size(scratch)
+    
+    # The key used to order tasks for packing, largest first
+    def get_size_key(self):
+        return (-self.memory, -self.min_cpus, -self.scratch)
+    
+    def __repr__(self):
+        cpus = str(self.min_cpus)
+        if self.max_cpus != self.min_cpus:
+            cpus = cpus + '-' + str(self.max_cpus)
+        return '<ResourceRequest cpus: ' + cpus + ' memory: ' + str(self.memory) + \
+            ' scratch: ' + str(self.scratch) + '>'
+
+DEFAULT_REQUEST = ResourceRequest()
+
+class ResourceAllocation():
+    '''
+    The resources allocated to a running task by a ResourcePool.
+    '''
+    
+    def __init__(self, cpus, memory, scratch):
+        '''
+        Constructor
+        '''
+        self.cpus = cpus
+        self.memory = memory
+        self.scratch = scratch
+
+class ResourcePool():
+    '''
+    The CPUs, memory and scratch space of a node, shared by the tasks 
+    running on it.
+    '''
+    
+    def __init__(self, cpus=None, memory=None, scratch=None):
+        '''
+        Constructor
+        '''
+        if cpus == None:
+            cpus = detect_cpus()
+        if memory == None:
+            memory = detect_memory()
+        if scratch == None:
+            scratch = detect_scratch()
+        self.total_cpus = cpus
+        self.total_memory = parse_size(memory)
+        self.total_scratch = parse_size(scratch)
+        self.free_cpus = self.total_cpus
+        self.free_memory = self.total_memory
+        self.free_scratch = self.total_scratch
+        # The condition is reentrant so that schedulers can hold it while
+        # they acquire resources for several tasks.
+        self.condition = threading.Condition(threading.RLock())
+        LOG.debug('Created resource pool: %s CPUs, %s bytes memory, %s bytes scratch', 
+                  self.total_cpus, self.total_memory, self.total_scratch)
+    
+    # Limit a request to the size of the node so that a task needing more
+    # than the node has can still run, on its own.
+    def clamp(self, request):
+        memory = request.memory
+        if (self.total_memory != None) and (memory > self.total_memory):
+            LOG.warning('Task requires %s bytes of memory but only %s are available, running it alone.', 
+                        memory, self.total_memory)
+            memory = self.total_memory
+        scratch = request.scratch
+        if (self.total_scratch != None) and (scratch > self.total_scratch):
+            LOG.warning('Task requires %s bytes of scratch space but only %s are available, running it alone.', 
+                        scratch, self.total_scratch)
+            scratch = self.total_scratch
+        return (min(request.min_cpus, self.total_cpus), min(request.max_cpus, self.total_cpus), memory, scratch)
+    
+    # Allocate the resources for request if they are free and return the
+    # ResourceAllocation, otherwise return None. A task with a CPU range
+    # is given an equal share of the free CPUs between share tasks, 
+    # within its range.
+    def try_acquire(self, request, share=1):
+        min_cpus, max_cpus, memory, scratch = self.clamp(request)
+        with self.condition:
+            if (min_cpus > self.free_cpus) or \
+                    ((self.free_memory != None) and (memory > self.free_memory)) or \
+                    ((self.free_scratch != None) and (scratch > self.free_scratch)):
+                return None
+            cpus = max(min_cpus, min(max_cpus, self.free_cpus // max(share, 1)))
+            self.free_cpus = self.free_cpus - cpus
+            if self.free_memory != None:
+                self.free_memory = self.free_memory - memory
+            if self.free_scratch != None:
+                self.free_scratch = self.free_scratch - scratch
+            return ResourceAllocation(cpus, memory, scratch)
+    
+    # Wait until the resources for request are free and allocate them
+    def acquire(self, request):
+        with self.condition:
+            allocation = self.try_acquire(request)
+            while allocation == None:
+                self.condition.wait()
+                allocation = self.try_acquire(request)
+            return allocation
+    
+    def release(self, allocation):
+        with self.condition:
+            self.free_cpus = self.free_cpus + allocation.cpus
+            if self.free_memory != None:
+                self.free_memory = self.free_memory + allocation.memory
+            if self.free_scratch != None:
+                self.free_scratch = self.free_scratch + allocation.scratch
+            self.condition.notify_all()
+
+def get_env_size(env_var):
+    value = os.environ.get(env_var)
+    if not value:
+        return None
+    return parse_size(value)
+
+def detect_cpus():
+    cpus = get_env_size(CPUS_ENV_VAR)
+    if cpus != None:
+        return cpus
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+# The physical memory of the node, or None if it cannot be determined in
+# which case memory requirements are not enforced.
+def detect_memory():
+    memory = get_env_size(MEMORY_ENV_VAR)
+    if memory != None:
+        return memory
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+# The space available in the scratch directory, or None if it cannot be
+# determined in which case scratch requirements are not enforced.
+def detect_scratch():
+    scratch = get_env_size(SCRATCH_ENV_VAR)
+    if scratch != None:
+        return scratch
+    directory = os.environ.get(SCRATCH_DIR_ENV_VAR) or tempfile.gettempdir()
+    try:
+        stats = os.statvfs(directory)
+        return stats.f_bavail * stats.f_frsize
+    except (OSError, AttributeError):
+        return None
+
+def set_resource_pool(pool):
+    global _resource_pool
+    _resource_pool = pool
+
+# Get the resource pool for the process, creating one for the local node
+# if none has been set.
+def get_resource_pool():
+    global _resource_pool
+    with _resource_pool_lock:
+        if _resource_pool == None:
+            _resource_pool = ResourcePool()
+        return _resource_pool
+
+# Get the resources needed by a task running func, or None if the task 
+# does not itself need any, e.g. a nested coordination form.
+def get_resource_request(func):
+    if hasattr(func, 'get_resources'):
+        request = func.get_resources()
+        if request == None:
+            return DEFAULT_REQUEST
+        return request
+    return None
@@ -0,0 +1,492 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import sys
+import logging
+import threading
+import itertools
+import collections
+
+from component import Component
+from pool import get_pool, get_process_pool, get_default_pool_size
+from futures import Future, FutureList, resolve
+from context import bind_context, ALLOCATED_THREADS_KEY
+from resources import get_resource_pool, get_resource_request
+from cache import get_result_cache
+from uptodate import get_skip_up_to_date
+from libhpc.wrapper.stream import run_pipeline, get_pipeline_status
+from libhpc.wrapper.process import wait_any
+import tracing
+
+LOG = logging.getLogger(__name__)
+
+# A registry of the available implementations (runners) of each
+# coordination form. A runner is selected by name, either for an
+# individual expression, globally for the process using set_cf_runner()
+# or through an environment variable of the form LIBHPC_CF_RUNNER_<FORM>,
+# e.g. LIBHPC_CF_RUNNER_PAR=processes. If no selection is made, the
+# default runner registered for the form is used.
+#
+# PAR runners are called with a list of tasks, each a tuple of a
+# component.Component or nested coordination form, its parameters and
+# the context (see libhpc.cf.context) to run it in, and the requested
+# pool size. They return the list of task results in
+# the order of the task list.
+#
+# PIPE runners are called with a list of stages, in the order in which
+# they are to be run, and the initial input to the PIPE. Each stage is
+# a callable that takes the output of the previous stage and returns
+# its own output. PIPE runners return the output of the final stage.
+#
+# A PAR runner can also have a submitter, registered under the same name,
+# that starts the tasks without waiting for them and returns a 
+# futures.Future for each task's result, see submit_cf_tasks.
+
+RUNNER_ENV_VAR_PREFIX = 'LIBHPC_CF_RUNNER_'
+
+_runners = {}
+_default_runners = {}
+_selected_runners = {}
+_submitters = {}
+_runners_lock = threading.Lock()
+
+def register_cf_runner(cf_string, name, runner, default=False):
+    if not callable(runner):
+        raise ValueError('The runner <' + str(name) + '> registered for form <' + cf_string + '> is not callable.')
+    with _runners_lock:
+        _runners.setdefault(cf_string, {})[name] = runner
+        if default or (cf_string not in _default_runners):
+            _default_runners[cf_string] = name
+
+def list_cf_runners(cf_string):
+    with _runners_lock:
+        return sorted(_runners.get(cf_string, {}).keys())
+
+def check_cf_runner(cf_string, name):
+    if name not in list_cf_runners(cf_string):
+        raise ValueError('Unknown runner <' + str(name) + '> for form <' + cf_string + \
+            '>, expected one of ' + str(list_cf_runners(cf_string)))
+    return name
+
+# Select the runner to be used for a form by any expression that
+# doesn't specify its own runner. Passing None clears the selection.
+def set_cf_runner(cf_string, name):
+    with _runners_lock:
+        if name == None:
+            _selected_runners.pop(cf_string, None)
+            return
+    check_cf_runner(cf_string, name)
+    with _runners_lock:
+        _selected_runners[cf_string] = name
+
+# Get the name of the runner to be used for a form. An explicit name
+# takes precedence over the process-wide selection which, in turn,
+# takes precedence over the environment and the registered default.
+def get_cf_runner_name(cf_string, name=None):
+    if name == None:
+        with _runners_lock:
+            name = _selected_runners.get(cf_string)
+    if name == None:
+        name = os.environ.get(RUNNER_ENV_VAR_PREFIX + cf_string)
+    if name == None:
+        with _runners_lock:
+            name = _default_runners.get(cf_string)
+    return check_cf_runner(cf_string, name)
+
+def get_cf_runner(cf_string, name=None):
+    name = get_cf_runner_name(cf_string, name)
+    with _runners_lock:
+        return _runners[cf_string][name]
+
+def register_cf_submitter(cf_string, name, submitter):
+    if not callable(submitter):
+        raise ValueError('The submitter <' + str(name) + '> registered for form <' + cf_string + '> is not callable.')
+    with _runners_lock:
+        _submitters.setdefault(cf_string, {})[name] = submitter
+
+# Start running a list of tasks with the selected runner for the form 
+# and return a list of futures.Future for their results, in the order of
+# the task list. Runners without a submitter run the whole task list in a
+# separate thread, so their futures all complete together.
+def submit_cf_tasks(cf_string, task_list, pool_size=None, name=None):
+    name = get_cf_runner_name(cf_string, name)
+    with _runners_lock:
+        submitter = _submitters.get(cf_string, {}).get(name)
+    if submitter != None:
+        return submitter(task_list, pool_size)
+    return submit_with_runner(get_cf_runner(cf_string, name), task_list, pool_size)
+
+def submit_with_runner(runner, task_list, pool_size=None):
+    futures = [Future() for _ in task_list]
+    def run_tasks():
+        try:
+            results = runner(task_list, pool_size)
+        except:
+            exc_info = sys.exc_info()
+            for future in futures:
+                future.set_exc_info(exc_info)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+    if len(task_list) > 0:
+        runner_thread = threading.Thread(target=run_tasks, name='libhpc-submit')
+        runner_thread.daemon = True
+        runner_thread.start()
+    return futures
+
+# Run an iterable of tasks with the selected runner for the form, 
+# returning a generator of their results in the order of the tasks. Tasks
+# are taken from the iterable as earlier results are yielded so that no 
+# more than max_pending tasks, by default twice the pool size, are held 
+# at once. Runners with a submitter keep max_pending tasks running, 
+# others are run with chunks of max_pending tasks.
+def stream_cf_tasks(cf_string, tasks, pool_size=None, name=None, max_pending=None):
+    name = get_cf_runner_name(cf_string, name)
+    if pool_size == None:
+        pool_size = get_default_pool_size()
+    if max_pending == None:
+        max_pending = 2 * pool_size
+    with _runners_lock:
+        submitter = _submitters.get(cf_string, {}).get(name)
+    if submitter != None:
+        return stream_with_submitter(submitter, tasks, pool_size, max_pending)
+    return stream_with_runner(get_cf_runner(cf_string, name), tasks, pool_size, max_pending)
+
+def stream_with_submitter(submitter, tasks, pool_size, max_pending):
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(submitter([task], pool_size)[0])
+        while len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+def stream_with_runner(runner, tasks, pool_size, max_pending):
+    tasks = iter(tasks)
+    chunk = list(itertools.islice(tasks, max_pending))
+    while len(chunk) > 0:
+        for result in runner(chunk, pool_size):
+            yield result
+        chunk = list(itertools.islice(tasks, max_pending))
+
+# Run a single PAR task, a tuple containing either an instance of
+# component.Component or a nested coordination form, its parameters and
+# the context to run it in.
+def run_par_task(task):
+    func, params, task_context = task
+    with bind_context(task_context):
+        if isinstance(func, Component):
+            return func.run(params)
+        return func(params)
+
+# Run a PAR task in a worker process. If the task was submitted while 
+# tracing, the trace events recorded while running it are returned with
+# the result so that they can be added to the submitting process' tracer.
+def run_par_task_in_process(task):
+    if task[2].get(tracing.TRACE_PATH_KEY) == None:
+        return (run_par_task(task), None)
+    with tracing.EventCollector() as task_tracer:
+        result = run_par_task(task)
+    return (result, (task_tracer.events, task_tracer.thread_names))
+
+def run_par_sequential(task_list, pool_size=None):
+    return [run_par_task(task) for task in task_list]
+
+def run_par_threads(task_list, pool_size=None):
+    return get_pool(pool_size).map(run_par_task, task_list)
+
+def submit_par_threads(task_list, pool_size=None):
+    return get_pool(pool_size).submit(run_par_task, task_list)
+
+# Run a list of PAR tasks, sending those that run a component.Component
+# to a pool of worker processes. Nested coordination forms cannot be
+# pickled so these are run on the local thread pool, concurrently with
+# the component tasks.
+def run_par_processes(task_list, pool_size=None):
+    output = [None] * len(task_list)
+    component_indexes = []
+    local_indexes = []
+    for index in range(len(task_list)):
+        if isinstance(task_list[index][0], Component):
+            component_indexes.append(index)
+        else:
+            local_indexes.append(index)
+    
+    component_results = None
+    if len(component_indexes) > 0:
+        component_results = get_process_pool(pool_size).map_async(run_par_task_in_process, 
+                                [task_list[index] for index in component_indexes])
+    if len(local_indexes) > 0:
+        local_results = get_pool(pool_size).map(run_par_task, 
+                                [task_list[index] for index in local_indexes])
+        for index, result in zip(local_indexes, local_results):
+            output[index] = result
+    if component_results != None:
+        active_tracer = tracing.tracer
+        for index, (result, task_trace) in zip(component_indexes, component_results.get()):
+            output[index] = result
+            if (task_trace != None) and (active_tracer != None):
+                active_tracer.add_events(task_trace[0], task_trace[1])
+    return output
+
+# Run a list of PAR tasks, starting the tools of the tasks whose 
+# component provides a command (see component.Component.get_command) 
+# directly rather than running the component's function on a thread that
+# waits for the tool. At most pool_size of these tools run at once. The 
+# process supervisor (see libhpc.wrapper.process) reports as each tool
+# exits and the next is then started, so the running tools do not need a
+# thread each. Other tasks, and tasks whose result may come from the 
+# result cache or whose outputs are up to date, are run on the thread 
+# pool as by run_par_threads.
+def run_par_launch(task_list, pool_size=None):
+    if pool_size == None:
+        pool_size = get_default_pool_size()
+    output = [None] * len(task_list)
+    launch_indexes = []
+    local_indexes = []
+    for index in range(len(task_list)):
+        if can_launch_task(task_list[index]):
+            launch_indexes.append(index)
+        else:
+            local_indexes.append(index)
+    
+    local_futures = []
+    if len(local_indexes) > 0:
+        local_futures = submit_par_threads([task_list[index] for index in local_indexes], pool_size)
+    # The running tools, a list of (handle, task index, command) tuples
+    running = []
+    try:
+        while (len(launch_indexes) > 0) or (len(running) > 0):
+            while (len(launch_indexes) > 0) and (len(running) < pool_size):
+                index = launch_indexes.pop(0)
+                command = get_task_command(task_list[index])
+                running.append((command.launch(), index, command))
+            completed = wait_any([handle for handle, _, _ in running])
+            for handle, index, command in [entry for entry in running if entry[0] in completed]:
+                running.remove((handle, index, command))
+                output[index] = get_launched_task_result(task_list[index], command, handle)
+    except:
+        for handle, _, _ in running:
+            handle.kill()
+        raise
+    for index, future in zip(local_indexes, local_futures):
+        output[index] = future.result()
+    return output
+
+# Whether the tool of a PAR task can be launched by run_par_launch
+def can_launch_task(task):
+    func, params, task_context = task
+    if not (isinstance(func, Component) and func.can_launch()):
+        return False
+    if func.cacheable and (get_result_cache() != None):
+        return False
+    if get_skip_up_to_date():
+        if not hasattr(params, '__iter__'):
+            params = [params]
+        with bind_context(task_context):
+            return not func.get_up_to_date_result(params)[0]
+    return True
+
+def get_task_command(task):
+    func, params, task_context = task
+    with bind_context(task_context):
+        return func.get_command(params)
+
+# Build the result of a PAR task from the exit status of its launched 
+# tool, as the component's function would, recording the tool's run as
+# a trace event when tracing.
+def get_launched_task_result(task, command, handle):
+    func, params, task_context = task
+    if handle.returncode != 0:
+        LOG.error('Command <%s> exited with status %s', command, handle.returncode)
+    active_tracer = tracing.tracer
+    if active_tracer != None:
+        path = task_context.get(tracing.TRACE_PATH_KEY, ()) + (func.get_id(),)
+        active_tracer.add_event(func.get_id(), 'component', handle.start_time, handle.end_time, path,
+                                {'component_id': func.get_id(), 'name': func.get_name(), 'command': str(command)})
+    return func.process_result(command.get_result(handle.returncode))
+
+# Run a list of PAR tasks, starting each task once the CPUs, memory and 
+# scratch space it needs are free in the process' resource pool (see 
+# libhpc.cf.resources). Tasks are considered in decreasing order of size,
+# so that smaller tasks fill the space left by larger ones, and at most
+# pool_size tasks run at once. Tasks running nested coordination forms
+# need no resources themselves.
+def run_par_resources(task_list, pool_size=None):
+    if len(task_list) == 0:
+        return []
+    if pool_size == None:
+        pool_size = get_default_pool_size()
+    state = _ResourceRun(task_list, get_resource_pool())
+    worker_count = min(pool_size, len(task_list))
+    get_pool(worker_count).map(state.work, range(worker_count))
+    if state.exc_info != None:
+        raise state.exc_info[0], state.exc_info[1], state.exc_info[2]
+    return state.output
+
+class _ResourceRun():
+    '''
+    The state of a single run of the resources PAR runner, shared by the
+    threads running its tasks.
+    '''
+    
+    def __init__(self, task_list, resource_pool):
+        self.task_list = task_list
+        self.resource_pool = resource_pool
+        self.requests = [get_resource_request(task[0]) for task in task_list]
+        self.pending = sorted(range(len(task_list)), key=self.get_size_key)
+        self.output = [None] * len(task_list)
+        self.exc_info = None
+    
+    def get_size_key(self, index):
+        if self.requests[index] == None:
+            return ((0, 0, 0), index)
+        return (self.requests[index].get_size_key(), index)
+    
+    # Claim the largest pending task whose resources are free, waiting 
+    # until one can be started. Returns the task index and its allocation,
+    # or None once no tasks are pending.
+    def claim(self):
+        condition = self.resource_pool.condition
+        with condition:
+            while (len(self.pending) > 0) and (self.exc_info == None):
+                for position, index in enumerate(self.pending):
+                    allocation = None
+                    if self.requests[index] != None:
+                        allocation = self.resource_pool.try_acquire(self.requests[index], len(self.pending))
+                        if allocation == None:
+                            continue
+                    del self.pending[position]
+                    return (index, allocation)
+                condition.wait()
+            return None
+    
+    def work(self, worker_index):
+        claimed = self.claim()
+        while claimed != None:
+            index, allocation = claimed
+            func, params, task_context = self.task_list[index]
+            try:
+                if allocation != None:
+                    task_context = dict(task_context)
+                    task_context[ALLOCATED_THREADS_KEY] = allocation.cpus
+                self.output[index] = run_par_task((func, params, task_context))
+            except:
+                with self.resource_pool.condition:
+                    if self.exc_info == None:
+                        self.exc_info = sys.exc_info()
+                    self.resource_pool.condition.notify_all()
+            finally:
+                if allocation != None:
+                    self.resource_pool.release(allocation)
+            claimed = self.claim()
+
+# Run the stages of a PIPE in turn. A stage that can submit its tasks (see 
+# forms.PAR) does so where its input is a futures.FutureList or the next 
+# stage can also submit, so that each task of the next stage starts as 
+# soon as the result it takes as input is ready rather than once all of
+# the stage's tasks have finished. Other stages, and the PIPE's output, 
+# get the results of a FutureList in the order of its tasks.
+def run_pipe_sequential(stage_list, initial_input=None):
+    output = initial_input
+    for index, stage in enumerate(stage_list):
+        if can_submit(stage) and (isinstance(output, FutureList) or \
+                ((index + 1 < len(stage_list)) and can_submit(stage_list[index + 1]))):
+            output = stage.submit(output)
+        else:
+            output = stage(resolve(output))
+    return resolve(output)
+
+def can_submit(stage):
+    return hasattr(stage, 'can_submit') and stage.can_submit()
+
+# Run a PIPE, connecting adjacent stages whose components can stream 
+# (see component.Component.get_stream_command) through OS pipes. The 
+# tools in each group of such stages run concurrently, each reading the
+# previous tool's output from its stdin, so the intermediate files 
+# between them are not written. A tool that writes faster than the next
+# can read blocks once the pipe is full. Other stages are run in turn as 
+# in run_pipe_sequential. The value passed on from a group is built from
+# the exit status of the group, the status of the last tool in it to 
+# fail or 0 if all succeeded, as with the shell's pipefail option. The
+# result cache and up to date checks are not applied to streamed stages.
+def run_pipe_streaming(stage_list, initial_input=None):
+    output = initial_input
+    index = 0
+    while index < len(stage_list):
+        end = index
+        while (end < len(stage_list)) and hasattr(stage_list[end], 'can_stream') and stage_list[end].can_stream():
+            end = end + 1
+        if end - index < 2:
+            output = stage_list[index](output)
+            index = index + 1
+            continue
+        output = run_stream_group(stage_list[index:end], output)
+        index = end
+    return output
+
+def run_stream_group(stage_list, initial_input):
+    commands = []
+    output = initial_input
+    for position, stage in enumerate(stage_list):
+        read_stdin = (position > 0)
+        write_stdout = (position < len(stage_list) - 1)
+        commands.append(stage.get_stream_command(output, read_stdin, write_stdout))
+        # The output the stage will produce if its tool succeeds, used to 
+        # prepare the next stage's parameters, e.g. to name its outputs
+        output = stage.func.process_result(commands[-1].get_result(0))
+    
+    if tracing.tracer != None:
+        with tracing.span('PIPE stages ' + str(stage_list[0].position) + '-' + str(stage_list[-1].position), 
+                          'stage', args={'commands': [str(command) for command in commands]}):
+            statuses = run_pipeline(commands)
+    else:
+        statuses = run_pipeline(commands)
+    return stage_list[-1].func.process_result(commands[-1].get_result(get_pipeline_status(statuses)))
+
+register_cf_runner('PAR', 'threads', run_par_threads, default=True)
+register_cf_runner('PAR', 'sequential', run_par_sequential)
+register_cf_runner('PAR', 'processes', run_par_processes)
+register_cf_runner('PAR', 'resources', run_par_resources)
+register_cf_runner('PAR', 'launch', run_par_launch)
+register_cf_submitter('PAR', 'threads', submit_par_threads)
+register_cf_runner('PIPE', 'sequential', run_pipe_sequential, default=True)
+register_cf_runner('PIPE', 'streaming', run_pipe_streaming)
@@ -0,0 +1,217 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+import json
+import time
+import threading
+
+from context import get_context_value, bind_values
+
+# Opt-in execution tracing for coordination forms. When tracing is enabled,
+# each component run and each coordination form invocation is recorded with
+# its start and end time, the process and thread that ran it and its 
+# nesting path within the expression, e.g. PIPE[1]/PAR[3]/bwa.align. 
+# Recorded events can be exported in the Chrome trace-event format and
+# viewed as a timeline in chrome://tracing or https://ui.perfetto.dev.
+#
+# When tracing is disabled, the only cost in the execution path is a check
+# of the module-level tracer variable.
+#
+# Example:
+#   tracing.enable_tracing()
+#   PIPE([...], inputs)()
+#   tracing.write_chrome_trace('pipeline_trace.json')
+
+TRACE_PATH_KEY = 'trace_path'
+
+# The active tracer, None when tracing is disabled
+tracer = None
+
+class Tracer():
+    '''
+    Collects the trace events recorded while tracing is enabled.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.events = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+    
+    def add_event(self, name, category, start, end, path, args=None):
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                 'pid': os.getpid(), 'tid': thread.ident,
+                 'args': {'path': format_path(path)}}
+        if args != None:
+            event['args'].update(args)
+        with self.lock:
+            self.events.append(event)
+            self.thread_names[(event['pid'], event['tid'])] = thread.name
+    
+    # Add events, and their thread names, recorded by another tracer
+    # e.g. one in a worker process.
+    def add_events(self, events, thread_names):
+        with self.lock:
+            self.events.extend(events)
+            self.thread_names.update(thread_names)
+    
+    def to_chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = []
+        for (pid, tid), thread_name in sorted(thread_names.items()):
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                             'args': {'name': thread_name}})
+        return {'traceEvents': metadata + sorted(events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms'}
+
+class TraceSpan():
+    '''
+    Records a trace event covering the body of a with block and extends
+    the nesting path seen by code run within the block.
+    '''
+    
+    def __init__(self, name, category, path_element=None, args=None):
+        '''
+        Constructor
+        '''
+        self.name = name
+        self.category = category
+        if path_element == None:
+            path_element = name
+        self.path = get_path() + (path_element,)
+        self.args = args
+        self.binding = bind_values(**{TRACE_PATH_KEY: self.path})
+        self.start = None
+    
+    def __enter__(self):
+        self.binding.__enter__()
+        self.start = time.time()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        self.binding.__exit__(exc_type, exc_value, traceback)
+        active_tracer = tracer
+        if active_tracer != None:
+            args = self.args
+            if exc_type != None:
+                args = dict(args or {})
+                args['error'] = repr(exc_value)
+            active_tracer.add_event(self.name, self.category, self.start, end, self.path, args)
+        return False
+
+class EventCollector():
+    '''
+    Enables a temporary tracer for the duration of a with block. Used in
+    worker processes to collect the events for a task so that they can be
+    returned to the tracer in the process that submitted the task.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.tracer = Tracer()
+        self.previous = None
+    
+    def __enter__(self):
+        global tracer
+        self.previous = tracer
+        tracer = self.tracer
+        return self.tracer
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        global tracer
+        tracer = self.previous
+        return False
+
+def enable_tracing():
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+# Stop tracing and return the tracer holding the recorded events.
+def disable_tracing():
+    global tracer
+    stopped_tracer = tracer
+    tracer = None
+    return stopped_tracer
+
+def is_tracing():
+    return tracer != None
+
+def get_tracer():
+    return tracer
+
+# Get the nesting path of the code currently running as a tuple of 
+# path elements.
+def get_path():
+    return get_context_value(TRACE_PATH_KEY, ())
+
+# Format a nesting path tuple as a string. Elements giving the index of
+# a task or stage, e.g. '[3]', are attached to the preceding element.
+def format_path(path):
+    formatted = ''
+    for element in path:
+        if (formatted == '') or element.startswith('['):
+            formatted = formatted + element
+        else:
+            formatted = formatted + '/' + element
+    return formatted
+
+def span(name, category, path_element=None, args=None):
+    return TraceSpan(name, category, path_element, args)
+
+# Write the events recorded by a tracer (by default the active tracer) to
+# a file in the Chrome trace-event JSON format.
+def write_chrome_trace(filename, trace_source=None):
+    if trace_source == None:
+        trace_source = tracer
+    if trace_source == None:
+        raise ValueError('Tracing is not enabled and no tracer was provided.')
+    with open(filename, 'w') as trace_file:
+        json.dump(trace_source.to_chrome_trace(), trace_file)
@@ -0,0 +1,81 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+import os
+
+# Make-style up-to-date checking of component outputs. When enabled, a 
+# component whose declared output files all exist and are at least as new
+# as its input files is not run and the result it would have returned is
+# built from its output parameter values. This allows a pipeline to be 
+# re-run after it has been edited, only running the steps whose inputs 
+# have changed.
+#
+# Up-to-date checking is enabled for the process with 
+# set_skip_up_to_date(True) or by setting the LIBHPC_CF_SKIP_UP_TO_DATE 
+# environment variable to 1.
+
+SKIP_UP_TO_DATE_ENV_VAR = 'LIBHPC_CF_SKIP_UP_TO_DATE'
+
+_skip_up_to_date = None
+
+# Enable or disable skipping of components with up to date outputs. 
+# Passing None reverts to the setting in the environment.
+def set_skip_up_to_date(skip):
+    global _skip_up_to_date
+    _skip_up_to_date = skip
+
+def get_skip_up_to_date():
+    if _skip_up_to_date != None:
+        return _skip_up_to_date
+    return os.environ.get(SKIP_UP_TO_DATE_ENV_VAR, '').lower() in ['1', 'true', 'yes', 'on']
+
+# Check whether all output_files exist and none of input_files have been
+# modified more recently than the oldest of them.
+def outputs_up_to_date(input_files, output_files):
+    if len(output_files) == 0:
+        return False
+    try:
+        oldest_output = min([os.path.getmtime(path) for path in output_files])
+        for path in input_files:
+            if os.path.getmtime(path) > oldest_output:
+                return False
+    except OSError:
+        return False
+    return True
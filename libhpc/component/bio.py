@@ -47,13 +47,18 @@ fastq_split_input = Parameter('fastq_split_input', 'string', 'input', False)
 fastq_split_output1 = Parameter('fastq_split_output1', 'string', 'inout', False)
 fastq_split_output2 = Parameter('fastq_split_output2', 'string', 'inout', False)
 
+fastq_split_paired_input1 = Parameter('fastq_split_paired_input1', 'string', 'input', False)
+fastq_split_paired_input2 = Parameter('fastq_split_paired_input2', 'string', 'input', False)
+fastq_split_paired_shards = Parameter('fastq_split_paired_shards', 'int', 'input', False)
+fastq_split_paired_output = Parameter('fastq_split_paired_output', 'list', 'output', False)
+
 bwa_index_param1 = Parameter('ref_genome_param', 'string', 'input', False)
 bwa_index_output_file = Parameter('ref_genome_param', 'string', 'input', False)
 bwa_index_result = Parameter('ref_genome_status', 'int', 'output', True)
 
 bwa_aln_ref_genome = Parameter('ref_genome_param', 'string', 'input', False)
 bwa_aln_short_read = Parameter('short_read_file', 'string', 'input', False)
-bwa_aln_output_file = Parameter('output_file', 'string', 'inout', False)
+bwa_aln_output_file = Parameter('output_file', 'string', 'inout', False, derive=(1, '{stem}.sai'))
 bwa_aln_result = Parameter('bwa_aln_status', 'int', 'output', True)
 
 bwa_sampe_param1 = Parameter('ref_genome_param', 'string', 'input', False)
@@ -62,9 +67,18 @@ bwa_sampe_param3 = Parameter('short_read_file_param', 'list', 'input', False)
 bwa_sampe_output_file = Parameter('sam_output_file', 'string', 'output', False)
 bwa_sampe_result = Parameter('bwa_sample_status', 'int', 'output', True)
 
+bwa_mem_ref_genome = Parameter('ref_genome_param', 'string', 'input', False)
+bwa_mem_short_read_files = Parameter('short_read_files', 'list', 'input', False)
+bwa_mem_output_file = Parameter('sam_output_file', 'string', 'output', False)
+bwa_mem_result = Parameter('bwa_mem_status', 'int', 'output', True)
+
+bwa_shm_ref_genome = Parameter('ref_genome_param', 'string', 'input', False)
+bwa_shm_subcommand = Parameter('bwa_subcommand_param', 'string', 'input', False)
+bwa_shm_result = Parameter('bwa_shm_loaded', 'string', 'output', True)
+
 samtools_import_param1 = Parameter('ref_genome_param', 'string', 'input', False)
 samtools_import_param2 = Parameter('sam_file_param', 'string', 'input', False)
-samtools_import_output = Parameter('bam_file_param', 'string', 'inout', False)
+samtools_import_output = Parameter('bam_file_param', 'string', 'inout', False, derive=(1, '{stem}.bam'))
 samtools_import_result = Parameter('samtools_import_status', 'int', 'output', True)
 
 samtools_sort_baminput = Parameter('samtools_bam_input_param', 'string', 'input', False)
@@ -72,24 +86,24 @@ samtools_sort_sortedoutput = Parameter('samtools_sorted_output_param', 'string',
 samtools_sort_result = Parameter('samtools_sort_status', 'int', 'output', True)
 
 samtools_index_input = Parameter('samtools_index_input_param', 'string', 'input', False)
-samtools_index_output = Parameter('samtools_index_output_param', 'string', 'output', False)
+samtools_index_output = Parameter('samtools_index_output_param', 'string', 'output', False, derive=(0, '{stem}.bai'))
 samtools_index_result = Parameter('samtools_index_status', 'string', 'output', True)
 
 samtools_faidx_input = Parameter('samtools_faidx_input_param', 'string', 'input', False)
-samtools_faidx_output = Parameter('samtools_faidx_output_param', 'string', 'output', False)
+samtools_faidx_output = Parameter('samtools_faidx_output_param', 'string', 'output', False, derive=(0, '{stem}.fai'))
 samtools_faidx_result = Parameter('samtools_faidx_status', 'string', 'output', True)
 
 samtools_mpileup_input = Parameter('samtools_mpileup_input_param', 'string', 'input', False)
-samtools_mpileup_output = Parameter('samtools_mpileup_output_param', 'string', 'inout', False)
+samtools_mpileup_output = Parameter('samtools_mpileup_output_param', 'string', 'inout', False, derive=(0, '{stem}.bcf'))
 samtools_mpileup_result = Parameter('samtools_mpileup_status', 'string', 'output', True)
 
 samtools_bcf2vcf_input = Parameter('samtools_bcf2vcf_input_param', 'string', 'input', False)
-samtools_bcf2vcf_output = Parameter('samtools_bcf2vcf_output_param', 'string', 'inout', False)
+samtools_bcf2vcf_output = Parameter('samtools_bcf2vcf_output_param', 'string', 'inout', False, derive=(0, '{stem}.vcf'))
 samtools_bcf2vcf_result = Parameter('samtools_bcf2vcf_status', 'string', 'output', True)
 
 picard_remove_duplicates_input = Parameter('picard_remove_duplicates_input', 'string', 'input', False)
-picard_remove_duplicates_output = Parameter('picard_remove_duplicates_output', 'string', 'inout', False)
-picard_remove_duplicates_metrics = Parameter('picard_remove_duplicates_metrics', 'string', 'inout', False)
+picard_remove_duplicates_output = Parameter('picard_remove_duplicates_output', 'string', 'inout', False, derive=(0, '{stem}_NODUP.{ext}'))
+picard_remove_duplicates_metrics = Parameter('picard_remove_duplicates_metrics', 'string', 'inout', False, derive=(0, '{stem}_marked.metrics'))
 picard_remove_duplicates_result = Parameter('picard_remove_duplicates_result', 'int', 'output', True)
 
 picard_add_read_groups_baminput = Parameter('add_read_groups_input_param', 'string', 'input', False)
@@ -99,7 +113,7 @@ picard_add_read_groups_rgplinput = Parameter('add_read_groups_rgpl_param', 'stri
 picard_add_read_groups_rgpuinput = Parameter('add_read_groups_rgpu_param', 'string', 'input', False)
 picard_add_read_groups_rgsminput = Parameter('add_read_groups_rgsm_param', 'string', 'input', False)
 #picard_add_read_groups_result = Parameter('add_read_groups_status', 'int', 'output', False)
-picard_add_read_groups_output = Parameter('add_read_groups_output_param', 'string', 'output', False)
+picard_add_read_groups_output = Parameter('add_read_groups_output_param', 'string', 'output', False, derive=(0, '{stem}_TAGGED.bam'))
 
 
 picard_merge_sam_input = Parameter('merge_sam_input_file_list', 'list', 'input', False)
@@ -107,11 +121,11 @@ picard_merge_sam_output = Parameter('merge_sam_output_file', 'string', 'output',
 picard_merge_sam_status = Parameter('merge_sam_status', 'int', 'output', True)
 
 picard_create_dictionary_ref_input = Parameter('picard_create_dict_ref_input', 'string', 'input', False)
-picard_create_dictionary_output = Parameter('picard_create_dict_file', 'string', 'inout', False)
+picard_create_dictionary_output = Parameter('picard_create_dict_file', 'string', 'inout', False, derive=(0, '{stem}.dict'))
 picard_create_dictionary_status = Parameter('picard_create_dict_status', 'int', 'output', True)
 
 picard_build_bam_index_input = Parameter('picard_build_bam_index_input_param', 'string', 'input', False)
-picard_build_bam_index_output = Parameter('picard_build_bam_index_output_param', 'string', 'output', False)
+picard_build_bam_index_output = Parameter('picard_build_bam_index_output_param', 'string', 'output', False, derive=(0, '{stem}.bai'))
 picard_build_bam_index_result = Parameter('picard_build_bam_index_status', 'string', 'output', True)
 
 picard_check_reference_input = Parameter('ref_genome_param', 'string', 'input', False)
@@ -119,51 +133,128 @@ picard_check_reference_output = Parameter('new_ref_genome_param', 'string', 'ino
 
 gatk_indel_targets_ref_input = Parameter('gatk_indel_targets_ref_input', 'string', 'input', False)
 gatk_indel_targets_bam_input = Parameter('gatk_indel_targets_bam_input', 'string', 'input', False)
-gatk_indel_targets_output = Parameter('gatk_indel_targets_output', 'string', 'inout', False)
+gatk_indel_targets_output = Parameter('gatk_indel_targets_output', 'string', 'inout', False, derive=(1, '{stem}.intervals'))
 gatk_indel_targets_status = Parameter('gatk_indel_targets_status', 'string', 'output', True)
 
 gatk_indel_realigner_ref_input = Parameter('gatk_realigner_ref_input', 'string', 'input', False)
 gatk_indel_realigner_bam_input = Parameter('gatk_realigner_bam_input', 'string', 'input', False)
 gatk_indel_realigner_interval_input = Parameter('gatk_realigner_interval_input', 'string', 'input', False)
-gatk_indel_realigner_output = Parameter('gatk_realigner_output', 'string', 'inout', False)
+gatk_indel_realigner_output = Parameter('gatk_realigner_output', 'string', 'inout', False, derive=(1, '{stem}_REALIGNED.{ext}'))
 gatk_indel_realigner_status = Parameter('gatk_realigner_status', 'string', 'output', True)
 
 gatk_base_recal_ref_genome = Parameter('gatk_recalibrator_ref_input', 'string', 'input', False)
 gatk_base_recal_bam_input = Parameter('gatk_recalibrator_bam_input', 'string', 'input', False)
 gatk_base_recal_known_sites = Parameter('gatk_recalibrator_known_sites_input', 'string', 'input', False)
-gatk_base_recal_output = Parameter('gatk_recalibrator_output', 'string', 'inout', False)
+gatk_base_recal_output = Parameter('gatk_recalibrator_output', 'string', 'inout', False, derive=(1, '{stem}_recal.table'))
 gatk_base_recal_status = Parameter('gatk_recalibrator_status', 'string', 'output', True)
 
 gatk_print_reads_ref_genome = Parameter('gatk_print_reads_ref_input', 'string', 'input', False)
 gatk_print_reads_bam_input = Parameter('gatk_print_reads_bam_input', 'string', 'input', False)
 gatk_print_reads_recal_table = Parameter('gatk_print_reads_recal_table', 'string', 'input', False)
-gatk_print_reads_output = Parameter('gatk_print_reads_output', 'string', 'inout', False)
+gatk_print_reads_output = Parameter('gatk_print_reads_output', 'string', 'inout', False, derive=(1, '{stem}_final.{ext}'))
 gatk_print_reads_status = Parameter('gatk_print_reads_status', 'string', 'output', True)
 
+# Parameters for the interval sharded versions of the GATK and samtools
+# tools. Output names depend on the interval shard and are left to the
+# wrappers rather than derived from the inputs.
+interval_shards_ref_input = Parameter('interval_shards_ref_input', 'string', 'input', False)
+interval_shards_count = Parameter('interval_shards_count', 'int', 'input', False)
+interval_shards_output = Parameter('interval_shards_output', 'list', 'output', False)
+
+gatk_indel_realigner_shard_ref_input = Parameter('gatk_realigner_shard_ref_input', 'string', 'input', False)
+gatk_indel_realigner_shard_bam_input = Parameter('gatk_realigner_shard_bam_input', 'string', 'input', False)
+gatk_indel_realigner_shard_targets = Parameter('gatk_realigner_shard_targets_input', 'string', 'input', False)
+gatk_indel_realigner_shard_intervals = Parameter('gatk_realigner_shard_intervals_input', 'string', 'input', False)
+gatk_indel_realigner_shard_output = Parameter('gatk_realigner_shard_output', 'string', 'inout', False)
+gatk_indel_realigner_shard_status = Parameter('gatk_realigner_shard_status', 'string', 'output', True)
+
+gatk_base_recal_shard_ref_genome = Parameter('gatk_recalibrator_shard_ref_input', 'string', 'input', False)
+gatk_base_recal_shard_bam_input = Parameter('gatk_recalibrator_shard_bam_input', 'string', 'input', False)
+gatk_base_recal_shard_known_sites = Parameter('gatk_recalibrator_shard_known_sites_input', 'string', 'input', False)
+gatk_base_recal_shard_intervals = Parameter('gatk_recalibrator_shard_intervals_input', 'string', 'input', False)
+gatk_base_recal_shard_output = Parameter('gatk_recalibrator_shard_output', 'string', 'inout', False)
+gatk_base_recal_shard_status = Parameter('gatk_recalibrator_shard_status', 'string', 'output', True)
+
+gatk_print_reads_shard_ref_genome = Parameter('gatk_print_reads_shard_ref_input', 'string', 'input', False)
+gatk_print_reads_shard_bam_input = Parameter('gatk_print_reads_shard_bam_input', 'string', 'input', False)
+gatk_print_reads_shard_recal_table = Parameter('gatk_print_reads_shard_recal_table', 'string', 'input', False)
+gatk_print_reads_shard_intervals = Parameter('gatk_print_reads_shard_intervals_input', 'string', 'input', False)
+gatk_print_reads_shard_output = Parameter('gatk_print_reads_shard_output', 'string', 'inout', False)
+gatk_print_reads_shard_status = Parameter('gatk_print_reads_shard_status', 'string', 'output', True)
+
+gatk_gather_bqsr_input = Parameter('gatk_gather_bqsr_input', 'list', 'input', False)
+gatk_gather_bqsr_output = Parameter('gatk_gather_bqsr_output', 'string', 'inout', False)
+gatk_gather_bqsr_status = Parameter('gatk_gather_bqsr_status', 'string', 'output', True)
+
+samtools_mpileup_shard_input = Parameter('samtools_mpileup_shard_input', 'string', 'input', False)
+samtools_mpileup_shard_intervals = Parameter('samtools_mpileup_shard_intervals_input', 'string', 'input', False)
+samtools_mpileup_shard_output = Parameter('samtools_mpileup_shard_output', 'string', 'inout', False)
+samtools_mpileup_shard_result = Parameter('samtools_mpileup_shard_result', 'string', 'output', True)
+
+samtools_concat_bcf_input = Parameter('samtools_concat_bcf_input', 'list', 'input', False)
+samtools_concat_bcf_output = Parameter('samtools_concat_bcf_output', 'string', 'inout', False)
+samtools_concat_bcf_result = Parameter('samtools_concat_bcf_result', 'string', 'output', True)
+
 # COMPONENT DEFINITIONS
     
 fastq_split = Component('fastq.splitter', 'Paired FASTQ File Splitter', 'libhpc.wrapper.bio.fastqsplitter.split_fastq', [fastq_split_input, fastq_split_output1, fastq_split_output2], [])
+fastq_split_paired = Component('fastq.split_paired', 'Paired FASTQ Files Shard Splitter', 'libhpc.wrapper.bio.fastqsplitter.split_paired_fastq', [fastq_split_paired_input1, fastq_split_paired_input2, fastq_split_paired_shards], [fastq_split_paired_output])
+
+# Resources needed by the tools, see libhpc.cf.resources. The JVM based
+# tools need a large heap while bwa aln is CPU bound and light on memory.
+bwa_aln_resources = {'cpus': (1, 8), 'memory': '1G'}
+bwa_mem_resources = {'cpus': (1, 8), 'memory': '6G'}
+samtools_sort_resources = {'cpus': (1, 4), 'memory': '2G'}
+gatk_resources = {'cpus': 1, 'memory': '8G'}
+gatk_threaded_resources = {'cpus': (1, 8), 'memory': '8G'}
+picard_resources = {'cpus': 1, 'memory': '4G'}
 
 #bwa_index = Component('bwa.index', 'BWA Index', 'bwa.index', [bwa_index_param1], [bwa_index_result])
-bwa_index = Component('bwa.index', 'BWA Index', 'libhpc.wrapper.bio.bwa.index', [bwa_index_param1, bwa_index_output_file], [bwa_index_result])
-bwa_aln = Component('bwa.align', 'BWA Initial Alignment', 'libhpc.wrapper.bio.bwa.align', [bwa_aln_ref_genome, bwa_aln_short_read, bwa_aln_output_file], [bwa_aln_result])
-bwa_sampe = Component('bwa.sampe', 'BWA Paired Alignment', 'libhpc.wrapper.bio.bwa.sampe', [bwa_sampe_param1, bwa_sampe_param2, bwa_sampe_param3, bwa_sampe_output_file], [bwa_sampe_result], 'pre')
+# bwa index writes its index files alongside the reference genome
+bwa_index_side_outputs = [(0, '{path}.' + ext) for ext in ['amb', 'ann', 'bwt', 'pac', 'sa']]
+bwa_index = Component('bwa.index', 'BWA Index', 'libhpc.wrapper.bio.bwa.index', [bwa_index_param1, bwa_index_output_file], [bwa_index_result], side_outputs=bwa_index_side_outputs, command_code='libhpc.wrapper.bio.bwa.index_command')
+bwa_aln = Component('bwa.align', 'BWA Initial Alignment', 'libhpc.wrapper.bio.bwa.align', [bwa_aln_ref_genome, bwa_aln_short_read, bwa_aln_output_file], [bwa_aln_result], resources=bwa_aln_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.bwa.align_command')
+bwa_sampe = Component('bwa.sampe', 'BWA Paired Alignment', 'libhpc.wrapper.bio.bwa.sampe', [bwa_sampe_param1, bwa_sampe_param2, bwa_sampe_param3, bwa_sampe_output_file], [bwa_sampe_result], 'pre', stream_code='libhpc.wrapper.bio.bwa.sampe_command')
+bwa_mem = Component('bwa.mem', 'BWA MEM Alignment', 'libhpc.wrapper.bio.bwa.mem', [bwa_mem_ref_genome, bwa_mem_short_read_files, bwa_mem_output_file], [bwa_mem_result], 'pre', resources=bwa_mem_resources, threads_arg='threads', stream_code='libhpc.wrapper.bio.bwa.mem_command')
+# Load the index of the reference genome given as a static parameter into
+# shared memory before a PAR of alignments run by the bwa subcommand given
+# as the second static parameter and release it afterwards, even if an 
+# alignment fails, e.g. 
+# GUARD(PAR([(bwa_mem, ref), (bwa_mem, ref)]), (bwa_shm_acquire, ref, 'mem'), (bwa_shm_release, ref, 'mem'))(read_pairs)
+# Only bwa mem uses the shared index, from bwa 0.7.9, so for bwa aln the
+# index is not loaded.
+bwa_shm_acquire = Component('bwa.shm_acquire', 'BWA Shared Memory Index Acquire', 'libhpc.wrapper.bio.bwa.shm_acquire', [bwa_shm_ref_genome, bwa_shm_subcommand], [bwa_shm_result], 'pre', cacheable=False)
+bwa_shm_release = Component('bwa.shm_release', 'BWA Shared Memory Index Release', 'libhpc.wrapper.bio.bwa.shm_release', [bwa_shm_ref_genome, bwa_shm_subcommand], [bwa_shm_result], 'pre', cacheable=False)
     
-samtools_import = Component('samtools.import', 'SAMtools Import', 'libhpc.wrapper.bio.samtools.import_sam', [samtools_import_param1, samtools_import_param2, samtools_import_output], [samtools_import_result], 'pre')
-samtools_sort = Component('samtools.sort', 'SAMtools Sort', 'libhpc.wrapper.bio.samtools.sort', [samtools_sort_baminput, samtools_sort_sortedoutput], [samtools_import_result])
-samtools_index = Component('samtools.index', 'SAMtools Index', 'libhpc.wrapper.bio.samtools.index', [samtools_index_input, samtools_index_output], [samtools_index_result])
-samtools_faidx = Component('samtools.faidx', 'SAMtools faidx', 'libhpc.wrapper.bio.samtools.faidx', [samtools_faidx_input, samtools_faidx_output], [samtools_faidx_result])
-samtools_mpileup = Component('samtools.mpileup', 'SAMtools mpileup', 'libhpc.wrapper.bio.samtools.mpileup', [samtools_mpileup_input, samtools_mpileup_output], [samtools_mpileup_result])
-samtools_bcf2vcf = Component('samtools.bcf2vcf', 'SAMtools BCF to VCF conversion', 'libhpc.wrapper.bio.samtools.bcf2vcf', [samtools_bcf2vcf_input, samtools_bcf2vcf_output], [samtools_bcf2vcf_result])
-
-picard_add_read_groups = Component('picard.add_read_groups', 'Picard - Add Read Groups', 'libhpc.wrapper.bio.picard.add_read_groups', [picard_add_read_groups_baminput, picard_add_read_groups_rgidinput, picard_add_read_groups_rglbinput, picard_add_read_groups_rgplinput, picard_add_read_groups_rgpuinput, picard_add_read_groups_rgsminput], [picard_add_read_groups_output]) # , picard_add_read_groups_result removed from return values    
-picard_merge_sam = Component('picard.merge_sam', 'Picard - Merge SAM/BAM files', 'libhpc.wrapper.bio.picard.merge_sam', [picard_merge_sam_input], [picard_merge_sam_output])
-picard_remove_duplicates = Component('picard.remove_duplicates', 'Picard - Remove Duplicates', 'libhpc.wrapper.bio.picard.remove_duplicates', [picard_remove_duplicates_input, picard_remove_duplicates_output, picard_remove_duplicates_metrics], [picard_remove_duplicates_result])
-picard_create_dictionary = Component('picard.create_dictionary', 'Picard - Create Dictionary', 'libhpc.wrapper.bio.picard.create_dictionary', [picard_create_dictionary_ref_input, picard_create_dictionary_output], [picard_create_dictionary_status])
-picard_build_bam_index = Component('picard.build_bam_index', 'Picard - Build BAM Index', 'libhpc.wrapper.bio.picard.build_bam_index', [picard_build_bam_index_input, picard_build_bam_index_output], [picard_build_bam_index_result])
+samtools_import = Component('samtools.import', 'SAMtools Import', 'libhpc.wrapper.bio.samtools.import_sam', [samtools_import_param1, samtools_import_param2, samtools_import_output], [samtools_import_result], 'pre', stream_code='libhpc.wrapper.bio.samtools.import_sam_command')
+samtools_sort = Component('samtools.sort', 'SAMtools Sort', 'libhpc.wrapper.bio.samtools.sort', [samtools_sort_baminput, samtools_sort_sortedoutput], [samtools_import_result], resources=samtools_sort_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.samtools.sort_command')
+samtools_index = Component('samtools.index', 'SAMtools Index', 'libhpc.wrapper.bio.samtools.index', [samtools_index_input, samtools_index_output], [samtools_index_result], command_code='libhpc.wrapper.bio.samtools.index_command')
+samtools_faidx = Component('samtools.faidx', 'SAMtools faidx', 'libhpc.wrapper.bio.samtools.faidx', [samtools_faidx_input, samtools_faidx_output], [samtools_faidx_result], command_code='libhpc.wrapper.bio.samtools.faidx_command')
+samtools_mpileup = Component('samtools.mpileup', 'SAMtools mpileup', 'libhpc.wrapper.bio.samtools.mpileup', [samtools_mpileup_input, samtools_mpileup_output], [samtools_mpileup_result], stream_code='libhpc.wrapper.bio.samtools.mpileup_command')
+samtools_bcf2vcf = Component('samtools.bcf2vcf', 'SAMtools BCF to VCF conversion', 'libhpc.wrapper.bio.samtools.bcf2vcf', [samtools_bcf2vcf_input, samtools_bcf2vcf_output], [samtools_bcf2vcf_result], stream_code='libhpc.wrapper.bio.samtools.bcf2vcf_command')
+
+picard_add_read_groups = Component('picard.add_read_groups', 'Picard - Add Read Groups', 'libhpc.wrapper.bio.picard.add_read_groups', [picard_add_read_groups_baminput, picard_add_read_groups_rgidinput, picard_add_read_groups_rglbinput, picard_add_read_groups_rgplinput, picard_add_read_groups_rgpuinput, picard_add_read_groups_rgsminput], [picard_add_read_groups_output], resources=picard_resources) # , picard_add_read_groups_result removed from return values    
+picard_merge_sam = Component('picard.merge_sam', 'Picard - Merge SAM/BAM files', 'libhpc.wrapper.bio.picard.merge_sam', [picard_merge_sam_input], [picard_merge_sam_output], resources=picard_resources)
+picard_remove_duplicates = Component('picard.remove_duplicates', 'Picard - Remove Duplicates', 'libhpc.wrapper.bio.picard.remove_duplicates', [picard_remove_duplicates_input, picard_remove_duplicates_output, picard_remove_duplicates_metrics], [picard_remove_duplicates_result], resources=picard_resources, command_code='libhpc.wrapper.bio.picard.remove_duplicates_command')
+picard_create_dictionary = Component('picard.create_dictionary', 'Picard - Create Dictionary', 'libhpc.wrapper.bio.picard.create_dictionary', [picard_create_dictionary_ref_input, picard_create_dictionary_output], [picard_create_dictionary_status], resources=picard_resources)
+picard_build_bam_index = Component('picard.build_bam_index', 'Picard - Build BAM Index', 'libhpc.wrapper.bio.picard.build_bam_index', [picard_build_bam_index_input, picard_build_bam_index_output], [picard_build_bam_index_result], resources=picard_resources, command_code='libhpc.wrapper.bio.picard.build_bam_index_command')
 picard_check_reference = Component('picard.check_reference', 'Check reference genome extension', 'libhpc.wrapper.bio.picard.check_rename_reference', [picard_check_reference_input, picard_check_reference_output], [])
 
-gatk_realigner_targets = Component('gatk.realigner_targets', 'Generate realigner targets for indel processing', 'libhpc.wrapper.bio.gatk.create_realigner_targets', [gatk_indel_targets_ref_input, gatk_indel_targets_bam_input, gatk_indel_targets_output], [gatk_indel_targets_status])
-gatk_indel_realigner = Component('gatk.indel_realigner', 'Realign BAM based on indels', 'libhpc.wrapper.bio.gatk.indel_realigner', [gatk_indel_realigner_ref_input, gatk_indel_realigner_bam_input, gatk_indel_realigner_interval_input, gatk_indel_realigner_output], [gatk_indel_realigner_status])    
-gatk_base_recalibrator = Component('gatk.base_recalibrator', 'GATK Base Recalibrator', 'libhpc.wrapper.bio.gatk.base_recalibrator', [gatk_base_recal_ref_genome, gatk_base_recal_bam_input, gatk_base_recal_known_sites, gatk_base_recal_output], [gatk_base_recal_status], 'pre')
-gatk_print_reads = Component('gatk.print_reads', 'GATK Print Reads', 'libhpc.wrapper.bio.gatk.print_reads', [gatk_print_reads_ref_genome, gatk_print_reads_bam_input, gatk_print_reads_recal_table, gatk_print_reads_output], [gatk_print_reads_status], 'pre')
\ No newline at end of file
+gatk_realigner_targets = Component('gatk.realigner_targets', 'Generate realigner targets for indel processing', 'libhpc.wrapper.bio.gatk.create_realigner_targets', [gatk_indel_targets_ref_input, gatk_indel_targets_bam_input, gatk_indel_targets_output], [gatk_indel_targets_status], resources=gatk_threaded_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.gatk.create_realigner_targets_command')
+gatk_indel_realigner = Component('gatk.indel_realigner', 'Realign BAM based on indels', 'libhpc.wrapper.bio.gatk.indel_realigner', [gatk_indel_realigner_ref_input, gatk_indel_realigner_bam_input, gatk_indel_realigner_interval_input, gatk_indel_realigner_output], [gatk_indel_realigner_status], resources=gatk_resources, command_code='libhpc.wrapper.bio.gatk.indel_realigner_command')
+gatk_base_recalibrator = Component('gatk.base_recalibrator', 'GATK Base Recalibrator', 'libhpc.wrapper.bio.gatk.base_recalibrator', [gatk_base_recal_ref_genome, gatk_base_recal_bam_input, gatk_base_recal_known_sites, gatk_base_recal_output], [gatk_base_recal_status], 'pre', resources=gatk_threaded_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.gatk.base_recalibrator_command')
+gatk_print_reads = Component('gatk.print_reads', 'GATK Print Reads', 'libhpc.wrapper.bio.gatk.print_reads', [gatk_print_reads_ref_genome, gatk_print_reads_bam_input, gatk_print_reads_recal_table, gatk_print_reads_output], [gatk_print_reads_status], 'pre', resources=gatk_threaded_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.gatk.print_reads_command')
+
+# Interval sharding, see libhpc.wrapper.bio.intervals. interval_shards 
+# splits the reference into a list of interval files. The sharded tools 
+# take an interval file as their last input so that they can be SCATTERed
+# over the list with the other inputs as static parameters. The per-shard
+# outputs are gathered with gatk_gather_bqsr, samtools_concat_bcf or, for 
+# BAM files, picard_merge_sam.
+interval_shards = Component('intervals.shards', 'Reference Interval Shards', 'libhpc.wrapper.bio.intervals.make_interval_shards', [interval_shards_ref_input, interval_shards_count], [interval_shards_output])
+gatk_indel_realigner_shard = Component('gatk.indel_realigner_shard', 'Realign BAM based on indels over an interval shard', 'libhpc.wrapper.bio.gatk.indel_realigner_intervals', [gatk_indel_realigner_shard_ref_input, gatk_indel_realigner_shard_bam_input, gatk_indel_realigner_shard_targets, gatk_indel_realigner_shard_intervals, gatk_indel_realigner_shard_output], [gatk_indel_realigner_shard_status], 'pre', resources=gatk_resources, command_code='libhpc.wrapper.bio.gatk.indel_realigner_intervals_command')
+gatk_base_recalibrator_shard = Component('gatk.base_recalibrator_shard', 'GATK Base Recalibrator over an interval shard', 'libhpc.wrapper.bio.gatk.base_recalibrator_intervals', [gatk_base_recal_shard_ref_genome, gatk_base_recal_shard_bam_input, gatk_base_recal_shard_known_sites, gatk_base_recal_shard_intervals, gatk_base_recal_shard_output], [gatk_base_recal_shard_status], 'pre', resources=gatk_threaded_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.gatk.base_recalibrator_intervals_command')
+gatk_print_reads_shard = Component('gatk.print_reads_shard', 'GATK Print Reads over an interval shard', 'libhpc.wrapper.bio.gatk.print_reads_intervals', [gatk_print_reads_shard_ref_genome, gatk_print_reads_shard_bam_input, gatk_print_reads_shard_recal_table, gatk_print_reads_shard_intervals, gatk_print_reads_shard_output], [gatk_print_reads_shard_status], 'pre', resources=gatk_threaded_resources, threads_arg='threads', command_code='libhpc.wrapper.bio.gatk.print_reads_intervals_command')
+gatk_gather_bqsr = Component('gatk.gather_bqsr', 'GATK Gather BQSR Reports', 'libhpc.wrapper.bio.gatk.gather_bqsr_reports', [gatk_gather_bqsr_input, gatk_gather_bqsr_output], [gatk_gather_bqsr_status], resources=gatk_resources, command_code='libhpc.wrapper.bio.gatk.gather_bqsr_reports_command')
+samtools_mpileup_shard = Component('samtools.mpileup_shard', 'SAMtools mpileup over an interval shard', 'libhpc.wrapper.bio.samtools.mpileup_intervals', [samtools_mpileup_shard_input, samtools_mpileup_shard_intervals, samtools_mpileup_shard_output], [samtools_mpileup_shard_result], 'pre')
+samtools_concat_bcf = Component('samtools.concat_bcf', 'bcftools concatenate BCF files', 'libhpc.wrapper.bio.samtools.concat_bcf', [samtools_concat_bcf_input, samtools_concat_bcf_output], [samtools_concat_bcf_result], command_code='libhpc.wrapper.bio.samtools.concat_bcf_command')
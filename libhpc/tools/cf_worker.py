@@ -0,0 +1,72 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# A worker daemon that runs coordination forms tasks sent by a 
+# coordinator, see libhpc.cf.distributed. The key shared with the 
+# coordinator is read from the LIBHPC_CF_AUTHKEY environment variable.
+#
+# Example: python -m libhpc.tools.cf_worker --address node01:7077 --slots 8
+
+import os
+import optparse
+
+from libhpc.cf.distributed import Worker, HEARTBEAT_INTERVAL
+from libhpc.cf.log import set_verbosity
+
+if __name__ == '__main__':
+    clparser = optparse.OptionParser(usage='usage: %prog [options]')
+    clparser.add_option("-a", "--address", action="store", type="string", default=None, dest="address", 
+                        help="The host:port of the coordinator")
+    clparser.add_option("-s", "--slots", action="store", type="int", default=1, dest="slots", 
+                        help="The number of tasks to run at once")
+    clparser.add_option("-n", "--name", action="store", type="string", default=None, dest="name", 
+                        help="The name the worker registers with, by default host:pid")
+    clparser.add_option("-b", "--heartbeat", action="store", type="float", default=HEARTBEAT_INTERVAL, dest="heartbeat", 
+                        help="The interval between heartbeats, in seconds")
+    clparser.add_option("-v", "--verbosity", action="store", type="string", default=None, dest="verbosity", 
+                        help="Library log level, e.g. info")
+    (options, args) = clparser.parse_args()
+    
+    if options.address == None:
+        clparser.error('The address of the coordinator must be provided with --address')
+    if options.verbosity != None:
+        set_verbosity(options.verbosity)
+    
+    Worker(options.address, slots=options.slots, name=options.name, heartbeat_interval=options.heartbeat).run()
@@ -127,7 +127,7 @@ class LibhpcComponentGenerator():
             c = CodeGeneratorBackend()
             c.begin(tab='    ')
             c.write('# Generated libhpc component wrapper code. Auto-generated by libhpc component generator.\n#\n\n')
-            c.write('from subprocess import call\n\n')
+            c.write('from libhpc.wrapper.process import call\n\n')
             c.write('# Executable, as specified in wrapper definition XML\n')
             c.write(executable_var + ' = ' + component.wrapper.executable + '\n\n')
             c.write('def set_' + executable_var + '(' + component_id_underscored  +'_location):\n')
@@ -0,0 +1,101 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# A benchmark for the overhead of the PAR coordination form. PAR is run
+# over an increasing number of trivial component tasks and the time per
+# task is reported. If the cost of PAR is linear in the number of tasks,
+# the time per task should remain roughly constant as the task count grows.
+#
+# Example: python -m libhpc.tools.par_benchmark -n 1000,10000,100000
+
+import os
+import time
+import optparse
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR
+from libhpc.cf.log import set_verbosity
+
+benchmark_input = Parameter('benchmark_input', 'int', 'input', False)
+benchmark_result = Parameter('benchmark_result', 'int', 'output', False)
+benchmark_component = Component('benchmark.negate', 'Benchmark negation', 'operator.neg', 
+                                [benchmark_input], [benchmark_result])
+
+# Time a single PAR expression over task_count tasks and return the time
+# taken in seconds.
+def time_par(task_count, runner=None, pool_size=None):
+    function_list = [benchmark_component] * task_count
+    param_list = range(task_count)
+    start = time.time()
+    result = PAR(function_list, param_list, pool_size=pool_size, runner=runner)()
+    elapsed = time.time() - start
+    if result != [-value for value in param_list]:
+        raise RuntimeError('PAR benchmark returned an unexpected result')
+    return elapsed
+
+def run_benchmark(task_counts, runner=None, pool_size=None, repeats=3):
+    results = []
+    for task_count in task_counts:
+        elapsed = min([time_par(task_count, runner, pool_size) for _ in range(repeats)])
+        results.append((task_count, elapsed))
+    return results
+
+if __name__ == '__main__':
+    clparser = optparse.OptionParser(usage='usage: %prog [options]')
+    clparser.add_option("-n", "--task-counts", action="store", type="string", default="1000,10000,100000", dest="task_counts", 
+                        help="Comma-separated list of the numbers of PAR tasks to time")
+    clparser.add_option("-r", "--runner", action="store", type="string", default=None, dest="runner", 
+                        help="The PAR runner to use, e.g. threads, sequential")
+    clparser.add_option("-p", "--pool-size", action="store", type="int", default=None, dest="pool_size", 
+                        help="The number of PAR workers")
+    clparser.add_option("-x", "--repeats", action="store", type="int", default=3, dest="repeats", 
+                        help="The number of times to time each task count, the fastest time is reported")
+    clparser.add_option("-v", "--verbosity", action="store", type="string", default=None, dest="verbosity", 
+                        help="Library log level to use while timing, e.g. debug (output is discarded)")
+    (options, args) = clparser.parse_args()
+    
+    if options.verbosity != None:
+        set_verbosity(options.verbosity, open(os.devnull, 'w'))
+    
+    task_counts = [int(value) for value in options.task_counts.split(',')]
+    print '%10s %12s %16s' % ('Tasks', 'Time (s)', 'Per task (us)')
+    for task_count, elapsed in run_benchmark(task_counts, options.runner, options.pool_size, options.repeats):
+        print '%10d %12.3f %16.2f' % (task_count, elapsed, (elapsed / task_count) * 1e6)
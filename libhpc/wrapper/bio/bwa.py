@@ -45,36 +45,296 @@ File created on Aug 7, 2012
 '''
 # Module that provides BWA tools as functions
 
-from subprocess import call
+import os
+import re
+import logging
+import threading
+from libhpc.wrapper.process import call, launch
+from libhpc.wrapper.stream import StreamCommand
+from libhpc.wrapper.toolchain import register_tool, set_tool_location, get_tool_path, \
+    get_tool_version
 
-bwa_exec = '/usr/local/bio/bwa-0.7.6a/bwa'
+# The default location of bwa, see libhpc.wrapper.toolchain
+register_tool('bwa', '/usr/local/bio/bwa-0.7.6a/bwa', version_args=[])
+
+LOG = logging.getLogger(__name__)
+
+# The extensions of the files making up a BWA index
+INDEX_EXTENSIONS = ['amb', 'ann', 'bwt', 'pac', 'sa']
+# The directory backing POSIX shared memory, in which bwa shm stores
+# indexes
+SHM_DIR = '/dev/shm'
 
 def set_bwa_exec(bwa_location):
-    global bwa_exec
-    bwa_exec = bwa_location
+    set_tool_location('bwa', bwa_location)
 
 def get_bwa_exec():
-    return bwa_exec
+    return get_tool_path('bwa')
 
 def index(ref_genome_file, output_file = None):
     print '\tBWA index...\n'
-    status = call([bwa_exec, 'index', ref_genome_file])
+    command = index_command(ref_genome_file, output_file)
+    status = command.run()
     print '\tBWA index...DONE...Status code: ' + str(status) + '\n\n'
-    return status
+    return command.get_result(status)
+
+# Get the command for index. bwa writes the index files alongside the 
+# reference genome, output_file is not used.
+def index_command(ref_genome_file, output_file = None):
+    return StreamCommand([get_bwa_exec(), 'index', ref_genome_file])
     
-def align(ref_genome_file, short_read_file, output_file = None):
+def align(ref_genome_file, short_read_file, output_file = None, threads = None):
     print '\tBWA align...\n'
+    command = align_command(ref_genome_file, short_read_file, output_file, threads)
+    status = command.run()
+    print '\tBWA align...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for align
+def align_command(ref_genome_file, short_read_file, output_file = None, threads = None):
     if output_file == None:
         output_file = short_read_file.rsplit('.',1)[0] + '.sai'
-    status = call([bwa_exec, 'aln', '-f', output_file, ref_genome_file, short_read_file])
-    print '\tBWA align...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    thread_args = []
+    if threads != None:
+        thread_args = ['-t', str(threads)]
+    return StreamCommand([get_bwa_exec(), 'aln'] + thread_args + ['-f', output_file, ref_genome_file, short_read_file], 
+                         None, [output_file])
     
 def sampe(ref_genome_file, short_read_alignment_indexes, short_read_files, sam_output_file = None):
     print '\tBWA sampe...\n'
+    command = sampe_command(ref_genome_file, short_read_alignment_indexes, short_read_files, sam_output_file)
+    status = command.run()
+    print '\tBWA sampe...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for sampe. If write_stdout is True, the SAM output is 
+# written to stdout rather than sam_output_file. sampe reads several 
+# input files so it cannot read its input from stdin.
+def sampe_command(ref_genome_file, short_read_alignment_indexes, short_read_files, sam_output_file = None,
+                  read_stdin = False, write_stdout = False):
+    if read_stdin:
+        raise ValueError('BWA sampe cannot read its input from stdin.')
     # If an output file name is not provided, calculate one based on short read file name
     if sam_output_file == None:
         sam_output_file = short_read_files[0].rsplit('.',1)[0].rsplit('_',1)[0] + '.sam'
-    status = call([bwa_exec, 'sampe', '-f', sam_output_file, ref_genome_file, short_read_alignment_indexes[0], short_read_alignment_indexes[1], short_read_files[0], short_read_files[1]])
-    print '\tBWA sampe...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, sam_output_file)
\ No newline at end of file
+    output_args = ['-f', sam_output_file]
+    if write_stdout:
+        output_args = []
+    return StreamCommand([get_bwa_exec(), 'sampe'] + output_args + [ref_genome_file, short_read_alignment_indexes[0], 
+        short_read_alignment_indexes[1], short_read_files[0], short_read_files[1]], None, [sam_output_file])
+
+def mem(ref_genome_file, short_read_files, sam_output_file = None, threads = None):
+    print '\tBWA mem...\n'
+    command = mem_command(ref_genome_file, short_read_files, sam_output_file, threads)
+    status = command.run()
+    print '\tBWA mem...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for mem, aligning a single FASTQ file or a pair of mate
+# files. bwa mem writes its SAM output to stdout, which is written to 
+# sam_output_file unless write_stdout is True. mem reads its index and 
+# reads from files so it cannot read its input from stdin.
+def mem_command(ref_genome_file, short_read_files, sam_output_file = None, threads = None,
+                read_stdin = False, write_stdout = False):
+    if read_stdin:
+        raise ValueError('BWA mem cannot read its input from stdin.')
+    if isinstance(short_read_files, basestring):
+        short_read_files = [short_read_files]
+    # If an output file name is not provided, calculate one based on short read file name
+    if sam_output_file == None:
+        sam_output_file = short_read_files[0].rsplit('.',1)[0].rsplit('_',1)[0] + '.sam'
+    thread_args = []
+    if threads != None:
+        thread_args = ['-t', str(threads)]
+    stdout_file = sam_output_file
+    if write_stdout:
+        stdout_file = None
+    return StreamCommand([get_bwa_exec(), 'mem'] + thread_args + [ref_genome_file] + list(short_read_files), 
+                         stdout_file, [sam_output_file])
+
+# Shared memory indexes
+#
+# bwa shm loads an index into shared memory once per node, from where 
+# bwa tools that look for a shared index use it rather than each loading
+# their own copy from disk. Only bwa mem looks for a shared index, from
+# bwa 0.7.9, so the index is only loaded for the subcommands in 
+# SHM_SUBCOMMANDS when the bwa in use is at least SHM_MIN_VERSION; 
+# otherwise acquiring and releasing it does nothing. shm_acquire and 
+# shm_release manage a shared index for the alignments run between them, 
+# counting the users of each index in this process: the index is loaded 
+# by the first user, unless it is already loaded, and dropped when the 
+# last user releases it if this process loaded it. If the index cannot 
+# be loaded, e.g. because there isn't enough shared memory, the tools 
+# load the index from disk as before.
+#
+# bwa identifies a shared index by the file name of its reference 
+# genome, without the directory, so an index already loaded with the 
+# same file name is the one bwa uses, whichever directory it was loaded
+# from.
+
+# The bwa subcommands that use an index in shared memory
+SHM_SUBCOMMANDS = ['mem']
+# The first bwa version whose subcommands use an index in shared memory
+SHM_MIN_VERSION = (0, 7, 9)
+
+# The users of each index acquired in this process, keyed by reference
+# genome file, as a list of the number of users, whether the index is in
+# shared memory and whether this process loaded it
+shm_users = {}
+shm_lock = threading.Lock()
+
+# Get the total size of the index files of a reference genome
+def get_index_size(ref_genome_file):
+    size = 0
+    for ext in INDEX_EXTENSIONS:
+        index_file = ref_genome_file + '.' + ext
+        if os.path.exists(index_file):
+            size += os.path.getsize(index_file)
+    return size
+
+# Get the free shared memory space on this node, or None if it is unknown
+def get_shm_free_space():
+    if not os.path.isdir(SHM_DIR):
+        return None
+    stats = os.statvfs(SHM_DIR)
+    return stats.f_bavail * stats.f_frsize
+
+# Get the version of bwa in use as a tuple of numbers, e.g. (0, 7, 6) for
+# 0.7.6a, or None if it is unknown
+def get_bwa_version():
+    try:
+        version = get_tool_version('bwa')
+    except ValueError as e:
+        LOG.warning('Unable to find the version of bwa: %s', e)
+        return None
+    if version == None:
+        return None
+    match = re.match(r'(\d+)\.(\d+)\.(\d+)', version)
+    if match == None:
+        return None
+    return tuple([int(number) for number in match.groups()])
+
+# Whether the bwa subcommand uses an index in shared memory with the bwa
+# in use
+def is_shm_supported(subcommand):
+    if subcommand not in SHM_SUBCOMMANDS:
+        return False
+    version = get_bwa_version()
+    return (version != None) and (version >= SHM_MIN_VERSION)
+
+def shm_load(ref_genome_file):
+    print '\tBWA shm load...\n'
+    free_space = get_shm_free_space()
+    index_size = get_index_size(ref_genome_file)
+    if (free_space != None) and (index_size > free_space):
+        print '\tBWA shm load...SKIPPED...Index size ' + str(index_size) + ' exceeds the free shared memory ' + \
+            str(free_space) + '\n\n'
+        return 1
+    status = call([get_bwa_exec(), 'shm', ref_genome_file])
+    print '\tBWA shm load...DONE...Status code: ' + str(status) + '\n\n'
+    return status
+
+# List the names of the indexes loaded in shared memory
+def shm_list():
+    handle = launch([get_bwa_exec(), 'shm', '-l'], capture_output=True, supervise=False)
+    (stdout, stderr) = handle.get_output()
+    if handle.returncode != 0:
+        return []
+    return [line.split('\t')[0] for line in stdout.splitlines() if line.strip() != '']
+
+# Drop all of the indexes loaded in shared memory
+def shm_drop():
+    print '\tBWA shm drop...\n'
+    status = call([get_bwa_exec(), 'shm', '-d'])
+    print '\tBWA shm drop...DONE...Status code: ' + str(status) + '\n\n'
+    return status
+
+# Whether bwa will find the index of ref_genome_file among the loaded 
+# indexes. bwa keys shared indexes on the file name of the reference 
+# genome, which is what bwa shm -l lists, so only file names are compared.
+def is_shm_loaded(ref_genome_file, loaded_indexes):
+    ref_name = os.path.basename(ref_genome_file)
+    return ref_name in [os.path.basename(index_name) for index_name in loaded_indexes]
+
+# Acquire the shared memory index of ref_genome_file for the alignments
+# run by the bwa subcommand, loading it if this is its first user and 
+# the subcommand uses a shared index, see is_shm_supported. Any further 
+# arguments, e.g. the input passed through a BYPASS, are ignored. Returns
+# whether the index is in shared memory.
+def shm_acquire(ref_genome_file, subcommand, *ignored):
+    with shm_lock:
+        users = shm_users.get(ref_genome_file, None)
+        if users != None:
+            users[0] += 1
+            return users[1]
+        loaded = False
+        owned = False
+        if not is_shm_supported(subcommand):
+            LOG.info('bwa %s does not use an index in shared memory with bwa version %s, the index of %s is ' + 
+                     'not loaded.', subcommand, get_bwa_version(), ref_genome_file)
+            shm_users[ref_genome_file] = [1, loaded, owned]
+            return loaded
+        try:
+            loaded = is_shm_loaded(ref_genome_file, shm_list())
+            if loaded:
+                LOG.info('An index with the file name of %s is already in shared memory, bwa will use it.', 
+                         ref_genome_file)
+            else:
+                loaded = (shm_load(ref_genome_file) == 0)
+                owned = loaded
+        except OSError as e:
+            LOG.warning('Unable to run bwa shm, the index of %s will be loaded from disk: %s', ref_genome_file, e)
+        if not loaded:
+            LOG.warning('The index of %s is not in shared memory, each alignment will load it from disk.', 
+                        ref_genome_file)
+        shm_users[ref_genome_file] = [1, loaded, owned]
+        return loaded
+
+# Release the shared memory index of ref_genome_file. When its last user
+# releases an index this process loaded, the index is dropped. bwa shm
+# can only drop all indexes at once, so the index is left loaded if 
+# others have been loaded since. The subcommand and any further 
+# arguments are ignored, they are accepted to match shm_acquire.
+def shm_release(ref_genome_file, *ignored):
+    with shm_lock:
+        users = shm_users.get(ref_genome_file, None)
+        if users == None:
+            raise ValueError('The shared memory index of <' + ref_genome_file + '> has not been acquired.')
+        users[0] -= 1
+        if users[0] > 0:
+            return False
+        del shm_users[ref_genome_file]
+        if not users[2]:
+            return False
+        other_indexes = [name for name in shm_list() if not is_shm_loaded(ref_genome_file, [name])]
+        if len(other_indexes) > 0:
+            LOG.warning('Leaving the index of %s in shared memory, bwa shm cannot drop it without dropping %s.', 
+                        ref_genome_file, other_indexes)
+            return False
+        return (shm_drop() == 0)
+
+class SharedIndex():
+    '''
+    Holds the shared memory index of a reference genome for the alignments
+    run by a bwa subcommand for the duration of a with block, see 
+    shm_acquire.
+    '''
+    
+    def __init__(self, ref_genome_file, subcommand='mem'):
+        '''
+        Constructor
+        '''
+        self.ref_genome_file = ref_genome_file
+        self.subcommand = subcommand
+        self.loaded = False
+    
+    def __enter__(self):
+        self.loaded = shm_acquire(self.ref_genome_file, self.subcommand)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        shm_release(self.ref_genome_file)
+        return False
+
+def shared_index(ref_genome_file, subcommand='mem'):
+    return SharedIndex(ref_genome_file, subcommand)
@@ -0,0 +1,327 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# Module that splits FASTQ files into shards that can be processed in 
+# parallel, e.g. aligned with BWA, and then merged.
+#
+# Files are read in large blocks, through a memory map for uncompressed
+# files or by streaming gzip compressed files, and each block is cut at
+# a record boundary by counting lines, so records are never broken up
+# and no per-record work is done in Python. Blocks are written to the 
+# shards whole. For uncompressed input, each shard holds a contiguous 
+# range of the input of about the same size. The size of compressed 
+# input is not known in advance, so blocks are dealt to the shards in 
+# turn instead. Inputs too small to give each shard several blocks are 
+# dealt to the shards a unit at a time, so that no shard is left empty 
+# while there are records for it. Records are assumed to be four lines long, as written by
+# current sequencers.
+#
+# When splitting a pair of mate files, the same number of records is 
+# taken from each file for each block so that mates are always written 
+# to the same shard. An interleaved file, in which mates alternate, can
+# be split keeping each pair together by splitting it in units of two
+# records. Shards whose filename ends with .gz are written compressed.
+
+import os
+import re
+import gzip
+import mmap
+
+# The largest block read from the input at once. Smaller blocks are used
+# for small inputs so that shards are balanced.
+BLOCK_SIZE = 8*1024*1024
+MIN_BLOCK_SIZE = 4*1024
+# The number of blocks each shard is expected to receive, at least
+BLOCKS_PER_SHARD = 8
+# The size of the buffer used when writing shards
+WRITE_BUFFER_SIZE = 16*1024*1024
+# Compressed shards are written with fast compression
+GZIP_COMPRESS_LEVEL = 1
+# The size of the windows used when searching for a line in a block
+SEARCH_WINDOW_SIZE = 64*1024
+# An estimate of the compression ratio of gzipped FASTQ, used to choose 
+# the block size for compressed input
+GZIP_RATIO_ESTIMATE = 4
+
+LINES_PER_RECORD = 4
+
+def is_gzip_file(filename):
+    with open(filename, 'rb') as input_file:
+        return input_file.read(2) == '\x1f\x8b'
+
+# Get the offset in data just after its nth newline character
+def find_line_end(data, n):
+    if n == 0:
+        return 0
+    start = 0
+    lines = 0
+    # Count lines a window at a time, then search the window holding the
+    # nth newline
+    while True:
+        end = min(start + SEARCH_WINDOW_SIZE, len(data))
+        window_lines = data.count('\n', start, end)
+        if (lines + window_lines >= n) or (end == len(data)):
+            break
+        lines = lines + window_lines
+        start = end
+    position = start - 1
+    while lines < n:
+        position = data.find('\n', position + 1)
+        if position < 0:
+            raise ValueError('Block does not contain ' + str(n) + ' lines')
+        lines = lines + 1
+    return position + 1
+
+class FastqBlockReader():
+    '''
+    Reads a FASTQ file, which may be gzip compressed, in blocks that end
+    at a unit boundary, a unit being one or more complete records.
+    '''
+    
+    def __init__(self, filename, unit_lines=LINES_PER_RECORD, block_size=BLOCK_SIZE):
+        '''
+        Constructor
+        '''
+        self.filename = filename
+        self.unit_lines = unit_lines
+        self.block_size = block_size
+        self.input_file = None
+        self.mmap = None
+        self.stream = None
+        self.position = 0
+        self.pending = ''
+        self.eof = False
+        # The uncompressed size of the file, if known
+        self.size = None
+        if is_gzip_file(filename):
+            self.stream = gzip.open(filename, 'rb')
+        else:
+            self.input_file = open(filename, 'rb')
+            self.size = os.fstat(self.input_file.fileno()).st_size
+            if self.size > 0:
+                self.mmap = mmap.mmap(self.input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def read_raw(self, size):
+        if self.stream != None:
+            data = self.stream.read(size)
+        elif self.mmap != None:
+            data = self.mmap[self.position:self.position + size]
+            self.position = self.position + len(data)
+        else:
+            data = ''
+        if len(data) == 0:
+            self.eof = True
+        return data
+    
+    # Read a block of complete units. If max_units is given, exactly that
+    # many units are read unless the file ends first, otherwise about 
+    # block_size bytes are read. Returns the block and the number of units
+    # it holds, 0 at the end of the file.
+    def read_units(self, max_units=None):
+        chunks = [self.pending]
+        lines = self.pending.count('\n')
+        if max_units == None:
+            lines_needed = self.unit_lines
+            bytes_needed = self.block_size
+        else:
+            lines_needed = max_units * self.unit_lines
+            bytes_needed = 0
+        length = len(self.pending)
+        while (not self.eof) and ((lines < lines_needed) or (length < bytes_needed)):
+            chunk = self.read_raw(max(self.block_size, MIN_BLOCK_SIZE))
+            chunks.append(chunk)
+            lines = lines + chunk.count('\n')
+            length = length + len(chunk)
+        data = ''.join(chunks)
+        if self.eof and (len(data) > 0) and (not data.endswith('\n')):
+            data = data + '\n'
+            lines = lines + 1
+        
+        units = lines // self.unit_lines
+        if max_units != None:
+            units = min(units, max_units)
+        if lines - units * self.unit_lines < self.unit_lines:
+            # Step back over the lines of any incomplete unit at the end,
+            # the block may also end part way through a line
+            cut = data.rfind('\n') + 1
+            for _ in range(lines - units * self.unit_lines):
+                cut = data.rfind('\n', 0, cut - 1) + 1
+        else:
+            cut = find_line_end(data, units * self.unit_lines)
+        self.pending = data[cut:]
+        if self.eof and (units == 0) and (len(self.pending.strip()) > 0):
+            raise ValueError('FASTQ file <' + self.filename + '> ends with an incomplete record')
+        return (data[:cut], units)
+    
+    def close(self):
+        if self.mmap != None:
+            self.mmap.close()
+        if self.input_file != None:
+            self.input_file.close()
+        if self.stream != None:
+            self.stream.close()
+
+def open_shard(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wb', GZIP_COMPRESS_LEVEL)
+    return open(filename, 'wb', WRITE_BUFFER_SIZE)
+
+# Get the default name of shard index of a FASTQ file. The shard number is
+# placed before a _1 or _2 mate suffix so that tools naming their output
+# after the first mate file, such as bwa sampe, give each shard a 
+# distinct name, e.g. sample_1.fastq.gz gives sample_part0_1.fastq.
+def get_shard_filename(input_file, index):
+    if input_file.endswith('.gz'):
+        input_file = input_file[:-3]
+    parts = input_file.rsplit('.', 1)
+    ext = ''
+    if len(parts) == 2:
+        ext = '.' + parts[1]
+    match = re.match(r'(.*)(_[12])$', parts[0])
+    if match:
+        return match.group(1) + '_part' + str(index) + match.group(2) + ext
+    return parts[0] + '_part' + str(index) + ext
+
+# Choose the block size for splitting an input of estimated_size bytes 
+# into shards so that each shard receives several blocks.
+def get_block_size(estimated_size, shards):
+    block_size = estimated_size // (shards * BLOCKS_PER_SHARD)
+    return max(MIN_BLOCK_SIZE, min(BLOCK_SIZE, block_size))
+
+# Split a FASTQ file, or a pair of mate files, into shards. input_files is
+# a list of one or two files and output_files a list holding the list 
+# of shard filenames for each input file. If interleaved is True, a 
+# single input file is split in units of two records so that mates stay
+# together.
+def split_files(input_files, output_files, interleaved=False):
+    shards = len(output_files[0])
+    if (len(input_files) not in [1, 2]) or (len(output_files) != len(input_files)):
+        raise ValueError('A single FASTQ file or a pair of mate files, and the shards for each, must be provided')
+    for shard_files in output_files:
+        if (len(shard_files) != shards) or (shards < 1):
+            raise ValueError('The same positive number of shards must be provided for each input file')
+    unit_lines = LINES_PER_RECORD
+    if interleaved and (len(input_files) == 1):
+        unit_lines = 2 * LINES_PER_RECORD
+    
+    estimated_size = os.path.getsize(input_files[0])
+    if is_gzip_file(input_files[0]):
+        estimated_size = estimated_size * GZIP_RATIO_ESTIMATE
+    block_size = get_block_size(estimated_size, shards)
+    # Small inputs are read a unit at a time and dealt to the shards in 
+    # turn, since a few blocks would leave some shards empty
+    max_units = None
+    if estimated_size < shards * BLOCKS_PER_SHARD * MIN_BLOCK_SIZE:
+        max_units = 1
+    readers = []
+    writers = []
+    try:
+        for filename in input_files:
+            readers.append(FastqBlockReader(filename, unit_lines, block_size))
+        for shard_files in output_files:
+            writers.append([open_shard(filename) for filename in shard_files])
+        
+        total_size = readers[0].size
+        consumed = 0
+        block_index = 0
+        while True:
+            block, units = readers[0].read_units(max_units)
+            if units == 0:
+                break
+            blocks = [block]
+            if len(readers) == 2:
+                mate_block, mate_units = readers[1].read_units(units)
+                if mate_units != units:
+                    raise ValueError('Mate file <' + input_files[1] + '> has fewer records than <' + 
+                                     input_files[0] + '>')
+                blocks.append(mate_block)
+            # Uncompressed input is split into contiguous ranges, otherwise
+            # blocks are dealt to the shards in turn
+            if (total_size != None) and (max_units == None):
+                shard = min(shards - 1, (consumed + len(block) // 2) * shards // total_size)
+            else:
+                shard = block_index % shards
+            for file_writers, data in zip(writers, blocks):
+                file_writers[shard].write(data)
+            consumed = consumed + len(block)
+            block_index = block_index + 1
+        if (len(readers) == 2) and (readers[1].read_units(1)[1] > 0):
+            raise ValueError('Mate file <' + input_files[1] + '> has more records than <' + 
+                             input_files[0] + '>')
+    finally:
+        for reader in readers:
+            reader.close()
+        for file_writers in writers:
+            for writer in file_writers:
+                writer.close()
+    return output_files
+
+# Split a FASTQ file into shards, returning the list of shard files. If
+# output_files is not provided, shard names are derived from the input 
+# filename, see get_shard_filename().
+def split_fastq_shards(input_file, shards, output_files=None, interleaved=False):
+    if output_files == None:
+        output_files = [get_shard_filename(input_file, index) for index in range(shards)]
+    print '\tFASTQ split - ' + str(shards) + ' shards...\n'
+    split_files([input_file], [output_files], interleaved)
+    print '\tFASTQ split...DONE\n\n'
+    return output_files
+
+# Split a pair of mate FASTQ files into shards, returning a list holding
+# the pair of mate files for each shard.
+def split_paired_fastq(input_file1, input_file2, shards, output_files1=None, output_files2=None):
+    if output_files1 == None:
+        output_files1 = [get_shard_filename(input_file1, index) for index in range(shards)]
+    if output_files2 == None:
+        output_files2 = [get_shard_filename(input_file2, index) for index in range(shards)]
+    print '\tFASTQ paired split - ' + str(shards) + ' shards...\n'
+    split_files([input_file1, input_file2], [output_files1, output_files2])
+    print '\tFASTQ paired split...DONE\n\n'
+    return [[file1, file2] for file1, file2 in zip(output_files1, output_files2)]
+
+# Split a paired FASTQ file, in which mates alternate, into two shards 
+# keeping each pair of mates together.
+def split_fastq(input_file, output_file1 = None, output_file2 = None):
+    if output_file1 == None:
+        output_file1 = get_shard_filename(input_file, 0)
+    if output_file2 == None:
+        output_file2 = get_shard_filename(input_file, 1)
+    split_fastq_shards(input_file, 2, [output_file1, output_file2], interleaved=True)
+    return (output_file1, output_file2)
@@ -44,15 +44,156 @@ File created on Feb 25, 2014
 @author: jhc02
 '''
 
+# Utilities for managing the files passed between the tool wrappers.
+#
+# duplicate_bam makes copies of a, possibly multi-GB, BAM file using the
+# cheapest method that is valid for the files involved. Where the copies
+# will only be read, they are hard links to the original. Otherwise a
+# copy-on-write reflink is made where the filesystem supports it, e.g.
+# btrfs or XFS, so that data is only copied when it is modified. Failing
+# that, the data is copied inside the kernel with copy_file_range or 
+# sendfile, without passing through Python, and as a last resort the 
+# file is copied with shutil. The method used is reported.
+
+import os
+import errno
 import shutil
+import ctypes
+import ctypes.util
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The duplication strategies, from cheapest to most expensive
+MOVE = 'move'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+COPY = 'copy'
+
+# The FICLONE ioctl request from linux/fs.h, which makes the destination
+# file a reflink of the source
+FICLONE = 0x40049409
+# The amount of data copied by each kernel call
+KERNEL_COPY_SIZE = 1024*1024*1024
+# Errors indicating that a strategy is not supported for a pair of files,
+# in which case the next strategy is tried
+UNSUPPORTED_ERRORS = set([errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL, 
+                          errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP, 
+                          getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)])
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+except OSError:
+    libc = None
+
+# Get a kernel copy function from the C library, or None if it is not
+# available, e.g. copy_file_range requires glibc 2.27
+def get_libc_function(name, argtypes):
+    func = getattr(libc, name, None)
+    if func != None:
+        func.argtypes = argtypes
+        func.restype = ctypes.c_ssize_t
+    return func
+
+# copy_file_range(fd_in, off_in, fd_out, off_out, len, flags) and 
+# sendfile(out_fd, in_fd, offset, count), with the file offsets being 
+# used and updated when the offset pointers are NULL
+copy_file_range_func = get_libc_function('copy_file_range', [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, 
+                                                             ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint])
+sendfile_func = get_libc_function('sendfile', [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t])
+
+class StrategyUnsupported(Exception):
+    pass
+
+def reflink(input_fd, output_fd):
+    if fcntl == None:
+        raise StrategyUnsupported()
+    try:
+        fcntl.ioctl(output_fd, FICLONE, input_fd)
+    except IOError as e:
+        if e.errno in UNSUPPORTED_ERRORS:
+            raise StrategyUnsupported()
+        raise
+
+# Copy the whole of the input to the output with a kernel copy function
+# called by copy_chunk(input_fd, output_fd, size). The strategy is 
+# unsupported if the first call fails with one of UNSUPPORTED_ERRORS, 
+# nothing having been written to the output.
+def kernel_copy(input_fd, output_fd, copy_chunk):
+    copied = 0
+    while True:
+        result = copy_chunk(input_fd, output_fd, KERNEL_COPY_SIZE)
+        if result < 0:
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if (copied == 0) and (error in UNSUPPORTED_ERRORS):
+                raise StrategyUnsupported()
+            raise OSError(error, os.strerror(error))
+        if result == 0:
+            break
+        copied += result
+
+def copy_file_range(input_fd, output_fd):
+    if copy_file_range_func == None:
+        raise StrategyUnsupported()
+    kernel_copy(input_fd, output_fd, lambda in_fd, out_fd, size: copy_file_range_func(in_fd, None, out_fd, None, size, 0))
+
+def sendfile(input_fd, output_fd):
+    if sendfile_func == None:
+        raise StrategyUnsupported()
+    kernel_copy(input_fd, output_fd, lambda in_fd, out_fd, size: sendfile_func(out_fd, in_fd, None, size))
+
+# The strategies used to copy the data of a file, in the order they are 
+# tried, each taking the input and output file descriptors
+COPY_STRATEGIES = [(REFLINK, reflink), (COPY_FILE_RANGE, copy_file_range), (SENDFILE, sendfile)]
+
+# Duplicate input_file as output_file, which is replaced if it exists,
+# and return the strategy used. If read_only is True, the duplicate is 
+# only read and can be a hard link to the input.
+def duplicate_file(input_file, output_file, read_only = False):
+    if os.path.realpath(input_file) == os.path.realpath(output_file):
+        raise ValueError('Cannot duplicate file <' + input_file + '> to itself.')
+    if os.path.lexists(output_file):
+        os.remove(output_file)
+    if read_only:
+        try:
+            os.link(input_file, output_file)
+            return HARDLINK
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRORS:
+                raise
+    with open(input_file, 'rb') as input_handle:
+        with open(output_file, 'wb') as output_handle:
+            strategy = COPY
+            for name, copy_data in COPY_STRATEGIES:
+                try:
+                    copy_data(input_handle.fileno(), output_handle.fileno())
+                    strategy = name
+                    break
+                except StrategyUnsupported:
+                    pass
+            if strategy == COPY:
+                shutil.copyfileobj(input_handle, output_handle, KERNEL_COPY_SIZE/64)
+    shutil.copymode(input_file, output_file)
+    return strategy
 
-def duplicate_bam(input_bam, output_bam):
+# Duplicate input_bam as output_bam. If output_bam is a list, input_bam 
+# is moved to the first file in the list and duplicated as the others. 
+# Returns the strategy used, or the list of strategies used for each 
+# output file.
+def duplicate_bam(input_bam, output_bam, read_only = False):
     if not isinstance(output_bam, list):
-        shutil.copy(input_bam, output_bam)
-    else:
-        shutil.move(input_bam, output_bam[0])
-        for filename in output_bam[1:]:
-            shutil.copy(output_bam[0],filename)
-                                   
-                                   
-            
+        strategy = duplicate_file(input_bam, output_bam, read_only)
+        print '\tDuplicate BAM - ' + output_bam + ' (' + strategy + ')\n'
+        return strategy
+    shutil.move(input_bam, output_bam[0])
+    strategies = [MOVE]
+    for filename in output_bam[1:]:
+        strategy = duplicate_file(output_bam[0], filename, read_only)
+        print '\tDuplicate BAM - ' + filename + ' (' + strategy + ')\n'
+        strategies.append(strategy)
+    return strategies
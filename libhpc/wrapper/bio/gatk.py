@@ -45,47 +45,68 @@ File created on Aug 7, 2012
 '''
 # Module that provides BWA tools as functions
 
-from subprocess import call
-from subprocess import check_output
-import os
-import platform
+from libhpc.wrapper.stream import StreamCommand
+from libhpc.wrapper.bio.intervals import get_interval_list, get_interval_suffix
+from libhpc.wrapper.toolchain import register_tool, set_tool_location, get_tool_path
 
-gatk_location = '/usr/local/bio/gatk/GenomeAnalysisTK.jar'
-java_exec = 'java'     
+# The default location of the GATK jar file, see libhpc.wrapper.toolchain.
+# The version is probed by running the jar with the toolchain's java.
+register_tool('gatk', '/usr/local/bio/gatk/GenomeAnalysisTK.jar', kind='file', 
+              version_args=lambda path: [get_tool_path('java'), '-jar', path, '--version'],
+              version_pattern=r'^\s*(\d\S*)')
 
+# Get the java executable used to run GATK. The toolchain finds it once,
+# using java_home on a Mac.
 def init_java():
-    global java_exec
-    
-    this_system = platform.system()
+    return get_tool_path('java')
 
-    if 'Darwin' in this_system:
-        print "Running on a Mac, setting java exec to the correct JAVA_HOME location"
-        java_home = check_output(['/usr/libexec/java_home']).strip()
-        java_exec = os.path.join(java_home, 'bin', 'java')
-        print 'New java executable value: ' + java_exec
 
+# Get the arguments setting the number of threads a GATK tool uses, 
+# flag is -nt for data threads or -nct for CPU threads per data thread
+def get_thread_args(flag, threads):
+    if threads == None:
+        return []
+    return [flag, str(threads)]
 
+# Get the arguments restricting a GATK tool to intervals, see 
+# intervals.get_interval_list for the forms intervals may take
+def get_interval_args(intervals):
+    args = []
+    for interval in get_interval_list(intervals):
+        args.extend(['-L', interval])
+    return args
 
 def set_gatk_location(location):
-    global gatk_location
-    gatk_location = location
+    set_tool_location('gatk', location)
 
 def get_gatk_location():
-    return gatk_location
+    return get_tool_path('gatk')
+
+# Get the command running the GATK tool with args
+def get_gatk_command(tool, args, outputs=None):
+    return StreamCommand([init_java(), '-jar', get_gatk_location(), '-T', tool] + args, None, outputs)
     
-def create_realigner_targets(ref_genome_file, bam_file, output_file = None):
-    init_java()
+def create_realigner_targets(ref_genome_file, bam_file, output_file = None, threads = None):
+    java_exec = init_java()
+    gatk_location = get_gatk_location()
     
     print '\tGenome Analysis ToolKit - Realigner Target Creator...[' + java_exec + ' -jar ' + gatk_location + ']\n'
-    if output_file == None:
-        output_file = bam_file.rsplit('.',1)[0] + '.intervals'
-    status = call([java_exec, '-jar', gatk_location, '-T', 'RealignerTargetCreator', '-R', ref_genome_file, '-I', bam_file, '-o', output_file])
+    command = create_realigner_targets_command(ref_genome_file, bam_file, output_file, threads)
+    status = command.run()
     print '\tGenome Analysis ToolKit - Realigner Target Creator...DONE...Status code: ' + str(status) + '\n\n'
     #return (status, output_file)
-    return (status, output_file)
+    return command.get_result(status)
+
+# Get the command for create_realigner_targets
+def create_realigner_targets_command(ref_genome_file, bam_file, output_file = None, threads = None):
+    if output_file == None:
+        output_file = bam_file.rsplit('.',1)[0] + '.intervals'
+    return get_gatk_command('RealignerTargetCreator', ['-R', ref_genome_file, '-I', bam_file, '-o', output_file] + 
+                            get_thread_args('-nt', threads), [output_file])
 
 def create_realigner_targets_with_pre_processing(ref_genome_file, bam_file, output_file = None):
-    init_java()
+    java_exec = init_java()
+    gatk_location = get_gatk_location()
     
     # TODO: Check approach of this extra function
     # Check if the provided ref_genome_file has a .fa or .fasta extension.
@@ -98,38 +119,90 @@ def create_realigner_targets_with_pre_processing(ref_genome_file, bam_file, outp
     print '\tGenome Analysis ToolKit - Realigner Target Creator...[' + java_exec + ' -jar ' + gatk_location + ']\n'
     if output_file == None:
         output_file = bam_file.rsplit('.',1)[0] + '.intervals'
-    status = call([java_exec, '-jar', gatk_location, '-T', 'RealignerTargetCreator', '-R', ref_genome_file, '-I', bam_file, '-o', output_file])
+    status = get_gatk_command('RealignerTargetCreator', ['-R', ref_genome_file, '-I', bam_file, '-o', output_file]).run()
     print '\tGenome Analysis ToolKit - Realigner Target Creator...DONE...Status code: ' + str(status) + '\n\n'
     #return (status, output_file)
     return (output_file)
 
 
-def indel_realigner(ref_genome_file, bam_file, target_intervals, output_file = None):
-    init_java()
-    
+def indel_realigner(ref_genome_file, bam_file, target_intervals, output_file = None, intervals = None):
     print '\tGenome Analysis ToolKit - Indel Realigner...\n'
-    if output_file == None:
-        output_file = bam_file.rsplit('.',1)[0] + '_REALIGNED.' + bam_file.rsplit('.',1)[1] 
-    status = call([java_exec, '-jar', gatk_location, '-T', 'IndelRealigner', '-R', ref_genome_file, '-I', bam_file, '-targetIntervals', target_intervals, '-o', output_file])
+    command = indel_realigner_command(ref_genome_file, bam_file, target_intervals, output_file, intervals)
+    status = command.run()
     print '\tGenome Analysis ToolKit - Indel Realigner...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
-def base_recalibrator(ref_genome_file, bam_file, known_sites_file, output_file = None):
-    init_java()
-    
-    print '\tGenome Analysis ToolKit - Base Recalibrator...\n'
+# Get the command for indel_realigner
+def indel_realigner_command(ref_genome_file, bam_file, target_intervals, output_file = None, intervals = None):
     if output_file == None:
-        output_file = bam_file.rsplit('.',1)[0] + '_recal.table' 
-    status = call([java_exec, '-jar', gatk_location, '-T', 'BaseRecalibrator', '-R', ref_genome_file, '-I', bam_file, '-knownSites:VCF', known_sites_file, '-o', output_file])
+        output_file = bam_file.rsplit('.',1)[0] + '_REALIGNED' + get_interval_suffix(intervals) + '.' + bam_file.rsplit('.',1)[1] 
+    return get_gatk_command('IndelRealigner', ['-R', ref_genome_file, '-I', bam_file, '-targetIntervals', target_intervals, 
+                            '-o', output_file] + get_interval_args(intervals), [output_file])
+
+def base_recalibrator(ref_genome_file, bam_file, known_sites_file, output_file = None, threads = None, intervals = None):
+    print '\tGenome Analysis ToolKit - Base Recalibrator...\n'
+    command = base_recalibrator_command(ref_genome_file, bam_file, known_sites_file, output_file, threads, intervals)
+    status = command.run()
     print '\tGenome Analysis ToolKit - Base Recalibrator...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
-def print_reads(ref_genome_file, bam_file, recalibration_table_file, output_file = None):
-    init_java()
-    
-    print '\tGenome Analysis ToolKit - Print Reads...\n'
+# Get the command for base_recalibrator
+def base_recalibrator_command(ref_genome_file, bam_file, known_sites_file, output_file = None, threads = None, intervals = None):
     if output_file == None:
-        output_file = bam_file.rsplit('.',1)[0] + '_final.' + bam_file.rsplit('.',1)[1] 
-    status = call([java_exec, '-jar', gatk_location, '-T', 'PrintReads', '-BQSR', recalibration_table_file, '-R', ref_genome_file, '-I', bam_file, '-o', output_file])
+        output_file = bam_file.rsplit('.',1)[0] + '_recal' + get_interval_suffix(intervals) + '.table' 
+    return get_gatk_command('BaseRecalibrator', ['-R', ref_genome_file, '-I', bam_file, '-knownSites:VCF', known_sites_file, 
+                            '-o', output_file] + get_thread_args('-nct', threads) + get_interval_args(intervals), [output_file])
+
+def print_reads(ref_genome_file, bam_file, recalibration_table_file, output_file = None, threads = None, intervals = None):
+    print '\tGenome Analysis ToolKit - Print Reads...\n'
+    command = print_reads_command(ref_genome_file, bam_file, recalibration_table_file, output_file, threads, intervals)
+    status = command.run()
     print '\tGenome Analysis ToolKit - PrintReads...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
+
+# Get the command for print_reads
+def print_reads_command(ref_genome_file, bam_file, recalibration_table_file, output_file = None, threads = None, intervals = None):
+    if output_file == None:
+        output_file = bam_file.rsplit('.',1)[0] + '_final' + get_interval_suffix(intervals) + '.' + bam_file.rsplit('.',1)[1] 
+    return get_gatk_command('PrintReads', ['-BQSR', recalibration_table_file, '-R', ref_genome_file, '-I', bam_file, 
+                            '-o', output_file] + get_thread_args('-nct', threads) + get_interval_args(intervals), [output_file])
+
+# Versions of the wrappers above that take the intervals to process as a
+# parameter, for use in components run on each interval shard, see
+# libhpc.wrapper.bio.intervals.
+def indel_realigner_intervals(ref_genome_file, bam_file, target_intervals, intervals, output_file = None):
+    return indel_realigner(ref_genome_file, bam_file, target_intervals, output_file, intervals=intervals)
+
+def base_recalibrator_intervals(ref_genome_file, bam_file, known_sites_file, intervals, output_file = None, threads = None):
+    return base_recalibrator(ref_genome_file, bam_file, known_sites_file, output_file, threads, intervals)
+
+def print_reads_intervals(ref_genome_file, bam_file, recalibration_table_file, intervals, output_file = None, threads = None):
+    return print_reads(ref_genome_file, bam_file, recalibration_table_file, output_file, threads, intervals)
+
+def indel_realigner_intervals_command(ref_genome_file, bam_file, target_intervals, intervals, output_file = None):
+    return indel_realigner_command(ref_genome_file, bam_file, target_intervals, output_file, intervals=intervals)
+
+def base_recalibrator_intervals_command(ref_genome_file, bam_file, known_sites_file, intervals, output_file = None, threads = None):
+    return base_recalibrator_command(ref_genome_file, bam_file, known_sites_file, output_file, threads, intervals)
+
+def print_reads_intervals_command(ref_genome_file, bam_file, recalibration_table_file, intervals, output_file = None, threads = None):
+    return print_reads_command(ref_genome_file, bam_file, recalibration_table_file, output_file, threads, intervals)
+
+# Gather the recalibration tables produced by base_recalibrator for each
+# interval shard into a single table.
+def gather_bqsr_reports(input_list, output_file = None):
+    print '\tGenome Analysis ToolKit - Gather BQSR Reports...\n'
+    command = gather_bqsr_reports_command(input_list, output_file)
+    status = command.run()
+    print '\tGenome Analysis ToolKit - Gather BQSR Reports...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for gather_bqsr_reports
+def gather_bqsr_reports_command(input_list, output_file = None):
+    if output_file == None:
+        output_file = input_list[0].rsplit('.',1)[0] + '_gathered.table'
+    command_list = [init_java(), '-cp', get_gatk_location(), 'org.broadinstitute.gatk.tools.GatherBqsrReports']
+    for input_file in input_list:
+        command_list.append('I=' + input_file)
+    command_list.append('O=' + output_file)
+    return StreamCommand(command_list, None, [output_file])
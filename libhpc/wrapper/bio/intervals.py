@@ -0,0 +1,176 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# Module that splits a reference genome into interval shards so that the
+# GATK and samtools stages of a sample can be run on each shard in 
+# parallel, e.g. with the SCATTER form, and their outputs gathered.
+#
+# The contigs of the reference are read from its samtools .fai index or
+# its Picard .dict sequence dictionary. Shards are contiguous runs of the
+# reference in its own order, balanced by the number of bases they hold,
+# so that the per-shard outputs can be concatenated in order. By default
+# contigs are not split between shards, as reads spanning a split would 
+# otherwise be output by the tools run on both shards. Where a tool only
+# reports positions, e.g. samtools mpileup, split_contigs can be set so 
+# that large contigs are split and the shards are evenly sized.
+#
+# Each shard is written to a BED file, which can be passed to GATK tools
+# with -L and to samtools mpileup with -l.
+
+import os
+
+# Read the contigs from a samtools .fai index, returning a list of 
+# (name, length) tuples in reference order
+def read_fai(fai_file):
+    contigs = []
+    with open(fai_file, 'r') as index_file:
+        for line in index_file:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2:
+                contigs.append((fields[0], int(fields[1])))
+    return contigs
+
+# Read the contigs from a Picard .dict sequence dictionary
+def read_dict(dict_file):
+    contigs = []
+    with open(dict_file, 'r') as dictionary_file:
+        for line in dictionary_file:
+            if not line.startswith('@SQ'):
+                continue
+            fields = dict([field.split(':', 1) for field in line.rstrip('\n').split('\t')[1:] if ':' in field])
+            if ('SN' in fields) and ('LN' in fields):
+                contigs.append((fields['SN'], int(fields['LN'])))
+    return contigs
+
+# Read the contigs of a reference. reference_file may be the .fai or 
+# .dict file or the FASTA file, in which case its .fai index, or failing
+# that its .dict dictionary, is used.
+def read_reference_contigs(reference_file):
+    if reference_file.endswith('.fai'):
+        return read_fai(reference_file)
+    if reference_file.endswith('.dict'):
+        return read_dict(reference_file)
+    if os.path.exists(reference_file + '.fai'):
+        return read_fai(reference_file + '.fai')
+    dict_file = reference_file.rsplit('.', 1)[0] + '.dict'
+    if os.path.exists(dict_file):
+        return read_dict(dict_file)
+    raise ValueError('No .fai index or .dict sequence dictionary found for reference <' + reference_file + '>')
+
+# Split a list of (name, length) contigs into shards, lists of 
+# (name, start, end) intervals with 0-based, half-open coordinates, of 
+# about total length / shards bases each. Shards that would be empty, 
+# where contigs are not split and a contig is larger than a shard, are 
+# not returned.
+def get_interval_shards(contigs, shards, split_contigs=False):
+    if (type(shards) != type(0)) or (shards < 1):
+        raise ValueError('The number of shards must be a positive integer, got <' + str(shards) + '>')
+    total = sum([length for name, length in contigs])
+    shard_list = [[] for _ in range(shards)]
+    if total == 0:
+        return []
+    position = 0
+    for name, length in contigs:
+        if split_contigs:
+            # Cut the contig at each shard boundary that falls within it
+            start = 0
+            while start < length:
+                shard = min(shards - 1, (position + start) * shards // total)
+                boundary = ((shard + 1) * total + shards - 1) // shards
+                end = min(length, boundary - position)
+                if end <= start:
+                    end = length
+                shard_list[shard].append((name, start, end))
+                start = end
+        else:
+            # Place the contig in the shard holding its midpoint
+            shard = min(shards - 1, (position + length // 2) * shards // total)
+            shard_list[shard].append((name, 0, length))
+        position = position + length
+    return [shard for shard in shard_list if len(shard) > 0]
+
+def write_bed(intervals, bed_file):
+    with open(bed_file, 'w') as output_file:
+        for name, start, end in intervals:
+            output_file.write(name + '\t' + str(start) + '\t' + str(end) + '\n')
+    return bed_file
+
+# Split the reference into shards, writing each shard to a BED file, and
+# return the list of BED files. Files are written to output_dir, or the
+# directory of the reference, named <reference stem>_shard<n>.bed.
+def make_interval_shards(reference_file, shards, output_dir = None, split_contigs = False):
+    contigs = read_reference_contigs(reference_file)
+    if output_dir == None:
+        output_dir = os.path.dirname(reference_file)
+    stem = os.path.basename(reference_file)
+    for ext in ['.fai', '.dict']:
+        if stem.endswith(ext):
+            stem = stem[:-len(ext)]
+    stem = stem.rsplit('.', 1)[0]
+    bed_files = []
+    for index, intervals in enumerate(get_interval_shards(contigs, shards, split_contigs)):
+        bed_files.append(write_bed(intervals, os.path.join(output_dir, stem + '_shard' + str(index) + '.bed')))
+    print '\tInterval shards - ' + str(len(bed_files)) + ' shards written for ' + reference_file + '\n'
+    return bed_files
+
+# Intervals may be given to the wrappers as a region string, e.g. 
+# chr1:1-1000000, the name of an interval file (.bed, .intervals or 
+# .list) or a list of these. Return them as a list.
+def get_interval_list(intervals):
+    if intervals == None:
+        return []
+    if isinstance(intervals, basestring):
+        return [intervals]
+    return list(intervals)
+
+def is_interval_file(interval):
+    return interval.rsplit('.', 1)[-1] in ['bed', 'intervals', 'list', 'interval_list']
+
+# Get the suffix added to a wrapper's default output filename when it is
+# run on intervals, so that the outputs for each shard are distinct, e.g.
+# _hg19_shard0 for hg19_shard0.bed or _chr1_1_1000 for chr1:1-1000.
+def get_interval_suffix(intervals):
+    interval_list = get_interval_list(intervals)
+    if len(interval_list) == 0:
+        return ''
+    first = interval_list[0]
+    if is_interval_file(first):
+        first = os.path.basename(first).rsplit('.', 1)[0]
+    return '_' + first.replace(':', '_').replace('-', '_')
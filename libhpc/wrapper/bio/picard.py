@@ -45,18 +45,24 @@ File created on Jan 9, 2014
 '''
 # Wrapper module that provides Picard tools as functions
 
-from subprocess import call
+from libhpc.wrapper.stream import StreamCommand
 import os
 import shutil
+from libhpc.wrapper.toolchain import register_tool, set_tool_location, get_tool_path
 
-picard_exec = '/usr/local/bio/picard-tools-1.107'
+# The default location of the directory of Picard jar files, see 
+# libhpc.wrapper.toolchain
+register_tool('picard', '/usr/local/bio/picard-tools-1.107', kind='directory')
 
 def set_picard_exec(picard_location):
-    global picard_exec
-    picard_exec = picard_location
+    set_tool_location('picard', picard_location)
 
 def get_picard_exec():
-    return picard_exec
+    return get_tool_path('picard')
+
+# Get the command running one of the Picard jar files with args
+def get_jar_command(jar_file, args, outputs=None):
+    return StreamCommand([get_tool_path('java'), '-jar', os.path.join(get_picard_exec(), jar_file)] + args, None, outputs)
 
 def add_read_groups(input_file, rgid, rglb, rgpl, rgpu, rgsm, output_file=None):
     # AddOrReplaceReadGroups.jar INPUT=ERR018562_pe_sorted.bam OUTPUT=ERR018562_pe_sorted_tagged.bam RGID=1 RGLB=ZAP430 RGPL=ILLUMINA RGPU='Lane 1' RGSM='ZAP430'
@@ -69,7 +75,7 @@ def add_read_groups(input_file, rgid, rglb, rgpl, rgpu, rgsm, output_file=None):
     if rgsm == None:
         rgsm = ''
     print '\tPICARD - AddOrReplaceReadGroups...\n'
-    status = call(['java', '-jar', os.path.join(picard_exec,'AddOrReplaceReadGroups.jar'), 'INPUT='+input_file, 'OUTPUT='+output_file, 'RGID='+str(rgid), 'RGLB='+rglb, 'RGPL='+rgpl, 'RGPU='+rgpu, 'RGSM='+rgsm])
+    status = get_jar_command('AddOrReplaceReadGroups.jar', ['INPUT='+input_file, 'OUTPUT='+output_file, 'RGID='+str(rgid), 'RGLB='+rglb, 'RGPL='+rgpl, 'RGPU='+rgpu, 'RGSM='+rgsm]).run()
     print '\tPICARD - AddOrReplaceReadGroups...DONE...Status code: ' + str(status) + '\n\n'
     return output_file
     
@@ -78,14 +84,13 @@ def merge_sam(input_list, output_file = None):
     if output_file == None:
         output_file = input_list[0].rsplit('.',1)[0] + '_MERGED.bam'
     
-    command_list = ['java', '-jar', os.path.join(picard_exec,'MergeSamFiles.jar')]
-    
+    args = []
     for input_value in input_list:
         print '\tPICARD - MergeSamFiles - Input value: INPUT=' + input_value + '\n'
-        command_list.append('INPUT='+input_value)
+        args.append('INPUT='+input_value)
          
-    command_list.append('OUTPUT='+output_file)
-    status = call(command_list)
+    args.append('OUTPUT='+output_file)
+    status = get_jar_command('MergeSamFiles.jar', args).run()
     print '\tPICARD - MergeSamFiles...DONE...Status code: ' + str(status) + '\n\n'
 
     return (output_file)
@@ -98,34 +103,54 @@ def create_dictionary(ref_genome_file, output_file = None):
     # Check if the output file exists, if it does, rename it to .old
     if os.path.exists(output_file):
         shutil.move(output_file, output_file + '.old')
-    status = call(['java', '-jar', os.path.join(picard_exec,'CreateSequenceDictionary.jar'), 'R=' + ref_genome_file, 'O=' + output_file])
+    command = get_jar_command('CreateSequenceDictionary.jar', ['R=' + ref_genome_file, 'O=' + output_file], [output_file])
+    status = command.run()
     print '\tPICARD CreateSequenceDictionary...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
 def build_bam_index(input_file, output_file=None):
     print '\tPICARD BuildBamIndex...\n'
+    command = build_bam_index_command(input_file, output_file)
+    status = command.run()
+    print '\tPICARD BuildBamIndex...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for build_bam_index
+def build_bam_index_command(input_file, output_file=None):
     if output_file == None:
         output_file = input_file.rsplit('.',1)[0] + '.bai'
-    status = call(['java', '-jar', os.path.join(picard_exec, 'BuildBamIndex.jar'), 'INPUT='+input_file, 'OUTPUT='+output_file])
-    print '\tPICARD BuildBamIndex...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return get_jar_command('BuildBamIndex.jar', ['INPUT='+input_file, 'OUTPUT='+output_file], [output_file])
 
 def mark_duplicates(input_file, output_file = None, metrics_file = None, remove_duplicates = False):
     print '\tPICARD MarkDuplicates...\n'
+    command = mark_duplicates_command(input_file, output_file, metrics_file, remove_duplicates)
+    status = command.run()
+    print '\tPICARD MarkDuplicates...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for mark_duplicates
+def mark_duplicates_command(input_file, output_file = None, metrics_file = None, remove_duplicates = False):
     if output_file == None:
         output_file = input_file.rsplit('.',1)[0] + '_marked.' + input_file.rsplit('.',1)[1]
     if metrics_file == None:
         metrics_file = input_file.rsplit('.',1)[0] + '_marked.metrics'
-    
-    status = call(['java', '-jar', os.path.join(picard_exec, 'MarkDuplicates.jar'), 'INPUT='+input_file, 'OUTPUT='+output_file, 'METRICS_FILE='+metrics_file, 'REMOVE_DUPLICATES='+str(remove_duplicates)])
-    print '\tPICARD MarkDuplicates...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file, metrics_file)
+    return get_jar_command('MarkDuplicates.jar', ['INPUT='+input_file, 'OUTPUT='+output_file, 'METRICS_FILE='+metrics_file, 
+                           'REMOVE_DUPLICATES='+str(remove_duplicates)], [output_file, metrics_file])
 
 def remove_duplicates(input_file, output_file = None, metrics_file = None):
     if output_file == None:
-        output_file = input_file.rsplit('.',1)[0] + '_NODUP.' + input_file.rsplit('.',1)[1]
+        output_file = get_nodup_filename(input_file)
     return mark_duplicates(input_file, output_file=output_file, metrics_file=metrics_file, remove_duplicates=True)
 
+# Get the command for remove_duplicates
+def remove_duplicates_command(input_file, output_file = None, metrics_file = None):
+    if output_file == None:
+        output_file = get_nodup_filename(input_file)
+    return mark_duplicates_command(input_file, output_file=output_file, metrics_file=metrics_file, remove_duplicates=True)
+
+def get_nodup_filename(input_file):
+    return input_file.rsplit('.',1)[0] + '_NODUP.' + input_file.rsplit('.',1)[1]
+
 def check_rename_reference(ref_genome_file, output_file = None):
     if (ref_genome_file.rsplit('.',1)[1] != 'fa') and (ref_genome_file.rsplit('.',1)[1] != 'fasta'):
         print "Provided FASTA input file <" + str(ref_genome_file) + "> doesn't have a compatible extension - .fa or .fasta, creating copy with .fa extension."
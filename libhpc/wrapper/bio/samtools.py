@@ -45,70 +45,162 @@ File created on Aug 7, 2012
 '''
 # Samtools module provides functions for various samtools operations
 
-from subprocess import call
+from libhpc.wrapper.stream import StreamCommand
+from libhpc.wrapper.bio.intervals import get_interval_list, get_interval_suffix, is_interval_file
 
-samtools_exec = '/usr/local/bio/samtools-0.1.19/samtools' 
-bcftools_exec = '/usr/local/bio/samtools-0.1.19/bcftools/bcftools' 
+from libhpc.wrapper.toolchain import register_tool, set_tool_location, get_tool_path
+
+# The default locations of samtools and bcftools, see 
+# libhpc.wrapper.toolchain
+register_tool('samtools', '/usr/local/bio/samtools-0.1.19/samtools', version_args=[])
+register_tool('bcftools', '/usr/local/bio/samtools-0.1.19/bcftools/bcftools', version_args=[])
 
 def set_samtools_exec(samtools_location):
-    global samtools_exec
-    samtools_exec = samtools_location
+    set_tool_location('samtools', samtools_location)
 
 def get_samtools_exec():
-    return samtools_exec
+    return get_tool_path('samtools')
+
+def set_bcftools_exec(bcftools_location):
+    set_tool_location('bcftools', bcftools_location)
+
+def get_bcftools_exec():
+    return get_tool_path('bcftools')
 
 def import_sam(ref_genome_file, sam_file, bam_file = None):
-    if bam_file == None:
-        bam_file = sam_file.rsplit('.',1)[0] + '.bam'
+    command = import_sam_command(ref_genome_file, sam_file, bam_file)
     print '\tSAM import...\n'
-    status = call([samtools_exec, 'import', ref_genome_file, sam_file, bam_file])
+    status = command.run()
     print '\tSAM import...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, bam_file)
-    
-def sort(bam_input_file, sorted_output_file = None):
+    return command.get_result(status)
+
+# Get the command for import_sam. If read_stdin is True, the SAM data is
+# read from stdin, sam_file is then only used to name the output file.
+def import_sam_command(ref_genome_file, sam_file, bam_file = None, read_stdin = False, write_stdout = False):
+    if bam_file == None:
+        bam_file = sam_file.rsplit('.',1)[0] + '.bam'
+    sam_input = sam_file
+    if read_stdin:
+        sam_input = '-'
+    bam_output = bam_file
+    if write_stdout:
+        bam_output = '-'
+    return StreamCommand([get_samtools_exec(), 'import', ref_genome_file, sam_input, bam_output], None, [bam_file])
+
+def sort(bam_input_file, sorted_output_file = None, threads = None):
+    command = sort_command(bam_input_file, sorted_output_file, threads)
+    print '\tSAM sort...\n'
+    status = command.run()
+    print '\tSAM sort...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for sort
+def sort_command(bam_input_file, sorted_output_file = None, threads = None):
     if sorted_output_file == None:
         # Suffix is automatically added by sort
         sorted_output_file = bam_input_file.rsplit('.',1)[0] + '_SORTED'
     else:
         sorted_output_file = bam_input_file.rsplit('.',1)[0]
-    print '\tSAM sort...\n'
-    status = call([samtools_exec, 'sort', bam_input_file, sorted_output_file])
-    print '\tSAM sort...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, sorted_output_file + '.bam')
+    thread_args = []
+    if threads != None:
+        thread_args = ['-@', str(threads)]
+    return StreamCommand([get_samtools_exec(), 'sort'] + thread_args + [bam_input_file, sorted_output_file], 
+                         None, [sorted_output_file + '.bam'])
 
 def index(input_file, output_file = None):
-    if output_file == None:
-        output_file = input_file.rsplit('.',1)[0] + '.bai'
+    command = index_command(input_file, output_file)
     print '\tSAM index...\n'
-    status = call([samtools_exec, 'index', input_file, output_file])
+    status = command.run()
     print '\tSAM index...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
-def faidx(input_file, output_file = None):
+# Get the command for index
+def index_command(input_file, output_file = None):
     if output_file == None:
-        output_file = input_file.rsplit('.',1)[0] + '.fai'
+        output_file = input_file.rsplit('.',1)[0] + '.bai'
+    return StreamCommand([get_samtools_exec(), 'index', input_file, output_file], None, [output_file])
+
+def faidx(input_file, output_file = None):
+    command = faidx_command(input_file, output_file)
     print '\tsamtools FA idx...\n'
-    status = call([samtools_exec, 'faidx', input_file, output_file])
+    status = command.run()
     print '\tsamtools faidx...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
-def mpileup(input_file, output_file = None):
+# Get the command for faidx
+def faidx_command(input_file, output_file = None):
     if output_file == None:
-        output_file = input_file.rsplit('.',1)[0] + '.bcf'
-    output_file_handle = open(output_file,'w')
+        output_file = input_file.rsplit('.',1)[0] + '.fai'
+    return StreamCommand([get_samtools_exec(), 'faidx', input_file, output_file], None, [output_file])
+
+def mpileup(input_file, output_file = None, intervals = None):
+    command = mpileup_command(input_file, output_file, intervals)
     print '\tsamtools mpileup...\n'
-    status = call([samtools_exec, 'mpileup', '-u', input_file], stdout=output_file_handle)
-    output_file_handle.close()
+    status = command.run()
     print '\tsamtools mpileup...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
 
-def bcf2vcf(input_file, output_file = None):
+# Version of mpileup taking the intervals to process as a parameter, for
+# use in components run on each interval shard
+def mpileup_intervals(input_file, intervals, output_file = None):
+    return mpileup(input_file, output_file, intervals)
+
+# Get the command for mpileup. If read_stdin is True, the BAM data is read
+# from stdin, input_file is then only used to name the output file. If
+# write_stdout is True, the BCF output is not written to output_file.
+# mpileup can be restricted to a single region or interval file.
+def mpileup_command(input_file, output_file = None, intervals = None, read_stdin = False, write_stdout = False):
     if output_file == None:
-        output_file = input_file.rsplit('.',1)[0] + '.vcf'
-    output_file_handle = open(output_file,'w')
+        output_file = input_file.rsplit('.',1)[0] + get_interval_suffix(intervals) + '.bcf'
+    bam_input = input_file
+    if read_stdin:
+        bam_input = '-'
+    stdout_file = output_file
+    if write_stdout:
+        stdout_file = None
+    interval_args = []
+    interval_list = get_interval_list(intervals)
+    if len(interval_list) > 1:
+        raise ValueError('samtools mpileup can only be restricted to a single region or interval file.')
+    elif len(interval_list) == 1:
+        if is_interval_file(interval_list[0]):
+            interval_args = ['-l', interval_list[0]]
+        else:
+            interval_args = ['-r', interval_list[0]]
+    return StreamCommand([get_samtools_exec(), 'mpileup', '-u'] + interval_args + [bam_input], stdout_file, [output_file])
+
+# Concatenate the BCF files produced by mpileup for each interval shard, 
+# in order, into a single BCF file
+def concat_bcf(input_list, output_file = None):
+    command = concat_bcf_command(input_list, output_file)
+    print '\tbcftools cat...\n'
+    status = command.run()
+    print '\tbcftools cat...DONE...Status code: ' + str(status) + '\n\n'
+    return command.get_result(status)
+
+# Get the command for concat_bcf
+def concat_bcf_command(input_list, output_file = None):
+    if output_file == None:
+        output_file = input_list[0].rsplit('.',1)[0] + '_gathered.bcf'
+    return StreamCommand([get_bcftools_exec(), 'cat'] + list(input_list), output_file, [output_file])
+
+def bcf2vcf(input_file, output_file = None):
+    command = bcf2vcf_command(input_file, output_file)
     print '\tbcftools view...\n'
-    status = call([bcftools_exec, 'view', input_file], stdout=output_file_handle)
-    output_file_handle.close()
+    status = command.run()
     print '\tbcftools view...DONE...Status code: ' + str(status) + '\n\n'
-    return (status, output_file)
+    return command.get_result(status)
+
+# Get the command for bcf2vcf, see mpileup_command for read_stdin and
+# write_stdout.
+def bcf2vcf_command(input_file, output_file = None, read_stdin = False, write_stdout = False):
+    if output_file == None:
+        output_file = input_file.rsplit('.',1)[0] + '.vcf'
+    bcf_input = input_file
+    if read_stdin:
+        bcf_input = '-'
+    stdout_file = output_file
+    if write_stdout:
+        stdout_file = None
+    return StreamCommand([get_bcftools_exec(), 'view', bcf_input], stdout_file, [output_file])
 
@@ -45,7 +45,7 @@ File created on Aug 7, 2012
 '''
 # Module that provides BWA tools as functions
 
-from subprocess import call
+from libhpc.wrapper.process import call
 
 bwa_exec = '/Users/jhc02/tmp/bio/bwa-0.6.2/bwa'
 
@@ -0,0 +1,326 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# A process launch layer for the tool wrappers. launch() starts a tool 
+# and returns a ProcessHandle rather than waiting for the tool to exit.
+# Handles can be polled, waited on or given callbacks to run when the 
+# tool exits, and provide the tool's exit status, its captured output 
+# and its start and end times.
+#
+# Handles are supervised by a ProcessSupervisor, a single thread that
+# polls the running tools and completes their handles as they exit, so
+# any number of concurrent tool invocations can be supervised without a
+# thread for each. Captured output is written to temporary files rather
+# than pipes so that a tool never blocks on output that nobody is 
+# reading.
+#
+# Wrappers describe the tool invocations they make as commands (see 
+# libhpc.wrapper.stream.StreamCommand) that are started with launch(), so
+# that a runner can start many tools and wait on them through the 
+# supervisor rather than with a thread for each, see the launch PAR 
+# runner in libhpc.cf.runners. call() launches a tool and waits for it to
+# exit, returning its exit status, in place of subprocess.call.
+
+import time
+import logging
+import tempfile
+import threading
+from subprocess import Popen
+
+LOG = logging.getLogger(__name__)
+
+# The shortest and longest intervals, in seconds, between polls of the
+# running tools by the supervisor. The interval is doubled up to the 
+# maximum while no tool exits and reset when one does.
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.5
+
+class ProcessHandle():
+    '''
+    A handle on a tool started by launch().
+    '''
+    
+    def __init__(self, argv, process, stdout_file=None, stderr_file=None):
+        '''
+        Constructor
+        '''
+        self.argv = argv
+        self.process = process
+        self.pid = process.pid
+        self.start_time = time.time()
+        self.end_time = None
+        self.returncode = None
+        # Temporary files that the tool's output is captured to
+        self.stdout_file = stdout_file
+        self.stderr_file = stderr_file
+        self.output = None
+        self.callbacks = []
+        self.supervisor = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+    
+    # Check whether the tool has exited, returning its exit status or None
+    # if it is still running.
+    def poll(self):
+        if self.supervisor != None:
+            # The supervisor polls the process, the handle is completed
+            # once it has seen the tool exit.
+            return self.returncode
+        if self.returncode == None:
+            with self.lock:
+                status = self.process.poll()
+            if status != None:
+                self.complete(status)
+        return self.returncode
+    
+    # Wait for the tool to exit and return its exit status. If a timeout in
+    # seconds is provided and the tool is still running when it expires,
+    # None is returned.
+    def wait(self, timeout=None):
+        if self.supervisor != None:
+            self.done.wait(timeout)
+            return self.returncode
+        if timeout == None:
+            if self.returncode == None:
+                self.complete(self.process.wait())
+            return self.returncode
+        end = time.time() + timeout
+        interval = MIN_POLL_INTERVAL
+        while (self.poll() == None) and (time.time() < end):
+            time.sleep(min(interval, max(end - time.time(), 0)))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+        return self.returncode
+    
+    def is_done(self):
+        return self.done.is_set()
+    
+    # Record the exit of the tool and run the handle's callbacks
+    def complete(self, status):
+        with self.lock:
+            if self.done.is_set():
+                return
+            self.end_time = time.time()
+            self.returncode = status
+            callbacks = self.callbacks
+            self.callbacks = []
+            self.done.set()
+        LOG.debug('Command <%s> exited with status %s after %.3fs', self, status, self.get_elapsed_time())
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                LOG.exception('Callback for command <%s> failed', self)
+    
+    # Add a function to be called with the handle when the tool exits. If
+    # it has already exited, the function is called immediately.
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+    
+    # Get the time in seconds for which the tool ran, or has been running
+    def get_elapsed_time(self):
+        if self.end_time == None:
+            return time.time() - self.start_time
+        return self.end_time - self.start_time
+    
+    # Get the captured stdout and stderr of the tool once it has exited. 
+    # The output of a stream that was not captured is None.
+    def get_output(self):
+        self.wait()
+        with self.lock:
+            if self.output == None:
+                self.output = (read_captured_output(self.stdout_file), 
+                               read_captured_output(self.stderr_file))
+                self.stdout_file = None
+                self.stderr_file = None
+            return self.output
+    
+    def kill(self):
+        if self.returncode == None:
+            try:
+                self.process.kill()
+            except OSError:
+                # The process has already exited
+                pass
+    
+    def __repr__(self):
+        return ' '.join([str(arg) for arg in self.argv])
+
+def read_captured_output(output_file):
+    if output_file == None:
+        return None
+    output_file.seek(0)
+    output = output_file.read()
+    output_file.close()
+    return output
+
+class ProcessSupervisor():
+    '''
+    Polls a set of running tools from a single thread and completes their
+    handles as they exit.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.handles = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.interval = MIN_POLL_INTERVAL
+    
+    def watch(self, handle):
+        with self.condition:
+            handle.supervisor = self
+            self.handles.append(handle)
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, name='ProcessSupervisor')
+                self.thread.daemon = True
+                self.thread.start()
+            # Poll again promptly so that short-lived tools are seen to exit
+            self.interval = MIN_POLL_INTERVAL
+            self.condition.notify_all()
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.handles) == 0:
+                    self.condition.wait()
+                handles = list(self.handles)
+            
+            exited = []
+            for handle in handles:
+                status = handle.process.poll()
+                if status != None:
+                    exited.append((handle, status))
+            if len(exited) > 0:
+                with self.condition:
+                    for handle, status in exited:
+                        self.handles.remove(handle)
+                for handle, status in exited:
+                    handle.complete(status)
+                with self.condition:
+                    # Wake any threads waiting for one of a set of handles
+                    self.condition.notify_all()
+                    self.interval = MIN_POLL_INTERVAL
+            else:
+                # Sleep until the interval passes or a new tool is watched
+                with self.condition:
+                    interval = self.interval
+                    self.interval = min(interval * 2, MAX_POLL_INTERVAL)
+                    self.condition.wait(interval)
+    
+    # Wait until at least one of handles has completed or the timeout in
+    # seconds expires and return the list of completed handles.
+    def wait_any(self, handles, timeout=None):
+        end = None
+        if timeout != None:
+            end = time.time() + timeout
+        with self.condition:
+            while True:
+                completed = [handle for handle in handles if handle.is_done()]
+                if len(completed) > 0:
+                    return completed
+                if end == None:
+                    self.condition.wait()
+                else:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        return completed
+                    self.condition.wait(remaining)
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+def get_supervisor():
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor == None:
+            _supervisor = ProcessSupervisor()
+        return _supervisor
+
+# Start a tool and return a ProcessHandle for it. stdin, stdout and 
+# stderr are passed to Popen. If capture_output is True, any of stdout 
+# and stderr that are not provided are captured and returned by the 
+# handle's get_output(). If supervise is True, the handle is completed by
+# the supervisor thread, otherwise the tool's exit is only seen when the
+# handle is polled or waited on.
+def launch(argv, stdin=None, stdout=None, stderr=None, capture_output=False, cwd=None, env=None, 
+           preexec_fn=None, supervise=True):
+    stdout_file = None
+    stderr_file = None
+    if capture_output:
+        if stdout == None:
+            stdout_file = tempfile.TemporaryFile()
+            stdout = stdout_file
+        if stderr == None:
+            stderr_file = tempfile.TemporaryFile()
+            stderr = stderr_file
+    LOG.debug('Starting command <%s>', ' '.join([str(arg) for arg in argv]))
+    try:
+        process = Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr, cwd=cwd, env=env, 
+                        close_fds=True, preexec_fn=preexec_fn)
+    except OSError:
+        for output_file in [stdout_file, stderr_file]:
+            if output_file != None:
+                output_file.close()
+        raise
+    handle = ProcessHandle(argv, process, stdout_file, stderr_file)
+    if supervise:
+        get_supervisor().watch(handle)
+    return handle
+
+# Wait until at least one of handles has completed, or the timeout 
+# expires, and return the list of completed handles.
+def wait_any(handles, timeout=None):
+    return get_supervisor().wait_any(handles, timeout)
+
+# Wait until all of handles have completed and return their exit statuses
+def wait_all(handles):
+    return [handle.wait() for handle in handles]
+
+# Run a tool and wait for it to exit, returning its exit status. This 
+# takes the same arguments as subprocess.call.
+def call(argv, stdin=None, stdout=None, stderr=None, cwd=None, env=None):
+    handle = launch(argv, stdin=stdin, stdout=stdout, stderr=stderr, cwd=cwd, env=env, supervise=False)
+    return handle.wait()
@@ -0,0 +1,172 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# Support for describing tool invocations as commands. Wrappers provide a
+# command function that returns a StreamCommand describing the tool 
+# invocation rather than running it. Commands can be run on their own, 
+# with stdout redirected to an output file, or launched without waiting 
+# for them (see libhpc.wrapper.process). The commands of tools that can 
+# read their input from stdin and/or write their output to stdout can 
+# also be connected into a pipeline in which each tool's stdout is 
+# connected to the next tool's stdin through an OS pipe. The tools in a
+# pipeline run concurrently and a tool writing faster than the next can 
+# read blocks when the pipe is full, so no intermediate files are 
+# written.
+
+import signal
+import logging
+from subprocess import PIPE
+from libhpc.wrapper.process import launch, wait_all
+
+LOG = logging.getLogger(__name__)
+
+class StreamCommand():
+    '''
+    A tool invocation that may be connected to other tools through its
+    stdin and stdout.
+    '''
+    
+    def __init__(self, argv, stdout_file=None, outputs=None):
+        '''
+        Constructor
+        '''
+        # The command line to run
+        self.argv = argv
+        # If provided, the file the tool's stdout is written to when it is
+        # not connected to another tool.
+        self.stdout_file = stdout_file
+        # The values returned by the wrapper after the exit status, 
+        # typically the names of its output files.
+        if outputs == None:
+            outputs = []
+        self.outputs = outputs
+    
+    # The value the wrapper returns when the tool exits with status. A 
+    # tool without outputs returns only its status.
+    def get_result(self, status):
+        if len(self.outputs) == 0:
+            return status
+        return (status,) + tuple(self.outputs)
+    
+    # Start the tool, with its stdout written to stdout_file if provided,
+    # and return a process.ProcessHandle for it that is completed by the
+    # process supervisor when the tool exits.
+    def launch(self):
+        output_file = None
+        if self.stdout_file != None:
+            output_file = open(self.stdout_file, 'wb')
+        try:
+            return launch(self.argv, stdout=output_file, preexec_fn=_restore_signals)
+        finally:
+            # The file is now held by the tool
+            if output_file != None:
+                output_file.close()
+    
+    # Run the tool and return its exit status once it has exited
+    def run(self):
+        handle = self.launch()
+        status = handle.wait()
+        if status != 0:
+            LOG.error('Command <%s> exited with status %s', self, status)
+        return status
+    
+    def __repr__(self):
+        return ' '.join([str(arg) for arg in self.argv])
+
+# Python ignores SIGPIPE, which is inherited by child processes. Restore
+# the default handler so that a tool writing to a pipe whose reader has 
+# exited is stopped, as it would be in a shell pipeline.
+def _restore_signals():
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+# Run a list of commands, connecting the stdout of each command to the
+# stdin of the next. The stdout of the last command is written to its 
+# stdout_file if provided. Returns the list of exit statuses of the 
+# commands once they have all exited.
+def run_pipeline(commands):
+    handles = []
+    output_file = None
+    previous_stdout = None
+    try:
+        for index, command in enumerate(commands):
+            stdout = None
+            if index < len(commands) - 1:
+                stdout = PIPE
+            elif command.stdout_file != None:
+                output_file = open(command.stdout_file, 'wb')
+                stdout = output_file
+            LOG.debug('Starting command <%s>', command)
+            # Descriptors are not inherited by the tools so that each pipe 
+            # is only held open by its writer and reader and end of file is
+            # seen when the writer exits.
+            handle = launch(command.argv, stdin=previous_stdout, stdout=stdout, 
+                            preexec_fn=_restore_signals)
+            handles.append(handle)
+            # The pipe is now held by the two processes it connects
+            if previous_stdout != None:
+                previous_stdout.close()
+            previous_stdout = handle.process.stdout
+    except OSError:
+        LOG.error('Unable to start command <%s>', commands[len(handles)])
+        if previous_stdout != None:
+            previous_stdout.close()
+        for handle in handles:
+            handle.kill()
+            handle.wait()
+        raise
+    finally:
+        if output_file != None:
+            output_file.close()
+    
+    statuses = wait_all(handles)
+    for command, status in zip(commands, statuses):
+        if status != 0:
+            LOG.error('Command <%s> exited with status %s', command, status)
+    return statuses
+
+# Get the exit status of a pipeline from the statuses of its commands.
+# As with the shell's pipefail option, this is the status of the last
+# command to fail, or 0 if all the commands succeeded.
+def get_pipeline_status(statuses):
+    pipeline_status = 0
+    for status in statuses:
+        if status != 0:
+            pipeline_status = status
+    return pipeline_status
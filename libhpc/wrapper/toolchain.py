@@ -0,0 +1,302 @@
+# Copyright (c) 2015, Imperial College London
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without 
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, 
+# this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright notice, 
+# this list of conditions and the following disclaimer in the documentation 
+# and/or other materials provided with the distribution.
+# 
+# 3. Neither the names of the copyright holders nor the names of their 
+# contributors may be used to endorse or promote products derived from this 
+# software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE 
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE 
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) 
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE 
+# POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------
+#
+# This file is part of the libhpc-cf Coordination Forms library that has been 
+# developed as part of the libhpc projects 
+# (http://www.imperial.ac.uk/lesc/projects/libhpc).
+#
+# We gratefully acknowledge the Engineering and Physical Sciences Research
+# Council (EPSRC) for their support of the projects:
+#   - libhpc: Intelligent Component-based Development of HPC Applications
+#     (EP/I030239/1).
+#   - libhpc Stage II: A Long-term Solution for the Usability, Maintainability
+#     and Sustainability of HPC Software (EP/K038788/1).
+# The toolchain used by the tool wrappers: the locations of the tools, 
+# e.g. the bwa executable or the GATK jar file, and their versions.
+#
+# Each tool is registered with its default location. When a wrapper 
+# needs a tool, the location is looked up in the toolchain overrides of
+# the coordination forms context, see libhpc.cf.context, falling back to
+# the default. Each location is found and validated the first time it is 
+# used and the result is cached for the rest of the process, so no 
+# filesystem or platform checks are repeated on later calls. Versions are
+# probed, by running the tool, the first time they are requested.
+#
+# Overrides are bound to the running thread and captured by the tasks of
+# coordination forms run within them, so concurrent tasks can use 
+# different versions of a tool:
+#
+#   with use_tools(gatk='/opt/gatk-3.5/GenomeAnalysisTK.jar'):
+#       result = expression(inputs)
+#
+# or, for part of an expression, see the TOOLS coordination form.
+
+import os
+import re
+import platform
+import threading
+import logging
+from distutils.spawn import find_executable
+from libhpc.cf.context import get_context, get_context_value, bind_context
+from libhpc.wrapper.process import launch
+
+LOG = logging.getLogger(__name__)
+
+# The context key holding the dictionary of tool location overrides
+TOOLCHAIN_KEY = 'toolchain'
+
+# The kinds of tool location: an executable, which is looked up on the
+# PATH if it is not a path, a file such as a jar file, or a directory 
+# such as a directory of jar files
+EXECUTABLE = 'executable'
+FILE = 'file'
+DIRECTORY = 'directory'
+TOOL_KINDS = [EXECUTABLE, FILE, DIRECTORY]
+
+# The pattern matching the version in the output of most tools run
+# without arguments
+VERSION_PATTERN = r'Version:\s*(\S+)'
+
+class ToolSpec():
+    '''
+    A tool registered with the toolchain: its default location, the kind
+    of location and how to probe its version. version_args is a list of
+    arguments to run the tool with, or a function taking the tool's path
+    and returning the command to run, and version_pattern is a regular 
+    expression whose first group matches the version in the command's 
+    output. If default_location is None, discover is called to find it.
+    '''
+    
+    def __init__(self, name, default_location, kind=EXECUTABLE, version_args=None, 
+                 version_pattern=VERSION_PATTERN, discover=None):
+        '''
+        Constructor
+        '''
+        if kind not in TOOL_KINDS:
+            raise ValueError(str(kind) + ' is not an accepted tool location kind')
+        self.name = name
+        self.default_location = default_location
+        self.kind = kind
+        self.version_args = version_args
+        self.version_pattern = version_pattern
+        self.discover = discover
+    
+    def get_version_command(self, path):
+        if self.version_args == None:
+            return None
+        if callable(self.version_args):
+            return self.version_args(path)
+        if self.kind == EXECUTABLE:
+            return [path] + list(self.version_args)
+        return None
+
+class ResolvedTool():
+    '''
+    A tool location that has been found and validated. The version is 
+    probed once, when it is first requested.
+    '''
+    
+    def __init__(self, spec, location, path):
+        '''
+        Constructor
+        '''
+        self.spec = spec
+        self.location = location
+        self.path = path
+        self.version = None
+        self.version_probed = False
+        self.lock = threading.Lock()
+    
+    def get_name(self):
+        return self.spec.name
+    
+    def get_path(self):
+        return self.path
+    
+    # Get the tool's version, or None if it cannot be determined
+    def get_version(self):
+        with self.lock:
+            if not self.version_probed:
+                self.version = self.probe_version()
+                self.version_probed = True
+            return self.version
+    
+    def probe_version(self):
+        command = self.spec.get_version_command(self.path)
+        if (command == None) or (self.spec.version_pattern == None):
+            return None
+        try:
+            (stdout, stderr) = launch(command, capture_output=True, supervise=False).get_output()
+        except OSError as e:
+            LOG.warning('Unable to run <%s> to probe the version of %s: %s', command, self.spec.name, e)
+            return None
+        match = re.search(self.spec.version_pattern, (stdout or '') + (stderr or ''), re.MULTILINE)
+        if match == None:
+            LOG.warning('Unable to find the version of %s in the output of <%s>', self.spec.name, command)
+            return None
+        return match.group(1)
+    
+    def __repr__(self):
+        return 'ResolvedTool(' + self.spec.name + ', ' + self.path + ')'
+
+class Toolchain():
+    '''
+    The registered tools and the cache of resolved tool locations.
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.tools = {}
+        self.resolved = {}
+        self.lock = threading.Lock()
+    
+    def register(self, spec):
+        with self.lock:
+            self.tools[spec.name] = spec
+    
+    def get_spec(self, name):
+        spec = self.tools.get(name, None)
+        if spec == None:
+            raise ValueError('The tool <' + str(name) + '> is not registered with the toolchain.')
+        return spec
+    
+    # Set the default location of a registered tool
+    def set_location(self, name, location):
+        with self.lock:
+            self.get_spec(name).default_location = location
+    
+    # Get the location of a tool, taking overrides in the current context
+    # into account. None is returned for a tool whose location is found
+    # by its discover function.
+    def get_location(self, name):
+        overrides = get_context_value(TOOLCHAIN_KEY)
+        if (overrides != None) and (name in overrides):
+            return overrides[name]
+        return self.get_spec(name).default_location
+    
+    # Get the resolved tool for the location of the named tool in the 
+    # current context, or for the given location.
+    def resolve(self, name, location=None):
+        if location == None:
+            location = self.get_location(name)
+        key = (name, location)
+        tool = self.resolved.get(key, None)
+        if tool != None:
+            return tool
+        with self.lock:
+            tool = self.resolved.get(key, None)
+            if tool == None:
+                spec = self.get_spec(name)
+                tool = ResolvedTool(spec, location, find_tool(spec, location))
+                LOG.debug('Resolved tool %s at <%s>', name, tool.get_path())
+                self.resolved[key] = tool
+            return tool
+    
+    # Forget the cached tool locations, e.g. after tools are installed
+    def clear(self):
+        with self.lock:
+            self.resolved = {}
+
+# Find and validate the path of a tool at location, raising a ValueError
+# if it cannot be found.
+def find_tool(spec, location):
+    if location == None:
+        if spec.discover == None:
+            raise ValueError('No location is set for the tool <' + spec.name + '>.')
+        location = spec.discover()
+    path = os.path.expanduser(location)
+    if spec.kind == EXECUTABLE:
+        if os.path.dirname(path) == '':
+            found_path = find_executable(path)
+            if found_path == None:
+                raise ValueError('Unable to find the executable <' + path + '> for the tool <' + 
+                                 spec.name + '> on the PATH.')
+            path = found_path
+        if not (os.path.isfile(path) and os.access(path, os.X_OK)):
+            raise ValueError('The location <' + path + '> of the tool <' + spec.name + 
+                             '> is not an executable file.')
+    elif spec.kind == FILE:
+        if not os.path.isfile(path):
+            raise ValueError('The location <' + path + '> of the tool <' + spec.name + '> is not a file.')
+    elif not os.path.isdir(path):
+        raise ValueError('The location <' + path + '> of the tool <' + spec.name + '> is not a directory.')
+    return os.path.abspath(path)
+
+# Find the java executable. On a Mac, the java on the PATH may not be the
+# selected JDK, which is found with java_home.
+def discover_java():
+    if platform.system() == 'Darwin':
+        (stdout, stderr) = launch(['/usr/libexec/java_home'], capture_output=True, supervise=False).get_output()
+        java_home = stdout.strip()
+        if java_home != '':
+            return os.path.join(java_home, 'bin', 'java')
+    return 'java'
+
+toolchain = Toolchain()
+toolchain.register(ToolSpec('java', None, version_args=['-version'], 
+                            version_pattern=r'version "([^"]+)"', discover=discover_java))
+
+def get_toolchain():
+    return toolchain
+
+def register_tool(name, default_location, kind=EXECUTABLE, version_args=None, 
+                  version_pattern=VERSION_PATTERN, discover=None):
+    toolchain.register(ToolSpec(name, default_location, kind, version_args, version_pattern, discover))
+
+def set_tool_location(name, location):
+    toolchain.set_location(name, location)
+
+def get_tool_location(name):
+    return toolchain.get_location(name)
+
+def resolve_tool(name, location=None):
+    return toolchain.resolve(name, location)
+
+def get_tool_path(name):
+    return toolchain.resolve(name).get_path()
+
+def get_tool_version(name):
+    return toolchain.resolve(name).get_version()
+
+# Get a copy of context with the tool location overrides in tools, a 
+# dictionary of tool names and locations, added to any it already has.
+def get_tools_context(context, tools):
+    overrides = dict(context.get(TOOLCHAIN_KEY, {}))
+    overrides.update(tools)
+    tools_context = dict(context)
+    tools_context[TOOLCHAIN_KEY] = overrides
+    return tools_context
+
+# Bind tool location overrides, given as tool name and location keyword
+# arguments, to the current thread for the duration of a with block.
+def use_tools(**locations):
+    return bind_context(get_tools_context(get_context(), locations))
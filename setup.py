@@ -7,6 +7,6 @@ setup(name='libhpc-cf',
       author='Jeremy Cohen',
       author_email='jeremy.cohen@imperial.ac.uk',
       license='BSD 3-Clause',
-      packages=['libhpc','libhpc.cf','libhpc.component','libhpc.wrapper','libhpc.wrapper.bio'],
+      packages=['libhpc','libhpc.cf','libhpc.component','libhpc.wrapper','libhpc.wrapper.bio','libhpc.tools'],
       zip_safe=False)
 
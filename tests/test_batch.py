@@ -0,0 +1,116 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+from libhpc.cf import batch
+from libhpc.wrapper.toolchain import use_tools
+
+# Stand-ins for the SLURM commands that run each array task in the
+# background on this machine, keeping the running tasks of each job in
+# a state directory
+FAKE_SBATCH = '''#!/bin/bash
+state="$FAKE_SLURM_STATE"
+echo "$@" >> "$state/sbatch.log"
+while [ $# -gt 1 ]; do
+  case "$1" in
+    --array) array=$2; shift 2;;
+    --output) output=$2; shift 2;;
+    --job-name) shift 2;;
+    *) shift;;
+  esac
+done
+script=$1
+id=$(( $(cat "$state/counter" 2>/dev/null || echo 100) + 1 )); echo $id > "$state/counter"
+range=${array%%\\%*}; last=${range#*-}
+mkdir -p "$state/$id"
+for i in $(seq 0 $last); do
+  ( log=${output//%a/$i}; [ -n "$FAKE_SLURM_SKIP" ] || SLURM_ARRAY_TASK_ID=$i sh $script > $log 2>&1; rm -f "$state/$id/$i" ) &
+  echo $! > "$state/$id/$i"
+done
+echo "$id;cluster"
+'''
+
+FAKE_SQUEUE = '''#!/bin/bash
+state="$FAKE_SLURM_STATE"
+id=$3
+[ -d "$state/$id" ] || { echo "slurm_load_jobs error: Invalid job id specified" >&2; exit 1; }
+[ -n "$(ls "$state/$id")" ] && echo $id
+exit 0
+'''
+
+FAKE_SCANCEL = '''#!/bin/bash
+state="$FAKE_SLURM_STATE"
+for f in "$state/$1"/*; do [ -f "$f" ] && { kill $(cat "$f"); rm -f "$f"; }; done 2>/dev/null
+exit 0
+'''
+
+def square(value):
+    return value * value
+
+def fail(value):
+    raise KeyError('bad value ' + str(value))
+
+a = Parameter('a', 'int')
+r = Parameter('r', 'int', 'output')
+squarer = Component('test.square', 'square', 'test_batch.square', [a], [r])
+failing = Component('test.fail', 'fail', 'test_batch.fail', [a], [r])
+
+class BatchRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        bin_dir = os.path.join(self.directory, 'bin')
+        self.state_dir = os.path.join(self.directory, 'state')
+        os.mkdir(bin_dir)
+        os.mkdir(self.state_dir)
+        tools = {}
+        for name, script in [('sbatch', FAKE_SBATCH), ('squeue', FAKE_SQUEUE), ('scancel', FAKE_SCANCEL)]:
+            tools[name] = os.path.join(bin_dir, name)
+            with open(tools[name], 'w') as f:
+                f.write(script)
+            os.chmod(tools[name], stat.S_IRWXU)
+        self.tools = use_tools(**tools)
+        self.tools.__enter__()
+        # The array tasks are separate interpreters that need to import
+        # this module
+        tests_dir = os.path.dirname(os.path.abspath(__file__))
+        self.environ = dict(os.environ)
+        os.environ['PYTHONPATH'] = os.pathsep.join([os.path.dirname(tests_dir), tests_dir] +
+                                                   filter(None, [os.environ.get('PYTHONPATH')]))
+        os.environ['FAKE_SLURM_STATE'] = self.state_dir
+        self.job_directory = os.path.join(self.directory, 'jobs')
+        batch.set_batch_config(batch.BatchConfig('slurm', self.job_directory, ['--partition', 'short'],
+                                                 max_array_size=4, poll_interval=0.2, status_interval=0.5,
+                                                 result_grace_period=1.0))
+
+    def tearDown(self):
+        self.tools.__exit__(None, None, None)
+        batch.set_batch_config(None)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.directory)
+
+    def test_tasks_run_as_array_jobs(self):
+        self.assertEqual(PAR([squarer] * 10, range(10), runner='batch')(), [value * value for value in range(10)])
+        with open(os.path.join(self.state_dir, 'sbatch.log')) as f:
+            submissions = f.read().splitlines()
+        # Ten tasks in array jobs of at most four tasks
+        self.assertEqual(len(submissions), 3)
+        self.assertTrue(all(['--partition short' in submission for submission in submissions]))
+        self.assertEqual(os.listdir(self.job_directory), [])
+        self.assertEqual(PAR([squarer, PIPE([(squarer,)])], [[3], [4]], runner='batch')(), [9, 16])
+
+    def test_errors_propagate(self):
+        self.assertRaises(KeyError, PAR([squarer, failing], [1, 2], runner='batch'))
+
+    def test_missing_results(self):
+        os.environ['FAKE_SLURM_SKIP'] = '1'
+        self.assertRaises(RuntimeError, PAR([squarer], [1], runner='batch'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import GUARD, PAR
+from libhpc.wrapper.toolchain import use_tools
+from libhpc.wrapper.bio import bwa
+from libhpc.component.bio import bwa_mem, bwa_shm_acquire, bwa_shm_release
+
+# A fake bwa: shm keeps the file names of the loaded indexes in a state
+# file alongside it, listing them as bwa shm -l does, and mem writes its
+# arguments as its SAM output
+FAKE_BWA = '''#!/bin/sh
+DIR=`dirname "$0"`
+case "$1" in
+  shm)
+    case "$2" in
+      -l) [ -f "$DIR/state" ] && awk '{print $1"\\t100"}' "$DIR/state"; exit 0;;
+      -d) rm -f "$DIR/state"; echo drop >> "$DIR/log"; exit 0;;
+      *) basename "$2" >> "$DIR/state"; echo load >> "$DIR/log"; exit 0;;
+    esac;;
+  mem) shift; echo "$@"; exit 0;;
+  "") echo "Version: 0.7.17-r1188" >&2; exit 1;;
+esac
+exit 1
+'''
+
+def fail(*args):
+    raise ValueError('alignment failed')
+
+failing_align = Component('test.fail', 'Failing alignment', 'test_bwa_shm.fail',
+                          [Parameter('read_file', 'string')], [Parameter('status', 'int', 'output')])
+
+class SharedIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bwa = os.path.join(self.directory, 'bwa')
+        with open(self.bwa, 'w') as f:
+            f.write(FAKE_BWA)
+        os.chmod(self.bwa, stat.S_IRWXU)
+        self.ref = os.path.join(self.directory, 'ref', 'genome.fa')
+        self.tools = use_tools(bwa=self.bwa)
+        self.tools.__enter__()
+
+    def tearDown(self):
+        self.tools.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def get_log(self):
+        log_file = os.path.join(self.directory, 'log')
+        if not os.path.exists(log_file):
+            return []
+        with open(log_file) as f:
+            return f.read().split()
+
+    def test_loaded_index_matched_by_file_name(self):
+        self.assertTrue(bwa.is_shm_loaded(self.ref, ['genome.fa']))
+        self.assertTrue(bwa.is_shm_loaded(self.ref, ['/other/genome.fa']))
+        self.assertFalse(bwa.is_shm_loaded(self.ref, ['other.fa']))
+        # An index bwa lists by its file name is used rather than loaded again
+        bwa.shm_load(self.ref)
+        self.assertTrue(bwa.shm_acquire(self.ref, 'mem'))
+        bwa.shm_release(self.ref)
+        self.assertEqual(self.get_log(), ['load'])
+
+    def test_guard_releases_index(self):
+        reads = [os.path.join(self.directory, 'sample' + str(i) + '_1.fq') for i in range(2)]
+        expression = GUARD(PAR([(bwa_mem, self.ref)] * 2),
+                           (bwa_shm_acquire, self.ref, 'mem'), (bwa_shm_release, self.ref, 'mem'))
+        results = expression(reads)
+        self.assertEqual(results,
+                         [os.path.join(self.directory, 'sample' + str(i) + '.sam') for i in range(2)])
+        self.assertEqual(self.get_log(), ['load', 'drop'])
+        self.assertEqual(bwa.shm_users, {})
+
+    def test_guard_releases_index_on_failure(self):
+        expression = GUARD(PAR([failing_align] * 2, ['a.fq', 'b.fq']),
+                           (bwa_shm_acquire, self.ref, 'mem'), (bwa_shm_release, self.ref, 'mem'))
+        self.assertRaises(ValueError, expression)
+        self.assertEqual(self.get_log(), ['load', 'drop'])
+        self.assertEqual(bwa.shm_users, {})
+
+    def test_mem_command(self):
+        command = bwa.mem_command(self.ref, ['a_1.fq', 'a_2.fq'], threads=4)
+        self.assertEqual(command.argv, [self.bwa, 'mem', '-t', '4', self.ref, 'a_1.fq', 'a_2.fq'])
+        self.assertEqual(command.outputs, ['a.sam'])
+        self.assertRaises(ValueError, bwa.mem_command, self.ref, 'a.fq', read_stdin=True)
+        sam_file = os.path.join(self.directory, 'a.sam')
+        self.assertEqual(bwa.mem(self.ref, 'a.fq', sam_file), (0, sam_file))
+        with open(sam_file) as f:
+            self.assertEqual(f.read().split(), [self.ref, 'a.fq'])
+
+if __name__ == '__main__':
+    unittest.main()
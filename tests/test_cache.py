@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.cache import ResultCache, set_result_cache
+from libhpc.cf.forms import PAR
+
+calls = []
+
+# Write the upper case content of source to target, and an index file
+def copy_upper(source, target, status=0):
+    calls.append(source)
+    with open(target, 'w') as f:
+        f.write(open(source).read().upper())
+    with open(target + '.idx', 'w') as f:
+        f.write('index')
+    return (status, target)
+
+# Return the input file unchanged, as picard.check_rename_reference does
+# for a reference genome that already has a .fa extension
+def echo_input(source, target=None):
+    calls.append(source)
+    return (source, )
+
+source_param = Parameter('source', 'string')
+target_param = Parameter('target', 'string', 'inout')
+status_param = Parameter('status', 'int', 'output', True)
+copy_upper_component = Component('test.copy_upper', 'copy upper', 'test_cache.copy_upper', 
+    [source_param, target_param, Parameter('fail', 'int')], [status_param], side_outputs=[(1, '{path}.idx')])
+echo_input_component = Component('test.echo_input', 'echo input', 'test_cache.echo_input', 
+    [source_param, target_param], [])
+
+class ResultCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.directory, 'cache'), '1M')
+        set_result_cache(self.cache)
+        del calls[:]
+        self.source = self.write_file('a.txt', 'hello')
+        self.target = os.path.join(self.directory, 'b.txt')
+    
+    def tearDown(self):
+        set_result_cache(None)
+        shutil.rmtree(self.directory)
+    
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+    
+    def test_cached_run_restores_outputs(self):
+        self.assertEqual(copy_upper_component.run([self.source, self.target, 0]), self.target)
+        os.remove(self.target)
+        os.remove(self.target + '.idx')
+        self.assertEqual(copy_upper_component.run([self.source, self.target, 0]), self.target)
+        self.assertEqual(open(self.target).read(), 'HELLO')
+        self.assertTrue(os.path.exists(self.target + '.idx'))
+        self.assertEqual(len(calls), 1)
+    
+    def test_changed_input_content_is_rerun(self):
+        copy_upper_component.run([self.source, self.target, 0])
+        self.write_file('a.txt', 'world')
+        PAR([copy_upper_component] * 2, [(self.source, self.target, 0)] * 2)()
+        self.assertEqual(open(self.target).read(), 'WORLD')
+        self.assertTrue(len(calls) in [2, 3])
+        copy_upper_component.run([self.source, self.target, 0])
+        self.assertTrue(len(calls) in [2, 3])
+    
+    def test_failed_runs_are_not_cached(self):
+        copy_upper_component.run([self.source, self.target, 1])
+        copy_upper_component.run([self.source, self.target, 1])
+        self.assertEqual(len(calls), 2)
+    
+    # Regression test: files that are inputs of the run, here returned 
+    # unchanged, must not be stored in the cache and restored over the input
+    def test_input_files_are_not_stored(self):
+        self.assertEqual(echo_input_component.run([self.source, None]), self.source)
+        self.assertEqual(echo_input_component.get_output_files([self.source, None], (self.source, )), [])
+        self.assertEqual(echo_input_component.get_output_files([self.source, self.source], (self.source, )), [])
+        stored = [name for root, dirs, files in os.walk(self.cache.entries_dir) for name in files]
+        self.assertEqual(stored, ['entry.pickle'])
+        self.assertEqual(echo_input_component.run([self.source, None]), self.source)
+        self.assertEqual(len(calls), 1)
+    
+    def test_eviction_keeps_the_cache_under_its_maximum_size(self):
+        cache = ResultCache(os.path.join(self.directory, 'small_cache'), 4000)
+        set_result_cache(cache)
+        for index in range(40):
+            source = self.write_file('s' + str(index), 'x' * 100 + str(index))
+            copy_upper_component.run([source, source + '.out', 0])
+        sizes = [entry[1] for entry in cache.list_entries()]
+        total_size = int(open(cache.size_file).read())
+        self.assertEqual(total_size, sum(sizes))
+        self.assertTrue(total_size <= 4000)
+        self.assertTrue(len(sizes) < 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PIPE, PAR
+
+calls = []
+failing = []
+
+# Write the upper case content of source to source.up, failing instead 
+# if source is named in failing
+def upper(source, target=None):
+    calls.append(source)
+    if source in failing:
+        raise RuntimeError('Failed on ' + source)
+    target = source + '.up'
+    with open(target, 'w') as f:
+        f.write(open(source).read().upper() + '!')
+    return (0, target)
+
+upper_params = [Parameter('source', 'string'), Parameter('target', 'string', 'inout')]
+upper_status = [Parameter('status', 'int', 'output', True)]
+first_upper = Component('test.first_upper', 'first upper', 'test_checkpoint.upper', upper_params, upper_status)
+second_upper = Component('test.second_upper', 'second upper', 'test_checkpoint.upper', upper_params, upper_status)
+
+class CheckpointTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'a.txt')
+        with open(self.source, 'w') as f:
+            f.write('hello')
+        self.checkpoint = os.path.join(self.directory, 'pipeline.checkpoint')
+        del calls[:]
+        del failing[:]
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    # PIPE stages are listed last first
+    def get_pipe(self, checkpoint):
+        return PIPE([second_upper, first_upper], [self.source], checkpoint=checkpoint)
+    
+    def test_resumes_after_the_last_completed_stage(self):
+        failing.append(self.source + '.up')
+        self.assertRaises(RuntimeError, self.get_pipe(self.checkpoint))
+        self.assertEqual(len(calls), 2)
+        del failing[:]
+        self.assertEqual(self.get_pipe(self.checkpoint)(), self.source + '.up.up')
+        self.assertEqual(calls[2:], [self.source + '.up'])
+        self.assertEqual(self.get_pipe(self.checkpoint)(), self.source + '.up.up')
+        self.assertEqual(len(calls), 3)
+    
+    def test_changed_input_file_is_rerun(self):
+        self.get_pipe(self.checkpoint)()
+        timestamp = time.time() + 5
+        os.utime(self.source, (timestamp, timestamp))
+        self.get_pipe(self.checkpoint)()
+        self.assertEqual(len(calls), 4)
+    
+    def test_changed_output_file_is_rerun(self):
+        self.get_pipe(self.checkpoint)()
+        with open(self.source + '.up', 'w') as f:
+            f.write('changed')
+        self.get_pipe(self.checkpoint)()
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(open(self.source + '.up').read(), 'HELLO!')
+    
+    def test_without_checkpoint_all_stages_run(self):
+        self.get_pipe(None)()
+        self.get_pipe(None)()
+        self.assertEqual(len(calls), 4)
+    
+    def test_par_tasks_use_their_own_checkpoints(self):
+        pipe = PIPE([second_upper, first_upper], checkpoint=self.checkpoint + '<<PAR_TASK_ID, string>>')
+        self.assertEqual(PAR([pipe, pipe], [[self.source], [self.source]])(), [self.source + '.up.up'] * 2)
+        self.assertTrue(os.path.exists(self.checkpoint + '0'))
+        self.assertTrue(os.path.exists(self.checkpoint + '1'))
+
+if __name__ == '__main__':
+    unittest.main()
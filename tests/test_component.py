@@ -0,0 +1,42 @@
+import unittest
+
+from libhpc.cf import component as component_module
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, resolve_expression
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+
+# Not callable, for testing entry point resolution
+not_a_function = 42
+
+class CountingComponent(Component):
+    
+    def __init__(self, *args, **kwargs):
+        Component.__init__(self, *args, **kwargs)
+        self.resolutions = 0
+    
+    def resolve_function(self, component_code):
+        self.resolutions = self.resolutions + 1
+        return Component.resolve_function(self, component_code)
+
+class ResolveFunctionTest(unittest.TestCase):
+    
+    def test_function_is_resolved_once(self):
+        component_module._resolved_functions.pop('operator.sub', None)
+        sub = CountingComponent('test.sub', 'sub', 'operator.sub', [a, b], [r])
+        self.assertEqual(PAR([sub] * 10, [(5, 1)] * 10)(), [4] * 10)
+        self.assertEqual(PIPE([(sub, 1), (sub, 1)], [5])(), 3)
+        self.assertEqual(sub.resolutions, 1)
+    
+    def test_invalid_entry_points_are_rejected(self):
+        for code in ['nodots', 'operator.no_such_function', 'test_component.not_a_function']:
+            bad = Component('test.bad', 'bad', code, [a], [r])
+            self.assertRaises(ValueError, resolve_expression, PAR([bad]))
+            self.assertFalse(code in component_module._resolved_functions)
+        self.assertRaises(ImportError, Component('test.bad', 'bad', 'no_such_module.f', [a], [r]).get_function)
+
+if __name__ == '__main__':
+    unittest.main()
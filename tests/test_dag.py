@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, BYPASS, APPEND, SPLIT, FILTER
+from libhpc.cf.dag import compile_expression, schedule
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+mul = Component('test.mul', 'mul', 'operator.mul', [a, b], [r])
+
+def sleep_and_return(value, duration):
+    time.sleep(duration)
+    return value
+
+value_param = Parameter('value', 'int')
+duration_param = Parameter('duration', 'float')
+output_param = Parameter('output', 'int', 'output')
+slow = Component('test.slow', 'slow', 'test_dag.sleep_and_return', [value_param, duration_param], [output_param])
+fast = Component('test.fast', 'fast', 'test_dag.sleep_and_return', [value_param, duration_param], [output_param])
+
+class TaskGraphTest(unittest.TestCase):
+    
+    def test_scheduled_results_match_direct_evaluation(self):
+        cases = [(PIPE([(add, 23), add], [12, 45]), ()),
+                 (PIPE([APPEND((add, 23))], [12]), ()),
+                 (PIPE([PAR([add, add]), SPLIT()], [1, 2, 3, 4]), ()),
+                 (PAR([add, mul, add], [(1, 2), (3, 4), (5, 6)]), ()),
+                 (PIPE([FILTER([0]), BYPASS((mul, 3))], [4]), ()),
+                 (PAR([(add, 10), (mul, 10)]), ([1, 2], )),
+                 (PAR([PIPE([(add, 1)]), PIPE([(mul, 2)])]), ([[1], [2]], )),
+                 (PIPE([PAR([add, mul], runner='sequential'), SPLIT()], [1, 2, 3, 4]), ())]
+        for expression, args in cases:
+            self.assertEqual(schedule(expression)(*args), expression(*args))
+    
+    # Independent work in different branches of a PAR overlaps when 
+    # scheduled as a graph rather than waiting for each form in turn
+    def test_independent_work_overlaps(self):
+        expression = PAR([PIPE([(slow, 0.3), FILTER([0]), PAR([(slow, 0.3), (fast, 0.01)])]), 
+                          PIPE([(fast, 0.3), (fast, 0.3)])])
+        inputs = [[[1], [2]], [3]]
+        start = time.time()
+        direct = expression(inputs)
+        direct_time = time.time() - start
+        start = time.time()
+        self.assertEqual(schedule(expression, 4)(inputs), direct)
+        self.assertTrue(time.time() - start < direct_time - 0.2)
+    
+    def test_critical_path_follows_the_slowest_components(self):
+        expression = PAR([PIPE([(slow, 0.01), FILTER([0]), PAR([(slow, 0.01), (fast, 0.01)])]), 
+                          PIPE([(fast, 0.01)])])
+        graph = compile_expression(expression, [[[1], [2]], [3]])
+        components = [node.component for node in graph.get_critical_path() if node.component != None]
+        self.assertEqual(components, [slow, slow])
+    
+    def test_missing_input_is_reported(self):
+        self.assertRaises(ValueError, schedule(PAR([add])))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import time
+import signal
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, SUBMIT
+from libhpc.cf import distributed
+
+def slow_square(value):
+    time.sleep(0.2)
+    return (value * value, os.getpid())
+
+def square(value):
+    return value * value
+
+def fail(value):
+    raise KeyError('bad value ' + str(value))
+
+a = Parameter('a', 'int')
+r = Parameter('r', 'int', 'output')
+slow_squarer = Component('test.slow_square', 'slow square', 'test_distributed.slow_square', [a], [r])
+squarer = Component('test.square', 'square', 'test_distributed.square', [a], [r])
+failing = Component('test.fail', 'fail', 'test_distributed.fail', [a], [r])
+
+# The workers are separate interpreters that need to import this module
+def get_worker_path():
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.dirname(tests_dir), tests_dir]
+    if os.environ.get('PYTHONPATH'):
+        paths.append(os.environ['PYTHONPATH'])
+    return os.pathsep.join(paths)
+
+class DistributedRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.python_path = os.environ.get('PYTHONPATH')
+        os.environ['PYTHONPATH'] = get_worker_path()
+        self.coordinator = distributed.start_coordinator(heartbeat_timeout=1.5, no_worker_timeout=5.0)
+        self.workers = distributed.start_local_workers(2, slots=2, heartbeat_interval=0.3)
+        self.assertTrue(self.coordinator.wait_for_workers(2, 20))
+
+    def tearDown(self):
+        distributed.stop_coordinator()
+        for worker in self.workers:
+            if worker.poll() == None:
+                worker.kill()
+            worker.wait()
+        if self.python_path == None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = self.python_path
+
+    def test_tasks_run_on_workers(self):
+        results = PAR([slow_squarer] * 8, range(8), runner='distributed')()
+        self.assertEqual([result[0] for result in results], [value * value for value in range(8)])
+        pids = set([result[1] for result in results])
+        self.assertFalse(os.getpid() in pids)
+        self.assertEqual(len(pids), 2)
+        expression = PIPE([PAR([squarer] * 3, runner='distributed'), PAR([PIPE([(squarer,)])] * 3, runner='distributed')])
+        self.assertEqual(expression([1, 2, 3]), [1, 16, 81])
+
+    def test_errors_propagate(self):
+        self.assertRaises(KeyError, PAR([failing, squarer], [1, 2], runner='distributed'))
+
+    def test_lost_worker_tasks_rerun(self):
+        futures = SUBMIT(PAR([slow_squarer] * 8, range(8), runner='distributed'))
+        time.sleep(0.1)
+        os.kill(self.workers[0].pid, signal.SIGKILL)
+        self.assertEqual([result[0] for result in futures.result()], [value * value for value in range(8)])
+        self.assertEqual(len(self.coordinator.get_worker_names()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from libhpc.wrapper.bio import fastqsplitter
+
+def get_record(index, mate=None, length=4):
+    name = '@read' + str(index)
+    if mate != None:
+        name = name + '/' + str(mate)
+    return name + '\n' + ('A' * length) + '\n+\n' + ('I' * length) + '\n'
+
+# Get the names of the records in a FASTQ file
+def get_names(path):
+    lines = open(path).read().split('\n')
+    return [lines[index] for index in range(0, len(lines) - 1, 4)]
+
+class FastqSplitterTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write(self, name, content, compress=False):
+        path = os.path.join(self.directory, name)
+        if compress:
+            output = gzip.open(path, 'wb')
+        else:
+            output = open(path, 'w')
+        output.write(content)
+        output.close()
+        return path
+    
+    # Uncompressed input large enough for several blocks per shard is 
+    # split into contiguous ranges
+    def test_shards_keep_record_order(self):
+        records = [get_record(index, length=50 + (index * 7) % 100) for index in range(3000)]
+        path = self.write('sample.fastq', ''.join(records))
+        shards = fastqsplitter.split_fastq_shards(path, 4)
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(''.join([open(shard).read() for shard in shards]), ''.join(records))
+        for shard in shards:
+            self.assertTrue(len(get_names(shard)) > 500)
+    
+    def test_small_input_is_split_on_record_boundaries(self):
+        path = self.write('small.fastq', ''.join([get_record(index) for index in range(4)]))
+        first, second = fastqsplitter.split_fastq(path)
+        self.assertEqual(open(first).read(), get_record(0) + get_record(1))
+        self.assertEqual(open(second).read(), get_record(2) + get_record(3))
+        path = self.write('ten.fastq', ''.join([get_record(index) for index in range(10)]))
+        shards = fastqsplitter.split_fastq_shards(path, 4)
+        self.assertEqual([len(get_names(shard)) for shard in shards], [3, 3, 2, 2])
+    
+    def test_paired_shards_keep_mates_together(self):
+        path1 = self.write('sample_1.fastq.gz', ''.join([get_record(index, 1, 20 + index % 60) for index in range(500)]), True)
+        path2 = self.write('sample_2.fastq', ''.join([get_record(index, 2, 90 - index % 60) for index in range(500)]))
+        pairs = fastqsplitter.split_paired_fastq(path1, path2, 3)
+        self.assertEqual(len(pairs), 3)
+        names = []
+        for shard1, shard2 in pairs:
+            names1 = [name.split('/')[0] for name in get_names(shard1)]
+            self.assertEqual(names1, [name.split('/')[0] for name in get_names(shard2)])
+            names.extend(names1)
+        self.assertEqual(sorted(names), sorted(['@read' + str(index) for index in range(500)]))
+    
+    def test_interleaved_pairs_are_not_split(self):
+        records = [get_record(index, mate) for index in range(11) for mate in (1, 2)]
+        path = self.write('interleaved.fastq', ''.join(records))
+        first, second = fastqsplitter.split_fastq(path)
+        names = []
+        for shard in [first, second]:
+            shard_names = get_names(shard)
+            self.assertEqual(len(shard_names) % 2, 0)
+            for index in range(0, len(shard_names), 2):
+                self.assertEqual(shard_names[index][:-2] + '/2', shard_names[index + 1])
+            names.extend(shard_names)
+        self.assertEqual(sorted(names), sorted([record.split('\n')[0] for record in records]))
+    
+    def test_mismatched_pairs_are_reported(self):
+        path1 = self.write('mismatch_1.fastq', ''.join([get_record(index, 1) for index in range(100)]))
+        path2 = self.write('mismatch_2.fastq', ''.join([get_record(index, 2) for index in range(99)]))
+        self.assertRaises(ValueError, fastqsplitter.split_paired_fastq, path1, path2, 2)
+    
+    def test_empty_and_unterminated_input(self):
+        path = self.write('empty.fastq', '')
+        self.assertEqual([open(shard).read() for shard in fastqsplitter.split_fastq_shards(path, 3)], ['', '', ''])
+        path = self.write('unterminated.fastq', '@a\nAC\n+\nII\n@b\nAC\n+\nII')
+        self.assertEqual([open(shard).read() for shard in fastqsplitter.split_fastq_shards(path, 2)], 
+                         ['@a\nAC\n+\nII\n', '@b\nAC\n+\nII\n'])
+
+if __name__ == '__main__':
+    unittest.main()
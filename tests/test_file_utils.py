@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libhpc.wrapper.bio import file_utils
+
+def unsupported(input_fd, output_fd):
+    raise file_utils.StrategyUnsupported()
+
+class DuplicateFileTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.source = self.get_path('source.bam')
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+        os.chmod(self.source, 0640)
+        self.strategies = file_utils.COPY_STRATEGIES
+    
+    def tearDown(self):
+        file_utils.COPY_STRATEGIES = self.strategies
+        shutil.rmtree(self.directory)
+    
+    def get_path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def assert_copy(self, path):
+        self.assertEqual(open(path, 'rb').read(), self.data)
+        self.assertEqual(os.stat(path).st_mode & 0777, 0640)
+    
+    def test_duplicate_copies_data_and_mode(self):
+        strategy = file_utils.duplicate_bam(self.source, self.get_path('copy.bam'))
+        self.assertTrue(strategy in [name for name, _ in self.strategies] + [file_utils.COPY])
+        self.assert_copy(self.get_path('copy.bam'))
+        # An existing output is replaced, not written through
+        os.link(self.source, self.get_path('linked.bam'))
+        file_utils.duplicate_file(self.get_path('copy.bam'), self.get_path('linked.bam'))
+        self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.get_path('linked.bam')).st_ino)
+    
+    def test_read_only_duplicate_is_hard_link(self):
+        self.assertEqual(file_utils.duplicate_bam(self.source, self.get_path('link.bam'), read_only=True), 
+                         file_utils.HARDLINK)
+        self.assertEqual(os.stat(self.source).st_ino, os.stat(self.get_path('link.bam')).st_ino)
+    
+    def test_duplicate_to_list_moves_first(self):
+        outputs = [self.get_path(name) for name in ['a.bam', 'b.bam', 'c.bam']]
+        strategies = file_utils.duplicate_bam(self.source, outputs)
+        self.assertEqual(strategies[0], file_utils.MOVE)
+        self.assertFalse(os.path.exists(self.source))
+        for path in outputs:
+            self.assert_copy(path)
+    
+    def test_unsupported_strategies_fall_back(self):
+        for count in range(len(self.strategies) + 1):
+            file_utils.COPY_STRATEGIES = [(name, unsupported) for name, _ in self.strategies[:count]] + \
+                                         self.strategies[count:]
+            output = self.get_path('fallback' + str(count) + '.bam')
+            strategy = file_utils.duplicate_file(self.source, output)
+            self.assertTrue(strategy not in [name for name, _ in self.strategies[:count]])
+            self.assert_copy(output)
+        self.assertEqual(strategy, file_utils.COPY)
+    
+    def test_empty_file_and_self_copy(self):
+        open(self.get_path('empty'), 'wb').close()
+        file_utils.duplicate_file(self.get_path('empty'), self.get_path('empty2'))
+        self.assertEqual(os.path.getsize(self.get_path('empty2')), 0)
+        self.assertRaises(ValueError, file_utils.duplicate_file, self.source, self.source)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, BYPASS, APPEND
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+
+class ExpressionShapeTest(unittest.TestCase):
+    
+    # Shape errors are reported when the form is created, before any 
+    # component runs
+    def test_shape_errors_are_reported_on_creation(self):
+        invalid = [lambda: PIPE([add], [1]),
+                   lambda: PIPE([add, (PIPE([add]), 1)]),
+                   lambda: PIPE([add, 3]),
+                   lambda: BYPASS((add, ), [1]),
+                   lambda: APPEND(add, [1]),
+                   lambda: PAR([add, 'x']),
+                   lambda: PAR([(PIPE([add]), 1)])]
+        for create in invalid:
+            self.assertRaises(ValueError, create)
+    
+    def test_valid_expressions_are_accepted(self):
+        self.assertEqual(PIPE([(add, 2), (add, 4)], [1])(), 7)
+        self.assertEqual(BYPASS(PIPE([add]))([1, 2]), [1, 2])
+    
+    def test_prepared_expression_can_be_run_repeatedly(self):
+        expression = PAR([add, add], [(1, 2), (3, 4)])
+        self.assertEqual(expression(), [3, 7])
+        self.assertEqual(expression(), [3, 7])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import time
+import threading
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, SUBMIT
+from libhpc.cf.futures import Future, FutureList
+
+events = []
+events_lock = threading.Lock()
+
+def record(name, value):
+    with events_lock:
+        events.append((name, value))
+
+def delayed_identity(value):
+    time.sleep(value * 0.1)
+    record('delayed', value)
+    return value
+
+def double(value):
+    record('double', value)
+    return value * 2
+
+def fail(value):
+    raise RuntimeError('task failed')
+
+a = Parameter('a', 'int')
+r = Parameter('r', 'int', 'output')
+delayed = Component('test.delayed', 'delayed', 'test_futures.delayed_identity', [a], [r])
+doubler = Component('test.double', 'double', 'test_futures.double', [a], [r])
+failing = Component('test.fail', 'fail', 'test_futures.fail', [a], [r])
+
+class FuturesTest(unittest.TestCase):
+
+    def setUp(self):
+        del events[:]
+
+    def test_downstream_tasks_start_when_ready(self):
+        expression = PIPE([PAR([doubler] * 4, pool_size=4), PAR([delayed] * 4, pool_size=4)])
+        self.assertEqual(expression([5, 1, 3, 2]), [10, 2, 6, 4])
+        # The quick task's result is doubled before the slowest task ends
+        self.assertTrue(events.index(('double', 1)) < events.index(('delayed', 5)))
+
+    def test_single_worker(self):
+        self.assertEqual(PIPE([PAR([doubler] * 3, pool_size=1), PAR([delayed] * 3, pool_size=1)])([1, 2, 3]),
+                         [2, 4, 6])
+
+    def test_submit(self):
+        futures = SUBMIT(PAR([delayed] * 3, pool_size=3), [3, 1, 2])
+        self.assertTrue(isinstance(futures, FutureList))
+        self.assertEqual(list(futures.completed()), [(1, 1), (2, 2), (0, 3)])
+        self.assertEqual(futures.result(), [3, 1, 2])
+        future = SUBMIT(doubler, [7])
+        self.assertTrue(isinstance(future, Future))
+        self.assertEqual(future.result(), 14)
+
+    def test_errors_propagate(self):
+        expression = PIPE([PAR([doubler, doubler]), PAR([failing, delayed])])
+        self.assertRaises(RuntimeError, expression, [1, 2])
+
+    def test_other_runners(self):
+        expression = PIPE([PAR([doubler, doubler], runner='processes'), PAR([delayed, delayed], runner='sequential')])
+        self.assertEqual(expression([1, 2]), [2, 4])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libhpc.wrapper.bio import intervals, samtools, gatk
+from libhpc.wrapper.toolchain import use_tools
+
+CONTIGS = [('chr1', 1000), ('chr2', 600), ('chr3', 300), ('chrM', 100)]
+
+class IntervalShardTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.reference = os.path.join(self.directory, 'hg.fa')
+        open(self.reference, 'w').close()
+        with open(self.reference + '.fai', 'w') as f:
+            for name, length in CONTIGS:
+                f.write(name + '\t' + str(length) + '\t0\t60\t61\n')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_read_contigs(self):
+        self.assertEqual(intervals.read_reference_contigs(self.reference), CONTIGS)
+        # Without a FASTA index, the sequence dictionary is read
+        with open(os.path.join(self.directory, 'hg.dict'), 'w') as f:
+            f.write('@HD\tVN:1.0\n@SQ\tSN:chr1\tLN:1000\tUR:file\n@SQ\tSN:chr2\tLN:50\n')
+        os.remove(self.reference + '.fai')
+        self.assertEqual(intervals.read_reference_contigs(self.reference), [('chr1', 1000), ('chr2', 50)])
+    
+    def test_whole_contig_shards(self):
+        self.assertEqual(intervals.get_interval_shards(CONTIGS, 1), [[(name, 0, length) for name, length in CONTIGS]])
+        self.assertEqual(intervals.get_interval_shards(CONTIGS, 3), 
+                         [[('chr1', 0, 1000)], [('chr2', 0, 600)], [('chr3', 0, 300), ('chrM', 0, 100)]])
+        # There are never more shards than contigs
+        self.assertEqual(len(intervals.get_interval_shards(CONTIGS, 10)), 4)
+    
+    def test_split_contig_shards(self):
+        shards = intervals.get_interval_shards(CONTIGS, 5, True)
+        self.assertEqual(shards, [[('chr1', 0, 400)], [('chr1', 400, 800)], [('chr1', 800, 1000), ('chr2', 0, 200)], 
+                                  [('chr2', 200, 600)], [('chr3', 0, 300), ('chrM', 0, 100)]])
+        for shard in shards:
+            self.assertEqual(sum([end - start for _, start, end in shard]), 400)
+    
+    def test_make_interval_shards(self):
+        files = intervals.make_interval_shards(self.reference, 3)
+        self.assertEqual(files, [os.path.join(self.directory, 'hg_shard' + str(index) + '.bed') for index in range(3)])
+        self.assertEqual(open(files[2]).read(), 'chr3\t0\t300\nchrM\t0\t100\n')
+        self.assertEqual(intervals.get_interval_suffix(files[1]), '_hg_shard1')
+        self.assertEqual(intervals.get_interval_list(files[1]), [files[1]])
+        self.assertEqual(intervals.get_interval_list(['chr1:1-5', 'chr2']), ['chr1:1-5', 'chr2'])
+    
+    def test_tool_interval_arguments(self):
+        bed_file = intervals.make_interval_shards(self.reference, 2)[0]
+        with use_tools(samtools='/bin/echo'):
+            self.assertEqual(samtools.mpileup_command('x.bam', intervals=bed_file).argv, 
+                             ['/bin/echo', 'mpileup', '-u', '-l', bed_file, 'x.bam'])
+            self.assertEqual(samtools.mpileup_command('x.bam', intervals='chr1:1-100').argv, 
+                             ['/bin/echo', 'mpileup', '-u', '-r', 'chr1:1-100', 'x.bam'])
+            self.assertRaises(ValueError, samtools.mpileup_command, 'x.bam', intervals=['chr1', 'chr2'])
+        self.assertEqual(gatk.get_interval_args(['chr1', bed_file]), ['-L', 'chr1', '-L', bed_file])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.uptodate import set_skip_up_to_date
+from libhpc.cf.forms import PAR
+from libhpc.wrapper.stream import StreamCommand
+from libhpc.wrapper.process import wait_any, wait_all
+
+calls = []
+
+# Copy source to target in a shell that records when it starts and ends
+# in log_file, sleeping in between
+def copy_command(source, target, log_file):
+    script = 'echo start >> ' + log_file + '; sleep 0.2; cp ' + source + ' ' + target + '; echo end >> ' + log_file
+    return StreamCommand(['sh', '-c', script], None, [target])
+
+def copy(source, target, log_file):
+    calls.append(source)
+    command = copy_command(source, target, log_file)
+    return command.get_result(command.run())
+
+def fail_command(source):
+    return StreamCommand(['sh', '-c', 'exit 4'])
+
+def fail(source):
+    command = fail_command(source)
+    return command.get_result(command.run())
+
+source_param = Parameter('source', 'string')
+copy_component = Component('test.copy', 'copy', 'test_launch.copy', 
+    [source_param, Parameter('target', 'string', 'inout'), Parameter('log', 'string')], 
+    [Parameter('status', 'int', 'output', True)], command_code='test_launch.copy_command')
+fail_component = Component('test.fail', 'fail', 'test_launch.fail', [source_param], 
+    [Parameter('status', 'int', 'output')], command_code='test_launch.fail_command')
+add = Component('test.add', 'add', 'operator.add', [Parameter('a', 'int'), Parameter('b', 'int')], 
+                [Parameter('r', 'int', 'output')])
+
+# Get the largest number of tools recorded as running at once in log_file
+def get_max_running(log_file):
+    running = 0
+    max_running = 0
+    for line in open(log_file).read().split():
+        if line == 'start':
+            running = running + 1
+        else:
+            running = running - 1
+        max_running = max(running, max_running)
+    return max_running
+
+class LaunchRunnerTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.directory, 'log')
+        self.sources = []
+        for index in range(6):
+            self.sources.append(os.path.join(self.directory, 'source' + str(index)))
+            with open(self.sources[-1], 'w') as f:
+                f.write(str(index))
+        del calls[:]
+    
+    def tearDown(self):
+        set_skip_up_to_date(None)
+        shutil.rmtree(self.directory)
+    
+    def get_inputs(self):
+        return [(source, source + '.copy', self.log_file) for source in self.sources]
+    
+    def test_tools_are_launched_without_their_functions(self):
+        inputs = self.get_inputs()
+        result = PAR([copy_component] * len(inputs), inputs, runner='launch', pool_size=3)()
+        self.assertEqual(result, [source + '.copy' for source in self.sources])
+        self.assertEqual(calls, [])
+        for index, source in enumerate(self.sources):
+            self.assertEqual(open(source + '.copy').read(), str(index))
+        self.assertEqual(get_max_running(self.log_file), 3)
+    
+    def test_results_match_threads_runner(self):
+        inputs = self.get_inputs()[:2] + [('x', )]
+        components = [copy_component, copy_component, fail_component]
+        launched = PAR(components, inputs, runner='launch')()
+        self.assertEqual(launched, PAR(components, inputs, runner='threads')())
+        self.assertEqual(launched[2], 4)
+    
+    def test_other_tasks_run_on_threads(self):
+        inputs = self.get_inputs()[:2] + [(1, 2)]
+        result = PAR([copy_component, copy_component, add], inputs, runner='launch')()
+        self.assertEqual(result, [self.sources[0] + '.copy', self.sources[1] + '.copy', 3])
+    
+    def test_up_to_date_tasks_are_not_launched(self):
+        inputs = self.get_inputs()[:2]
+        PAR([copy_component] * 2, inputs, runner='launch')()
+        os.remove(self.log_file)
+        set_skip_up_to_date(True)
+        result = PAR([copy_component] * 2, inputs, runner='launch')()
+        self.assertEqual(result, [self.sources[0] + '.copy', self.sources[1] + '.copy'])
+        self.assertFalse(os.path.exists(self.log_file))
+
+class CommandLaunchTest(unittest.TestCase):
+    
+    def test_commands_are_waited_on_through_supervisor(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output_file = os.path.join(directory, 'out')
+            slow = StreamCommand(['sh', '-c', 'sleep 0.5; echo slow'], output_file, [output_file]).launch()
+            fast = StreamCommand(['sh', '-c', 'exit 2']).launch()
+            start = time.time()
+            self.assertEqual(wait_any([slow, fast]), [fast])
+            self.assertTrue(time.time() - start < 0.4)
+            self.assertEqual(wait_all([slow, fast]), [0, 2])
+            self.assertEqual(open(output_file).read(), 'slow\n')
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_running_command_needs_no_thread(self):
+        command = StreamCommand(['sleep', '0.3'])
+        thread_count = threading.active_count()
+        handles = [command.launch() for _ in range(20)]
+        # At most the supervisor thread is added however many tools run
+        self.assertTrue(threading.active_count() <= thread_count + 1)
+        self.assertEqual(wait_all(handles), [0] * 20)
+        self.assertEqual(command.get_result(0), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import sys
+import logging
+import unittest
+from StringIO import StringIO
+
+from libhpc.cf.log import set_verbosity, TRACE, LOGGER_NAME
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+
+class LoggingTest(unittest.TestCase):
+    
+    def tearDown(self):
+        set_verbosity(None)
+    
+    def test_forms_do_not_print(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            PIPE([PAR([add, add])], [(1, 2), (3, 4)])()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output, '')
+    
+    def test_messages_follow_the_verbosity(self):
+        stream = StringIO()
+        set_verbosity('warning', stream)
+        PAR([add, add], [(1, 2), (3, 4)])()
+        self.assertEqual(stream.getvalue(), '')
+        set_verbosity('debug', stream)
+        PAR([add, add], [(1, 2), (3, 4)])()
+        self.assertTrue('DEBUG' in stream.getvalue())
+        self.assertFalse('TRACE' in stream.getvalue())
+    
+    def test_trace_level(self):
+        set_verbosity('trace', StringIO())
+        self.assertTrue(logging.getLogger(LOGGER_NAME).isEnabledFor(TRACE))
+        set_verbosity(None)
+        self.assertFalse(logging.getLogger(LOGGER_NAME).isEnabledFor(logging.DEBUG))
+    
+    def test_unknown_level_is_rejected(self):
+        self.assertRaises(ValueError, set_verbosity, 'chatty')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import threading
+import unittest
+import subprocess
+
+from libhpc.cf.pool import get_pool, set_default_pool_size, get_default_pool_size, POOL_SIZE_ENV_VAR
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+
+class ConcurrencyCounter():
+    
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+    
+    def run(self, value):
+        with self.lock:
+            self.active = self.active + 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active = self.active - 1
+        return value * 2
+
+class WorkerPoolTest(unittest.TestCase):
+    
+    def test_map_returns_results_in_order(self):
+        self.assertEqual(get_pool(4).map(lambda x: x * 2, range(100)), [x * 2 for x in range(100)])
+    
+    def test_map_runs_at_most_size_tasks_at_once(self):
+        counter = ConcurrencyCounter()
+        get_pool(3).map(counter.run, range(30))
+        self.assertTrue(counter.peak <= 3)
+        self.assertTrue(counter.peak > 1)
+    
+    def test_nested_map_makes_progress(self):
+        pool = get_pool(2)
+        self.assertEqual(pool.map(lambda x: sum(pool.map(lambda y: y, range(x))), range(6)), 
+                         [0, 0, 1, 3, 6, 10])
+    
+    def test_map_reraises_task_exception(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise KeyError(x)
+            return x
+        self.assertRaises(KeyError, get_pool(4).map, fail_on_three, range(10))
+    
+    def test_pools_are_shared_and_reused(self):
+        pool = get_pool(5)
+        self.assertTrue(get_pool(5) is pool)
+        pool.map(lambda x: x, range(20))
+        threads = threading.active_count()
+        for _ in range(5):
+            pool.map(lambda x: x, range(20))
+        self.assertEqual(threading.active_count(), threads)
+    
+    def test_invalid_size_is_rejected(self):
+        self.assertRaises(ValueError, get_pool, 0)
+        self.assertRaises(ValueError, set_default_pool_size, 'four')
+    
+    def test_default_size_from_environment(self):
+        set_default_pool_size(None)
+        os.environ[POOL_SIZE_ENV_VAR] = '7'
+        try:
+            self.assertEqual(get_default_pool_size(), 7)
+        finally:
+            del os.environ[POOL_SIZE_ENV_VAR]
+    
+    def test_par_runs_on_the_pool(self):
+        self.assertEqual(PAR([add, add, add], [(1, 2), (3, 4), (5, 6)], pool_size=2)(), [3, 7, 11])
+        self.assertEqual(PIPE([PAR([add, add], pool_size=1)], [(1, 1), (2, 2)])(), [2, 4])
+
+class PoolShutdownTest(unittest.TestCase):
+    
+    # Exit must not wait for tasks still running in the pools
+    def test_exit_does_not_wait_for_running_tasks(self):
+        script = '\n'.join(['import time',
+                            'from libhpc.cf.pool import get_pool, get_process_pool',
+                            'get_pool(2).submit(time.sleep, [30])',
+                            'get_process_pool(1).map_async(time.sleep, [30])',
+                            'time.sleep(0.5)'])
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', script])
+        self.assertTrue(time.time() - start < 15)
+    
+    # Idle worker threads must stop before the interpreter is torn down
+    def test_exit_with_idle_pools_is_clean(self):
+        script = '\n'.join(['from libhpc.cf.pool import get_pool',
+                            'for size in range(2, 40):',
+                            '    get_pool(size).map(abs, range(-50, 50))'])
+        # A worker woken during teardown only fails some of the time
+        for _ in range(5):
+            process = subprocess.Popen([sys.executable, '-c', script], stderr=subprocess.PIPE)
+            stderr = process.communicate()[1]
+            self.assertEqual(process.returncode, 0)
+            self.assertEqual(stderr, '')
+
+if __name__ == '__main__':
+    unittest.main()
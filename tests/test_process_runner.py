@@ -0,0 +1,39 @@
+import os
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+mul = Component('test.mul', 'mul', 'operator.mul', [a, b], [r])
+get_pid = Component('test.get_pid', 'get pid', 'test_process_runner.get_pid_plus', [a], [r])
+fail = Component('test.fail', 'fail', 'test_process_runner.fail', [a], [r])
+
+def get_pid_plus(value):
+    return os.getpid() + value
+
+def fail(value):
+    raise KeyError(value)
+
+class ProcessRunnerTest(unittest.TestCase):
+    
+    def test_results_in_task_order(self):
+        self.assertEqual(PAR([add, mul, add], [(1, 2), (3, 4), (5, 6)], runner='processes')(), [3, 12, 11])
+    
+    def test_components_run_in_worker_processes(self):
+        pids = PAR([get_pid, get_pid], [0, 0], runner='processes', pool_size=2)()
+        self.assertFalse(os.getpid() in pids)
+    
+    def test_nested_forms_run_alongside_components(self):
+        self.assertEqual(PAR([(add, 10), (mul, 10), PIPE([(add, 1)])], runner='processes', pool_size=2)([1, 2, [3]]), 
+                         [11, 20, 4])
+    
+    def test_component_exception_is_reraised(self):
+        self.assertRaises(KeyError, PAR([fail, add], [1, (1, 2)], runner='processes'))
+
+if __name__ == '__main__':
+    unittest.main()
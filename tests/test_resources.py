@@ -0,0 +1,88 @@
+import time
+import unittest
+import threading
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+from libhpc.cf.resources import ResourcePool, ResourceRequest, set_resource_pool, get_resource_pool
+from libhpc.cf.dag import schedule
+
+GIGABYTE = 1024 ** 3
+
+running = [0]
+peak = [0]
+lock = threading.Lock()
+
+# Record the number of concurrent runs while sleeping, returning the 
+# number of threads passed
+def work(value, threads=None):
+    with lock:
+        running[0] = running[0] + 1
+        peak[0] = max(peak[0], running[0])
+    time.sleep(0.1)
+    with lock:
+        running[0] = running[0] - 1
+    return (value, threads)
+
+value_param = Parameter('value', 'int')
+result_param = Parameter('result', 'list', 'output')
+big = Component('test.big', 'big', 'test_resources.work', [value_param], [result_param], 
+                resources={'cpus': 1, 'memory': '6G'})
+small = Component('test.small', 'small', 'test_resources.work', [value_param], [result_param], 
+                  resources={'cpus': 1, 'memory': '1G'})
+threaded = Component('test.threaded', 'threaded', 'test_resources.work', [value_param], [result_param], 
+                     resources={'cpus': (1, 8)}, threads_arg='threads')
+plain = Component('test.plain', 'plain', 'test_resources.work', [value_param], [result_param])
+missing = Component('test.missing', 'missing', 'test_resources.missing', [value_param], [result_param], 
+                    resources={'cpus': 2})
+
+class ResourceRunnerTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.previous_pool = get_resource_pool()
+        self.pool = ResourcePool(cpus=4, memory='10G', scratch=None)
+        set_resource_pool(self.pool)
+        peak[0] = 0
+    
+    def tearDown(self):
+        set_resource_pool(self.previous_pool)
+    
+    def run_par(self, components, inputs, pool_size=8):
+        return PAR(components, [(value, ) for value in inputs], runner='resources', pool_size=pool_size)()
+    
+    def test_memory_limits_concurrency(self):
+        self.assertEqual(self.run_par([big] * 3, range(3)), [(0, None), (1, None), (2, None)])
+        self.assertEqual(peak[0], 1)
+    
+    def test_cpus_limit_concurrency(self):
+        self.assertEqual(len(self.run_par([small] * 8, range(8))), 8)
+        self.assertEqual(peak[0], 4)
+    
+    def test_small_tasks_fill_space_left_by_large(self):
+        self.run_par([big, small, small, small, big], range(5))
+        self.assertEqual(peak[0], 4)
+    
+    def test_allocated_cpus_are_passed_to_threads_arg(self):
+        self.assertEqual(self.run_par([threaded], [1]), [(1, 4)])
+        self.assertEqual(self.run_par([threaded, threaded], [1, 2], 4), [(1, 2), (2, 2)])
+        self.assertEqual(PAR([threaded], [(1, )])(), [(1, None)])
+    
+    def test_nested_forms_and_undeclared_components_run(self):
+        result = PAR([PIPE([threaded]), plain], [[1], (2, )], runner='resources', pool_size=4)()
+        self.assertEqual(result, [(1, None), (2, None)])
+    
+    def test_task_graph_packs_onto_resources(self):
+        expression = PAR([big, big, small, small], [(value, ) for value in range(4)])
+        self.assertEqual(len(schedule(expression, pool_size=8, resource_pool=self.pool)()), 4)
+        self.assertEqual(peak[0], 3)
+    
+    def test_resources_are_released_after_failure(self):
+        self.assertRaises(ValueError, self.run_par, [missing, small], [1, 2])
+        self.assertEqual((self.pool.free_cpus, self.pool.free_memory), (4, 10 * GIGABYTE))
+    
+    def test_invalid_request(self):
+        self.assertRaises(ValueError, ResourceRequest, cpus=(3, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, GET_CF_RUNNER, SET_CF_RUNNER
+from libhpc.cf.runners import register_cf_runner, list_cf_runners, run_par_sequential, run_par_threads, \
+    RUNNER_ENV_VAR_PREFIX
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+
+# A PAR runner that records the tasks it is given
+recorded_tasks = []
+def run_par_recording(task_list, pool_size=None):
+    recorded_tasks.append(len(task_list))
+    return run_par_sequential(task_list, pool_size)
+
+register_cf_runner('PAR', 'test_recording', run_par_recording)
+
+class RunnerRegistryTest(unittest.TestCase):
+    
+    def tearDown(self):
+        SET_CF_RUNNER('PAR', None)
+        os.environ.pop(RUNNER_ENV_VAR_PREFIX + 'PAR', None)
+        del recorded_tasks[:]
+    
+    def test_default_runners(self):
+        self.assertTrue(GET_CF_RUNNER('PAR') is run_par_threads)
+        self.assertTrue(set(['threads', 'sequential', 'processes', 'test_recording']) <= set(list_cf_runners('PAR')))
+    
+    def test_registered_runner_is_used_when_named(self):
+        self.assertEqual(PAR([add, add], [(1, 2), (3, 4)], runner='test_recording')(), [3, 7])
+        self.assertEqual(recorded_tasks, [2])
+    
+    def test_selection_precedence(self):
+        os.environ[RUNNER_ENV_VAR_PREFIX + 'PAR'] = 'sequential'
+        self.assertTrue(GET_CF_RUNNER('PAR') is run_par_sequential)
+        SET_CF_RUNNER('PAR', 'test_recording')
+        self.assertTrue(GET_CF_RUNNER('PAR') is run_par_recording)
+        self.assertTrue(GET_CF_RUNNER('PAR', 'threads') is run_par_threads)
+        PAR([add], [(1, 2)])()
+        self.assertEqual(recorded_tasks, [1])
+    
+    def test_unknown_runner_is_rejected(self):
+        self.assertRaises(ValueError, GET_CF_RUNNER, 'PAR', 'no_such_runner')
+        self.assertRaises(ValueError, SET_CF_RUNNER, 'PAR', 'no_such_runner')
+        os.environ[RUNNER_ENV_VAR_PREFIX + 'PAR'] = 'no_such_runner'
+        self.assertRaises(ValueError, GET_CF_RUNNER, 'PAR')
+    
+    def test_runner_must_be_callable(self):
+        self.assertRaises(ValueError, register_cf_runner, 'PAR', 'test_not_callable', 'run_par_threads')
+
+if __name__ == '__main__':
+    unittest.main()
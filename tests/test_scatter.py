@@ -0,0 +1,47 @@
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PIPE, SCATTER, GATHER, SPLIT, chunk_list
+from libhpc.cf.dag import schedule
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+total = Component('test.sum', 'sum', '__builtin__.sum', [Parameter('values', 'list')], [r])
+
+class ScatterGatherTest(unittest.TestCase):
+    
+    def test_chunk_list(self):
+        self.assertEqual(chunk_list(range(10), 3), [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        self.assertEqual(chunk_list(tuple(range(10)), 4), [(0, 1, 2), (3, 4, 5), (6, 7), (8, 9)])
+        self.assertEqual(chunk_list([], 2), [[], []])
+        self.assertEqual(SPLIT()([1, 2, 3, 4, 5]), [[1, 2, 3], [4, 5]])
+    
+    def test_scatter_shards(self):
+        self.assertEqual(SCATTER(add, chunk_size=2)([1, 2, 3, 4, 5, 6]), [3, 7, 11])
+        self.assertEqual(SCATTER(add, shards=3)([1, 2, 3, 4, 5, 6]), [3, 7, 11])
+        self.assertEqual(SCATTER(add, shards=1)([1, 2]), [3])
+        self.assertEqual(SCATTER(add)([]), [])
+    
+    def test_scatter_static_params_and_chunker(self):
+        self.assertEqual(SCATTER((add, [0]), shards=2)([1, 2, 3, 4]), [[1, 2, 0], [3, 4, 0]])
+        self.assertEqual(SCATTER(add, chunker=lambda items, count: [items[0::2], items[1::2]])([1, 2, 3, 4]), [4, 6])
+    
+    def test_gather(self):
+        self.assertEqual(PIPE([GATHER(), SCATTER(add, shards=3)])([1, 2, 3, 4, 5, 6]), [3, 7, 11])
+        self.assertEqual(PIPE([GATHER(total), SCATTER(add, shards=3)])([1, 2, 3, 4, 5, 6]), 21)
+        self.assertEqual(PIPE([GATHER(lambda results: max(results)), SCATTER(add, chunk_size=2, runner='sequential')], 
+                              [1, 2, 3, 40, 5, 6])(), 43)
+    
+    def test_scheduled_scatter_gather(self):
+        self.assertEqual(schedule(PIPE([GATHER(), SCATTER(add, shards=3)]))([1, 2, 3, 4, 5, 6]), [3, 7, 11])
+    
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, SCATTER, add, shards=0)
+        self.assertRaises(ValueError, SCATTER, add, shards=2, chunk_size=2)
+        self.assertRaises(ValueError, SCATTER, add, chunker=5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE
+from libhpc.cf.dag import schedule
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+incrementer = Component('test.increment', 'increment', 'test_stream_par.increment', [a], [r])
+doubler = Component('test.double', 'double', 'test_stream_par.double', [a], [r])
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+
+def increment(value):
+    return value + 1
+
+def double(value):
+    return value * 2
+
+class StreamingParTest(unittest.TestCase):
+
+    def test_inputs_are_taken_lazily(self):
+        counts = {'produced': 0, 'consumed': 0, 'pending': 0}
+        def produce(count):
+            for value in xrange(count):
+                counts['produced'] += 1
+                counts['pending'] = max(counts['pending'], counts['produced'] - counts['consumed'])
+                yield value
+        results = []
+        for result in PAR(incrementer, pool_size=4, stream=True, max_pending=8)(produce(2000)):
+            counts['consumed'] += 1
+            results.append(result)
+        self.assertEqual(results, range(1, 2001))
+        # At most max_pending tasks are waiting ahead of the consumer
+        self.assertTrue(counts['pending'] <= 9, counts['pending'])
+
+    def test_streams_chain_in_pipe(self):
+        results = PIPE([PAR([doubler], stream=True), PAR([incrementer], stream=True)])(xrange(10))
+        self.assertFalse(isinstance(results, list))
+        self.assertEqual(list(results), [2 * (value + 1) for value in range(10)])
+
+    def test_runners_and_nested_forms(self):
+        self.assertEqual(list(PAR([incrementer], stream=True, runner='sequential')(xrange(5))), [1, 2, 3, 4, 5])
+        self.assertEqual(list(PAR([(add, 10)], xrange(5), stream=True, runner='processes', max_pending=2)()),
+                         [10, 11, 12, 13, 14])
+        self.assertEqual(list(PAR(PIPE([(add, 1), doubler]), stream=True)([[1], [2], [3]])), [3, 5, 7])
+        self.assertEqual(list(schedule(PIPE([PAR([incrementer], stream=True)], [1, 2, 3]))()), [2, 3, 4])
+
+    def test_invalid_streams(self):
+        self.assertRaises(ValueError, PAR, [incrementer, incrementer], stream=True)
+        self.assertRaises(ValueError, PAR, [incrementer, incrementer], max_pending=3)
+
+if __name__ == '__main__':
+    unittest.main()
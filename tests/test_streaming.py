@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PIPE
+from libhpc.wrapper.stream import StreamCommand
+
+def generate_command(count, output, read_stdin=False, write_stdout=False):
+    return StreamCommand(['seq', str(count)], None if write_stdout else output, [output])
+
+def replace_command(input_file, output=None, read_stdin=False, write_stdout=False):
+    if output == None:
+        output = input_file + '.x'
+    argv = ['sed', 's/1/X/'] + ([] if read_stdin else [input_file])
+    return StreamCommand(argv, None if write_stdout else output, [output])
+
+def fail_command(input_file, output=None, read_stdin=False, write_stdout=False):
+    if output == None:
+        output = input_file + '.f'
+    argv = ['sh', '-c', 'head -c 10 > /dev/null; exit 3']
+    return StreamCommand(argv, None if write_stdout else output, [output])
+
+def run_command(command):
+    return command.get_result(command.run())
+
+def generate(count, output):
+    return run_command(generate_command(count, output))
+
+def replace(input_file, output=None):
+    return run_command(replace_command(input_file, output))
+
+def fail(input_file, output=None):
+    return run_command(fail_command(input_file, output))
+
+def count_lines(input_file):
+    return len(open(input_file).read().split())
+
+count_param = Parameter('count', 'int')
+input_param = Parameter('input', 'string')
+output_param = Parameter('output', 'string', 'inout')
+status_param = Parameter('status', 'int', 'output', True)
+visible_status_param = Parameter('status', 'int', 'output')
+lines_param = Parameter('lines', 'int', 'output')
+generate_component = Component('test.generate', 'generate', 'test_streaming.generate', [count_param, output_param], 
+                               [status_param], stream_code='test_streaming.generate_command')
+replace_component = Component('test.replace', 'replace', 'test_streaming.replace', [input_param, output_param], 
+                              [status_param], stream_code='test_streaming.replace_command')
+fail_component = Component('test.fail', 'fail', 'test_streaming.fail', [input_param, output_param], 
+                           [status_param], stream_code='test_streaming.fail_command')
+report_component = Component('test.report', 'report', 'test_streaming.replace', [input_param, output_param], 
+                             [visible_status_param], stream_code='test_streaming.replace_command')
+count_component = Component('test.count', 'count', 'test_streaming.count_lines', [input_param], [lines_param])
+
+class StreamingPipeTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'numbers.txt')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_streaming_matches_sequential(self):
+        expression = [count_component, replace_component, replace_component, generate_component]
+        sequential = PIPE(expression, [20000, self.output])()
+        sequential_content = open(self.output + '.x.x').read()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        self.assertEqual(PIPE(expression, [20000, self.output], runner='streaming')(), sequential)
+        self.assertEqual(open(self.output + '.x.x').read(), sequential_content)
+        # Only the last stage writes a file, the others are connected by pipes
+        self.assertEqual(os.listdir(self.directory), ['numbers.txt.x.x'])
+    
+    def test_failing_stage_status_is_returned(self):
+        result = PIPE([report_component, fail_component, generate_component], [10 ** 7, self.output], 
+                      runner='streaming')()
+        self.assertEqual(result[0][0], 3)
+        result = PIPE([report_component, generate_component], [1000, self.output], runner='streaming')()
+        self.assertEqual(result[0][0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
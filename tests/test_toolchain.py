@@ -0,0 +1,81 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+import threading
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, TOOLS
+from libhpc.cf.dag import schedule
+from libhpc.cf.pool import get_process_pool
+from libhpc.wrapper.toolchain import register_tool, set_tool_location, get_tool_path, get_tool_version, use_tools
+
+def get_test_tool_path():
+    return get_tool_path('test_tool')
+
+which = Component('test.which', 'which', 'test_toolchain.get_test_tool_path', [], 
+                  [Parameter('path', 'string', 'output')])
+
+class ToolchainTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tools = [self.write_tool('v1'), self.write_tool('v2')]
+        register_tool('test_tool', self.tools[0], version_args=[])
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    # Write a tool that reports version when run without arguments
+    def write_tool(self, version):
+        path = os.path.join(self.directory, version, 'tool')
+        os.mkdir(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\necho "Version: ' + version + '" >&2\nexit 1\n')
+        os.chmod(path, stat.S_IRWXU)
+        return path
+    
+    def test_locations_and_versions(self):
+        self.assertEqual(get_tool_path('test_tool'), self.tools[0])
+        self.assertEqual(get_tool_version('test_tool'), 'v1')
+        set_tool_location('test_tool', self.tools[1])
+        self.assertEqual(get_tool_version('test_tool'), 'v2')
+    
+    def test_invalid_tools(self):
+        self.assertRaises(ValueError, get_tool_path, 'test_unregistered_tool')
+        register_tool('test_missing_tool', os.path.join(self.directory, 'missing'))
+        self.assertRaises(ValueError, get_tool_path, 'test_missing_tool')
+        register_tool('test_file_tool', os.path.join(self.directory, 'missing.jar'), kind='file')
+        self.assertRaises(ValueError, get_tool_path, 'test_file_tool')
+    
+    def test_overrides_are_per_thread(self):
+        errors = []
+        def check(tool):
+            with use_tools(test_tool=tool):
+                for _ in range(200):
+                    if get_tool_path('test_tool') != tool:
+                        errors.append(tool)
+        threads = [threading.Thread(target=check, args=(tool, )) for tool in self.tools * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(get_tool_path('test_tool'), self.tools[0])
+    
+    def test_tools_form(self):
+        override = {'test_tool': self.tools[1]}
+        expression = PAR([TOOLS(which, override), which, TOOLS(PIPE([which]), override)], [[], [], []])
+        expected = [self.tools[1], self.tools[0], self.tools[1]]
+        self.assertEqual(expression(), expected)
+        self.assertEqual(schedule(expression)(), expected)
+        # Worker processes started by earlier tests don't have test_tool
+        # registered, so the shared process pool is restarted
+        get_process_pool().shutdown()
+        self.assertEqual(PAR([TOOLS(which, override), which], [[], []], runner='processes')(), expected[:2])
+        self.assertRaises(ValueError, TOOLS, which, 'x')
+
+if __name__ == '__main__':
+    unittest.main()
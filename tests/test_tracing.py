@@ -0,0 +1,64 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf import tracing
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.forms import PAR, PIPE, BYPASS, FILTER
+
+a = Parameter('a', 'int')
+b = Parameter('b', 'int')
+r = Parameter('r', 'int', 'output')
+add = Component('test.add', 'add', 'operator.add', [a, b], [r])
+mul = Component('test.mul', 'mul', 'operator.mul', [a, b], [r])
+
+class TracingTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        tracing.disable_tracing()
+        shutil.rmtree(self.directory)
+    
+    def get_events(self, trace_source=None):
+        trace_file = os.path.join(self.directory, 'trace.json')
+        tracing.write_chrome_trace(trace_file, trace_source)
+        with open(trace_file) as f:
+            return json.load(f)['traceEvents']
+    
+    def test_disabled_by_default(self):
+        self.assertFalse(tracing.is_tracing())
+        self.assertRaises(ValueError, tracing.write_chrome_trace, os.path.join(self.directory, 'trace.json'))
+    
+    def test_events_record_nesting_paths(self):
+        tracing.enable_tracing()
+        # PIPE stages are listed last first
+        self.assertEqual(PIPE([BYPASS((add, 3)), FILTER([0]), PAR([add, (mul, 2)])], [[1, 2], [3]])(), [3])
+        paths = [event['args']['path'] for event in self.get_events() if event['ph'] == 'X']
+        for path in ['PIPE', 'PIPE[0]/PAR', 'PIPE[0]/PAR[0]/test.add', 'PIPE[0]/PAR[1]/test.mul', 
+                     'PIPE[1]/FILTER', 'PIPE[2]/BYPASS', 'PIPE[2]/BYPASS/test.add']:
+            self.assertTrue(path in paths, path)
+    
+    def test_events_from_worker_processes_are_collected(self):
+        tracing.enable_tracing()
+        PAR([add, mul], [(1, 2), (3, 4)], runner='processes')()
+        events = [event for event in self.get_events() if event['ph'] == 'X']
+        component_pids = set([event['pid'] for event in events if event['name'] in ['test.add', 'test.mul']])
+        self.assertEqual(len(component_pids), 1)
+        self.assertFalse(os.getpid() in component_pids)
+    
+    def test_events_have_durations_and_thread_names(self):
+        tracing.enable_tracing()
+        PAR([add, add], [(1, 2), (3, 4)])()
+        events = self.get_events(tracing.disable_tracing())
+        self.assertTrue(len([event for event in events if event['ph'] == 'M']) > 0)
+        for event in events:
+            if event['ph'] == 'X':
+                self.assertTrue(event['dur'] >= 0)
+
+if __name__ == '__main__':
+    unittest.main()
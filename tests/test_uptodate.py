@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from libhpc.cf.params import Parameter
+from libhpc.cf.component import Component
+from libhpc.cf.uptodate import set_skip_up_to_date
+from libhpc.cf.forms import PAR, PIPE
+from libhpc.component.bio import picard_check_reference
+
+calls = []
+
+# Write the upper case content of source to target, deriving the target
+# name from source if it is not provided
+def upper(source, target=None):
+    calls.append(source)
+    if target == None:
+        target = source.rsplit('.', 1)[0] + '.up'
+    with open(target, 'w') as f:
+        f.write(open(source).read().upper())
+    return (0, target)
+
+# Copy source to target, returning only the output parameter value
+def copy(source, target):
+    calls.append(source)
+    shutil.copyfile(source, target)
+    return (target, )
+
+source_param = Parameter('source', 'string')
+upper_component = Component('test.upper', 'upper', 'test_uptodate.upper', 
+    [source_param, Parameter('target', 'string', 'inout', derive=(0, '{stem}.up'))], 
+    [Parameter('status', 'int', 'output', True)])
+copy_component = Component('test.copy', 'copy', 'test_uptodate.copy', 
+    [source_param, Parameter('target', 'string', 'inout')], [])
+
+class UpToDateTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'a.txt')
+        with open(self.source, 'w') as f:
+            f.write('hello')
+        del calls[:]
+        set_skip_up_to_date(True)
+    
+    def tearDown(self):
+        set_skip_up_to_date(False)
+        shutil.rmtree(self.directory)
+    
+    def touch(self, path, offset):
+        timestamp = time.time() + offset
+        os.utime(path, (timestamp, timestamp))
+    
+    def test_up_to_date_component_is_skipped(self):
+        target = os.path.join(self.directory, 'a.up')
+        self.assertEqual(upper_component.run([self.source]), target)
+        self.assertEqual(upper_component.run([self.source]), target)
+        self.assertEqual(PAR([upper_component] * 2, [self.source] * 2)(), [target] * 2)
+        self.assertEqual(len(calls), 1)
+    
+    def test_newer_input_is_rerun(self):
+        upper_component.run([self.source])
+        self.touch(self.source, 5)
+        upper_component.run([self.source])
+        self.assertEqual(len(calls), 2)
+    
+    def test_missing_output_is_rerun(self):
+        target = upper_component.run([self.source])
+        os.remove(target)
+        upper_component.run([self.source])
+        self.assertEqual(len(calls), 2)
+    
+    def test_skipping_disabled(self):
+        set_skip_up_to_date(False)
+        upper_component.run([self.source])
+        upper_component.run([self.source])
+        self.assertEqual(len(calls), 2)
+    
+    # Regression test: a single output parameter value, with no return 
+    # value, must be returned whole rather than indexed as a tuple
+    def test_single_output_parameter_is_returned_whole(self):
+        target = os.path.join(self.directory, 'out.txt')
+        self.assertEqual(copy_component.run([self.source, target]), target)
+        self.assertEqual(copy_component.run([self.source, target]), target)
+        self.assertEqual(PIPE([copy_component], [self.source, target])(), target)
+        self.assertEqual(len(calls), 1)
+        reference = os.path.join(self.directory, 'ref.fa')
+        shutil.copyfile(self.source, reference)
+        self.assertEqual(picard_check_reference.get_up_to_date_result([reference, reference]), 
+                         (True, (reference, )))
+        self.assertEqual(picard_check_reference.run([reference, reference]), reference)
+
+if __name__ == '__main__':
+    unittest.main()